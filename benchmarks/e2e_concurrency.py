@@ -0,0 +1,379 @@
+"""端到端并发基准：通过 stdio 启动真实的 FastMCP 服务器，并发调用 coder / codex / gemini
+
+后端使用 ccg_mcp.testing 中的假 CLI，无需网络与真实账号。输出 JSON 结果（吞吐、延迟分位数、
+服务器 RSS 与 CPU），可与另一次运行的结果对比以发现性能回退：
+
+    python benchmarks/e2e_concurrency.py --calls 300 --concurrency 50 --output after.json
+    python benchmarks/e2e_concurrency.py --output after.json --compare before.json
+
+对比时任一指标回退超过 --threshold（默认 20%）则以退出码 1 结束。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+from mcp import ClientSession, StdioServerParameters  # noqa: E402
+from mcp.client.stdio import stdio_client  # noqa: E402
+
+from ccg_mcp.testing import install_fake_cli  # noqa: E402
+
+TOOLS = ("coder", "codex", "gemini")
+
+# 对比时检查的指标：(路径, 越大越好)
+COMPARED_METRICS: List[Tuple[str, bool]] = [
+    ("throughput_rps", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p99", False),
+    ("server.rss_peak_mb", False),
+    ("server.cpu_ms_per_call", False),
+]
+
+
+# ============================================================================
+# 服务器进程资源采样
+# ============================================================================
+
+class ProcessSampler:
+    """定期采样进程的 RSS 与累计 CPU 时间（读取 /proc，非 Linux 平台不采样）"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.rss_peak = 0
+        self.rss_last = 0
+        self.cpu_start: Optional[float] = None
+        self.cpu_last: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def start(self) -> None:
+        if self.pid is not None:
+            self.cpu_start = self._cpu_seconds()
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._sample()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        if self.pid is None:
+            return
+        rss = self._rss_bytes()
+        if rss is not None:
+            self.rss_last = rss
+            self.rss_peak = max(self.rss_peak, rss)
+        cpu = self._cpu_seconds()
+        if cpu is not None:
+            self.cpu_last = cpu
+
+    def _rss_bytes(self) -> Optional[int]:
+        try:
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _cpu_seconds(self) -> Optional[float]:
+        """用户态 + 内核态 CPU 秒数（不含子进程，即不含假 CLI 自身的开销）"""
+        try:
+            stat = Path(f"/proc/{self.pid}/stat").read_text()
+        except OSError:
+            return None
+        fields = stat.rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._clock_ticks
+
+    def cpu_used(self) -> Optional[float]:
+        if self.cpu_start is None or self.cpu_last is None:
+            return None
+        return self.cpu_last - self.cpu_start
+
+
+def find_server_pid(command_marker: str) -> Optional[int]:
+    """查找本进程启动的服务器子进程（stdio_client 不暴露子进程 PID）"""
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    me = os.getpid()
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            cmdline = (entry / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == me and command_marker in cmdline:
+            return int(entry.name)
+    return None
+
+
+# ============================================================================
+# 统计
+# ============================================================================
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies_ms),
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+        "p50": round(percentile(latencies_ms, 0.50), 2),
+        "p90": round(percentile(latencies_ms, 0.90), 2),
+        "p99": round(percentile(latencies_ms, 0.99), 2),
+        "max": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """解析调用比例，如 "coder=1,codex=2,gemini=1" """
+    mix: Dict[str, float] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in TOOLS:
+            raise argparse.ArgumentTypeError(f"未知工具: {name}（可选: {', '.join(TOOLS)}）")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("调用比例不能全为 0")
+    return mix
+
+
+# ============================================================================
+# 运行
+# ============================================================================
+
+def build_scenario(args: argparse.Namespace) -> Dict[str, Any]:
+    """每次调用的假 CLI 场景：分段回复 + 若干内部工具调用"""
+    return {
+        "delay": args.event_delay,
+        "text": "x" * args.text_bytes,
+        "chunks": args.chunks,
+        "tool_uses": [
+            {"name": "Bash", "input": {"command": f"echo {i}"}, "output": "ok"}
+            for i in range(args.tool_uses)
+        ],
+        "usage": {"input_tokens": 1000, "output_tokens": 200},
+    }
+
+
+async def _call(
+    session: ClientSession, tool: str, project: Path, semaphore: asyncio.Semaphore,
+) -> Tuple[str, float, bool]:
+    async with semaphore:
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await session.call_tool(tool, {"PROMPT": "benchmark", "cd": str(project)})
+            if not result.isError and result.content:
+                ok = bool(json.loads(result.content[0].text).get("success"))
+        except Exception:
+            ok = False
+        return tool, (time.perf_counter() - start) * 1000, ok
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="ccg-bench-") as tmp:
+        root = Path(tmp)
+        home, project, bin_dir = root / "home", root / "project", root / "bin"
+        home.mkdir()
+        project.mkdir()
+        scenario = build_scenario(args)
+        for backend in ("claude", "codex", "gemini"):
+            install_fake_cli(bin_dir, backend, scenario)
+
+        env = dict(os.environ)
+        env.update({
+            "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+            "HOME": str(home),  # 隔离 ~/.ccg-mcp/config.toml
+            "USERPROFILE": str(home),
+            "CODER_API_TOKEN": "benchmark",
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT / "src"), env.get("PYTHONPATH")])),
+        })
+        if args.profiling:
+            env["CCG_MCP_PROFILING"] = "1"
+        marker = "ccg_mcp.cli"
+        params = StdioServerParameters(command=sys.executable, args=["-m", marker], env=env, cwd=str(project))
+
+        rng = random.Random(args.seed)
+        names = list(args.mix)
+        plan = rng.choices(names, weights=[args.mix[n] for n in names], k=args.calls)
+
+        with open(os.devnull, "w") as errlog:
+            async with stdio_client(params, errlog=errlog) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    # 预热：首次调用包含模块导入与配置加载
+                    for tool in names:
+                        await session.call_tool(tool, {"PROMPT": "warmup", "cd": str(project)})
+
+                    sampler = ProcessSampler(find_server_pid(marker))
+                    sampler.start()
+                    semaphore = asyncio.Semaphore(args.concurrency)
+                    started = time.perf_counter()
+                    results = await asyncio.gather(*(_call(session, tool, project, semaphore) for tool in plan))
+                    wall = time.perf_counter() - started
+                    sampler.stop()
+
+    latencies = [ms for _, ms, _ in results]
+    errors = sum(1 for _, _, ok in results if not ok)
+    cpu = sampler.cpu_used()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "event_delay": args.event_delay,
+            "text_bytes": args.text_bytes,
+            "chunks": args.chunks,
+            "tool_uses": args.tool_uses,
+            "profiling": args.profiling,
+            "seed": args.seed,
+        },
+        "wall_s": round(wall, 3),
+        "errors": errors,
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "latency_ms_by_tool": {
+            tool: latency_summary([ms for name, ms, _ in results if name == tool]) for tool in names
+        },
+        "server": {
+            "pid_found": sampler.pid is not None,
+            "rss_peak_mb": round(sampler.rss_peak / 2**20, 2),
+            "rss_end_mb": round(sampler.rss_last / 2**20, 2),
+            "cpu_s": round(cpu, 3) if cpu is not None else None,
+            "cpu_percent": round(cpu / wall * 100, 1) if cpu is not None and wall else None,
+            "cpu_ms_per_call": round(cpu * 1000 / len(results), 3) if cpu is not None and results else None,
+        },
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+# ============================================================================
+# 对比
+# ============================================================================
+
+def _lookup(result: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = result
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """与基线对比，change 为相对变化（正数表示变好），低于 -threshold 记为回退"""
+    rows = []
+    for path, higher_is_better in COMPARED_METRICS:
+        now, before = _lookup(current, path), _lookup(baseline, path)
+        if now is None or not before:
+            continue
+        change = (now - before) / before
+        if not higher_is_better:
+            change = -change
+        rows.append({
+            "metric": path,
+            "baseline": before,
+            "current": now,
+            "change": round(change, 4),
+            "regression": change < -threshold,
+        })
+    return {
+        "baseline_commit": baseline.get("meta", {}).get("commit", ""),
+        "threshold": threshold,
+        "metrics": rows,
+        "regressions": [row["metric"] for row in rows if row["regression"]],
+    }
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="End-to-end concurrency benchmark of the CCG-MCP stdio server")
+    parser.add_argument("--calls", type=int, default=300, help="number of measured tool calls (default: 300)")
+    parser.add_argument("--concurrency", type=int, default=50, help="max in-flight calls (default: 50)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("coder=1,codex=1,gemini=1"),
+                        help="tool weights, e.g. coder=1,codex=2,gemini=1")
+    parser.add_argument("--event-delay", type=float, default=0.005, help="fake CLI delay between events (s)")
+    parser.add_argument("--text-bytes", type=int, default=2000, help="size of each reply (bytes)")
+    parser.add_argument("--chunks", type=int, default=5, help="reply chunks per call")
+    parser.add_argument("--tool-uses", type=int, default=3, help="internal tool calls per call")
+    parser.add_argument("--profiling", action="store_true", help="enable server overhead profiling")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the call mix")
+    parser.add_argument("--output", type=Path, help="write the JSON result to this file")
+    parser.add_argument("--compare", type=Path, help="baseline JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative regression threshold (default: 0.2)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    result = asyncio.run(run_benchmark(args))
+    exit_code = 0
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        result["comparison"] = compare(result, baseline, args.threshold)
+        if result["comparison"]["regressions"]:
+            exit_code = 1
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""解析阶段微基准：coder / codex / gemini 工具逐行处理合成输出流的吞吐与峰值内存
+
+    python benchmarks/parser_throughput.py                 # 默认场景（约 1 分钟）
+    python benchmarks/parser_throughput.py --full          # 含 100 万事件与 10 MB 单行
+    python benchmarks/parser_throughput.py --scenario tool_results --backend codex
+
+解析阶段在进程内运行（不启动子进程，见 ccg_mcp.testing.streams），结果以 JSON 输出。
+tests/unit/test_parser_budget.py 以较小规模检查吞吐与内存预算。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+BACKENDS = ("claude", "codex", "gemini")
+
+# 场景名 -> synthetic_stream 参数；full 为 True 的场景仅在 --full 时运行
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "events_10k_1kb": {"events": 10_000, "line_bytes": 1024},
+    "events_100k_1kb": {"events": 100_000, "line_bytes": 1024},
+    "events_1m_1kb": {"events": 1_000_000, "line_bytes": 1024, "full": True},
+    "lines_1mb": {"events": 50, "line_bytes": 1 << 20},
+    "lines_10mb": {"events": 20, "line_bytes": 10 << 20, "full": True},
+    "tool_results": {"events": 10_000, "line_bytes": 256, "tool_result_bytes": 64 << 10, "tool_every": 2},
+    "tool_results_10mb": {"events": 40, "line_bytes": 256, "tool_result_bytes": 10 << 20, "tool_every": 2,
+                          "full": True},
+}
+
+
+def run(scenarios: List[str], backends: List[str], trace_memory: bool) -> List[Dict[str, Any]]:
+    from ccg_mcp.testing.streams import measure_parser, synthetic_stream
+
+    results = []
+    for name in scenarios:
+        params = {k: v for k, v in SCENARIOS[name].items() if k != "full"}
+        for backend in backends:
+            result = measure_parser(
+                backend,
+                lambda backend=backend: synthetic_stream(backend, **params),
+                trace_memory=trace_memory,
+            )
+            result["scenario"] = name
+            results.append(result)
+            print(f"{name:20s} {backend:7s} {result['events_per_s']:>12,.0f} events/s "
+                  f"{result['mb_per_s']:>8,.1f} MB/s  peak {result['peak_memory_mb']} MB", file=sys.stderr)
+    return results
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Microbenchmark of the per-line parsing stage of the tools")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--backend", action="append", choices=BACKENDS, help="run only these backends")
+    parser.add_argument("--full", action="store_true", help="include 1M-event and 10 MB-line scenarios")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory pass")
+    parser.add_argument("--output", type=Path, help="write the JSON result to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    scenarios = args.scenario or [name for name, spec in SCENARIOS.items() if args.full or not spec.get("full")]
+    backends = args.backend or list(BACKENDS)
+
+    with tempfile.TemporaryDirectory(prefix="ccg-parser-home-") as home:
+        # 隔离 ~/.ccg-mcp（超时历史、Coder 配置）
+        os.environ["HOME"] = home
+        os.environ.setdefault("CODER_API_TOKEN", "benchmark")
+        results = run(scenarios, backends, trace_memory=not args.no_memory)
+
+    text = json.dumps({
+        "meta": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""回放基准：把录制的真实后端输出流经 runner 与解析器回放，测量服务端处理开销
+
+录制（见 ccg_mcp.recording）：
+
+    CCG_MCP_RECORD_DIR=~/ccg-streams ccg-mcp
+
+回放：
+
+    python benchmarks/replay_streams.py ~/ccg-streams --speed 0 --repeat 5 --output replay.json
+
+speed 为加速倍数（1 为原速，0 为尽快输出）。每个夹具按录制时的工具调用 coder / codex / gemini，
+开启剖析后记录逐行解析耗时，输出 JSON 结果。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+from ccg_mcp import profiling  # noqa: E402
+from ccg_mcp.recording import iter_fixtures, load_fixture  # noqa: E402
+from ccg_mcp.testing import install_replay_cli  # noqa: E402
+
+
+def _tool_function(tool: str):
+    if tool == "coder":
+        from ccg_mcp.tools.coder import coder_tool
+        return coder_tool
+    if tool == "codex":
+        from ccg_mcp.tools.codex import codex_tool
+        return codex_tool
+    from ccg_mcp.tools.gemini import gemini_tool
+    return gemini_tool
+
+
+def _fixture_paths(paths: List[Path]) -> List[Path]:
+    result: List[Path] = []
+    for path in paths:
+        result.extend(iter_fixtures(path) if path.is_dir() else [path])
+    return result
+
+
+def replay_fixture(path: Path, speed: float, repeat: int, root: Path) -> Dict[str, Any]:
+    """回放单个夹具 repeat 次，汇总耗时与解析开销"""
+    fixture = load_fixture(path)
+    bin_dir = root / "bin"
+    install_replay_cli(bin_dir, path, speed=speed)
+    tool = _tool_function(fixture.tool)
+
+    walls: List[float] = []
+    parse_ms: List[float] = []
+    parse_max_us = 0.0
+    successes = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = asyncio.run(tool(PROMPT="replay", cd=root, return_metrics=True, max_retries=0))
+        walls.append((time.perf_counter() - start) * 1000)
+        successes += bool(result.get("success"))
+        parse = ((result.get("metrics") or {}).get("profile") or {}).get("parse") or {}
+        parse_ms.append(parse.get("total_ms", 0.0))
+        parse_max_us = max(parse_max_us, parse.get("max_us", 0.0))
+
+    mean_wall = sum(walls) / len(walls)
+    mean_parse = sum(parse_ms) / len(parse_ms)
+    return {
+        "fixture": path.name,
+        "tool": fixture.tool,
+        "lines": len(fixture.lines),
+        "bytes": fixture.total_bytes,
+        "recorded_ms": fixture.duration_ms,
+        "speed": speed,
+        "repeat": repeat,
+        "successes": successes,
+        "wall_ms": {"mean": round(mean_wall, 2), "min": round(min(walls), 2), "max": round(max(walls), 2)},
+        "parse_ms_mean": round(mean_parse, 3),
+        "parse_max_us": round(parse_max_us, 2),
+        "parse_lines_per_s": round(len(fixture.lines) / (mean_parse / 1000), 1) if mean_parse else None,
+        "parse_mb_per_s": round(fixture.total_bytes / 2**20 / (mean_parse / 1000), 2) if mean_parse else None,
+    }
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay recorded backend streams through the runner and parsers")
+    parser.add_argument("paths", nargs="+", type=Path, help="fixture files or directories")
+    parser.add_argument("--speed", type=float, default=0.0, help="speed-up factor, 0 = as fast as possible")
+    parser.add_argument("--repeat", type=int, default=3, help="replays per fixture (default: 3)")
+    parser.add_argument("--output", type=Path, help="write the JSON result to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    fixtures = _fixture_paths(args.paths)
+    if not fixtures:
+        print("未找到录制文件", file=sys.stderr)
+        return 2
+
+    profiling.set_enabled(True)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ccg-replay-") as tmp:
+        root = Path(tmp)
+        os.environ["PATH"] = f"{root / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}"
+        os.environ.setdefault("CODER_API_TOKEN", "replay")
+        for path in fixtures:
+            results.append(replay_fixture(path.resolve(), args.speed, args.repeat, root))
+
+    text = json.dumps({"fixtures": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""后端内部工具调用跟踪模块
+
+跟踪 coder（stream-json 的 tool_use / tool_result）、codex（command_execution 等 item）
+和 gemini（tool_use / tool_result 事件）在一次运行中执行的内部工具调用，
+用于在超时等中断场景下告知调用方哪些动作已经完成。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from ccg_mcp.metrics import PhaseTimeline
+
+
+# 摘要中优先展示的输入字段（按顺序匹配）
+_SUMMARY_KEYS = ("command", "file_path", "path", "absolute_path", "pattern", "url", "query", "description")
+_SUMMARY_MAX_CHARS = 200
+
+
+def summarize_input(tool_input: Any) -> str:
+    """提取工具输入的简短摘要（如 Bash 命令、文件路径）"""
+    if isinstance(tool_input, dict):
+        for key in _SUMMARY_KEYS:
+            value = tool_input.get(key)
+            if isinstance(value, (str, list)) and value:
+                text = " ".join(str(v) for v in value) if isinstance(value, list) else value
+                return text[:_SUMMARY_MAX_CHARS]
+        for value in tool_input.values():
+            if isinstance(value, str) and value:
+                return value[:_SUMMARY_MAX_CHARS]
+        return ""
+    if isinstance(tool_input, str):
+        return tool_input[:_SUMMARY_MAX_CHARS]
+    return ""
+
+
+def payload_bytes(value: Any) -> Optional[int]:
+    """工具输入 / 输出的字节数（字符串按 UTF-8，其他按 JSON 序列化），无内容时返回 None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    try:
+        return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ToolActionTracker:
+    """内部工具调用跟踪器
+
+    按 id 配对工具调用的开始与结束事件，结束后记入已完成列表。
+    传入 timeline 时同时记录每次调用的起止时间、输入 / 输出字节数与错误标记。
+    """
+
+    def __init__(self, timeline: Optional[PhaseTimeline] = None) -> None:
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._completed: List[Dict[str, Any]] = []
+        self._timeline = timeline
+
+    def start(
+        self,
+        action_id: Optional[str],
+        name: str,
+        summary: str = "",
+        input_bytes: Optional[int] = None,
+    ) -> None:
+        """记录工具调用开始"""
+        if not action_id:
+            return
+        self._pending[action_id] = {"id": action_id, "name": name, "summary": summary}
+        if self._timeline is not None:
+            self._timeline.tool_use_start(action_id, name, summary, input_bytes)
+
+    def finish(
+        self,
+        action_id: Optional[str],
+        is_error: bool = False,
+        name: str = "",
+        summary: str = "",
+        output_bytes: Optional[int] = None,
+    ) -> None:
+        """记录工具调用结束
+
+        未见过开始事件的调用（如 codex 只输出 item.completed）直接按 name/summary 记录。
+        """
+        if not action_id:
+            return
+        action = self._pending.pop(action_id, None)
+        if action is None:
+            action = {"id": action_id, "name": name, "summary": summary}
+        action["is_error"] = is_error
+        self._completed.append(action)
+        if self._timeline is not None:
+            self._timeline.tool_use_end(
+                action_id, action["name"], action["summary"], is_error, output_bytes
+            )
+
+    def completed_actions(self) -> List[Dict[str, Any]]:
+        """已完成的工具调用列表（按完成顺序）"""
+        return [dict(action) for action in self._completed]
+
+    def pending_actions(self) -> List[Dict[str, Any]]:
+        """已开始但尚未结束的工具调用列表"""
+        return [dict(action) for action in self._pending.values()]
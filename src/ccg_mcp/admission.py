@@ -0,0 +1,230 @@
+"""调用准入控制
+
+服务器上所有客户端共享的每后端并发上限：同一时刻每个后端（coder / codex / gemini）最多执行
+max_concurrent 个调用，超出的调用按到达顺序排队，排队数达到 max_queue 时直接拒绝（error_kind 为 overloaded）。
+
+工具实现内部是同步的（逐行读取子进程输出、重试退避 sleep），获得准入后在工作线程中执行，
+不阻塞服务器事件循环：多个调用可以并行，initialize / tools/list 等请求也不会被长调用卡住。
+
+配置（[server]，见 config.get_server_settings）：
+
+    [server]
+    max_concurrent = 4                      # 每个后端的默认上限
+    max_concurrent_by_tool = { coder = 2 }  # 按后端覆盖
+    max_queue = 64                          # 每个后端的排队上限，0 表示不排队
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Deque, Dict, Optional, TypeVar
+
+from ccg_mcp import profiling
+
+TOOLS = ("coder", "codex", "gemini")
+
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MAX_QUEUE = 64
+
+# 排队已满时返回的 error_kind
+OVERLOADED = "overloaded"
+# 端到端截止时间内未获得执行名额时返回的 error_kind（与各工具的 deadline_exceeded 一致）
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+# 执行工具调用的工作线程名前缀
+WORKER_THREAD_PREFIX = "ccg-tool-"
+
+_T = TypeVar("_T")
+
+
+class AdmissionRejected(Exception):
+    """排队已满，调用被拒绝"""
+    pass
+
+
+class AdmissionTimeout(Exception):
+    """排队等待超过调用方的剩余时间预算"""
+    pass
+
+
+def _run_in_worker(factory: Callable[[], Coroutine[Any, Any, _T]]) -> _T:
+    """在工作线程的独立事件循环中运行 factory() 返回的协程（cProfile 开启时同时剖析本线程）"""
+    with profiling.profile_worker():
+        return asyncio.run(factory())
+
+
+class AdmissionController:
+    """每后端并发上限与排队
+
+    Args:
+        max_concurrent: 每个后端同时执行的调用数上限
+        limits: 按后端覆盖的上限（如 {"coder": 2}）
+        max_queue: 每个后端的排队上限
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        limits: Optional[Dict[str, int]] = None,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.limits = {tool: max(1, int(limit)) for tool, limit in (limits or {}).items()}
+        self.max_queue = max(0, int(max_queue))
+        self._active: Dict[str, int] = {}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._rejected: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def limit(self, tool: str) -> int:
+        return self.limits.get(tool, self.max_concurrent)
+
+    # ------------------------------------------------------------------
+    # 准入
+    # ------------------------------------------------------------------
+
+    async def acquire(self, tool: str, timeout: Optional[float] = None) -> None:
+        """获取一个执行名额，名额已满时排队等待
+
+        Args:
+            timeout: 最长等待秒数，None 表示不限制
+
+        Raises:
+            AdmissionRejected: 排队数已达上限
+            AdmissionTimeout: 等待超过 timeout
+        """
+        waiters = self._waiters.setdefault(tool, deque())
+        if self._active.get(tool, 0) < self.limit(tool) and not waiters:
+            self._active[tool] = self._active.get(tool, 0) + 1
+            return
+        if len(waiters) >= self.max_queue:
+            self._rejected[tool] = self._rejected.get(tool, 0) + 1
+            raise AdmissionRejected(
+                f"{tool} 并发已满（执行中 {self._active.get(tool, 0)}，排队 {len(waiters)}），请稍后重试"
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            if timeout is None:
+                await waiter
+            else:
+                # shield：超时时不取消 waiter，以便区分名额是否已在超时的同时移交给本调用
+                await asyncio.wait_for(asyncio.shield(waiter), max(0.0, timeout))
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已移交给本调用，但调用已被取消或超时：交还
+                self.release(tool)
+            else:
+                waiter.cancel()
+                waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise AdmissionTimeout(
+                f"{tool} 排队 {timeout:.0f}s 仍未获得执行名额（执行中 {self._active.get(tool, 0)}），已达到截止时间"
+            ) from None
+
+    def release(self, tool: str) -> None:
+        """交还名额：有排队时直接移交给队首，否则名额数减一"""
+        waiters = self._waiters.get(tool)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active[tool] = max(0, self._active.get(tool, 0) - 1)
+
+    async def call(
+        self,
+        tool: str,
+        factory: Callable[[], Coroutine[Any, Any, _T]],
+        timeout: Optional[float] = None,
+    ) -> _T:
+        """获得准入后在工作线程中执行 factory() 返回的协程（在该线程的独立事件循环中运行）
+
+        factory 在获得名额后才调用，可据此计算剩余的时间预算。timeout 为最长排队等待秒数。
+        工作线程继承调用方的上下文变量（如 runner.cancel_scope 的取消事件）：调用方被取消时，
+        由外层设置取消事件终止子进程（见 server._dispatch），名额在工作线程结束后交还。
+        """
+        await self.acquire(tool, timeout)
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            future: asyncio.Future[_T] = loop.run_in_executor(self._get_executor(), context.run, _run_in_worker, factory)
+        except BaseException:
+            self.release(tool)
+            raise
+        future.add_done_callback(lambda _: self.release(tool))
+        return await asyncio.shield(future)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # 名额总数即同时执行的上限，再留出未列出的工具名的余量
+            workers = sum(self.limit(tool) for tool in TOOLS) + self.max_concurrent
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=WORKER_THREAD_PREFIX)
+        return self._executor
+
+    def shutdown(self) -> None:
+        """关闭工作线程池（不等待执行中的调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # ------------------------------------------------------------------
+    # 状态（可能在指标导出线程中读取，先复制再遍历）
+    # ------------------------------------------------------------------
+
+    def active(self) -> Dict[str, int]:
+        """各后端执行中的调用数"""
+        return {tool: count for tool, count in list(self._active.items()) if count}
+
+    def queued(self) -> Dict[str, int]:
+        """各后端排队中的调用数"""
+        counts = {tool: sum(1 for w in list(waiters) if not w.done()) for tool, waiters in list(self._waiters.items())}
+        return {tool: count for tool, count in counts.items() if count}
+
+    def rejected(self) -> Dict[str, int]:
+        """各后端被拒绝的调用累计数"""
+        return dict(self._rejected)
+
+    def snapshot(self) -> Dict[str, Any]:
+        active, queued, rejected = self.active(), self.queued(), self.rejected()
+        return {
+            tool: {
+                "limit": self.limit(tool),
+                "active": active.get(tool, 0),
+                "queued": queued.get(tool, 0),
+                "rejected": rejected.get(tool, 0),
+            }
+            for tool in TOOLS
+        }
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """获取全局准入控制（首次调用时按 [server] 配置创建）"""
+    global _admission
+    if _admission is None:
+        from ccg_mcp.config import get_server_settings
+
+        settings = get_server_settings()
+        limits = settings.get("max_concurrent_by_tool")
+        _admission = AdmissionController(
+            max_concurrent=settings.get("max_concurrent", DEFAULT_MAX_CONCURRENT),
+            limits=limits if isinstance(limits, dict) else None,
+            max_queue=settings.get("max_queue", DEFAULT_MAX_QUEUE),
+        )
+    return _admission
+
+
+def set_admission(controller: Optional[AdmissionController]) -> None:
+    """替换全局准入控制（None 表示下次按配置重新创建，主要用于测试）"""
+    global _admission
+    if _admission is not None and _admission is not controller:
+        _admission.shutdown()
+    _admission = controller
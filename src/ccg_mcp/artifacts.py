@@ -0,0 +1,177 @@
+"""大结果按句柄返回（MCP 资源）
+
+coder / gemini 的 result 可达数百 KB，return_all_messages=True 时还会内联全部事件，
+宿主需要序列化整个响应并放入模型上下文。超过 inline_limit 字符的字段改为存放在服务端：
+
+- 响应中的 result / partial_result 只保留开头的预览，all_messages 移除
+- resources 字段给出各字段的资源 URI（ccg://artifacts/<id>）与大小（字符数、UTF-8 字节数、行数）
+- 调用方按需通过 read_artifact 工具分页读取，或直接读取 MCP 资源（完整内容）
+
+内容按 SHA-256 寻址（同一结果多次返回不重复存放），总大小超过上限时淘汰最久未读取的内容。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+URI_PREFIX = "ccg://artifacts/"
+
+# 超过此字符数的字段改为资源句柄（0 表示不转存）
+DEFAULT_INLINE_LIMIT = 32_000
+# 转存后响应中保留的预览字符数
+PREVIEW_CHARS = 2_000
+# 服务端保存的内容总字节数上限
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# read_artifact 默认与最大的单页字符数
+DEFAULT_PAGE_CHARS = 32_000
+MAX_PAGE_CHARS = 256_000
+
+# 可转存的文本字段
+TEXT_FIELDS = ("result", "partial_result")
+
+
+class Artifact:
+    """服务端保存的一段文本"""
+
+    def __init__(self, artifact_id: str, text: str, mime_type: str):
+        self.id = artifact_id
+        self.text = text
+        self.mime_type = mime_type
+        self.bytes = len(text.encode("utf-8", "surrogatepass"))
+
+    @property
+    def uri(self) -> str:
+        return URI_PREFIX + self.id
+
+    def handle(self) -> Dict[str, Any]:
+        """响应中引用本内容的句柄"""
+        return {
+            "uri": self.uri,
+            "mime_type": self.mime_type,
+            "chars": len(self.text),
+            "bytes": self.bytes,
+            "lines": self.text.count("\n") + 1 if self.text else 0,
+        }
+
+
+class ArtifactStore:
+    """内存中的内容存储（线程安全，按最近读取淘汰）
+
+    Args:
+        max_bytes: 保存内容的总字节数上限
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, Artifact]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, text: str, mime_type: str = "text/plain") -> Artifact:
+        """保存内容，返回其句柄对象（相同内容返回已有的）"""
+        artifact_id = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()[:24]
+        with self._lock:
+            artifact = self._items.get(artifact_id)
+            if artifact is None:
+                artifact = Artifact(artifact_id, text, mime_type)
+                self._items[artifact_id] = artifact
+                self._bytes += artifact.bytes
+            self._items.move_to_end(artifact_id)
+            # 至少保留刚存入的内容
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.bytes
+            return artifact
+
+    def get(self, uri_or_id: str) -> Optional[Artifact]:
+        """按 URI 或 id 查找（不存在或已淘汰时返回 None）"""
+        artifact_id = uri_or_id[len(URI_PREFIX):] if uri_or_id.startswith(URI_PREFIX) else uri_or_id
+        with self._lock:
+            artifact = self._items.get(artifact_id)
+            if artifact is not None:
+                self._items.move_to_end(artifact_id)
+            return artifact
+
+    def read(self, uri_or_id: str, offset: int = 0, limit: int = DEFAULT_PAGE_CHARS) -> Optional[Dict[str, Any]]:
+        """按字符区间读取 [offset, offset + limit)，内容不存在时返回 None"""
+        artifact = self.get(uri_or_id)
+        if artifact is None:
+            return None
+        offset = max(0, offset)
+        limit = min(max(1, limit), MAX_PAGE_CHARS)
+        end = min(offset + limit, len(artifact.text))
+        return {
+            **artifact.handle(),
+            "offset": offset,
+            "content": artifact.text[offset:end],
+            "next_offset": end if end < len(artifact.text) else None,
+        }
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"count": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def offload_result(result: Dict[str, Any], limit: Optional[int] = None) -> Dict[str, Any]:
+    """将工具返回值中超过 limit 字符的字段转存为资源，返回新的返回值（不修改原字典）
+
+    limit 默认读取 [server] inline_limit，0 表示不转存。
+    """
+    if limit is None:
+        limit = get_inline_limit()
+    if limit <= 0:
+        return result
+    store = get_artifact_store()
+    resources: Dict[str, Any] = {}
+    offloaded = dict(result)
+    for field in TEXT_FIELDS:
+        value = result.get(field)
+        if isinstance(value, str) and len(value) > limit:
+            resources[field] = store.put(value).handle()
+            offloaded[field] = value[:PREVIEW_CHARS] + f"\n\n…[已截断，完整内容（{len(value)} 字符）见 resources.{field}]"
+    messages = result.get("all_messages")
+    if isinstance(messages, list) and messages:
+        text = "\n".join(json.dumps(message, ensure_ascii=False, default=str) for message in messages)
+        if len(text) > limit:
+            resources["all_messages"] = store.put(text, "application/x-ndjson").handle()
+            del offloaded["all_messages"]
+    if not resources:
+        return result
+    offloaded["resources"] = resources
+    return offloaded
+
+
+_artifact_store: Optional[ArtifactStore] = None
+_inline_limit: Optional[int] = None
+
+
+def get_inline_limit() -> int:
+    """获取转存阈值（首次调用时读取 [server] inline_limit）"""
+    global _inline_limit
+    if _inline_limit is None:
+        from ccg_mcp.config import get_server_settings
+
+        _inline_limit = int(get_server_settings().get("inline_limit", DEFAULT_INLINE_LIMIT))
+    return _inline_limit
+
+
+def get_artifact_store() -> ArtifactStore:
+    """获取全局内容存储（首次调用时按 [server] artifact_max_mb 配置创建）"""
+    global _artifact_store
+    if _artifact_store is None:
+        from ccg_mcp.config import get_server_settings
+
+        max_mb = get_server_settings().get("artifact_max_mb")
+        _artifact_store = ArtifactStore(int(max_mb * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES)
+    return _artifact_store
+
+
+def set_artifact_store(store: Optional[ArtifactStore], inline_limit: Optional[int] = None) -> None:
+    """替换全局内容存储与转存阈值（None 表示下次按配置重新创建，主要用于测试）"""
+    global _artifact_store, _inline_limit
+    _artifact_store = store
+    _inline_limit = inline_limit
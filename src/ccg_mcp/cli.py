@@ -1,11 +1,88 @@
 """Console entry point for the CCG-MCP server."""
 
-from ccg_mcp.server import run
+from __future__ import annotations
 
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Optional
 
-def main() -> None:
-    """Start the CCG-MCP server."""
-    run()
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="ccg-mcp", description="CCG-MCP server")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="measure server cold start (imports, time to initialize) and print a JSON report",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement for --profile-startup")
+    parser.add_argument(
+        "--transport", choices=("stdio", "streamable-http"),
+        help="serve over stdio (default) or as a shared daemon over streamable HTTP",
+    )
+    parser.add_argument("--host", help="bind address for streamable HTTP (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="port for streamable HTTP (default: 8765)")
+    parser.add_argument("--socket", type=Path, help="serve streamable HTTP on this Unix socket instead of TCP")
+    subparsers = parser.add_subparsers(dest="command")
+
+    stats = subparsers.add_parser("stats", help="Summarize persisted call metrics of a project")
+    stats.add_argument("--cd", type=Path, default=Path.cwd(), help="project directory (default: cwd)")
+    stats.add_argument("--window", default="24h", help="time window, e.g. 30m, 24h, 7d (default: 24h)")
+    stats.add_argument("--tool", default="", help="only include this tool")
+    stats.add_argument("--model", default="", help="only include this model")
+
+    trace = subparsers.add_parser("trace", help="Render Chrome trace and OTLP JSON files of a trace")
+    trace.add_argument("trace_id", help="trace_id passed to the tool calls")
+    trace.add_argument("--cd", type=Path, default=Path.cwd(), help="project directory (default: cwd)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Start the CCG-MCP server, or run a subcommand."""
+    args = _build_parser().parse_args(argv)
+
+    if args.profile_startup:
+        from ccg_mcp.startup import profile_startup
+
+        try:
+            report = profile_startup(repeat=args.repeat)
+        except (RuntimeError, OSError, subprocess.SubprocessError) as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    if args.command == "stats":
+        from ccg_mcp.store import compute_stats
+
+        try:
+            result = compute_stats(args.cd, window=args.window, tool=args.tool, model=args.model)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(2)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    if args.command == "trace":
+        from ccg_mcp.tracing import parse_trace_context, render_trace
+
+        trace_id, _ = parse_trace_context(args.trace_id)
+        try:
+            chrome_path, otlp_path = render_trace(args.cd, trace_id)
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps({"chrome": str(chrome_path), "otlp": str(otlp_path)}, ensure_ascii=False, indent=2))
+        return
+
+    from ccg_mcp.server import run
+
+    try:
+        run(transport=args.transport, host=args.host, port=args.port, socket=args.socket)
+    except (RuntimeError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""客户端隔离
+
+守护进程模式（streamable HTTP / Unix socket）下多个客户端共享一个服务器，这里隔离各客户端的会话与工作目录：
+
+- 会话归属：后端会话（SESSION_ID）归创建它的客户端（MCP 会话）所有，其他客户端续接时被拒绝；
+  所属客户端断开（其 MCP 会话对象被回收）后可被接管
+- 工作目录：守护进程的当前目录与客户端无关，cd 必须为绝对路径；配置了 allowed_roots 时 cd 必须位于其中之一
+
+stdio 模式下只有一个客户端，会话归属检查总是通过，相对路径的 cd 按服务器（即客户端）的当前目录解析。
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# 返回的 error_kind
+SESSION_FORBIDDEN = "session_forbidden"
+INVALID_CD = "invalid_cd"
+
+# 记录归属的会话数上限（超出时淘汰最久未使用的）
+MAX_OWNED_SESSIONS = 10_000
+
+
+class ClientRegistry:
+    """会话归属与工作目录检查
+
+    Args:
+        allowed_roots: 允许的工作目录根（为空表示不限制）
+        require_absolute_cd: 是否要求 cd 为绝对路径（守护进程模式）
+        max_sessions: 记录归属的会话数上限
+    """
+
+    def __init__(
+        self,
+        allowed_roots: Optional[Iterable[Path]] = None,
+        require_absolute_cd: bool = False,
+        max_sessions: int = MAX_OWNED_SESSIONS,
+    ):
+        self.allowed_roots = [Path(root).expanduser().resolve() for root in (allowed_roots or [])]
+        self.require_absolute_cd = require_absolute_cd
+        self.max_sessions = max_sessions
+        # (工具, 会话 ID) -> 所属客户端的弱引用
+        self._owners: "OrderedDict[Tuple[str, str], weakref.ref]" = OrderedDict()
+        self._clients: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def check_cd(self, cd: Path) -> Optional[str]:
+        """检查工作目录，不允许时返回错误信息"""
+        cd = Path(cd).expanduser()
+        if self.require_absolute_cd and not cd.is_absolute():
+            return f"守护进程模式下 cd 必须为绝对路径：{cd}"
+        if self.allowed_roots:
+            resolved = cd.resolve()
+            if not any(resolved == root or root in resolved.parents for root in self.allowed_roots):
+                roots = ", ".join(str(root) for root in self.allowed_roots)
+                return f"工作目录不在允许的范围内（allowed_roots: {roots}）：{resolved}"
+        return None
+
+    def check_session(self, client: Any, tool: str, session_id: str) -> Optional[str]:
+        """检查客户端能否续接会话，不允许时返回错误信息"""
+        if client is None or not session_id:
+            return None
+        self.connect(client)
+        with self._lock:
+            ref = self._owners.get((tool, session_id))
+            owner = ref() if ref is not None else None
+        if owner is None or owner is client:
+            return None
+        return f"{tool} 会话 {session_id} 属于另一个客户端，不能续接"
+
+    def claim(self, client: Any, tool: str, session_id: Optional[str]) -> None:
+        """记录会话归属（已属于其他在线客户端的会话不变）"""
+        if client is None or not session_id:
+            return
+        self.connect(client)
+        key = (tool, str(session_id))
+        with self._lock:
+            ref = self._owners.get(key)
+            owner = ref() if ref is not None else None
+            if owner is None:
+                self._owners[key] = weakref.ref(client)
+            elif owner is not client:
+                return
+            self._owners.move_to_end(key)
+            while len(self._owners) > self.max_sessions:
+                self._owners.popitem(last=False)
+
+    def connect(self, client: Any) -> None:
+        """记录一个客户端（断开后自动移除）"""
+        with self._lock:
+            self._clients.add(client)
+
+    def connected_clients(self) -> int:
+        """当前在线的客户端数"""
+        with self._lock:
+            return len(self._clients)
+
+    def owned_sessions(self) -> Dict[str, int]:
+        """各工具中所属客户端仍在线的会话数"""
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for (tool, _), ref in self._owners.items():
+                if ref() is not None:
+                    counts[tool] = counts.get(tool, 0) + 1
+        return counts
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "connected_clients": self.connected_clients(),
+            "owned_sessions": self.owned_sessions(),
+            "allowed_roots": [str(root) for root in self.allowed_roots],
+            "require_absolute_cd": self.require_absolute_cd,
+        }
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取全局客户端注册表（首次调用时按 [server] allowed_roots 创建）"""
+    global _registry
+    if _registry is None:
+        from ccg_mcp.config import get_server_settings
+
+        roots = get_server_settings().get("allowed_roots") or []
+        _registry = ClientRegistry(allowed_roots=[Path(str(root)) for root in roots])
+    return _registry
+
+
+def set_client_registry(registry: Optional[ClientRegistry]) -> None:
+    """替换全局客户端注册表（None 表示下次按配置重新创建，主要用于测试）"""
+    global _registry
+    _registry = registry
+
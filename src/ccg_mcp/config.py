@@ -161,7 +161,91 @@ def get_config() -> dict[str, Any]:
     return _config_cache
 
 
+# 价格表缓存
+_price_table_cache: dict[str, dict[str, float]] | None = None
+
+
+def get_price_table() -> dict[str, dict[str, float]]:
+    """获取模型价格表（带缓存）
+
+    读取配置文件中的 [pricing.<模型名或工具名>]，单位：美元 / 百万 token，例如：
+
+        [pricing."glm-4.7"]
+        input = 0.6
+        output = 2.2
+        cache_read = 0.11
+
+    与 Coder 配置无关，codex / gemini 单独使用时也可配置；未配置或加载失败时返回空字典。
+    """
+    global _price_table_cache
+
+    if _price_table_cache is None:
+        try:
+            pricing = load_config().get("pricing", {})
+        except ConfigError:
+            pricing = {}
+        _price_table_cache = {
+            str(model): {key: float(value) for key, value in price.items() if isinstance(value, (int, float))}
+            for model, price in pricing.items()
+            if isinstance(price, dict)
+        }
+
+    return _price_table_cache
+
+
+def get_metrics_settings() -> dict[str, Any]:
+    """获取指标导出配置（[metrics]）
+
+    例如：
+
+        [metrics]
+        prometheus_port = 9464        # 本地 /metrics HTTP 端点
+        prometheus_host = "127.0.0.1"
+        textfile = "/var/lib/node_exporter/textfile/ccg_mcp.prom"
+        textfile_interval = 15
+        profiling = true              # 服务端开销剖析（见 profiling 模块）
+        record_dir = "~/ccg-streams"  # 录制后端输出流（见 recording 模块）
+
+    与 Coder 配置无关，未配置或加载失败时返回空字典。
+    """
+    try:
+        metrics = load_config().get("metrics", {})
+    except ConfigError:
+        return {}
+    return dict(metrics) if isinstance(metrics, dict) else {}
+
+
+def get_server_settings() -> dict[str, Any]:
+    """获取服务器配置（[server]）
+
+    例如：
+
+        [server]
+        transport = "streamable-http"           # stdio（默认）/ streamable-http
+        host = "127.0.0.1"
+        port = 8765
+        socket = "~/.ccg-mcp/ccg-mcp.sock"      # 设置后在 Unix socket 上提供 streamable HTTP
+        max_concurrent = 4                      # 每个后端同时执行的调用数上限（见 admission 模块）
+        max_concurrent_by_tool = { coder = 2 }
+        max_queue = 64
+        allowed_roots = ["~/work"]              # 允许的工作目录根（见 clients 模块）
+        max_jobs = 64                           # 未结束的后台任务数上限（见 jobs 模块）
+        max_finished_jobs = 200
+        job_store = ".ccg/jobs.sqlite3"         # 后台任务持久化（见 jobstore 模块），"" 表示不持久化
+        inline_limit = 32000                    # 超过此字符数的结果按资源句柄返回（见 artifacts 模块），0 表示始终内联
+        artifact_max_mb = 64
+
+    与 Coder 配置无关，未配置或加载失败时返回空字典。
+    """
+    try:
+        server = load_config().get("server", {})
+    except ConfigError:
+        return {}
+    return dict(server) if isinstance(server, dict) else {}
+
+
 def reset_config_cache() -> None:
     """重置配置缓存（主要用于测试）"""
-    global _config_cache
+    global _config_cache, _price_table_cache
     _config_cache = None
+    _price_table_cache = None
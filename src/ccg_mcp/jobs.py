@@ -0,0 +1,406 @@
+"""异步任务（submit_job / job_status / job_result / cancel_job）
+
+长时间运行的 coder / codex / gemini 调用（最长 30 分钟）常常超过 MCP 客户端的请求超时，
+请求断开后结果随之丢失。任务 API 将调用放到后台执行，调用方提交后立即拿到 job_id，
+之后查询状态、等待或取回结果，期间可以并行提交多个任务或处理其他工作。
+
+- 任务在服务器事件循环上调度，经准入控制（见 admission 模块）在工作线程中执行
+- 取消：排队中的任务直接移出队列，执行中的任务终止其子进程（见 runner.cancel_scope）
+- 任务归提交它的客户端所有（同 clients 模块的会话归属），所属客户端断开后可被其他客户端取回
+- 已结束的任务保留最近 max_finished 个，执行中与排队的任务数不超过 max_active
+- 任务写入本地 SQLite 队列（见 jobstore 模块），服务器重启后恢复：已捕获会话 ID 的任务续接原会话
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from ccg_mcp.jobstore import JobStore
+
+# 任务状态
+QUEUED = "queued"  # 等待准入
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+DEFAULT_MAX_ACTIVE = 64
+DEFAULT_MAX_FINISHED = 200
+
+# 状态中展示的 prompt 前缀长度
+PROMPT_PREVIEW_CHARS = 120
+
+# 持久化的输出尾部行数与执行中写入的最小间隔（秒）
+OUTPUT_TAIL_LINES = 50
+PROGRESS_SAVE_INTERVAL = 2.0
+
+# 同一任务因服务器重启被恢复的次数上限（避免反复崩溃的任务无限重跑）
+MAX_RECOVERIES = 2
+
+# 无法恢复的中断任务的 error_kind
+INTERRUPTED = "interrupted"
+
+
+class JobLimitError(Exception):
+    """执行中的任务数已达上限"""
+    pass
+
+
+class Job:
+    """一个后台任务"""
+
+    def __init__(self, tool: str, prompt: str, cd: str, owner: Any = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex[:16]
+        self.tool = tool
+        self.prompt_preview = prompt[:PROMPT_PREVIEW_CHARS]
+        self.cd = cd
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.session_id: Optional[str] = None  # 执行中从输出捕获的会话 ID
+        self.recoveries = 0  # 因服务器重启被恢复的次数
+        self.cancel_event = threading.Event()
+        self._owner = weakref.ref(owner) if owner is not None else None
+        self._done: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._store: Optional["JobStore"] = None
+        self._output: "deque[str]" = deque(maxlen=OUTPUT_TAIL_LINES)
+        self._last_save = 0.0
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Job":
+        """由任务队列中的记录重建任务（不含归属）"""
+        job = cls(record["tool"], record["prompt"], record["cd"], job_id=record["id"])
+        job.status = record["status"]
+        job.created_at = record["created_at"]
+        job.started_at = record["started_at"]
+        job.finished_at = record["finished_at"]
+        job.result = record["result"]
+        job.error = record["error"]
+        job.session_id = record["session_id"]
+        job.recoveries = record["recoveries"]
+        if record["output_tail"]:
+            job._output.extend(record["output_tail"].splitlines())
+        return job
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def owned_by(self, client: Any) -> bool:
+        """client 能否访问本任务（未记录归属、所属客户端已断开或为同一客户端时可以）"""
+        if self._owner is None or client is None:
+            return True
+        owner = self._owner()
+        return owner is None or owner is client
+
+    def mark_running(self) -> None:
+        """获得准入、开始执行（在工作线程中调用）"""
+        self.started_at = time.time()
+        self.status = RUNNING
+        if self._store is not None:
+            self._store.save(self)
+
+    def observe(self, line: str) -> None:
+        """记录一行 CLI 输出（在读取线程中调用，见 runner.observe_output）
+
+        首次捕获会话 ID 时立即持久化，其余输出按 PROGRESS_SAVE_INTERVAL 节流写入。
+        """
+        self._output.append(line)
+        captured = False
+        if self.session_id is None:
+            self.session_id = _session_from_line(line)
+            captured = self.session_id is not None
+        now = time.monotonic()
+        if self._store is not None and (captured or now - self._last_save >= PROGRESS_SAVE_INTERVAL):
+            self._last_save = now
+            self._store.save_progress(self)
+
+    def output_tail(self) -> str:
+        """最近的输出行"""
+        return "\n".join(self._output)
+
+    def elapsed_s(self) -> float:
+        end = self.finished_at or time.time()
+        return round(end - (self.started_at or self.created_at), 3)
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "job_id": self.id,
+            "tool": self.tool,
+            "status": self.status,
+            "prompt": self.prompt_preview,
+            "cd": self.cd,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_s": self.elapsed_s(),
+        }
+        session_id = (self.result or {}).get("SESSION_ID") or self.session_id
+        if session_id:
+            info["SESSION_ID"] = session_id
+        if self.result is not None and self.result.get("error_kind"):
+            info["error_kind"] = self.result["error_kind"]
+        if self.recoveries:
+            info["recoveries"] = self.recoveries
+        if self.error:
+            info["error"] = self.error
+        if include_result and self.result is not None:
+            info["result"] = self.result
+        return info
+
+
+def _session_from_line(line: str) -> Optional[str]:
+    """从一行 JSON 输出中提取会话 ID（coder / gemini 的 session_id，codex 的 thread_id）"""
+    if '"session_id"' not in line and '"thread_id"' not in line:
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    value = data.get("session_id") or data.get("thread_id")
+    return str(value) if value else None
+
+
+def plan_recovery(record: Dict[str, Any]) -> Tuple[Optional[Tuple[str, Dict[str, Any]]], str]:
+    """决定如何恢复一个被中断的任务
+
+    Returns:
+        ((prompt, arguments), "") 表示按此参数重新提交；(None, 原因) 表示无法安全恢复
+    """
+    tool = record["tool"]
+    arguments = dict(record["arguments"])
+    if record["recoveries"] >= MAX_RECOVERIES:
+        return None, f"任务已因服务器重启恢复 {record['recoveries']} 次，不再自动恢复"
+    if record["session_id"] and record["status"] == RUNNING:
+        # 已捕获会话 ID：续接原会话，只需一轮续接
+        from ccg_mcp.retry import RESUME_PROMPT
+
+        arguments["SESSION_ID"] = record["session_id"]
+        return (RESUME_PROMPT, arguments), ""
+    if record["status"] == RUNNING and tool == "coder":
+        # Coder 有写入副作用，未捕获会话 ID 时不从头重跑
+        return None, "coder 任务执行中服务器已退出，且未捕获会话 ID，无法续接；请检查工作区后重新提交"
+    return (record["prompt"], arguments), ""
+
+
+class JobTable:
+    """进程内任务表
+
+    Args:
+        max_active: 排队与执行中的任务数上限
+        max_finished: 保留的已结束任务数（超出时淘汰最早结束的）
+        store: 可选的任务队列，任务的提交、状态变化与输出写入其中（见 jobstore 模块）
+    """
+
+    def __init__(
+        self,
+        max_active: int = DEFAULT_MAX_ACTIVE,
+        max_finished: int = DEFAULT_MAX_FINISHED,
+        store: Optional["JobStore"] = None,
+    ):
+        self.max_active = max_active
+        self.max_finished = max_finished
+        self.store = store
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def submit(
+        self,
+        tool: str,
+        prompt: str,
+        cd: str,
+        run: Callable[[Job], Awaitable[Dict[str, Any]]],
+        owner: Any = None,
+        arguments: Optional[Dict[str, Any]] = None,
+        record: Optional[Dict[str, Any]] = None,
+    ) -> Job:
+        """创建任务并在当前事件循环上后台执行 run(job)
+
+        run 应在获得准入、开始执行时调用 job.mark_running()，在 runner.cancel_scope(job.cancel_event)
+        与 runner.observe_output(job.observe) 内执行调用。prompt / arguments 为持久化的原始参数；
+        record 为恢复的任务队列记录，沿用其 job_id 与已捕获的会话 ID。
+
+        Raises:
+            JobLimitError: 排队与执行中的任务数已达上限
+        """
+        active = sum(1 for job in self._jobs.values() if not job.finished)
+        if active >= self.max_active:
+            raise JobLimitError(f"未完成的任务数已达上限（{self.max_active}），请等待已有任务结束或取消部分任务")
+        job = Job(tool, prompt, cd, owner, job_id=record["id"] if record else None)
+        if record is not None:
+            job.created_at = record["created_at"]
+            job.session_id = record["session_id"]
+            job.recoveries = record["recoveries"] + 1
+            job._output.extend((record["output_tail"] or "").splitlines())
+        job._done = asyncio.Event()
+        self._jobs[job.id] = job
+        if self.store is not None:
+            job._store = self.store
+            self.store.add(job, prompt, arguments or {})
+        job._task = asyncio.get_running_loop().create_task(self._execute(job, run))
+        return job
+
+    def restore(self, job: Job) -> None:
+        """加入从任务队列载入的已结束任务（不会再执行）"""
+        self._jobs[job.id] = job
+        job._store = self.store
+        if self.store is not None:
+            self.store.save(job)
+        self._evict()
+
+    def load_finished(self) -> int:
+        """从任务队列载入最近结束的任务，返回载入数"""
+        if self.store is None:
+            return 0
+        records = self.store.finished(self.max_finished)
+        for record in records:
+            self._jobs.setdefault(record["id"], Job.from_record(record))
+        return len(records)
+
+    async def _execute(self, job: Job, run: Callable[[Job], Awaitable[Dict[str, Any]]]) -> None:
+        try:
+            job.result = await run(job)
+            if job.result.get("success"):
+                job.status = SUCCEEDED
+            elif job.cancel_event.is_set():
+                job.status = CANCELLED
+            else:
+                job.status = FAILED
+        except asyncio.CancelledError:
+            if not job.cancel_event.is_set():
+                # 服务器退出（事件循环关闭时取消所有任务）：终止子进程，
+                # 任务队列中的记录保持未结束，重启后恢复
+                job._store = None
+                job.cancel_event.set()
+                raise
+            job.status = CANCELLED
+        except Exception as e:  # 工具实现自身的异常不能让任务停留在执行中
+            job.status = FAILED
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+            if job._store is not None:
+                job._store.save(job)
+            assert job._done is not None
+            job._done.set()
+            self._evict()
+
+    def _evict(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.finished_at or 0)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+        if self.store is not None:
+            self.store.prune(self.max_finished)
+
+    def recover(self, launch: Callable[[Dict[str, Any], str, Dict[str, Any]], Job]) -> List[Job]:
+        """载入最近结束的任务，并接管上次运行中断的任务（需在事件循环中调用）
+
+        可恢复的任务经 launch(record, prompt, arguments) 重新提交（见 plan_recovery），
+        其余记为失败（error_kind = "interrupted"，附带已捕获的会话 ID 与输出尾部）。返回接管的任务。
+        """
+        if self.store is None:
+            return []
+        self.load_finished()
+        recovered = []
+        for record in self.store.claim_interrupted():
+            plan, reason = plan_recovery(record)
+            if plan is not None:
+                try:
+                    recovered.append(launch(record, *plan))
+                    continue
+                except JobLimitError as e:
+                    reason = str(e)
+            job = Job.from_record(record)
+            job.status = FAILED
+            job.finished_at = time.time()
+            job.result = {
+                "success": False,
+                "tool": job.tool,
+                "error": f"服务器重启，任务已中断：{reason}",
+                "error_kind": INTERRUPTED,
+                "SESSION_ID": job.session_id,
+                "partial_output": job.output_tail(),
+            }
+            self.restore(job)
+            recovered.append(job)
+        return recovered
+
+    def get(self, job_id: str, client: Any = None) -> Optional[Job]:
+        """查找任务（不存在或属于其他在线客户端时返回 None）"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.owned_by(client):
+            return None
+        return job
+
+    def list(self, client: Any = None) -> List[Job]:
+        """client 可访问的任务（按提交顺序）"""
+        return [job for job in self._jobs.values() if job.owned_by(client)]
+
+    def cancel(self, job: Job) -> bool:
+        """取消任务；已结束的任务返回 False"""
+        if job.finished:
+            return False
+        job.cancel_event.set()
+        if job.status == QUEUED and job._task is not None:
+            # 仍在等待准入：直接取消调度（执行中的任务由 runner 终止子进程后自行结束）
+            job._task.cancel()
+        return True
+
+    async def wait(self, job: Job, timeout: float) -> bool:
+        """等待任务结束，最多 timeout 秒；返回是否已结束"""
+        if job.finished or timeout <= 0:
+            return job.finished
+        assert job._done is not None
+        try:
+            await asyncio.wait_for(job._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job.finished
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        counts: Dict[str, int] = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+_job_table: Optional[JobTable] = None
+
+
+def get_job_table() -> JobTable:
+    """获取全局任务表（首次调用时按 [server] 配置创建）"""
+    global _job_table
+    if _job_table is None:
+        from ccg_mcp.config import get_server_settings
+        from ccg_mcp.jobstore import get_job_store
+
+        settings = get_server_settings()
+        _job_table = JobTable(
+            max_active=settings.get("max_jobs", DEFAULT_MAX_ACTIVE),
+            max_finished=settings.get("max_finished_jobs", DEFAULT_MAX_FINISHED),
+            store=get_job_store(),
+        )
+    return _job_table
+
+
+def set_job_table(table: Optional[JobTable]) -> None:
+    """替换全局任务表（None 表示下次按配置重新创建，主要用于测试）"""
+    global _job_table
+    _job_table = table
@@ -0,0 +1,257 @@
+"""任务持久化（SQLite 任务队列）
+
+后台任务（见 jobs 模块）的参数、状态、执行中捕获的会话 ID 与输出尾部写入本地 SQLite，
+默认位于服务器工作目录下的 `.ccg/jobs.sqlite3`。服务器进程退出（客户端重启、崩溃）后重新启动时：
+
+- 已结束的任务重新载入，仍可通过 job_result 取回
+- 未结束的任务按原 job_id 重新提交（见 jobs.plan_recovery）：已捕获会话 ID 的任务续接原会话，
+  只需一轮续接而不必从头重跑
+- 多个服务器共用同一队列时，只接管所属进程已退出的任务
+
+写入失败静默忽略，不影响任务执行。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    cd TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    session_id TEXT,
+    output_tail TEXT,
+    result TEXT,
+    error TEXT,
+    recoveries INTEGER NOT NULL DEFAULT 0,
+    server_id TEXT NOT NULL,
+    pid INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at);
+"""
+
+# 与 jobs 模块的状态取值一致
+_ACTIVE_STATES = ("queued", "running")
+
+# 本进程的标识（PID 可能被复用，如容器中总为同一 PID）
+SERVER_ID = uuid.uuid4().hex
+
+
+def get_job_store_path() -> Path:
+    """获取默认任务队列路径（服务器工作目录下的 .ccg/jobs.sqlite3）"""
+    return Path(".ccg") / "jobs.sqlite3"
+
+
+def _pid_alive(pid: int) -> bool:
+    """进程是否仍在运行
+
+    无法确定时视为仍在运行：误判为已退出会让其他服务器接管并重跑存活服务器的任务（coder 有写入副作用）。
+    """
+    if sys.platform == "win32":
+        return _windows_pid_alive(pid)
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+if sys.platform == "win32":
+    import ctypes
+
+    _PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    _STILL_ACTIVE = 259
+    _ERROR_INVALID_PARAMETER = 87
+
+    def _windows_pid_alive(pid: int) -> bool:
+        """Windows 下通过 OpenProcess / GetExitCodeProcess 探测（os.kill 会终止进程，不能用于探测）"""
+        try:
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+            if not handle:
+                # 进程不存在时为 ERROR_INVALID_PARAMETER；拒绝访问等说明进程存在
+                return ctypes.get_last_error() != _ERROR_INVALID_PARAMETER
+            try:
+                code = ctypes.c_ulong()
+                if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                    return True
+                return code.value == _STILL_ACTIVE
+            finally:
+                kernel32.CloseHandle(handle)
+        except OSError:
+            return True
+
+
+class JobStore:
+    """SQLite 任务队列
+
+    所有方法线程安全（任务状态在事件循环与工作线程中更新），数据库在首次使用时打开。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or get_job_store_path()).expanduser().absolute()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """打开数据库（调用方需持有锁），失败后不再重试"""
+        if self._conn is None and not self._broken:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False, isolation_level=None)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                self._conn = conn
+            except (sqlite3.Error, OSError):
+                self._broken = True
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Cursor]:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                return conn.execute(sql, params)
+            except sqlite3.Error:
+                return None
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._conn is None and not self.path.exists():
+                return []  # 尚未提交过任务：不为读取创建数据库
+            conn = self._connect()
+            if conn is None:
+                return []
+            try:
+                return [_decode(row) for row in conn.execute(sql, params).fetchall()]
+            except sqlite3.Error:
+                return []
+
+    def add(self, job: Any, prompt: str, arguments: Dict[str, Any]) -> None:
+        """记录新提交（或恢复后重新提交）的任务，prompt / arguments 为提交时的原始参数"""
+        self._execute(
+            "INSERT OR REPLACE INTO jobs (id, tool, prompt, cd, arguments, status, created_at, session_id,"
+            " recoveries, server_id, pid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.tool, prompt, job.cd, json.dumps(arguments, ensure_ascii=False, default=str),
+             job.status, job.created_at, job.session_id, job.recoveries, SERVER_ID, os.getpid()),
+        )
+
+    def save(self, job: Any) -> None:
+        """更新任务状态、会话 ID、输出尾部与结果"""
+        result = json.dumps(job.result, ensure_ascii=False, default=str) if job.result is not None else None
+        self._execute(
+            "UPDATE jobs SET status = ?, started_at = ?, finished_at = ?, session_id = ?, output_tail = ?,"
+            " result = ?, error = ? WHERE id = ?",
+            (job.status, job.started_at, job.finished_at, job.session_id, job.output_tail(),
+             result, job.error, job.id),
+        )
+
+    def save_progress(self, job: Any) -> None:
+        """执行中更新会话 ID 与输出尾部"""
+        self._execute(
+            "UPDATE jobs SET session_id = ?, output_tail = ? WHERE id = ?",
+            (job.session_id, job.output_tail(), job.id),
+        )
+
+    def finished(self, limit: int) -> List[Dict[str, Any]]:
+        """最近结束的 limit 个任务（按结束时间升序）"""
+        rows = self._query(
+            "SELECT * FROM jobs WHERE status NOT IN (?, ?) ORDER BY finished_at DESC LIMIT ?",
+            (*_ACTIVE_STATES, limit),
+        )
+        return rows[::-1]
+
+    def claim_interrupted(self) -> List[Dict[str, Any]]:
+        """接管所属服务器进程已退出的未结束任务（按提交顺序）
+
+        每条记录只会被一个服务器接管：接管时以原 server_id 为条件更新为本进程。
+        """
+        claimed = []
+        rows = self._query("SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", _ACTIVE_STATES)
+        for row in rows:
+            if row["server_id"] == SERVER_ID:
+                continue
+            if row["pid"] != os.getpid() and _pid_alive(row["pid"]):
+                continue  # 其他仍在运行的服务器的任务
+            cursor = self._execute(
+                "UPDATE jobs SET server_id = ?, pid = ? WHERE id = ? AND server_id = ?",
+                (SERVER_ID, os.getpid(), row["id"], row["server_id"]),
+            )
+            if cursor is not None and cursor.rowcount == 1:
+                claimed.append(row)
+        return claimed
+
+    def prune(self, keep: int) -> None:
+        """只保留最近结束的 keep 个任务"""
+        self._execute(
+            "DELETE FROM jobs WHERE status NOT IN (?, ?) AND id NOT IN"
+            " (SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY finished_at DESC LIMIT ?)",
+            (*_ACTIVE_STATES, *_ACTIVE_STATES, keep),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    record = dict(row)
+    for key in ("arguments", "result"):
+        if record.get(key) is not None:
+            try:
+                record[key] = json.loads(record[key])
+            except ValueError:
+                record[key] = None
+    if not isinstance(record.get("arguments"), dict):
+        record["arguments"] = {}
+    return record
+
+
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> Optional[JobStore]:
+    """获取全局任务队列（首次调用时按 [server] job_store 配置创建，配置为空字符串时不持久化）"""
+    global _job_store
+    if _job_store is None:
+        from ccg_mcp.config import get_server_settings
+
+        path = get_server_settings().get("job_store")
+        if path == "":
+            return None
+        _job_store = JobStore(Path(path) if path else None)
+    return _job_store
+
+
+def set_job_store(store: Optional[JobStore]) -> None:
+    """替换全局任务队列（None 表示下次按配置重新创建，主要用于测试）"""
+    global _job_store
+    if _job_store is not None and _job_store is not store:
+        _job_store.close()
+    _job_store = store
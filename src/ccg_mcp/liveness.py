@@ -0,0 +1,160 @@
+"""子进程活动监测模块
+
+空闲超时只统计 stdout 输出时，静默运行长测试套件的后端会被误判为空闲。
+本模块通过 /proc 读取子进程树（含同进程组与所有后代进程）的 CPU 时间与 I/O 计数，
+将真实的计算或读写视为活动；完全阻塞、没有任何 CPU / I/O 的真正卡死仍会触发空闲超时。
+
+仅在提供 /proc 的平台（Linux）上生效，其他平台自动降级为只看 stdout。
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_PROC = "/proc"
+
+
+class LivenessSignal:
+    """活动信号类型枚举"""
+    CPU = "cpu"  # 进程树消耗了 CPU 时间
+    IO = "io"  # 进程树发生了读写
+
+
+def _clock_ticks() -> int:
+    try:
+        return os.sysconf("SC_CLK_TCK")
+    except (AttributeError, ValueError, OSError):
+        return 100
+
+
+_CLK_TCK = _clock_ticks()
+
+
+def _read_stat(pid: int) -> Optional[Tuple[int, int, float]]:
+    """读取 /proc/<pid>/stat，返回 (ppid, pgrp, CPU 秒数)
+
+    CPU 秒数包含 utime + stime + cutime + cstime：已退出并被回收的子进程时间会
+    转入父进程的 cutime/cstime，因此进程树总量在子进程退出时保持连续。
+    """
+    try:
+        with open(f"{_PROC}/{pid}/stat", "rb") as f:
+            data = f.read().decode("ascii", "replace")
+    except OSError:
+        return None
+    # comm 字段可能含空格和括号，从最后一个 ')' 之后开始解析
+    fields = data[data.rfind(")") + 2:].split()
+    try:
+        ppid = int(fields[1])
+        pgrp = int(fields[2])
+        ticks = int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+    except (IndexError, ValueError):
+        return None
+    return ppid, pgrp, ticks / _CLK_TCK
+
+
+def _read_io_bytes(pid: int) -> int:
+    """读取 /proc/<pid>/io 中的 rchar + wchar（无权限或不存在时返回 0）"""
+    total = 0
+    try:
+        with open(f"{_PROC}/{pid}/io", "rb") as f:
+            for raw in f:
+                key, _, value = raw.decode("ascii", "replace").partition(":")
+                if key in ("rchar", "wchar"):
+                    total += int(value.strip() or 0)
+    except (OSError, ValueError):
+        return 0
+    return total
+
+
+def _all_pids() -> Iterable[int]:
+    try:
+        entries = os.listdir(_PROC)
+    except OSError:
+        return []
+    return (int(name) for name in entries if name.isdigit())
+
+
+def process_tree(root_pid: int) -> Dict[int, float]:
+    """获取进程树中每个进程的 CPU 秒数
+
+    进程树 = root 本身 + 所有后代进程 + 与 root 同进程组的进程
+    （root 以新会话启动时，进程组即其 pid）。
+
+    Returns:
+        {pid: CPU 秒数}，root 不存在时返回空字典
+    """
+    stats: Dict[int, Tuple[int, int, float]] = {}
+    for pid in _all_pids():
+        stat = _read_stat(pid)
+        if stat is not None:
+            stats[pid] = stat
+    if root_pid not in stats:
+        return {}
+
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+
+    tree: Set[int] = {pid for pid, (_, pgrp, _) in stats.items() if pgrp == root_pid}
+    tree.add(root_pid)
+    stack = list(tree)
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in tree:
+                tree.add(child)
+                stack.append(child)
+    return {pid: stats[pid][2] for pid in tree}
+
+
+class ProcessActivityMonitor:
+    """子进程树活动监测器
+
+    用法:
+        monitor = ProcessActivityMonitor(process.pid)
+        ...
+        signal = monitor.poll()  # 自上次采样以来有 CPU / I/O 活动时返回信号类型
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        min_cpu_s: float = 0.1,
+        min_io_bytes: int = 64 * 1024,
+    ):
+        self.pid = pid
+        self.min_cpu_s = min_cpu_s  # 两次采样间至少消耗的 CPU 秒数
+        self.min_io_bytes = min_io_bytes  # 两次采样间至少读写的字节数
+        self.available = os.path.isdir(f"{_PROC}/{pid}")
+        self._last: Optional[Tuple[float, int]] = None
+
+    def sample(self) -> Optional[Tuple[float, int]]:
+        """采样进程树的 (CPU 秒数, I/O 字节数) 总量"""
+        if not self.available:
+            return None
+        tree = process_tree(self.pid)
+        if not tree:
+            return None
+        cpu = sum(tree.values())
+        io = sum(_read_io_bytes(pid) for pid in tree)
+        return cpu, io
+
+    def poll(self) -> Optional[str]:
+        """检查自上次采样以来是否有活动
+
+        首次调用只建立基线并返回 None。
+
+        Returns:
+            LivenessSignal.CPU / LivenessSignal.IO，无活动时返回 None
+        """
+        current = self.sample()
+        if current is None:
+            return None
+        previous, self._last = self._last, current
+        if previous is None:
+            return None
+        if current[0] - previous[0] >= self.min_cpu_s:
+            return LivenessSignal.CPU
+        if current[1] - previous[1] >= self.min_io_bytes:
+            return LivenessSignal.IO
+        return None
@@ -0,0 +1,366 @@
+"""指标收集模块
+
+coder、codex、gemini 三个工具共享的调用指标收集器。
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ccg_mcp import profiling
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """计算分位数（线性插值），values 为空时返回 0
+
+    Args:
+        values: 样本
+        q: 分位数，0-100
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Phase:
+    """调用阶段枚举（PhaseTimeline 中的时间点）"""
+    ATTEMPT_START = "attempt_start"  # 本次尝试开始（首次尝试为调用开始）
+    SPAWN = "spawn"  # 子进程已启动
+    FIRST_BYTE = "first_byte"  # 收到第一行输出
+    SESSION_ID = "session_id"  # 获取到会话 ID
+    FIRST_TEXT = "first_text"  # 收到第一段 assistant 文本
+    RESULT = "result"  # 收到结果 / 回合完成事件
+    EXIT = "exit"  # 子进程退出
+
+
+class PhaseTimeline:
+    """调用阶段时间线
+
+    记录最后一次尝试中各阶段相对调用开始的毫秒偏移，以及内部工具调用的起止时间。
+    runner 负责 spawn / first_byte / exit，工具负责协议相关的阶段。
+    """
+
+    def __init__(self) -> None:
+        self._origin = time.monotonic()
+        self._marks: Dict[str, int] = {}
+        self._tool_uses: List[Dict[str, Any]] = []
+        self._open_tool_uses: Dict[str, Dict[str, Any]] = {}
+        self._attempts = 0
+        self._history: List[Dict[str, Any]] = []  # 之前各次尝试的时间点与工具调用
+
+    def elapsed_ms(self) -> int:
+        """距调用开始的毫秒数"""
+        return int((time.monotonic() - self._origin) * 1000)
+
+    def begin_attempt(self) -> None:
+        """开始新的尝试：清空上一次尝试的时间点（归档到历史）"""
+        if self._attempts:
+            self._history.append({"marks": self._marks, "tool_uses": self._tool_uses})
+        self._marks = {Phase.ATTEMPT_START: self.elapsed_ms() if self._attempts else 0}
+        self._tool_uses = []
+        self._open_tool_uses = {}
+        self._attempts += 1
+
+    def mark(self, phase: str) -> None:
+        """记录阶段时间点（同一尝试内只记录第一次）"""
+        if phase not in self._marks:
+            self._marks[phase] = self.elapsed_ms()
+
+    def get(self, phase: str) -> Optional[int]:
+        """获取阶段时间点（毫秒偏移），未发生时返回 None"""
+        return self._marks.get(phase)
+
+    def tool_use_start(
+        self,
+        tool_use_id: str,
+        name: str,
+        summary: str = "",
+        input_bytes: Optional[int] = None,
+    ) -> None:
+        """记录内部工具调用开始"""
+        entry: Dict[str, Any] = {
+            "id": tool_use_id,
+            "name": name,
+            "summary": summary,
+            "start_ms": self.elapsed_ms(),
+            "end_ms": None,
+            "duration_ms": None,
+            "is_error": False,
+            "input_bytes": input_bytes,
+            "output_bytes": None,
+        }
+        self._open_tool_uses[tool_use_id] = entry
+        self._tool_uses.append(entry)
+
+    def tool_use_end(
+        self,
+        tool_use_id: str,
+        name: str = "",
+        summary: str = "",
+        is_error: bool = False,
+        output_bytes: Optional[int] = None,
+    ) -> None:
+        """记录内部工具调用结束（未见过开始事件时只记录结束时间，耗时未知）"""
+        entry = self._open_tool_uses.pop(tool_use_id, None)
+        if entry is None:
+            entry = {
+                "id": tool_use_id,
+                "name": name,
+                "summary": summary,
+                "start_ms": None,
+                "end_ms": None,
+                "duration_ms": None,
+                "is_error": False,
+                "input_bytes": None,
+                "output_bytes": None,
+            }
+            self._tool_uses.append(entry)
+        entry["end_ms"] = self.elapsed_ms()
+        if entry["start_ms"] is not None:
+            entry["duration_ms"] = entry["end_ms"] - entry["start_ms"]
+        entry["is_error"] = is_error
+        entry["output_bytes"] = output_bytes
+
+    def tool_use_summary(self, duration_ms: int = 0) -> List[Dict[str, Any]]:
+        """按工具名汇总所有尝试中的内部工具调用，按总耗时降序
+
+        未结束的调用按当前时间计算耗时；share 为总耗时占调用总耗时的比例。
+        """
+        now_ms = self.elapsed_ms()
+        groups: Dict[str, Dict[str, Any]] = {}
+        for timeline in self.attempt_timelines():
+            for entry in timeline["tool_uses"]:
+                name = entry.get("name") or "unknown"
+                group = groups.setdefault(name, {
+                    "name": name, "count": 0, "errors": 0, "unfinished": 0,
+                    "total_ms": 0, "max_ms": 0, "output_bytes": 0,
+                })
+                group["count"] += 1
+                group["errors"] += 1 if entry.get("is_error") else 0
+                elapsed = entry.get("duration_ms")
+                if entry.get("end_ms") is None:
+                    group["unfinished"] += 1
+                    if entry.get("start_ms") is not None:
+                        elapsed = now_ms - entry["start_ms"]
+                if elapsed is not None:
+                    group["total_ms"] += elapsed
+                    group["max_ms"] = max(group["max_ms"], elapsed)
+                group["output_bytes"] += entry.get("output_bytes") or 0
+        summary = sorted(groups.values(), key=lambda g: -g["total_ms"])
+        for group in summary:
+            group["share"] = round(group["total_ms"] / duration_ms, 4) if duration_ms > 0 else None
+        return summary
+
+    def attempt_timelines(self) -> List[Dict[str, Any]]:
+        """按顺序返回每次尝试的 {"marks": {...}, "tool_uses": [...]}（含当前尝试）"""
+        timelines = [
+            {"marks": dict(entry["marks"]), "tool_uses": [dict(t) for t in entry["tool_uses"]]}
+            for entry in self._history
+        ]
+        if self._attempts:
+            timelines.append({"marks": dict(self._marks), "tool_uses": [dict(t) for t in self._tool_uses]})
+        return timelines
+
+    def ttft_ms(self) -> Optional[int]:
+        """首个 assistant 文本的耗时（time-to-first-token，从调用开始计）"""
+        return self.get(Phase.FIRST_TEXT)
+
+    def server_overhead_ms(self, duration_ms: int) -> Optional[int]:
+        """服务端开销：最后一次尝试中子进程启动前与退出后的耗时"""
+        start = self.get(Phase.ATTEMPT_START)
+        spawn = self.get(Phase.SPAWN)
+        exit_ms = self.get(Phase.EXIT)
+        if start is None or spawn is None or exit_ms is None:
+            return None
+        return max(0, spawn - start) + max(0, duration_ms - exit_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典：{"<phase>_ms": 偏移, ..., "tool_uses": [...]}"""
+        result: Dict[str, Any] = {f"{phase}_ms": offset for phase, offset in self._marks.items()}
+        result["tool_uses"] = [dict(entry) for entry in self._tool_uses]
+        return result
+
+
+# finish() 完成后调用的回调（如指标持久化），回调异常不影响主流程
+_finish_hooks: List[Callable[["MetricsCollector"], None]] = []
+
+
+def add_finish_hook(hook: Callable[["MetricsCollector"], None]) -> None:
+    """注册 MetricsCollector.finish 完成后的回调"""
+    if hook not in _finish_hooks:
+        _finish_hooks.append(hook)
+
+
+def remove_finish_hook(hook: Callable[["MetricsCollector"], None]) -> None:
+    """移除 finish 回调"""
+    if hook in _finish_hooks:
+        _finish_hooks.remove(hook)
+
+
+class MetricsCollector:
+    """指标收集器"""
+
+    def __init__(
+        self,
+        tool: str,
+        prompt: str,
+        sandbox: str,
+        project: Optional[Path] = None,
+        model: str = "",
+    ):
+        self.tool = tool
+        self.sandbox = sandbox
+        self.project = project  # 工作目录，用于按项目持久化
+        self.model = model
+        self.prompt_chars = len(prompt)
+        self.prompt_lines = prompt.count('\n') + 1
+        self.ts_start = datetime.now(timezone.utc)
+        self.phases = PhaseTimeline()  # 与 ts_start 同时开始计时
+        self.ts_end: Optional[datetime] = None
+        self.duration_ms: int = 0
+        self.success: bool = False
+        self.error_kind: Optional[str] = None
+        self.retries: int = 0
+        self.exit_code: Optional[int] = None
+        self.result_chars: int = 0
+        self.result_lines: int = 0
+        self.raw_output_lines: int = 0
+        self.json_decode_errors: int = 0
+        self.rate_limited: bool = False
+        self.retry_after_s: Optional[float] = None
+        self.retry_delays_ms: List[int] = []
+        self.retry_budget_exhausted: bool = False
+        self.deadline_s: Optional[float] = None
+        self.attempts: List[Dict[str, Any]] = []
+        self.resumed_attempts: int = 0
+        self.recovered_by_resume: int = 0
+        self.restarted_attempts: int = 0
+        self.liveness_extensions: Dict[str, int] = {}
+        self.time_to_first_event_ms: Optional[int] = None
+        self.startup_timeouts: int = 0
+        self.adaptive_timeout: Optional[Dict[str, Any]] = None  # 自适应超时推导结果
+        self.usage: Optional[Dict[str, Any]] = None  # token 用量与成本（见 usage.account_usage）
+        self.trace_id: Optional[str] = None  # 调用方传入 trace_id 时启用追踪（见 tracing 模块）
+        self.parent_span_id: Optional[str] = None
+        self.span_id: Optional[str] = None
+        # 服务端开销剖析（仅在开启剖析时记录，见 profiling 模块）
+        self._profiler = profiling.CallProfiler() if profiling.is_enabled() else None
+        self.profile: Optional[Dict[str, Any]] = None
+
+    def finish(
+        self,
+        success: bool,
+        error_kind: Optional[str] = None,
+        result: str = "",
+        exit_code: Optional[int] = None,
+        raw_output_lines: int = 0,
+        json_decode_errors: int = 0,
+        retries: int = 0,
+        retry_stats: Optional[Dict[str, Any]] = None,
+        runner_stats: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """完成指标收集
+
+        Args:
+            retry_stats: RetryScheduler.to_dict() 返回的重试调度信息
+            runner_stats: safe_cli_command 写入的子进程执行统计
+        """
+        self.ts_end = datetime.now(timezone.utc)
+        self.duration_ms = int((self.ts_end - self.ts_start).total_seconds() * 1000)
+        self.success = success
+        self.error_kind = error_kind
+        self.result_chars = len(result)
+        self.result_lines = result.count('\n') + 1 if result else 0
+        self.exit_code = exit_code
+        self.raw_output_lines = raw_output_lines
+        self.json_decode_errors = json_decode_errors
+        self.retries = retries
+        if retry_stats:
+            self.rate_limited = retry_stats.get("rate_limited", False)
+            self.retry_after_s = retry_stats.get("retry_after_s")
+            self.retry_delays_ms = retry_stats.get("retry_delays_ms", [])
+            self.retry_budget_exhausted = retry_stats.get("retry_budget_exhausted", False)
+            self.deadline_s = retry_stats.get("deadline_s")
+            self.attempts = retry_stats.get("attempts", [])
+            self.resumed_attempts = retry_stats.get("resumed_attempts", 0)
+            self.recovered_by_resume = retry_stats.get("recovered_by_resume", 0)
+            self.restarted_attempts = retry_stats.get("restarted_attempts", 0)
+        if runner_stats:
+            self.liveness_extensions = dict(runner_stats.get("liveness_extensions", {}))
+            self.time_to_first_event_ms = runner_stats.get("time_to_first_event_ms")
+            self.startup_timeouts = runner_stats.get("startup_timeouts", 0)
+        if self._profiler is not None:
+            self.profile = self._profiler.result(runner_stats)
+        for hook in list(_finish_hooks):
+            try:
+                hook(self)
+            except Exception:
+                pass  # 静默失败，不影响主流程
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "ts_start": self.ts_start.isoformat() if self.ts_start else None,
+            "ts_end": self.ts_end.isoformat() if self.ts_end else None,
+            "duration_ms": self.duration_ms,
+            "tool": self.tool,
+            "model": self.model or None,
+            "sandbox": self.sandbox,
+            "success": self.success,
+            "error_kind": self.error_kind,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "retry_after_s": self.retry_after_s,
+            "retry_delays_ms": self.retry_delays_ms,
+            "retry_budget_exhausted": self.retry_budget_exhausted,
+            "deadline_s": self.deadline_s,
+            "attempts": self.attempts,
+            "resumed_attempts": self.resumed_attempts,
+            "recovered_by_resume": self.recovered_by_resume,
+            "restarted_attempts": self.restarted_attempts,
+            "liveness_extensions": self.liveness_extensions,
+            "time_to_first_event_ms": self.time_to_first_event_ms,
+            "startup_timeouts": self.startup_timeouts,
+            "adaptive_timeout": self.adaptive_timeout,
+            "usage": self.usage,
+            "ttft_ms": self.phases.ttft_ms(),
+            "server_overhead_ms": self.phases.server_overhead_ms(self.duration_ms),
+            "phases": self.phases.to_dict(),
+            "tool_use_summary": self.phases.tool_use_summary(self.duration_ms),
+            "profile": self.profile,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "exit_code": self.exit_code,
+            "prompt_chars": self.prompt_chars,
+            "prompt_lines": self.prompt_lines,
+            "result_chars": self.result_chars,
+            "result_lines": self.result_lines,
+            "raw_output_lines": self.raw_output_lines,
+            "json_decode_errors": self.json_decode_errors,
+        }
+
+    def format_duration(self) -> str:
+        """格式化耗时为 "xmxs" 格式"""
+        total_seconds = self.duration_ms // 1000
+        minutes = total_seconds // 60
+        seconds = total_seconds % 60
+        return f"{minutes}m{seconds}s"
+
+    def log_to_stderr(self) -> None:
+        """将指标输出到 stderr（JSONL 格式）"""
+        metrics = self.to_dict()
+        # 移除 None 值以减少输出
+        metrics = {k: v for k, v in metrics.items() if v is not None}
+        try:
+            print(json.dumps(metrics, ensure_ascii=False), file=sys.stderr)
+        except Exception:
+            pass  # 静默失败，不影响主流程
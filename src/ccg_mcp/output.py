@@ -0,0 +1,131 @@
+"""结果直接写入工作区文件（output_path）
+
+设计文档、审核报告等结果通常要落盘保存。传入 output_path 时，助手输出边产出边写入 cd 下的文件，
+返回值中的 result / partial_result 只保留开头的摘要，并给出文件路径与大小：
+
+- 首段输出到达时才创建文件（未产出任何内容的失败调用不留下空文件）
+- 从头重试时清空重写；续接会话重试时保留被中断尝试已产出的内容（与返回值的拼接方式一致）
+- 成功结束时文件内容与原本返回的 result 完全一致（如 coder 的最终 result 事件与流式文本不同时以前者为准）
+- 路径必须位于 cd 之内；写入失败时不影响调用，完整结果照常内联返回并附带 output_error
+"""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import IO, Any, Dict, Optional
+
+# 返回值中保留的摘要字符数
+SUMMARY_CHARS = 500
+
+
+class OutputPathError(ValueError):
+    """output_path 无效（不在 cd 之内或为目录）"""
+    pass
+
+
+def resolve_output_path(cd: Path, output_path: str) -> Path:
+    """解析 output_path（相对路径相对于 cd）
+
+    Raises:
+        OutputPathError: 路径不在 cd 之内或指向目录
+    """
+    root = Path(cd).expanduser().resolve()
+    target = (root / Path(output_path).expanduser()).resolve()
+    try:
+        target.relative_to(root)
+    except ValueError:
+        raise OutputPathError(f"output_path 必须位于工作目录 {root} 之内：{output_path}")
+    if target == root or target.is_dir():
+        raise OutputPathError(f"output_path 不能是目录：{output_path}")
+    return target
+
+
+class OutputWriter:
+    """将助手输出增量写入文件
+
+    Args:
+        path: 已解析的目标路径（见 resolve_output_path）
+        separator: 相邻输出段之间的分隔符，与工具拼接 result 的方式一致
+    """
+
+    def __init__(self, path: Path, separator: str = ""):
+        self.path = path
+        self.separator = separator
+        self._file: Optional[IO[str]] = None
+        self._hash = hashlib.sha256()
+        self._parts = 0
+        self._prefix = ""
+        self.error: Optional[str] = None  # 写入失败的原因（之后不再写入）
+
+    def begin_attempt(self, prefix: str = "") -> None:
+        """开始一次尝试：清空已写入的内容；prefix 为续接会话时被中断尝试已产出的内容"""
+        if self._file is not None and self.error is None:
+            try:
+                self._file.seek(0)
+                self._file.truncate()
+            except OSError as e:
+                self._fail(e)
+        self._hash = hashlib.sha256()
+        self._parts = 0
+        self._prefix = prefix + "\n\n" if prefix else ""
+
+    def write(self, text: str) -> None:
+        """追加一段输出并立即刷新"""
+        if not text or self.error is not None:
+            return
+        chunk = (self.separator if self._parts else self._prefix) + text
+        self._parts += 1
+        try:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "w", encoding="utf-8", newline="")
+            self._file.write(chunk)
+            self._file.flush()
+        except OSError as e:
+            self._fail(e)
+            return
+        self._hash.update(chunk.encode("utf-8", "surrogatepass"))
+
+    def _fail(self, error: OSError) -> None:
+        self.error = f"写入 {self.path} 失败：{error}"
+        self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def finish(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """结束写入并将返回值中的结果替换为摘要与文件信息（就地修改并返回 result）
+
+        成功时若文件内容与 result 不一致则以 result 重写。
+        """
+        text = result.get("result")
+        if result.get("success") and isinstance(text, str):
+            if hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest() != self._hash.digest():
+                self.begin_attempt()
+                self.write(text)
+        self._close()
+        if self.error is not None:
+            result["output_error"] = self.error
+            return result
+        if self._parts == 0:
+            return result  # 未写入任何内容
+        for field in ("result", "partial_result"):
+            value = result.get(field)
+            if isinstance(value, str):
+                result[field] = summarize(value, self.path)
+        result["output_path"] = str(self.path)
+        result["output_bytes"] = self.path.stat().st_size
+        return result
+
+
+def summarize(text: str, path: Path) -> str:
+    """返回值中代替完整结果的摘要"""
+    if len(text) <= SUMMARY_CHARS:
+        return f"{text}\n\n[完整内容已写入 {path}]"
+    return f"{text[:SUMMARY_CHARS]}…\n\n[共 {len(text)} 字符，完整内容已写入 {path}]"
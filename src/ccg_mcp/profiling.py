@@ -0,0 +1,332 @@
+"""服务端开销剖析模块（按需开启）
+
+用于区分调用延迟中服务端自身（JSON 解析、深拷贝、队列交接）与后端各占多少：
+- 事件循环延迟：后台线程定期向事件循环投递探针，测量其被执行前的等待时间
+- 逐行解析开销：runner 统计调用方处理每一行输出的耗时（见 safe_cli_command）
+- 每次调用的服务端 CPU 时间：调用线程的 thread_time 增量
+
+以上结果写入 metrics.profile，随指标一起持久化到 `.ccg/metrics/`。
+另可通过 `debug_profile` 工具按需开启 tracemalloc / cProfile，快照写入 `.ccg/profiles/`。
+
+开启方式：环境变量 `CCG_MCP_PROFILING=1`、config.toml 的 `[metrics] profiling = true`，
+或运行时调用 `debug_profile(action="enable")`。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+
+
+PROFILES_DIR = Path(".ccg") / "profiles"
+
+# 事件循环探针间隔（秒）与保留的样本数
+LOOP_PROBE_INTERVAL = 0.1
+LOOP_LAG_SAMPLES = 3000
+
+_enabled = os.environ.get("CCG_MCP_PROFILING", "").lower() in ("1", "true", "yes")
+
+
+def is_enabled() -> bool:
+    """是否开启剖析"""
+    return _enabled
+
+
+def set_enabled(enabled: bool) -> None:
+    """开启 / 关闭剖析"""
+    global _enabled
+    _enabled = enabled
+    if not enabled:
+        stop_loop_monitor()
+
+
+# ============================================================================
+# 事件循环延迟
+# ============================================================================
+
+class LoopLagMonitor:
+    """事件循环延迟监测
+
+    后台线程每隔 interval 通过 call_soon_threadsafe 投递一个探针，记录其被执行前的等待时间。
+    事件循环被阻塞时，尚未执行的探针的等待时间计入 current_lag()。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = LOOP_PROBE_INTERVAL):
+        self.loop = loop
+        self.interval = interval
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=LOOP_LAG_SAMPLES)  # (执行时刻, 延迟秒)
+        self._pending_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ccg-loop-lag", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set() and not self.loop.is_closed():
+            done = threading.Event()
+            sent = time.monotonic()
+            with self._lock:
+                self._pending_since = sent
+
+            def probe(sent: float = sent, done: threading.Event = done) -> None:
+                now = time.monotonic()
+                with self._lock:
+                    self._pending_since = None
+                    self._samples.append((now, now - sent))
+                done.set()
+
+            try:
+                self.loop.call_soon_threadsafe(probe)
+            except RuntimeError:
+                break  # 事件循环已关闭
+            while not done.wait(self.interval) and not self._stop.is_set():
+                pass
+            self._stop.wait(self.interval)
+
+    def current_lag(self) -> float:
+        """尚未执行的探针已等待的秒数（事件循环未阻塞时为 0）"""
+        with self._lock:
+            pending = self._pending_since
+        if pending is None or self._stop.is_set():
+            return 0.0
+        return max(0.0, time.monotonic() - pending)
+
+    def max_lag_since(self, since: float) -> float:
+        """since（monotonic）之后观测到的最大延迟（秒），含当前未执行的探针"""
+        with self._lock:
+            lags = [lag for at, lag in self._samples if at >= since]
+        return max(lags + [self.current_lag()])
+
+    def stats(self) -> Dict[str, Any]:
+        """最近样本的延迟分布（毫秒）"""
+        with self._lock:
+            lags = sorted(lag * 1000 for _, lag in self._samples)
+
+        def rank(q: float) -> float:
+            # 最近秩分位数（metrics 模块依赖本模块，这里不复用其 percentile）
+            return round(lags[min(len(lags) - 1, int(len(lags) * q))], 2) if lags else 0.0
+
+        return {
+            "samples": len(lags),
+            "p50_ms": rank(0.50),
+            "p99_ms": rank(0.99),
+            "max_ms": round(lags[-1], 2) if lags else 0.0,
+            "current_ms": round(self.current_lag() * 1000, 2),
+        }
+
+
+_loop_monitor: Optional[LoopLagMonitor] = None
+
+
+def ensure_loop_monitor() -> Optional[LoopLagMonitor]:
+    """在当前运行的事件循环上启动延迟监测（已启动或不在事件循环中时直接返回）
+
+    只监测主线程的事件循环（服务器循环）；工具调用在工作线程的独立事件循环中执行，不替换监测对象。
+    """
+    global _loop_monitor
+    if threading.current_thread() is not threading.main_thread():
+        return _loop_monitor
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _loop_monitor
+    if _loop_monitor is None or _loop_monitor.loop is not loop:
+        if _loop_monitor is not None:
+            _loop_monitor.stop()
+        _loop_monitor = LoopLagMonitor(loop)
+        _loop_monitor.start()
+    return _loop_monitor
+
+
+def stop_loop_monitor() -> None:
+    global _loop_monitor
+    if _loop_monitor is not None:
+        _loop_monitor.stop()
+        _loop_monitor = None
+
+
+# ============================================================================
+# 每次调用的剖析结果
+# ============================================================================
+
+class CallProfiler:
+    """单次调用的剖析（由 MetricsCollector 在开启剖析时创建）"""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.cpu_start = time.thread_time()
+        ensure_loop_monitor()
+
+    def result(self, runner_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """汇总本次调用的服务端开销"""
+        profile: Dict[str, Any] = {
+            "server_cpu_ms": round((time.thread_time() - self.cpu_start) * 1000, 2),
+            "loop_lag_max_ms": None,
+            "parse": None,
+        }
+        if _loop_monitor is not None:
+            profile["loop_lag_max_ms"] = round(_loop_monitor.max_lag_since(self.started) * 1000, 2)
+        if runner_stats and runner_stats.get("parse_lines"):
+            lines = runner_stats["parse_lines"]
+            total_ns = runner_stats.get("parse_ns", 0)
+            profile["parse"] = {
+                "lines": lines,
+                "total_ms": round(total_ns / 1e6, 2),
+                "mean_us": round(total_ns / lines / 1e3, 2),
+                "max_us": round(runner_stats.get("parse_max_ns", 0) / 1e3, 2),
+            }
+        return profile
+
+
+# ============================================================================
+# tracemalloc / cProfile 快照
+# ============================================================================
+
+class _CProfileSession:
+    """一次 cprofile_start 到 cprofile_stop 的剖析：事件循环线程一个 Profile，
+    每个工作线程中的工具调用各一个 Profile（cProfile 只剖析开启它的线程），停止时合并"""
+
+    def __init__(self, loop_profile: cProfile.Profile):
+        self.loop_profile = loop_profile
+        self._worker_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self.stopped = False
+
+    def add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            if not self.stopped:
+                self._worker_profiles.append(profile)
+
+    def stop(self) -> List[cProfile.Profile]:
+        """停止收集，返回全部 Profile（进行中的调用结束后不再并入）"""
+        self.loop_profile.disable()
+        with self._lock:
+            self.stopped = True
+            return [self.loop_profile, *self._worker_profiles]
+
+
+_cprofile: Optional[_CProfileSession] = None
+
+
+def get_profiles_dir(project: Path) -> Path:
+    """获取项目的剖析快照目录"""
+    return Path(project) / PROFILES_DIR
+
+
+def _snapshot_path(project: Path, prefix: str, suffix: str) -> Path:
+    directory = get_profiles_dir(project)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{suffix}"
+
+
+def status() -> Dict[str, Any]:
+    """当前剖析状态"""
+    return {
+        "enabled": _enabled,
+        "loop_lag": _loop_monitor.stats() if _loop_monitor is not None else None,
+        "tracemalloc": tracemalloc.is_tracing(),
+        "cprofile": _cprofile is not None,
+    }
+
+
+def start_tracemalloc(frames: int = 10) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracemalloc() -> None:
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def snapshot_tracemalloc(project: Path, top: int = 30) -> Dict[str, Any]:
+    """写入 tracemalloc 快照（二进制，可用 tracemalloc.Snapshot.load 加载）与按行统计的摘要
+
+    Raises:
+        RuntimeError: tracemalloc 未开启时抛出
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc 未开启，请先调用 tracemalloc_start")
+    snapshot = tracemalloc.take_snapshot()
+    path = _snapshot_path(project, "tracemalloc", ".snapshot")
+    snapshot.dump(str(path))
+    current, peak = tracemalloc.get_traced_memory()
+    top_lines = [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+    path.with_suffix(".txt").write_text("\n".join(top_lines) + "\n", encoding="utf-8")
+    return {"path": str(path), "current_bytes": current, "peak_bytes": peak, "top": top_lines}
+
+
+def start_cprofile() -> None:
+    """开启 cProfile：剖析事件循环线程，以及此后在工作线程中开始的工具调用（见 profile_worker）"""
+    global _cprofile
+    if _cprofile is None:
+        import cProfile  # 按需导入，不计入服务器启动耗时
+
+        profile = cProfile.Profile()
+        profile.enable()
+        _cprofile = _CProfileSession(profile)
+
+
+@contextmanager
+def profile_worker() -> Iterator[None]:
+    """cProfile 开启期间剖析当前（工作）线程中执行的代码，结束时并入当前剖析
+
+    工具调用在 admission 的工作线程中执行（解析输出等服务端开销都在这里），
+    而 cProfile 只记录调用 enable() 的线程，因此每个调用各自开启一个 Profile。
+    """
+    session = _cprofile
+    if session is None:
+        yield
+        return
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        session.add(profile)
+
+
+def stop_cprofile(project: Path, top: int = 30) -> Dict[str, Any]:
+    """停止 cProfile，合并各线程的结果，写入 .prof 文件（可用 pstats / snakeviz 查看）与累计耗时摘要
+
+    Raises:
+        RuntimeError: cProfile 未开启时抛出
+    """
+    import pstats
+
+    global _cprofile
+    if _cprofile is None:
+        raise RuntimeError("cProfile 未开启，请先调用 cprofile_start")
+    session, _cprofile = _cprofile, None
+    profiles = session.stop()
+    path = _snapshot_path(project, "cprofile", ".prof")
+    buffer = io.StringIO()
+    stats = pstats.Stats(*profiles, stream=buffer)
+    stats.dump_stats(str(path))
+    stats.sort_stats("cumulative").print_stats(top)
+    summary = buffer.getvalue()
+    path.with_suffix(".txt").write_text(summary, encoding="utf-8")
+    top_lines: List[str] = [line for line in summary.splitlines() if line.strip()]
+    return {"path": str(path), "top": top_lines[-top:]}
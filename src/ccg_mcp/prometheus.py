@@ -0,0 +1,433 @@
+"""Prometheus / OpenMetrics 指标导出模块
+
+长期运行的部署可开启服务级指标注册表，由 MetricsCollector.finish 回调驱动：
+- 计数器：调用数（按工具 / 模型 / 结果）、错误数与重试数（按 error_kind）
+- 直方图：调用耗时、首个初始化事件耗时（time-to-first-event）
+- 仪表：正在运行的子进程数、准入控制的执行中 / 排队调用数、在线客户端数、各状态的后台任务数、等待持久化的指标记录数
+
+通过本地 HTTP 端点（/metrics）或 node_exporter 的 textfile collector 文件导出，
+在 config.toml 的 [metrics] 中配置，未配置时不启用。不依赖 prometheus_client。
+"""
+
+from __future__ import annotations
+
+import atexit
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from ccg_mcp.admission import get_admission
+from ccg_mcp.clients import get_client_registry
+from ccg_mcp.jobs import get_job_table
+from ccg_mcp.metrics import MetricsCollector, add_finish_hook
+from ccg_mcp.runner import running_processes
+from ccg_mcp.store import pending_records
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# 直方图分桶（秒）
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+TTFE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ============================================================================
+# 指标类型
+# ============================================================================
+
+class _Metric:
+    """指标基类"""
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+    def family_name(self, openmetrics: bool) -> str:
+        return self.name
+
+    def render(self, openmetrics: bool) -> List[str]:
+        family = self.family_name(openmetrics)
+        return [
+            f"# HELP {family} {_escape(self.documentation)}",
+            f"# TYPE {family} {self.TYPE}",
+            *self.samples(openmetrics),
+        ]
+
+
+class Counter(_Metric):
+    """单调递增计数器（name 不含 _total 后缀，可由回调在导出时取值）"""
+
+    TYPE = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback  # 返回 {标签值元组: 累计值}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.collect().get(self._key(labels), 0)
+
+    def collect(self) -> Dict[LabelValues, float]:
+        if self._callback is not None:
+            try:
+                return dict(self._callback())
+            except Exception:
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def family_name(self, openmetrics: bool) -> str:
+        # Prometheus 文本格式中 TYPE 行需与样本同名，OpenMetrics 中为不带 _total 的族名
+        return self.name if openmetrics else f"{self.name}_total"
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Gauge(_Metric):
+    """仪表（可由回调在导出时取值）"""
+
+    TYPE = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback  # 返回 {标签值元组: 数值}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def collect(self) -> Dict[LabelValues, float]:
+        if self._callback is not None:
+            try:
+                return dict(self._callback())
+            except Exception:
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_Metric):
+    """直方图（累积分桶）"""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # {标签值元组: ([各分桶累积计数], 总和, 样本数)}
+        self._series: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        lines: List[str] = []
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# ============================================================================
+# 注册表
+# ============================================================================
+
+_M = TypeVar("_M", bound=_Metric)
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _M) -> _M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, openmetrics: bool = False) -> str:
+        """按 Prometheus 文本格式（默认）或 OpenMetrics 格式输出"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def _running_processes() -> Dict[LabelValues, float]:
+    return {(tool.lower(),): count for tool, count in running_processes().items()}
+
+
+def _admission_active() -> Dict[LabelValues, float]:
+    return {(tool,): count for tool, count in get_admission().active().items()}
+
+
+def _admission_queued() -> Dict[LabelValues, float]:
+    return {(tool,): count for tool, count in get_admission().queued().items()}
+
+
+def _admission_rejected() -> Dict[LabelValues, float]:
+    return {(tool,): count for tool, count in get_admission().rejected().items()}
+
+
+def _connected_clients() -> Dict[LabelValues, float]:
+    return {(): get_client_registry().connected_clients()}
+
+
+def _jobs_by_status() -> Dict[LabelValues, float]:
+    return {(status,): count for status, count in get_job_table().counts().items()}
+
+
+def _pending_records() -> Dict[LabelValues, float]:
+    return {(): pending_records()}
+
+
+class CallMetrics:
+    """服务级调用指标（由 MetricsCollector.finish 回调更新）"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        register = self.registry.register
+        self.calls = register(Counter(
+            "ccg_calls", "Tool calls by tool, model and outcome", ("tool", "model", "outcome")
+        ))
+        self.errors = register(Counter(
+            "ccg_errors", "Failed tool calls by error kind", ("tool", "error_kind")
+        ))
+        self.retries = register(Counter(
+            "ccg_retries", "Retried attempts by the error kind that caused them", ("tool", "error_kind")
+        ))
+        self.duration = register(Histogram(
+            "ccg_call_duration_seconds", "End-to-end tool call duration", ("tool",), DURATION_BUCKETS
+        ))
+        self.ttfe = register(Histogram(
+            "ccg_time_to_first_event_seconds", "Time from spawn to the backend init event", ("tool",), TTFE_BUCKETS
+        ))
+        self.inflight = register(Gauge(
+            "ccg_inflight_processes", "Backend CLI processes currently running", ("tool",), _running_processes
+        ))
+        self.queue_depth = register(Gauge(
+            "ccg_metrics_queue_depth", "Metrics records waiting to be persisted", (), _pending_records
+        ))
+        self.admission_active = register(Gauge(
+            "ccg_admission_active", "Tool calls admitted and executing", ("tool",), _admission_active
+        ))
+        self.admission_queued = register(Gauge(
+            "ccg_admission_queued", "Tool calls waiting for an execution slot", ("tool",), _admission_queued
+        ))
+        self.admission_rejected = register(Counter(
+            "ccg_admission_rejected", "Tool calls rejected because the queue was full", ("tool",),
+            _admission_rejected,
+        ))
+        self.clients = register(Gauge(
+            "ccg_connected_clients", "MCP clients connected to this server", (), _connected_clients
+        ))
+        self.jobs = register(Gauge(
+            "ccg_jobs", "Background jobs by status (finished jobs are kept up to the history limit)", ("status",),
+            _jobs_by_status,
+        ))
+
+    def observe(self, metrics: MetricsCollector) -> None:
+        """记录一次完成的调用"""
+        tool = metrics.tool
+        self.calls.inc(
+            tool=tool, model=metrics.model or "default", outcome="success" if metrics.success else "error"
+        )
+        if not metrics.success:
+            self.errors.inc(tool=tool, error_kind=metrics.error_kind or "unknown")
+        # 最后一次尝试之后没有重试，其余失败的尝试各对应一次重试
+        for attempt in metrics.attempts[:-1]:
+            if attempt.get("error_kind"):
+                self.retries.inc(tool=tool, error_kind=attempt["error_kind"])
+        if metrics.duration_ms is not None:
+            self.duration.observe(metrics.duration_ms / 1000, tool=tool)
+        if metrics.time_to_first_event_ms is not None:
+            self.ttfe.observe(metrics.time_to_first_event_ms / 1000, tool=tool)
+
+
+# 全局调用指标（install_prometheus 时创建）
+_call_metrics: Optional[CallMetrics] = None
+
+
+def get_call_metrics() -> CallMetrics:
+    """获取服务级调用指标，首次调用时注册 finish 回调"""
+    global _call_metrics
+    if _call_metrics is None:
+        _call_metrics = CallMetrics()
+        add_finish_hook(_observe)
+    return _call_metrics
+
+
+def _observe(metrics: MetricsCollector) -> None:
+    if _call_metrics is not None:
+        _call_metrics.observe(metrics)
+
+
+# ============================================================================
+# 导出
+# ============================================================================
+
+def _wants_openmetrics(accept: str) -> bool:
+    return "application/openmetrics-text" in (accept or "")
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程中启动 /metrics HTTP 端点（port 为 0 时随机分配）"""
+    registry = get_call_metrics().registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            openmetrics = _wants_openmetrics(self.headers.get("Accept", ""))
+            body = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass  # stdout / stderr 留给 MCP 协议与日志，不输出访问日志
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ccg-prometheus", daemon=True).start()
+    return server
+
+
+class TextfileExporter:
+    """定期将指标原子写入 textfile collector 文件（*.prom）"""
+
+    def __init__(self, path: Path, interval: float = 15.0):
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self) -> None:
+        """立即写出一次（写入失败静默忽略）"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+            tmp_path.write_text(get_call_metrics().registry.render(), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ccg-prometheus-textfile", daemon=True)
+            self._thread.start()
+            atexit.register(self.write)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.write()
+            self._stop.wait(self.interval)
+
+
+def install_prometheus(settings: Dict[str, object]) -> None:
+    """按 [metrics] 配置启用导出（prometheus_port / prometheus_host / textfile / textfile_interval）
+
+    导出启动失败（如端口被占用）不影响 MCP 服务本身。
+    """
+    port = settings.get("prometheus_port")
+    textfile = settings.get("textfile")
+    if port is None and not textfile:
+        return
+    get_call_metrics()
+    if port is not None:
+        try:
+            start_http_server(int(str(port)), str(settings.get("prometheus_host", "127.0.0.1")))
+        except (OSError, ValueError):
+            pass
+    if textfile:
+        interval = float(str(settings.get("textfile_interval", 15.0)))
+        TextfileExporter(Path(str(textfile)).expanduser(), interval).start()
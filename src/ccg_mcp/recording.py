@@ -0,0 +1,220 @@
+"""后端输出流录制与回放
+
+录制真实 claude / codex / gemini 调用的原始 stdout 与时序，写成紧凑的夹具文件，
+用于在离线环境下以真实流量形态测量解析器与 runner 的性能（回放见 ccg_mcp.testing.replay）。
+
+开启方式：环境变量 `CCG_MCP_RECORD_DIR=<目录>` 或 config.toml 的 `[metrics] record_dir`。
+每次 CLI 执行写入一个 `<tool>-<时间戳>.jsonl.gz`：
+
+    {"format": "ccg-stream/1", "tool": "codex", "cli": "codex", "argv": [...], "exit_code": 0, ...}
+    [12, "{\"type\":\"thread.started\",...}"]
+    [3, "..."]
+
+首行为头信息，之后每行为 [距上一行的毫秒数, 输出行]。prompt 不会被录制（通过 stdin 传递），
+输出行与命令参数中的密钥（API token、Authorization 头、已知密钥环境变量的值等）写入前被替换。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+FORMAT = "ccg-stream/1"
+SUFFIX = ".jsonl.gz"
+SCRUBBED = "[REDACTED]"
+
+# 值需要整体替换的环境变量（名称匹配）
+_SECRET_ENV_PATTERN = re.compile(r"(TOKEN|SECRET|PASSWORD|API_KEY|APIKEY|AUTH)", re.IGNORECASE)
+
+# 输出中常见的密钥形态
+_SECRET_PATTERNS = [
+    re.compile(r"\bsk-(?:ant-|proj-)?[A-Za-z0-9_\-]{16,}"),         # Anthropic / OpenAI key
+    re.compile(r"\bAIza[0-9A-Za-z_\-]{30,}"),                       # Google API key
+    re.compile(r"\bgh[pousr]_[A-Za-z0-9]{30,}"),                    # GitHub token
+    re.compile(r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b"),                   # AWS access key
+    re.compile(r"\beyJ[A-Za-z0-9_\-]{10,}\.[A-Za-z0-9_\-]{10,}\.[A-Za-z0-9_\-]{10,}"),  # JWT
+    re.compile(r"(?i)(\bbearer\s+)[A-Za-z0-9._~+/\-]{8,}=*"),
+    # JSON / 环境变量形式的 "api_key": "..."、TOKEN=...（保留键名）
+    re.compile(
+        r"(?i)((?:api[_-]?key|access[_-]?token|auth[_-]?token|secret|password|authorization)"
+        r"[\"']?\s*[:=]\s*[\"']?)([^\"'\s,}]{6,})"
+    ),
+]
+
+_record_dir: Optional[Path] = (
+    Path(os.environ["CCG_MCP_RECORD_DIR"]) if os.environ.get("CCG_MCP_RECORD_DIR") else None
+)
+
+
+def get_record_dir() -> Optional[Path]:
+    """录制目录（未开启时为 None）"""
+    return _record_dir
+
+
+def set_record_dir(directory: Optional[Path]) -> None:
+    """开启（传入目录）或关闭（传入 None）录制"""
+    global _record_dir
+    _record_dir = Path(directory) if directory else None
+
+
+# ============================================================================
+# 脱敏
+# ============================================================================
+
+class Scrubber:
+    """替换文本中的密钥
+
+    除通用正则外，还会替换环境中名称像密钥的变量（*_TOKEN、*_API_KEY 等）的值，
+    以及用户主目录路径（替换为 ~）。
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]] = None):
+        environ: Mapping[str, str] = os.environ if env is None else env
+        values = {
+            value for name, value in environ.items()
+            if _SECRET_ENV_PATTERN.search(name) and len(value) >= 6
+        }
+        # 长的先替换，避免短值截断长值
+        self._literals = sorted(values, key=len, reverse=True)
+        home = str(Path.home())
+        self._home = home if len(home) > 1 else ""
+
+    def __call__(self, text: str) -> str:
+        for literal in self._literals:
+            if literal in text:
+                text = text.replace(literal, SCRUBBED)
+        for pattern in _SECRET_PATTERNS:
+            if pattern.groups:
+                text = pattern.sub(lambda m: m.group(1) + SCRUBBED, text)
+            else:
+                text = pattern.sub(SCRUBBED, text)
+        if self._home and self._home in text:
+            text = text.replace(self._home, "~")
+        return text
+
+
+# ============================================================================
+# 录制
+# ============================================================================
+
+class StreamRecorder:
+    """录制一次 CLI 执行的输出行与时序（线程安全，由 runner 的读取线程调用 line）"""
+
+    def __init__(
+        self,
+        directory: Path,
+        tool: str,
+        cmd: List[str],
+        env: Optional[Dict[str, str]] = None,
+    ):
+        self.directory = Path(directory)
+        self.tool = tool.lower()  # runner 传入的是显示名（如 "Codex"）
+        self.scrub = Scrubber(env)
+        self.argv = [self.scrub(str(arg)) for arg in cmd]
+        self.started_at = datetime.now()
+        self._start = time.monotonic()
+        self._last = self._start
+        self._lines: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def line(self, text: str) -> None:
+        """记录一行输出（空行忽略）"""
+        if not text:
+            return
+        now = time.monotonic()
+        with self._lock:
+            delta = int(round((now - self._last) * 1000))
+            self._last = now
+            self._lines.append((delta, self.scrub(text)))
+
+    def save(self, exit_code: Optional[int]) -> Path:
+        """写入夹具文件并返回路径"""
+        with self._lock:
+            lines = list(self._lines)
+        header = {
+            "format": FORMAT,
+            "tool": self.tool,
+            "cli": Path(self.argv[0]).name if self.argv else "",
+            "argv": self.argv,
+            "recorded_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_ms": int((time.monotonic() - self._start) * 1000),
+            "exit_code": exit_code,
+            "lines": len(lines),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.tool}-{self.started_at.strftime('%Y%m%d-%H%M%S-%f')}{SUFFIX}"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for delta, text in lines:
+                f.write(json.dumps([delta, text], ensure_ascii=False) + "\n")
+        return path
+
+
+def start_recording(tool: str, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Optional[StreamRecorder]:
+    """开启录制时为一次 CLI 执行创建录制器，否则返回 None"""
+    if _record_dir is None:
+        return None
+    return StreamRecorder(_record_dir, tool, cmd, env)
+
+
+# ============================================================================
+# 读取
+# ============================================================================
+
+class StreamFixture:
+    """已录制的输出流"""
+
+    def __init__(self, header: Dict[str, Any], lines: List[Tuple[int, str]]):
+        self.header = header
+        self.lines = lines
+
+    @property
+    def tool(self) -> str:
+        return str(self.header.get("tool", ""))
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self.header.get("exit_code")
+
+    @property
+    def duration_ms(self) -> int:
+        """录制时从启动到最后一行的耗时"""
+        return sum(delta for delta, _ in self.lines)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(text.encode("utf-8")) + 1 for _, text in self.lines)
+
+    def replay(self, speed: float = 1.0) -> Iterator[str]:
+        """按录制时序逐行返回（speed 为加速倍数，0 表示不等待）"""
+        for delta, text in self.lines:
+            if speed > 0 and delta:
+                time.sleep(delta / 1000 / speed)
+            yield text
+
+
+def load_fixture(path: Path) -> StreamFixture:
+    """读取夹具文件
+
+    Raises:
+        ValueError: 文件格式不符时抛出
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:  # type: ignore[operator]
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != FORMAT:
+            raise ValueError(f"不支持的录制格式: {path}")
+        lines = [(int(delta), str(text)) for delta, text in (json.loads(row) for row in f if row.strip())]
+    return StreamFixture(header, lines)
+
+
+def iter_fixtures(directory: Path) -> Iterator[Path]:
+    """按文件名顺序列出目录中的夹具文件"""
+    yield from sorted(Path(directory).glob(f"*{SUFFIX}"))
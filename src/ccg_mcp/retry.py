@@ -0,0 +1,392 @@
+"""重试调度模块
+
+为 coder、codex、gemini 三个工具提供统一的重试调度：
+- 识别事件流中的 429 / quota / overloaded 等限流信号，并解析 retry-after 提示
+- 去相关抖动（decorrelated jitter）退避，避免并发任务同步重试
+- 服务级重试预算，防止重试风暴成倍放大上游负载
+- 端到端截止时间，覆盖所有尝试与退避，保证可预期的最坏延迟
+"""
+
+from __future__ import annotations
+
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, List, Optional
+
+
+# ============================================================================
+# 限流信号识别
+# ============================================================================
+
+class RateLimitKind:
+    """限流信号类型枚举"""
+    RATE_LIMIT = "rate_limit"  # 429 / Too Many Requests
+    QUOTA = "quota"  # 配额耗尽（RESOURCE_EXHAUSTED 等）
+    OVERLOADED = "overloaded"  # 上游过载（529 / 503 overloaded）
+
+
+_RATE_LIMIT_PATTERNS: List[tuple[str, re.Pattern[str]]] = [
+    (RateLimitKind.QUOTA, re.compile(r"quota|resource[_ ]exhausted|insufficient_quota", re.IGNORECASE)),
+    (RateLimitKind.OVERLOADED, re.compile(r"overloaded|\b529\b|server (?:is )?busy|at capacity", re.IGNORECASE)),
+    (RateLimitKind.RATE_LIMIT, re.compile(r"\b429\b|too many requests|rate[ _-]?limit", re.IGNORECASE)),
+]
+
+# 时长片段，例如 "1m30s"、"12.5s"、"1500ms"、"30 seconds"
+_DURATION_PART = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(ms|milliseconds?|s|secs?|seconds?|m|mins?|minutes?|h|hrs?|hours?)?(?![a-z])",
+    re.IGNORECASE,
+)
+_DURATION_UNITS = {
+    "ms": 0.001, "millisecond": 0.001, "milliseconds": 0.001,
+    "s": 1.0, "sec": 1.0, "secs": 1.0, "second": 1.0, "seconds": 1.0,
+    "m": 60.0, "min": 60.0, "mins": 60.0, "minute": 60.0, "minutes": 60.0,
+    "h": 3600.0, "hr": 3600.0, "hrs": 3600.0, "hour": 3600.0, "hours": 3600.0,
+}
+_DURATION_EXPR = r"((?:\d+(?:\.\d+)?\s*(?:ms|milliseconds?|s|secs?|seconds?|m|mins?|minutes?|h|hrs?|hours?)?\s*)+)"
+
+_RETRY_AFTER_MS = re.compile(r"retry[-_]after[-_]ms[\"']?\s*[:=]\s*[\"']?(\d+(?:\.\d+)?)", re.IGNORECASE)
+_RETRY_AFTER_HTTP_DATE = re.compile(
+    r"retry-after[\"']?\s*[:=]\s*[\"']?([A-Z][a-z]{2}, \d{1,2} [A-Z][a-z]{2} \d{4} \d{2}:\d{2}:\d{2} GMT)",
+)
+_RETRY_AFTER_HINTS = [
+    # Retry-After: 30 / "retry_after": 30 / retryDelay: "36s"
+    re.compile(r"retry[-_ ]?after[\"']?\s*[:=]\s*[\"']?" + _DURATION_EXPR, re.IGNORECASE),
+    re.compile(r"retry[-_]?delay[\"']?\s*[:=]\s*[\"']?" + _DURATION_EXPR, re.IGNORECASE),
+    # "retry after 30s" / "Please retry in 36.31s" / "try again in 1m30s" / "reset after 20s"
+    re.compile(r"(?:retry|try again|reset|resets)\s+(?:after|in)\s+" + _DURATION_EXPR, re.IGNORECASE),
+]
+
+
+class RateLimitSignal:
+    """从错误信息中识别出的限流信号"""
+
+    def __init__(self, kind: str, retry_after_s: Optional[float] = None):
+        self.kind = kind
+        self.retry_after_s = retry_after_s  # 上游给出的等待提示（秒），未提供时为 None
+
+    def __repr__(self) -> str:
+        return f"RateLimitSignal(kind={self.kind!r}, retry_after_s={self.retry_after_s!r})"
+
+
+def _parse_duration(text: str) -> Optional[float]:
+    """解析 "1m30s"、"12.5"、"1500ms" 等时长文本为秒数，无单位时按秒处理"""
+    total = 0.0
+    matched = False
+    for value, unit in _DURATION_PART.findall(text):
+        matched = True
+        total += float(value) * _DURATION_UNITS.get((unit or "s").lower(), 1.0)
+    return total if matched else None
+
+
+def parse_retry_after(text: str) -> Optional[float]:
+    """从错误文本中解析 retry-after 提示
+
+    支持 Retry-After 头（秒数或 HTTP 日期）、retry_after_ms、retryDelay，
+    以及 "Please retry in 36s"、"try again in 1m30s" 之类的自然语言提示。
+
+    Returns:
+        等待秒数；未找到提示时返回 None
+    """
+    if not text:
+        return None
+
+    match = _RETRY_AFTER_MS.search(text)
+    if match:
+        return float(match.group(1)) / 1000.0
+
+    match = _RETRY_AFTER_HTTP_DATE.search(text)
+    if match:
+        try:
+            reset_at = parsedate_to_datetime(match.group(1))
+            return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+
+    for pattern in _RETRY_AFTER_HINTS:
+        match = pattern.search(text)
+        if match:
+            seconds = _parse_duration(match.group(1))
+            if seconds is not None:
+                return seconds
+    return None
+
+
+def classify_rate_limit(text: str) -> Optional[RateLimitSignal]:
+    """识别错误文本中的限流信号
+
+    按 quota > overloaded > rate_limit 的优先级匹配，同时解析 retry-after 提示。
+
+    Returns:
+        识别到限流时返回 RateLimitSignal，否则返回 None
+    """
+    if not text:
+        return None
+    for kind, pattern in _RATE_LIMIT_PATTERNS:
+        if pattern.search(text):
+            return RateLimitSignal(kind, parse_retry_after(text))
+    return None
+
+
+# ============================================================================
+# 服务级重试预算
+# ============================================================================
+
+class RetryBudget:
+    """服务级重试预算（滑动窗口）
+
+    在 ttl_s 窗口内，允许的重试次数为 min_retries + ratio * 请求数。
+    所有工具调用共享同一预算，上游大面积故障时重试量被限制在请求量的固定比例内。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, ttl_s: float = 60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.ttl_s = ttl_s
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        """移除窗口外的记录（调用方需持有锁）"""
+        cutoff = now - self.ttl_s
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self) -> None:
+        """记录一次首次请求（为预算存入额度）"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """尝试为一次重试扣除预算
+
+        Returns:
+            预算充足返回 True，否则返回 False（调用方应放弃重试）
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            allowed = self.min_retries + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+    def reset(self) -> None:
+        """清空预算记录（主要用于测试）"""
+        with self._lock:
+            self._requests.clear()
+            self._retries.clear()
+
+
+# 全局重试预算（所有工具共享）
+_retry_budget = RetryBudget()
+
+
+def get_retry_budget() -> RetryBudget:
+    """获取服务级重试预算"""
+    return _retry_budget
+
+
+# 续接会话重试时发送的提示（替代从头重跑完整 PROMPT）
+RESUME_PROMPT = (
+    "上一轮执行因超时或错误中断。请在当前会话中从中断处继续完成原任务，"
+    "不要重复已完成的工作，最后给出完整结论。"
+)
+
+# 启动超时后在新进程上立即重试的次数（此时任务尚未开始，不计入 max_retries）
+MAX_STARTUP_RETRIES = 1
+
+
+# ============================================================================
+# 端到端截止时间
+# ============================================================================
+
+# 截止时间收紧后的单次尝试时长下限（秒）：0 对 runner 意味着不限制，不能作为已到期时的上限
+MIN_ATTEMPT_SECONDS = 0.1
+
+class Deadline:
+    """端到端截止时间
+
+    从创建时开始计时，覆盖所有尝试与退避等待；seconds <= 0 表示不限制。
+    """
+
+    def __init__(self, seconds: float = 0):
+        self.seconds = seconds
+        self._expires_at: Optional[float] = time.monotonic() + seconds if seconds > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        """是否设置了截止时间"""
+        return self._expires_at is not None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数；未设置截止时间时返回 None"""
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """截止时间是否已到"""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cap(self, max_duration: float) -> float:
+        """将单次尝试的总时长上限收紧到剩余预算内
+
+        Args:
+            max_duration: 单次尝试的总时长上限（秒），0 表示无限制
+
+        Returns:
+            收紧后的上限（秒），0 表示无限制；设置了截止时间时至少为 MIN_ATTEMPT_SECONDS
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return max_duration
+        remaining = max(remaining, MIN_ATTEMPT_SECONDS)
+        if max_duration <= 0:
+            return remaining
+        return min(max_duration, remaining)
+
+
+# ============================================================================
+# 重试调度器
+# ============================================================================
+
+class RetryScheduler:
+    """单次工具调用的重试调度器
+
+    用法:
+        scheduler = RetryScheduler(deadline=Deadline(deadline))
+        while ...:
+            scheduler.begin_attempt()
+            run(max_duration=scheduler.attempt_max_duration(max_duration))
+            scheduler.end_attempt(error_kind)
+            delay = scheduler.next_delay(signal)
+            if delay is None:
+                break  # 预算耗尽、等待时间过长或截止时间不足，放弃重试
+            time.sleep(delay)
+    """
+
+    # 上游要求等待超过此值（秒）时不再重试，直接返回限流错误
+    MAX_RETRY_AFTER_S = 300.0
+    # 截止时间剩余不足此值（秒）时不再发起新的尝试
+    MIN_ATTEMPT_S = 1.0
+
+    def __init__(
+        self,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        rate_limit_base_delay: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_base_delay = rate_limit_base_delay
+        self.budget = budget if budget is not None else get_retry_budget()
+        self.budget.record_request()
+        self._prev_delay = base_delay
+        self.delays: List[float] = []
+        self.rate_limited = False
+        self.retry_after_s: Optional[float] = None
+        self.budget_exhausted = False
+        self.deadline = deadline if deadline is not None else Deadline()
+        self.attempts: List[Dict[str, Any]] = []
+        self._attempt_start: Optional[float] = None
+        self._attempt_mode = "fresh"
+
+    def attempt_max_duration(self, max_duration: float) -> float:
+        """本次尝试可用的总时长上限（已按截止时间收紧）"""
+        return self.deadline.cap(max_duration)
+
+    def begin_attempt(self, mode: str = "fresh") -> None:
+        """标记一次尝试开始
+
+        Args:
+            mode: "fresh" 表示完整重跑，"resume" 表示续接上次尝试的会话
+        """
+        self._attempt_start = time.monotonic()
+        self._attempt_mode = mode
+
+    def end_attempt(self, error_kind: Optional[str] = None) -> None:
+        """记录一次尝试的耗时与结果"""
+        if self._attempt_start is None:
+            return
+        self.attempts.append({
+            "attempt": len(self.attempts),
+            "mode": self._attempt_mode,
+            "duration_ms": int((time.monotonic() - self._attempt_start) * 1000),
+            "error_kind": error_kind,
+        })
+        self._attempt_start = None
+
+    def next_delay(self, signal: Optional[RateLimitSignal] = None) -> Optional[float]:
+        """计算下一次重试前的等待时间
+
+        - 有 retry-after 提示：等待提示时长，并叠加小幅抖动错开并发任务
+        - 限流但无提示：以更大的基准值做去相关抖动退避
+        - 其他错误：去相关抖动退避 sleep = min(cap, uniform(base, prev * 3))
+
+        Returns:
+            等待秒数；None 表示不应重试（预算耗尽、上游要求等待过久或截止时间不足）
+        """
+        base = self.base_delay
+        if signal is not None:
+            self.rate_limited = True
+            base = max(base, self.rate_limit_base_delay)
+            if signal.retry_after_s is not None:
+                self.retry_after_s = signal.retry_after_s
+                if signal.retry_after_s > self.MAX_RETRY_AFTER_S:
+                    return None
+
+        # 截止时间不足以完成退避并发起新尝试时放弃重试
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            min_wait = signal.retry_after_s if signal is not None and signal.retry_after_s else 0.0
+            if remaining - min_wait < self.MIN_ATTEMPT_S:
+                return None
+
+        if not self.budget.try_acquire():
+            self.budget_exhausted = True
+            return None
+
+        if signal is not None and signal.retry_after_s is not None:
+            jitter = random.uniform(0, min(5.0, 0.2 * signal.retry_after_s + base))
+            delay = signal.retry_after_s + jitter
+        else:
+            delay = min(self.max_delay, random.uniform(base, max(base, self._prev_delay * 3)))
+
+        # 退避等待不能吃掉截止时间内最后一次尝试的预算
+        if remaining is not None:
+            delay = min(delay, remaining - self.MIN_ATTEMPT_S)
+
+        self._prev_delay = max(delay, base)
+        self.delays.append(delay)
+        return delay
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为指标字典"""
+        return {
+            "rate_limited": self.rate_limited,
+            "retry_after_s": self.retry_after_s,
+            "retry_delays_ms": [int(d * 1000) for d in self.delays],
+            "retry_budget_exhausted": self.budget_exhausted,
+            "deadline_s": self.deadline.seconds if self.deadline.enabled else None,
+            "attempts": self.attempts,
+            # 续接会话 vs 从头重跑的重试统计（首次尝试不计入）
+            "resumed_attempts": sum(1 for a in self.attempts if a["mode"] == "resume"),
+            "recovered_by_resume": sum(
+                1 for a in self.attempts if a["mode"] == "resume" and a["error_kind"] is None
+            ),
+            "restarted_attempts": sum(1 for a in self.attempts[1:] if a["mode"] == "fresh"),
+        }
@@ -0,0 +1,497 @@
+"""子进程执行模块
+
+coder、codex、gemini 三个工具共享的 CLI 子进程执行器：
+- 通过 stdin 传递 prompt，读取线程 + 队列流式返回输出行
+- 空闲超时 + 总时长硬上限双重保障
+- 空闲判定同时参考子进程树的 CPU / I/O 活动（见 liveness 模块），避免静默工作被误杀
+- 任何情况下（包括异常）都清理子进程（POSIX 下整个进程组）与读取线程
+- 支持取消：在 cancel_scope 内执行的调用，取消事件被设置后终止子进程
+- 支持观察输出：在 observe_output 内执行的调用，每行输出同时交给观察者（如任务持久化）
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterator, Optional
+
+from ccg_mcp import profiling, recording
+from ccg_mcp.liveness import ProcessActivityMonitor
+from ccg_mcp.metrics import Phase, PhaseTimeline
+
+
+# ============================================================================
+# 错误类型定义
+# ============================================================================
+
+class CommandNotFoundError(Exception):
+    """命令不存在错误"""
+    pass
+
+
+class CommandTimeoutError(Exception):
+    """命令执行超时错误（包括被取消而提前终止）"""
+    def __init__(self, message: str, is_idle: bool = False, is_startup: bool = False, is_cancelled: bool = False):
+        super().__init__(message)
+        self.is_idle = is_idle  # 标记是否为空闲超时
+        self.is_startup = is_startup  # 标记是否为启动超时（未收到初始化事件）
+        self.is_cancelled = is_cancelled  # 标记是否因调用被取消而终止（见 cancel_scope）
+
+
+# ============================================================================
+# 取消
+# ============================================================================
+
+# 当前调用的取消事件（工作线程通过复制的上下文继承）
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("ccg_cancel_event", default=None)
+
+
+@contextmanager
+def cancel_scope(event: threading.Event) -> Iterator[threading.Event]:
+    """在此范围内执行的 CLI 调用可通过 event.set() 取消：正在运行的子进程被终止，
+    尚未启动的调用不再启动，均抛出 is_cancelled 的 CommandTimeoutError"""
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """当前取消范围的事件，不在 cancel_scope 内时为 None"""
+    return _cancel_event.get()
+
+
+def is_cancelled() -> bool:
+    """当前调用是否已被取消"""
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def interruptible_sleep(seconds: float) -> bool:
+    """重试退避等待，调用被取消时提前返回；返回 False 表示已取消"""
+    event = _cancel_event.get()
+    if event is None:
+        time.sleep(seconds)
+        return True
+    return not event.wait(seconds)
+
+
+# 当前调用的输出观察者（工作线程通过复制的上下文继承）
+_output_observer: ContextVar[Optional[Callable[[str], None]]] = ContextVar("ccg_output_observer", default=None)
+
+
+@contextmanager
+def observe_output(callback: Callable[[str], None]) -> Iterator[None]:
+    """在此范围内执行的 CLI 调用，每行输出（包括各次重试）都交给 callback
+
+    callback 在读取线程中调用，应尽快返回；其异常被忽略，不影响调用本身。
+    """
+    token = _output_observer.set(callback)
+    try:
+        yield
+    finally:
+        _output_observer.reset(token)
+
+
+# ============================================================================
+# 进程清理
+# ============================================================================
+
+# POSIX 下以新会话启动子进程，超时清理时可终止整个进程组（包括 CLI 派生的测试进程等）
+_USE_PROCESS_GROUP = os.name == "posix"
+
+
+def _send_signal(process: subprocess.Popen, sig: int) -> None:
+    """向子进程（POSIX 下为整个进程组）发送信号"""
+    if _USE_PROCESS_GROUP:
+        try:
+            os.killpg(process.pid, sig)
+            return
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+    if sig == getattr(signal, "SIGKILL", None):
+        process.kill()
+    else:
+        process.terminate()
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    """终止子进程：先 SIGTERM，5 秒后仍未退出则 SIGKILL（best-effort，不抛异常）"""
+    try:
+        if process.poll() is None:
+            _send_signal(process, signal.SIGTERM)
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                _send_signal(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+                try:
+                    process.wait(timeout=2)  # kill 后也设超时
+                except subprocess.TimeoutExpired:
+                    pass  # 极端情况：进程无法终止，放弃
+        elif _USE_PROCESS_GROUP:
+            # 主进程已退出，清理进程组中残留的后代进程
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError, OSError):
+                pass
+    except (ProcessLookupError, OSError):
+        pass  # 进程已退出，忽略
+
+
+# ============================================================================
+# 命令执行
+# ============================================================================
+
+# 无输出时检查子进程树 CPU / I/O 活动的间隔（秒），0 表示只看 stdout
+LIVENESS_CHECK_INTERVAL = 5.0
+
+# 读取 / 写入线程名前缀（便于排查线程泄漏）
+RUNNER_THREAD_PREFIX = "ccg-runner-"
+
+def _record_parse(stats: Dict[str, Any], elapsed_ns: int) -> None:
+    stats["parse_lines"] = stats.get("parse_lines", 0) + 1
+    stats["parse_ns"] = stats.get("parse_ns", 0) + elapsed_ns
+    stats["parse_max_ns"] = max(stats.get("parse_max_ns", 0), elapsed_ns)
+
+
+# 正在运行的子进程数（按工具），供指标导出使用
+_running: Dict[str, int] = {}
+_running_lock = threading.Lock()
+
+
+def _track_running(tool: str, delta: int) -> None:
+    with _running_lock:
+        count = _running.get(tool, 0) + delta
+        if count > 0:
+            _running[tool] = count
+        else:
+            _running.pop(tool, None)
+
+
+def running_processes() -> Dict[str, int]:
+    """获取正在运行的子进程数（按工具）"""
+    with _running_lock:
+        return dict(_running)
+
+
+@contextmanager
+def safe_cli_command(
+    cmd: list[str],
+    tool: str,
+    not_found_message: str,
+    is_completed: Callable[[str], bool],
+    env: Optional[dict[str, str]] = None,
+    cwd: Optional[Path] = None,
+    timeout: float = 300,
+    max_duration: float = 1800,
+    prompt: str = "",
+    stats: Optional[Dict[str, Any]] = None,
+    liveness_interval: float = LIVENESS_CHECK_INTERVAL,
+    is_started: Optional[Callable[[str], bool]] = None,
+    startup_timeout: float = 0,
+    phases: Optional[PhaseTimeline] = None,
+) -> Iterator[Generator[str, None, tuple[Optional[int], int]]]:
+    """安全执行 CLI 命令的上下文管理器
+
+    确保在任何情况下（包括异常）都能正确清理子进程。
+
+    Args:
+        cmd: 命令和参数列表，cmd[0] 为 CLI 名称（通过 PATH 查找）
+        tool: 工具名称，用于错误信息
+        not_found_message: CLI 未安装时的错误提示
+        is_completed: 判断某行输出是否表示会话/回合结束
+        env: 环境变量字典，None 表示继承当前环境
+        cwd: 工作目录
+        timeout: 空闲超时（秒），无输出且子进程树无 CPU / I/O 活动超过此时间触发超时
+        max_duration: 总时长硬上限（秒），0 表示无限制
+        prompt: 通过 stdin 传递的 prompt
+        stats: 可选的统计字典，执行过程中累加：
+            liveness_extensions: {"cpu": n, "io": n}，无输出但因子进程活动而重置空闲计时的次数
+            startup_timeouts: 启动超时次数
+            time_to_first_event_ms: 最近一次执行从启动到收到初始化事件的耗时
+            max_event_gap_ms: 最近一次执行中相邻输出行的最大间隔
+            run_duration_ms: 最近一次正常结束的执行耗时
+            exit_code / raw_output_lines: 最近一次正常结束的退出码与输出行数（与生成器返回值相同；
+                调用方用 for 循环消费生成器时取不到返回值）
+            parse_lines / parse_ns / parse_max_ns: 开启剖析时，调用方处理每行输出的耗时（累加）
+        liveness_interval: 无输出时检查子进程活动的间隔（秒），0 表示禁用
+        is_started: 判断某行输出是否为初始化事件（如 coder 的 system/init）
+        startup_timeout: 启动超时（秒），超过此时间仍未收到初始化事件即终止进程，0 表示不限制
+        phases: 可选的阶段时间线，记录 spawn / first_byte / exit
+
+    用法:
+        with safe_cli_command(cmd, "codex", msg, is_completed, timeout=300) as gen:
+            for line in gen:
+                process_line(line)
+
+    Raises:
+        CommandNotFoundError: CLI 未安装时抛出
+        CommandTimeoutError: 命令执行超时或调用被取消时抛出
+    """
+    cancel_event = _cancel_event.get()
+    if cancel_event is not None and cancel_event.is_set():
+        raise CommandTimeoutError(f"{tool} 调用已取消。", is_cancelled=True)
+    observer = _output_observer.get()  # 读取线程不继承上下文，在此取出
+    executable = shutil.which(cmd[0])
+    if not executable:
+        raise CommandNotFoundError(not_found_message)
+    popen_cmd = cmd.copy()
+    popen_cmd[0] = executable
+
+    process = subprocess.Popen(
+        popen_cmd,
+        shell=False,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        encoding='utf-8',
+        errors='replace',  # 处理非 UTF-8 字符，避免 UnicodeDecodeError
+        env=env,
+        cwd=str(cwd) if cwd else None,
+        start_new_session=_USE_PROCESS_GROUP,
+    )
+    _track_running(tool, 1)
+    if phases is not None:
+        phases.mark(Phase.SPAWN)
+    # 开启录制时保存原始输出与时序（见 recording 模块）
+    recorder = recording.start_recording(tool, cmd, env)
+
+    thread: Optional[threading.Thread] = None
+    writer: Optional[threading.Thread] = None
+    # 同一 stats 字典可跨多次尝试复用，计数累加
+    liveness_extensions: Dict[str, int] = (
+        stats.setdefault("liveness_extensions", {}) if stats is not None else {}
+    )
+
+    def cleanup() -> None:
+        """清理子进程和线程（best-effort，不抛异常）"""
+        nonlocal thread
+        # 1. 先终止进程（POSIX 下为整个进程组），管道写端随之关闭，读取线程读到 EOF
+        #    （读取线程阻塞在 readline 时 close() 会等待同一把锁，不能用来解除阻塞）
+        _terminate(process)
+        # 2. 关闭 stdout
+        try:
+            if process.stdout and not process.stdout.closed:
+                process.stdout.close()
+        except (OSError, IOError):
+            pass
+        # 3. 等待线程结束（写入线程随子进程退出收到 EPIPE）
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=5)
+        if writer is not None and writer.is_alive():
+            writer.join(timeout=5)
+
+    try:
+        def write_prompt() -> None:
+            """通过 stdin 传递 prompt，然后关闭 stdin
+
+            在单独线程中写入：子进程不读取 stdin 时，超过管道缓冲区的 prompt 会阻塞写入，
+            不能因此阻塞超时判定。
+            """
+            if not process.stdin:
+                return
+            try:
+                if prompt:
+                    process.stdin.write(prompt)
+            except (BrokenPipeError, OSError, ValueError):
+                pass  # 子进程可能已退出，忽略写入错误
+            finally:
+                try:
+                    process.stdin.close()
+                except (BrokenPipeError, OSError, ValueError):
+                    pass
+
+        writer = threading.Thread(target=write_prompt, name=f"{RUNNER_THREAD_PREFIX}writer", daemon=True)
+        writer.start()
+
+        output_queue: queue.Queue[str | None] = queue.Queue()
+        raw_output_lines_holder = [0]  # 使用列表以便在嵌套函数中修改
+        GRACEFUL_SHUTDOWN_DELAY = 0.3
+
+        def read_output() -> None:
+            """在单独线程中读取进程输出"""
+            try:
+                if process.stdout:
+                    for line in iter(process.stdout.readline, ""):
+                        stripped = line.strip()
+                        if stripped and phases is not None and not raw_output_lines_holder[0]:
+                            phases.mark(Phase.FIRST_BYTE)
+                        output_queue.put(stripped)
+                        if recorder is not None:
+                            recorder.line(stripped)
+                        if observer is not None and stripped:
+                            try:
+                                observer(stripped)
+                            except Exception:
+                                pass  # 观察者出错不影响调用
+                        if stripped:
+                            raw_output_lines_holder[0] += 1
+                        if is_completed(stripped):
+                            time.sleep(GRACEFUL_SHUTDOWN_DELAY)
+                            break
+                    process.stdout.close()
+            except (OSError, IOError, ValueError):
+                pass  # stdout 被关闭，正常退出
+            finally:
+                output_queue.put(None)  # 确保投递哨兵
+
+        thread = threading.Thread(target=read_output, name=f"{RUNNER_THREAD_PREFIX}reader", daemon=True)
+        thread.start()
+
+        monitor = ProcessActivityMonitor(process.pid) if liveness_interval > 0 else None
+        if monitor is not None:
+            monitor.poll()  # 建立基线
+
+        def generator() -> Generator[str, None, tuple[Optional[int], int]]:
+            """生成器：读取输出并处理超时"""
+            nonlocal thread
+            start_time = time.monotonic()
+            last_activity_time = start_time
+            last_liveness_check = start_time
+            last_event_time = start_time
+            started = is_started is None
+            max_event_gap = 0.0
+            timeout_error: CommandTimeoutError | None = None
+            if stats is not None:
+                for key in ("run_duration_ms", "exit_code", "raw_output_lines"):
+                    stats.pop(key, None)
+            # 开启剖析时统计调用方处理每一行（JSON 解析等）的耗时：yield 返回前的时间即为处理耗时
+            parse_stats = stats if profiling.is_enabled() else None
+
+            while True:
+                now = time.monotonic()
+
+                if cancel_event is not None and cancel_event.is_set():
+                    timeout_error = CommandTimeoutError(f"{tool} 调用已取消，进程已终止。", is_cancelled=True)
+                    break
+
+                if max_duration > 0 and (now - start_time) >= max_duration:
+                    timeout_error = CommandTimeoutError(
+                        f"{tool} 执行超时（总时长超过 {max_duration:g}s），进程已终止。",
+                        is_idle=False
+                    )
+                    break
+
+                # 启动看门狗：卡在初始化之前的进程不等满空闲超时
+                if not started and startup_timeout > 0 and (now - start_time) >= startup_timeout:
+                    if stats is not None:
+                        stats["startup_timeouts"] = stats.get("startup_timeouts", 0) + 1
+                    timeout_error = CommandTimeoutError(
+                        f"{tool} 启动超时（{startup_timeout:g}s 内未收到初始化事件），进程已终止。",
+                        is_startup=True
+                    )
+                    break
+
+                # 无输出期间定期检查子进程树活动：真实的计算或读写视为活动
+                if (
+                    monitor is not None
+                    and now - last_activity_time >= liveness_interval
+                    and now - last_liveness_check >= liveness_interval
+                ):
+                    last_liveness_check = now
+                    signal_name = monitor.poll()
+                    if signal_name is not None:
+                        liveness_extensions[signal_name] = liveness_extensions.get(signal_name, 0) + 1
+                        last_activity_time = now
+
+                if (now - last_activity_time) >= timeout:
+                    timeout_error = CommandTimeoutError(
+                        f"{tool} 空闲超时（{timeout:g}s 无输出且无进程活动），进程已终止。",
+                        is_idle=True
+                    )
+                    break
+
+                try:
+                    line = output_queue.get(timeout=0.5)
+                    if line is None:
+                        break
+                    received_at = time.monotonic()
+                    if line:
+                        # 以 stdout 事件为准统计间隔（含启动到首行），供自适应超时使用
+                        max_event_gap = max(max_event_gap, received_at - last_event_time)
+                        last_event_time = received_at
+                    last_activity_time = received_at
+                    if not started and line and is_started is not None and is_started(line):
+                        started = True
+                        if stats is not None:
+                            stats["time_to_first_event_ms"] = int((received_at - start_time) * 1000)
+                    if monitor is not None and now - last_liveness_check >= liveness_interval:
+                        # 有输出时也推进基线，避免把输出期间的活动算到下一次空闲检查
+                        last_liveness_check = now
+                        monitor.poll()
+                    if line:
+                        if parse_stats is not None:
+                            parse_start = time.perf_counter_ns()
+                            yield line
+                            _record_parse(parse_stats, time.perf_counter_ns() - parse_start)
+                        else:
+                            yield line
+                except queue.Empty:
+                    if process.poll() is not None and not thread.is_alive():
+                        break
+
+            if stats is not None:
+                stats["max_event_gap_ms"] = int(max_event_gap * 1000)
+
+            if timeout_error is not None:
+                cleanup()
+                if phases is not None:
+                    phases.mark(Phase.EXIT)
+                raise timeout_error
+
+            exit_code: Optional[int] = None
+            try:
+                exit_code = process.wait(timeout=5)
+                if phases is not None:
+                    phases.mark(Phase.EXIT)
+            except subprocess.TimeoutExpired:
+                _terminate(process)
+                timeout_error = CommandTimeoutError(
+                    f"{tool} 进程等待超时，进程已终止。",
+                    is_idle=False
+                )
+            finally:
+                if thread is not None:
+                    thread.join(timeout=5)
+
+            if timeout_error is not None:
+                raise timeout_error
+
+            while not output_queue.empty():
+                try:
+                    line = output_queue.get_nowait()
+                    if line is not None:
+                        yield line
+                except queue.Empty:
+                    break
+
+            if stats is not None:
+                stats["run_duration_ms"] = int((time.monotonic() - start_time) * 1000)
+                stats["exit_code"] = exit_code
+                stats["raw_output_lines"] = raw_output_lines_holder[0]
+            return (exit_code, raw_output_lines_holder[0])
+
+        yield generator()
+
+    except Exception:
+        cleanup()
+        raise
+    finally:
+        # 确保在退出上下文时清理
+        cleanup()
+        _track_running(tool, -1)
+        if recorder is not None:
+            try:
+                recorder.save(process.returncode)
+            except OSError:
+                pass  # 录制失败不影响调用
@@ -1,22 +1,131 @@
 """CCG-MCP 服务器主体
 
-提供 coder、codex 和 gemini 三个 MCP 工具，实现多方协作。
+提供 coder、codex 和 gemini 三个 MCP 工具，实现多方协作；长任务可通过 submit_job 等任务工具在后台执行。
+大结果按资源句柄返回，通过 read_artifact 分页读取（见 artifacts 模块）。
 """
 
 from __future__ import annotations
 
+import asyncio
+import inspect
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-from typing import Annotated, Any, Dict, List, Literal, Optional
+from typing import Annotated, Any, AsyncIterator, Callable, Coroutine, Dict, List, Literal, Optional
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 
-from ccg_mcp.tools.coder import coder_tool
-from ccg_mcp.tools.codex import codex_tool
-from ccg_mcp.tools.gemini import gemini_tool
+from ccg_mcp import profiling, recording
+from ccg_mcp.admission import DEADLINE_EXCEEDED, OVERLOADED, AdmissionRejected, AdmissionTimeout, get_admission
+from ccg_mcp.artifacts import DEFAULT_PAGE_CHARS, URI_PREFIX, get_artifact_store, offload_result
+from ccg_mcp.clients import INVALID_CD, SESSION_FORBIDDEN, get_client_registry
+from ccg_mcp.config import get_metrics_settings, get_server_settings
+from ccg_mcp.jobs import Job, JobLimitError, get_job_table
+from ccg_mcp.store import compute_stats, flush_all, install_metrics_store
+from ccg_mcp.tracing import install_tracing
+
+# 工具实现（ccg_mcp.tools.*）在首次调用时才导入，缩短服务器启动到响应 initialize 的时间
+
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    """服务器启动时（streamable HTTP 下为每个会话开始时）恢复上次运行中断的后台任务"""
+    _recover_jobs()
+    yield {}
+
 
 # 创建 MCP 服务器实例
-mcp = FastMCP("CCG-MCP Server")
+mcp = FastMCP("CCG-MCP Server", lifespan=_lifespan)
+
+# 每次调用的指标持久化到项目目录下的 .ccg/metrics/，带 trace_id 的调用写入 .ccg/traces/
+install_metrics_store()
+install_tracing()
+
+DEFAULT_HTTP_PORT = 8765
+
+# 任务 API 的 error_kind
+INVALID_ARGUMENTS = "invalid_arguments"
+JOB_NOT_FOUND = "job_not_found"
+# read_artifact 的 error_kind（内容已被淘汰或服务器已重启）
+ARTIFACT_NOT_FOUND = "artifact_not_found"
+
+# job_result 等待期间发送进度通知的间隔（秒）；cancel_job 等待运行中任务结束的时间（秒）
+JOB_PROGRESS_INTERVAL = 5.0
+JOB_CANCEL_GRACE = 2.0
+
+# 是否已从任务队列恢复过中断的任务（见 _recover_jobs）
+_jobs_recovered = False
+
+
+def _client_of(ctx: Optional[Context]) -> Any:
+    """调用所属的客户端（MCP 会话对象），不在请求上下文中时为 None"""
+    if ctx is None:
+        return None
+    try:
+        return ctx.session
+    except ValueError:
+        return None
+
+
+def _check_access(tool: str, client: Any, cd: Path, session_id: str) -> Optional[Dict[str, Any]]:
+    """检查工作目录与会话归属，不允许时返回错误结果"""
+    registry = get_client_registry()
+    error = registry.check_cd(cd)
+    if error is not None:
+        return {"success": False, "tool": tool, "error": error, "error_kind": INVALID_CD}
+    error = registry.check_session(client, tool, session_id)
+    if error is not None:
+        return {"success": False, "tool": tool, "error": error, "error_kind": SESSION_FORBIDDEN}
+    return None
+
+
+async def _dispatch(
+    tool: str,
+    client: Any,
+    cd: Path,
+    session_id: str,
+    call: Callable[..., Coroutine[Any, Any, Dict[str, Any]]],
+    deadline: float = 0,
+) -> Dict[str, Any]:
+    """检查工作目录与会话归属，经准入控制后在工作线程中执行工具调用
+
+    端到端截止时间 deadline（秒，0 表示不限制）从此处开始计时：排队等待不超过剩余预算，
+    获得名额后以 call(deadline=剩余秒数) 调用工具实现。
+    调用方取消请求时设置取消事件，终止工作线程中的子进程并尽快交还名额。
+    """
+    from ccg_mcp.retry import MIN_ATTEMPT_SECONDS, Deadline
+    from ccg_mcp.runner import cancel_scope, current_cancel_event
+
+    denied = _check_access(tool, client, cd, session_id)
+    if denied is not None:
+        return denied
+    clock = Deadline(deadline)
+
+    def factory() -> Coroutine[Any, Any, Dict[str, Any]]:
+        remaining = clock.remaining()
+        return call(deadline=0 if remaining is None else round(max(remaining, MIN_ATTEMPT_SECONDS), 3))
+
+    # 后台任务已在自己的取消范围内（cancel_job / 服务器退出由 jobs 模块处理），不另设事件
+    outer = current_cancel_event()
+    event = outer or threading.Event()
+    try:
+        with cancel_scope(event):
+            result = await get_admission().call(tool, factory, timeout=clock.remaining())
+    except AdmissionRejected as e:
+        return {"success": False, "tool": tool, "error": str(e), "error_kind": OVERLOADED}
+    except AdmissionTimeout as e:
+        return {"success": False, "tool": tool, "error": str(e), "error_kind": DEADLINE_EXCEEDED}
+    except asyncio.CancelledError:
+        if outer is None:
+            event.set()
+        raise
+    # 超时等失败结果也可能带有可续接的会话 ID
+    get_client_registry().claim(client, tool, result.get("SESSION_ID"))
+    return result
 
 
 @mcp.tool(
@@ -68,10 +177,19 @@ async def coder(
     timeout: Annotated[int, "空闲超时（秒），无输出超过此时间触发超时，默认 300 秒"] = 300,
     max_duration: Annotated[int, "总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制"] = 1800,
     max_retries: Annotated[int, "最大重试次数，默认 0（Coder 有写入副作用，默认不重试）"] = 0,
+    deadline: Annotated[int, "端到端截止时间（秒），覆盖所有尝试与退避等待，默认 0 表示不限制"] = 0,
+    startup_timeout: Annotated[int, "启动超时（秒），超过此时间未收到初始化事件即在新进程上立即重试，默认 60 秒，0 表示不限制"] = 60,
+    adaptive_timeout: Annotated[bool, "是否按历史耗时分布自动推导 timeout / max_duration（样本不足时沿用传入值）"] = False,
+    trace_id: Annotated[str, "追踪 ID（32 位十六进制、W3C traceparent 或任意字符串），传入时将本次调用的 span 写入 .ccg/traces/，默认不追踪"] = "",
+    output_path: Annotated[str, "结果写入的文件路径（相对 cd，必须位于 cd 之内）；传入时输出边产出边写入文件，返回值只保留摘要与路径，默认不写文件"] = "",
     log_metrics: Annotated[bool, "是否将指标输出到 stderr"] = False,
+    ctx: Optional[Context] = None,
 ) -> Dict[str, Any]:
     """执行 Coder 代码任务"""
-    return await coder_tool(
+    from ccg_mcp.tools.coder import coder_tool
+
+    return offload_result(await _dispatch("coder", _client_of(ctx), cd, SESSION_ID, partial(
+        coder_tool,
         PROMPT=PROMPT,
         cd=cd,
         sandbox=sandbox,
@@ -81,8 +199,12 @@ async def coder(
         timeout=timeout,
         max_duration=max_duration,
         max_retries=max_retries,
+        startup_timeout=startup_timeout,
+        adaptive_timeout=adaptive_timeout,
+        trace_id=trace_id,
+        output_path=output_path,
         log_metrics=log_metrics,
-    )
+    ), deadline=deadline))
 
 
 @mcp.tool(
@@ -151,10 +273,23 @@ async def codex(
     timeout: Annotated[int, "空闲超时（秒），无输出超过此时间触发超时，默认 300 秒"] = 300,
     max_duration: Annotated[int, "总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制"] = 1800,
     max_retries: Annotated[int, "最大重试次数，默认 1（Codex 只读可安全重试）"] = 1,
+    deadline: Annotated[int, "端到端截止时间（秒），覆盖所有尝试与退避等待，默认 0 表示不限制"] = 0,
+    startup_timeout: Annotated[int, "启动超时（秒），超过此时间未收到初始化事件即在新进程上立即重试，默认 60 秒，0 表示不限制"] = 60,
+    adaptive_timeout: Annotated[bool, "是否按历史耗时分布自动推导 timeout / max_duration（样本不足时沿用传入值）"] = False,
+    trace_id: Annotated[str, "追踪 ID（32 位十六进制、W3C traceparent 或任意字符串），传入时将本次调用的 span 写入 .ccg/traces/，默认不追踪"] = "",
+    resume_on_retry: Annotated[
+        bool,
+        Field(description="重试时若已获取会话 ID，则续接原会话继续而非从头重跑，默认 true"),
+    ] = True,
+    output_path: Annotated[str, "结果写入的文件路径（相对 cd，必须位于 cd 之内）；传入时输出边产出边写入文件，返回值只保留摘要与路径，默认不写文件"] = "",
     log_metrics: Annotated[bool, "是否将指标输出到 stderr"] = False,
+    ctx: Optional[Context] = None,
 ) -> Dict[str, Any]:
     """执行 Codex 代码审核"""
-    return await codex_tool(
+    from ccg_mcp.tools.codex import codex_tool
+
+    return offload_result(await _dispatch("codex", _client_of(ctx), cd, SESSION_ID, partial(
+        codex_tool,
         PROMPT=PROMPT,
         cd=cd,
         sandbox=sandbox,
@@ -169,8 +304,13 @@ async def codex(
         timeout=timeout,
         max_duration=max_duration,
         max_retries=max_retries,
+        startup_timeout=startup_timeout,
+        adaptive_timeout=adaptive_timeout,
+        trace_id=trace_id,
+        resume_on_retry=resume_on_retry,
+        output_path=output_path,
         log_metrics=log_metrics,
-    )
+    ), deadline=deadline))
 
 
 @mcp.tool(
@@ -226,10 +366,23 @@ async def gemini(
     timeout: Annotated[int, "空闲超时（秒），无输出超过此时间触发超时，默认 300 秒"] = 300,
     max_duration: Annotated[int, "总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制"] = 1800,
     max_retries: Annotated[int, "最大重试次数，默认 1"] = 1,
+    deadline: Annotated[int, "端到端截止时间（秒），覆盖所有尝试与退避等待，默认 0 表示不限制"] = 0,
+    startup_timeout: Annotated[int, "启动超时（秒），超过此时间未收到初始化事件即在新进程上立即重试，默认 60 秒，0 表示不限制"] = 60,
+    adaptive_timeout: Annotated[bool, "是否按历史耗时分布自动推导 timeout / max_duration（样本不足时沿用传入值）"] = False,
+    trace_id: Annotated[str, "追踪 ID（32 位十六进制、W3C traceparent 或任意字符串），传入时将本次调用的 span 写入 .ccg/traces/，默认不追踪"] = "",
+    resume_on_retry: Annotated[
+        bool,
+        Field(description="重试时若已获取会话 ID，则续接原会话继续而非从头重跑，默认 true"),
+    ] = True,
+    output_path: Annotated[str, "结果写入的文件路径（相对 cd，必须位于 cd 之内）；传入时输出边产出边写入文件，返回值只保留摘要与路径，默认不写文件"] = "",
     log_metrics: Annotated[bool, "是否将指标输出到 stderr"] = False,
+    ctx: Optional[Context] = None,
 ) -> Dict[str, Any]:
     """执行 Gemini 任务"""
-    return await gemini_tool(
+    from ccg_mcp.tools.gemini import gemini_tool
+
+    return offload_result(await _dispatch("gemini", _client_of(ctx), cd, SESSION_ID, partial(
+        gemini_tool,
         PROMPT=PROMPT,
         cd=cd,
         sandbox=sandbox,
@@ -241,10 +394,389 @@ async def gemini(
         timeout=timeout,
         max_duration=max_duration,
         max_retries=max_retries,
+        startup_timeout=startup_timeout,
+        adaptive_timeout=adaptive_timeout,
+        trace_id=trace_id,
+        resume_on_retry=resume_on_retry,
+        output_path=output_path,
         log_metrics=log_metrics,
-    )
+    ), deadline=deadline))
+
+
+@mcp.tool(
+    name="stats",
+    description="""
+    汇总项目内历史调用指标（读取 .ccg/metrics/ 下的持久化记录）。
+
+    按 工具 / 模型 分组返回时间窗口内的调用数、成功率、重试率、
+    耗时分位数（p50 / p95 / p99）与错误类型分布。
+    """,
+)
+async def stats(
+    cd: Annotated[Path, "项目目录"],
+    window: Annotated[str, "时间窗口，如 30m、24h、7d，默认 24h"] = "24h",
+    tool: Annotated[str, "只统计指定工具（coder / codex / gemini），默认全部"] = "",
+    model: Annotated[str, "只统计指定模型，默认全部"] = "",
+) -> Dict[str, Any]:
+    """汇总历史调用指标"""
+    error = get_client_registry().check_cd(cd)
+    if error is not None:
+        return {"success": False, "error": error, "error_kind": INVALID_CD}
+    # 等待写入队列与读取指标文件都是阻塞操作，放到线程中执行，不阻塞其他客户端
+    await asyncio.to_thread(flush_all)
+    try:
+        summary = await asyncio.to_thread(compute_stats, cd, window=window, tool=tool, model=model)
+        return {"success": True, **summary}
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+
+@mcp.tool(
+    name="submit_job",
+    description="""
+    在后台提交一个 coder / codex / gemini 任务，立即返回 job_id。
+
+    适用于可能超过客户端请求超时的长任务，或需要并行执行多个任务的场景：
+    提交后用 job_status 查询进度，用 job_result 等待并取回结果（与直接调用该工具的返回值相同），
+    用 cancel_job 取消（终止正在运行的进程）。
+
+    arguments 为工具的其他参数，与直接调用该工具相同（如 sandbox、SESSION_ID、model、timeout）。
+    任务持久化在服务器工作目录的 .ccg/jobs.sqlite3 中，服务器重启后自动恢复（已捕获会话 ID 的任务续接原会话），job_id 不变。
+    """,
+)
+async def submit_job(
+    tool: Annotated[Literal["coder", "codex", "gemini"], Field(description="要执行的工具")],
+    PROMPT: Annotated[str, "发送给工具的任务指令"],
+    cd: Annotated[Path, "工作目录"],
+    arguments: Annotated[
+        Optional[Dict[str, Any]],
+        Field(description="工具的其他参数（如 sandbox、SESSION_ID、model、timeout），默认均为该工具的默认值"),
+    ] = None,
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    """提交后台任务"""
+    from ccg_mcp import tools
+
+    impl = getattr(tools, f"{tool}_tool")
+    arguments = dict(arguments or {})
+    unknown = sorted(set(arguments) - (set(inspect.signature(impl).parameters) - {"PROMPT", "cd"}))
+    if unknown:
+        return {"success": False, "tool": tool, "error": f"{tool} 不支持的参数：{', '.join(unknown)}",
+                "error_kind": INVALID_ARGUMENTS}
+
+    client = _client_of(ctx)
+    denied = _check_access(tool, client, cd, str(arguments.get("SESSION_ID") or ""))
+    if denied is not None:
+        return denied
+
+    try:
+        job = _start_job(tool, PROMPT, cd, arguments, client)
+    except JobLimitError as e:
+        return {"success": False, "tool": tool, "error": str(e), "error_kind": OVERLOADED}
+    return {"success": True, **job.to_dict()}
+
+
+def _start_job(
+    tool: str,
+    PROMPT: str,
+    cd: Path,
+    arguments: Dict[str, Any],
+    client: Any,
+    record: Optional[Dict[str, Any]] = None,
+    run_prompt: Optional[str] = None,
+    run_arguments: Optional[Dict[str, Any]] = None,
+) -> Job:
+    """提交后台任务；恢复中断的任务时 record 为任务队列记录，run_prompt / run_arguments 为实际执行的参数
+
+    Raises:
+        JobLimitError: 未结束的任务数已达上限
+    """
+    from ccg_mcp import tools
+    from ccg_mcp.runner import cancel_scope, observe_output
+
+    impl = getattr(tools, f"{tool}_tool")
+    prompt = PROMPT if run_prompt is None else run_prompt
+    call_arguments = arguments if run_arguments is None else run_arguments
+    session_id = str(call_arguments.get("SESSION_ID") or "")
+
+    async def run(job: Job) -> Dict[str, Any]:
+        def call(deadline: float = 0) -> Coroutine[Any, Any, Dict[str, Any]]:
+            job.mark_running()
+            return impl(PROMPT=prompt, cd=cd, **{**call_arguments, "deadline": deadline})
+
+        with cancel_scope(job.cancel_event), observe_output(job.observe):
+            return await _dispatch(tool, client, cd, session_id, call,
+                                   deadline=float(call_arguments.get("deadline") or 0))
+
+    return get_job_table().submit(tool, PROMPT, str(cd), run, owner=client, arguments=arguments, record=record)
+
+
+def _recover_jobs() -> None:
+    """从任务队列恢复上次运行中断的任务（每个进程只执行一次，需在事件循环中调用）"""
+    global _jobs_recovered
+    if _jobs_recovered:
+        return
+    _jobs_recovered = True
+
+    def launch(record: Dict[str, Any], prompt: str, arguments: Dict[str, Any]) -> Job:
+        return _start_job(
+            record["tool"], record["prompt"], Path(record["cd"]), record["arguments"], None,
+            record=record, run_prompt=prompt, run_arguments=arguments,
+        )
+
+    get_job_table().recover(launch)
+
+
+def _job_not_found(job_id: str) -> Dict[str, Any]:
+    return {"success": False, "error": f"任务不存在或已过期：{job_id}", "error_kind": JOB_NOT_FOUND}
+
+
+@mcp.tool(
+    name="job_status",
+    description="""
+    查询后台任务状态（queued / running / succeeded / failed / cancelled）。
+
+    不传 job_id 时列出当前客户端的所有任务。
+    """,
+)
+async def job_status(
+    job_id: Annotated[str, "任务 ID，默认列出全部任务"] = "",
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    """查询任务状态"""
+    table = get_job_table()
+    client = _client_of(ctx)
+    if not job_id:
+        return {"success": True, "jobs": [job.to_dict() for job in table.list(client)]}
+    job = table.get(job_id, client)
+    if job is None:
+        return _job_not_found(job_id)
+    return {"success": True, **job.to_dict()}
+
+
+@mcp.tool(
+    name="job_result",
+    description="""
+    取回后台任务的结果。
+
+    任务未结束时最多等待 wait 秒（期间发送进度通知），仍未结束则返回当前状态，可再次调用。
+    结束后 result 字段与直接调用该工具的返回值相同。
+    """,
+)
+async def job_result(
+    job_id: Annotated[str, "任务 ID"],
+    wait: Annotated[int, "任务未结束时最多等待的秒数，默认 0（立即返回）"] = 0,
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    """取回任务结果"""
+    table = get_job_table()
+    job = table.get(job_id, _client_of(ctx))
+    if job is None:
+        return _job_not_found(job_id)
+
+    deadline = time.monotonic() + max(0, wait)
+    while not job.finished and time.monotonic() < deadline:
+        await table.wait(job, min(JOB_PROGRESS_INTERVAL, deadline - time.monotonic()))
+        if ctx is not None and not job.finished:
+            await ctx.report_progress(job.elapsed_s(), message=f"{job.tool} 任务 {job.id}：{job.status}")
+    info = job.to_dict(include_result=True)
+    if "result" in info:
+        info["result"] = offload_result(info["result"])
+    return {"success": True, **info}
+
+
+@mcp.tool(
+    name="cancel_job",
+    description="""
+    取消后台任务：排队中的任务不再执行，运行中的任务终止其进程（已产出的部分结果保留在 job_result 中）。
+    """,
+)
+async def cancel_job(
+    job_id: Annotated[str, "任务 ID"],
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    """取消任务"""
+    table = get_job_table()
+    job = table.get(job_id, _client_of(ctx))
+    if job is None:
+        return _job_not_found(job_id)
+    cancelled = table.cancel(job)
+    # 排队中的任务取消后立即结束；运行中的任务需等待进程终止
+    await table.wait(job, JOB_CANCEL_GRACE)
+    return {"success": True, "cancelled": cancelled, **job.to_dict()}
+
+
+@mcp.tool(
+    name="read_artifact",
+    description="""
+    分页读取转存在服务端的大结果。
+
+    result / partial_result 超过阈值或 all_messages 较大时，工具返回值中只保留预览，
+    完整内容的 URI 与大小（chars / bytes / lines）在 resources 字段中。
+    按字符区间读取 [offset, offset + limit)；next_offset 为 null 表示已读完。
+    all_messages 为 JSON Lines（每行一条消息）。
+    """,
+)
+async def read_artifact(
+    uri: Annotated[str, "resources 中给出的 URI（ccg://artifacts/...）"],
+    offset: Annotated[int, "起始字符位置，默认 0"] = 0,
+    limit: Annotated[int, f"读取的字符数，默认 {DEFAULT_PAGE_CHARS}"] = DEFAULT_PAGE_CHARS,
+) -> Dict[str, Any]:
+    """分页读取大结果"""
+    page = get_artifact_store().read(uri, offset, limit)
+    if page is None:
+        return {"success": False, "error": f"内容不存在或已被淘汰：{uri}（可通过 SESSION_ID 续接会话重新获取）",
+                "error_kind": ARTIFACT_NOT_FOUND}
+    return {"success": True, **page}
+
+
+@mcp.resource(URI_PREFIX + "{artifact_id}", name="artifact", description="转存在服务端的大结果（完整内容）")
+def artifact_resource(artifact_id: str) -> str:
+    """读取完整内容（支持 MCP 资源的宿主可直接读取 resources 中的 URI）"""
+    artifact = get_artifact_store().get(artifact_id)
+    if artifact is None:
+        raise ValueError(f"内容不存在或已被淘汰：{URI_PREFIX}{artifact_id}")
+    return artifact.text
+
+
+@mcp.tool(
+    name="debug_profile",
+    description="""
+    服务端开销剖析（调试用）。
+
+    - status：剖析开关、事件循环延迟分布、tracemalloc / cProfile 状态、准入控制（各后端执行中 / 排队数）、在线客户端数、后台任务数与转存的大结果
+    - enable / disable：开启 / 关闭每次调用的剖析（metrics.profile：服务端 CPU 时间、逐行解析耗时、事件循环延迟）
+    - tracemalloc_start / tracemalloc_snapshot / tracemalloc_stop：内存分配快照
+    - cprofile_start / cprofile_stop：CPU 剖析
+
+    快照写入 cd 下的 .ccg/profiles/。
+    """,
+)
+async def debug_profile(
+    action: Annotated[
+        Literal[
+            "status", "enable", "disable",
+            "tracemalloc_start", "tracemalloc_snapshot", "tracemalloc_stop",
+            "cprofile_start", "cprofile_stop",
+        ],
+        Field(description="剖析操作"),
+    ],
+    cd: Annotated[Path, "项目目录（快照写入其中的 .ccg/profiles/）"] = Path("."),
+    top: Annotated[int, "摘要中返回的条目数，默认 30"] = 30,
+) -> Dict[str, Any]:
+    """服务端开销剖析"""
+    if action in ("tracemalloc_snapshot", "cprofile_stop"):
+        # 快照写入 cd，与其他工具一样受 allowed_roots 限制
+        error = get_client_registry().check_cd(cd)
+        if error is not None:
+            return {"success": False, "error": error, "error_kind": INVALID_CD}
+    result: Dict[str, Any] = {}
+    try:
+        if action == "status":
+            result = {
+                "admission": get_admission().snapshot(),
+                "clients": get_client_registry().snapshot(),
+                "jobs": get_job_table().counts(),
+                "artifacts": get_artifact_store().snapshot(),
+            }
+        elif action == "enable":
+            profiling.set_enabled(True)
+            profiling.ensure_loop_monitor()
+        elif action == "disable":
+            profiling.set_enabled(False)
+        elif action == "tracemalloc_start":
+            profiling.start_tracemalloc()
+        elif action == "tracemalloc_snapshot":
+            result = profiling.snapshot_tracemalloc(cd, top)
+        elif action == "tracemalloc_stop":
+            profiling.stop_tracemalloc()
+        elif action == "cprofile_start":
+            profiling.start_cprofile()
+        elif action == "cprofile_stop":
+            result = profiling.stop_cprofile(cd, top)
+    except (RuntimeError, OSError) as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, **profiling.status(), **result}
+
+
+async def _serve_unix_socket(path: Path) -> None:
+    """在 Unix socket 上提供 streamable HTTP（socket 文件仅当前用户可访问）"""
+    import socket
+
+    import uvicorn
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        if not path.is_socket():
+            raise RuntimeError(f"{path} 已存在且不是 socket 文件")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()  # 上次退出时未清理的 socket 文件
+        else:
+            raise RuntimeError(f"已有服务器在 {path} 上监听")
+        finally:
+            probe.close()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(path))
+    os.chmod(path, 0o600)
+    # 访问由文件权限控制；浏览器无法访问 Unix socket，不需要按 Host 头防御 DNS rebinding
+    mcp.settings.transport_security = None
+    config = uvicorn.Config(mcp.streamable_http_app(), log_level=mcp.settings.log_level.lower())
+    try:
+        await uvicorn.Server(config).serve(sockets=[sock])
+    finally:
+        sock.close()
+        path.unlink(missing_ok=True)
+
+
+def run(
+    transport: Optional[str] = None,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    socket: Optional[Path] = None,
+) -> None:
+    """启动 MCP 服务器
+
+    默认通过 stdio 服务单个客户端。transport 为 "streamable-http"（或指定了 socket）时以守护进程模式运行：
+    多个客户端通过 HTTP（host:port 的 /mcp）或 Unix socket 共享同一个服务器进程的缓存、准入控制与指标，
+    各客户端的会话与工作目录相互隔离（见 ccg_mcp.clients）。参数未给出时读取 [server] 配置。
+
+    Raises:
+        ValueError: 传输方式不支持，或 stdio 传输同时指定了 socket
+    """
+    server_settings = get_server_settings()
+    socket = socket or server_settings.get("socket")
+    transport = transport or server_settings.get("transport") or ("streamable-http" if socket else "stdio")
+    if transport not in ("stdio", "streamable-http"):
+        raise ValueError(f"不支持的传输方式：{transport}")
+    if transport == "stdio" and socket:
+        raise ValueError(f"stdio 传输不监听 socket（{socket}），请改用 streamable-http 或去掉 socket 设置")
+
+    # 可选：Prometheus / OpenMetrics 指标导出（[metrics] 配置）
+    settings = get_metrics_settings()
+    if settings.get("prometheus_port") is not None or settings.get("textfile"):
+        from ccg_mcp.prometheus import install_prometheus  # 未配置导出时不加载
+
+        install_prometheus(settings)
+    # 可选：服务端开销剖析（也可通过环境变量 CCG_MCP_PROFILING 或 debug_profile 工具开启）
+    if settings.get("profiling"):
+        profiling.set_enabled(True)
+    # 可选：录制后端输出流（也可通过环境变量 CCG_MCP_RECORD_DIR 开启）
+    if settings.get("record_dir"):
+        recording.set_record_dir(Path(settings["record_dir"]).expanduser())
 
+    if transport == "stdio":
+        mcp.run(transport="stdio")
+        return
 
-def run() -> None:
-    """启动 MCP 服务器"""
-    mcp.run(transport="stdio")
+    # 守护进程的当前目录与客户端无关，要求 cd 为绝对路径
+    get_client_registry().require_absolute_cd = True
+    if socket:
+        asyncio.run(_serve_unix_socket(Path(socket).expanduser()))
+        return
+    mcp.settings.host = host or server_settings.get("host") or mcp.settings.host
+    mcp.settings.port = int(port or server_settings.get("port") or DEFAULT_HTTP_PORT)
+    mcp.run(transport="streamable-http")
@@ -0,0 +1,174 @@
+"""服务器冷启动剖析（`ccg-mcp --profile-startup`）
+
+MCP 宿主为每个客户端启动一个服务器进程，每次启动都要付出导入与初始化的开销。这里在新的解释器中测量：
+- 导入耗时：`python -X importtime -c "import ccg_mcp.server"`，按顶层包汇总自身耗时，列出最慢的模块
+- 启动后已加载的 ccg_mcp 模块（工具实现应在首次调用时才导入）
+- 从启动进程到收到 initialize 响应、tools/list 响应的耗时（通过 stdio 发送 JSON-RPC）
+- 空解释器（`python -c pass`）的启动耗时作为基线
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 启动时不应导入的模块（首次调用工具或开启对应功能时才加载）
+LAZY_MODULES = (
+    "ccg_mcp.tools.coder",
+    "ccg_mcp.tools.codex",
+    "ccg_mcp.tools.gemini",
+    "ccg_mcp.runner",
+    "ccg_mcp.prometheus",
+)
+
+PROTOCOL_VERSION = "2025-03-26"
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 输出为 [(模块, 自身微秒, 累计微秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def _python(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, timeout=120, env=env,
+    )
+
+
+def measure_imports(top: int = 15) -> Dict[str, Any]:
+    """在新解释器中测量导入 ccg_mcp.server 的耗时与启动后已加载的 ccg_mcp 模块"""
+    code = (
+        "import json, sys; import ccg_mcp.server; "
+        "print(json.dumps(sorted(m for m in sys.modules if m.startswith('ccg_mcp'))))"
+    )
+    proc = _python(["-X", "importtime", "-c", code])
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 ccg_mcp.server 失败：{proc.stderr.strip()[-500:]}")
+    rows = parse_importtime(proc.stderr)
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    by_package: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    total_us = next((cumulative for name, _, cumulative in rows if name == "ccg_mcp.server"), 0)
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "import_ms": round(total_us / 1000, 1),
+        "own_modules_ms": round(by_package.get("ccg_mcp", 0) / 1000, 1),
+        "by_package_ms": {name: round(us / 1000, 1) for name, us in packages[:top]},
+        "slowest_modules_ms": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cum_us / 1000, 1)}
+            for name, self_us, cum_us in sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+        ],
+        "loaded_modules": loaded,
+        "eager_lazy_modules": [name for name in LAZY_MODULES if name in loaded],
+    }
+
+
+def _rpc(method: str, request_id: Optional[int] = None, params: Optional[Dict[str, Any]] = None) -> bytes:
+    message: Dict[str, Any] = {"jsonrpc": "2.0", "method": method}
+    if request_id is not None:
+        message["id"] = request_id
+    if params is not None:
+        message["params"] = params
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+def _read_response(stdout: Any, request_id: int) -> Dict[str, Any]:
+    """读取指定 id 的 JSON-RPC 响应（跳过通知与日志行）"""
+    while True:
+        line = stdout.readline()
+        if not line:
+            raise RuntimeError("服务器在响应前退出")
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(message, dict) and message.get("id") == request_id:
+            return message
+
+
+def measure_handshake() -> Dict[str, Any]:
+    """启动服务器进程，测量到 initialize / tools/list 响应的耗时"""
+    env = dict(os.environ)
+    env.setdefault("PYTHONUNBUFFERED", "1")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "ccg_mcp.cli"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env,
+    )
+    try:
+        assert process.stdin is not None and process.stdout is not None
+        process.stdin.write(_rpc("initialize", 1, {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "ccg-mcp-profile-startup", "version": "0"},
+        }))
+        process.stdin.flush()
+        initialize = _read_response(process.stdout, 1)
+        initialize_ms = (time.perf_counter() - start) * 1000
+
+        process.stdin.write(_rpc("notifications/initialized"))
+        process.stdin.write(_rpc("tools/list", 2, {}))
+        process.stdin.flush()
+        tools = _read_response(process.stdout, 2)
+        tools_list_ms = (time.perf_counter() - start) * 1000
+    finally:
+        try:
+            if process.stdin:
+                process.stdin.close()
+            process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+    return {
+        "initialize_ms": round(initialize_ms, 1),
+        "tools_list_ms": round(tools_list_ms, 1),
+        "server": (initialize.get("result") or {}).get("serverInfo", {}),
+        "tools": [tool.get("name") for tool in (tools.get("result") or {}).get("tools", [])],
+    }
+
+
+def measure_interpreter() -> float:
+    """空解释器启动耗时（毫秒）"""
+    start = time.perf_counter()
+    _python(["-c", "pass"])
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else round((ordered[middle - 1] + ordered[middle]) / 2, 1)
+
+
+def profile_startup(repeat: int = 3, top: int = 15) -> Dict[str, Any]:
+    """冷启动剖析报告（各项取 repeat 次的中位数）"""
+    repeat = max(1, repeat)
+    interpreter = [measure_interpreter() for _ in range(repeat)]
+    handshakes = [measure_handshake() for _ in range(repeat)]
+    imports = measure_imports(top)
+    return {
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "interpreter_ms": _median(interpreter),
+        "initialize_ms": _median([h["initialize_ms"] for h in handshakes]),
+        "tools_list_ms": _median([h["tools_list_ms"] for h in handshakes]),
+        "tools": handshakes[-1]["tools"],
+        **imports,
+    }
@@ -0,0 +1,285 @@
+"""指标持久化与聚合统计模块
+
+每次调用的指标追加写入项目目录下的 `.ccg/metrics/metrics.jsonl`（按大小轮转），
+写入在后台线程中批量进行，工具调用只做一次入队，不阻塞。
+
+`stats` MCP 工具与 `ccg-mcp stats` 命令读取这些文件，按 工具 / 模型 汇总时间窗口内的
+耗时分位数（p50 / p95 / p99）、成功率、重试率和错误类型分布。
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from ccg_mcp.metrics import MetricsCollector, add_finish_hook, percentile
+
+
+# 单个文件上限与保留的轮转文件数
+MAX_FILE_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 3
+
+METRICS_DIR = Path(".ccg") / "metrics"
+METRICS_FILE = "metrics.jsonl"
+
+
+def get_metrics_dir(project: Path) -> Path:
+    """获取项目的指标目录"""
+    return Path(project) / METRICS_DIR
+
+
+# ============================================================================
+# 写入
+# ============================================================================
+
+class MetricsStore:
+    """JSONL 指标存储（按大小轮转，后台批量写入）"""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = MAX_FILE_BYTES,
+        backup_count: int = BACKUP_COUNT,
+    ):
+        self.directory = Path(directory)
+        self.path = self.directory / METRICS_FILE
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue: queue.Queue[Optional[Dict[str, Any]]] = queue.Queue()
+        self._lock = threading.Lock()  # 串行化写文件（后台线程与 flush 可能同时写）
+        self._thread: Optional[threading.Thread] = None
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录（只入队，不阻塞）"""
+        self._queue.put(record)
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="ccg-metrics-store", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            # 阻塞等待第一条，再取走队列中已积压的记录一起写出
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def pending(self) -> int:
+        """排队等待写入的记录数"""
+        return self._queue.qsize()
+
+    def flush(self) -> None:
+        """同步写出所有排队的记录（进程退出与测试时调用）"""
+        batch: List[Optional[Dict[str, Any]]] = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write(batch)
+        for _ in batch:
+            self._queue.task_done()
+        # 等待后台线程写完已取走的批次
+        self._queue.join()
+
+    def _write(self, batch: List[Optional[Dict[str, Any]]]) -> None:
+        records = [record for record in batch if record is not None]
+        if not records:
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        with self._lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._rotate_if_needed(len(lines.encode("utf-8")))
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                pass  # 静默失败，不影响主流程
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        """当前文件写入后将超过上限时轮转：metrics.jsonl -> .1 -> .2 ..."""
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{METRICS_FILE}.{index}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{METRICS_FILE}.{index + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path.with_name(f"{METRICS_FILE}.1"))
+        else:
+            self.path.unlink()
+
+
+# 每个项目目录一个存储实例
+_stores: Dict[str, MetricsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_metrics_store(project: Path) -> MetricsStore:
+    """获取项目的指标存储"""
+    directory = get_metrics_dir(Path(project).resolve())
+    key = str(directory)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = MetricsStore(directory)
+        return store
+
+
+def flush_all() -> None:
+    """写出所有存储中排队的记录"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+
+def pending_records() -> int:
+    """所有存储中排队等待写入的记录数"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    return sum(store.pending() for store in stores)
+
+
+atexit.register(flush_all)
+
+
+def _persist(metrics: MetricsCollector) -> None:
+    if metrics.project is None:
+        return
+    try:
+        get_metrics_store(metrics.project).append(metrics.to_dict())
+    except Exception:
+        pass  # 静默失败，不影响主流程
+
+
+_installed = False
+
+
+def install_metrics_store() -> None:
+    """启用指标持久化：每次 MetricsCollector.finish 后写入对应项目的 .ccg/metrics/"""
+    global _installed
+    if not _installed:
+        add_finish_hook(_persist)
+        _installed = True
+
+
+# ============================================================================
+# 读取与聚合
+# ============================================================================
+
+_WINDOW = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$", re.IGNORECASE)
+_WINDOW_UNITS = {"": 3600, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(text: str) -> float:
+    """解析时间窗口（"30m"、"24h"、"7d"，无单位按小时），返回秒数
+
+    Raises:
+        ValueError: 格式无效时抛出
+    """
+    match = _WINDOW.match(str(text))
+    if not match:
+        raise ValueError(f"无效的时间窗口：{text!r}（示例：30m、24h、7d）")
+    return float(match.group(1)) * _WINDOW_UNITS[match.group(2).lower()]
+
+
+def iter_records(project: Path, since: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """按时间顺序读取项目的指标记录（含轮转文件），since 之前的记录被跳过"""
+    directory = get_metrics_dir(project)
+    files = sorted(
+        directory.glob(f"{METRICS_FILE}*"),
+        key=lambda p: -int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0,
+    )
+    for path in files:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is not None:
+                        try:
+                            if datetime.fromisoformat(record.get("ts_start", "")) < since:
+                                continue
+                        except (TypeError, ValueError):
+                            continue
+                    yield record
+        except OSError:
+            continue
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总一组记录：调用数、成功率、重试率、耗时分位数、错误类型分布"""
+    durations = [r.get("duration_ms", 0) for r in records]
+    calls = len(records)
+    error_kinds: Dict[str, int] = {}
+    for record in records:
+        if not record.get("success") and record.get("error_kind"):
+            kind = record["error_kind"]
+            error_kinds[kind] = error_kinds.get(kind, 0) + 1
+    return {
+        "calls": calls,
+        "success_rate": round(sum(1 for r in records if r.get("success")) / calls, 4) if calls else None,
+        "retry_rate": round(sum(1 for r in records if r.get("retries")) / calls, 4) if calls else None,
+        "retries": sum(r.get("retries", 0) for r in records),
+        "duration_ms": {
+            "p50": round(percentile(durations, 50)),
+            "p95": round(percentile(durations, 95)),
+            "p99": round(percentile(durations, 99)),
+        },
+        "error_kinds": dict(sorted(error_kinds.items(), key=lambda item: -item[1])),
+    }
+
+
+def compute_stats(
+    project: Path,
+    window: str = "24h",
+    tool: str = "",
+    model: str = "",
+) -> Dict[str, Any]:
+    """按 工具 / 模型 汇总时间窗口内的调用指标
+
+    Args:
+        project: 项目目录（读取其中的 .ccg/metrics/）
+        window: 时间窗口，如 "30m"、"24h"、"7d"
+        tool: 只统计指定工具（可选）
+        model: 只统计指定模型（可选）
+    """
+    since = datetime.now(timezone.utc) - timedelta(seconds=parse_window(window))
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    selected: List[Dict[str, Any]] = []
+    for record in iter_records(project, since):
+        record_model = record.get("model") or "default"
+        if tool and record.get("tool") != tool:
+            continue
+        if model and record_model != model:
+            continue
+        selected.append(record)
+        groups.setdefault(f"{record.get('tool')}:{record_model}", []).append(record)
+    return {
+        "project": str(Path(project).resolve()),
+        "window": window,
+        "since": since.isoformat(),
+        "overall": summarize(selected),
+        "groups": {key: summarize(records) for key, records in sorted(groups.items())},
+    }
@@ -0,0 +1,17 @@
+"""CCG-MCP 测试辅助模块
+
+提供可编排的假 claude / codex / gemini CLI、已录制输出流的回放与合成输出流，用于在无网络、
+无真实 CLI 的环境中测试与基准测试各项功能。
+"""
+
+from ccg_mcp.testing.fake_cli import install_fake_cli, invocation_count
+from ccg_mcp.testing.replay import install_replay_cli
+from ccg_mcp.testing.streams import measure_parser, synthetic_stream
+
+__all__ = [
+    "install_fake_cli",
+    "install_replay_cli",
+    "invocation_count",
+    "measure_parser",
+    "synthetic_stream",
+]
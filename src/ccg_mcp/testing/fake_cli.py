@@ -0,0 +1,373 @@
+"""可编排的假 claude / codex / gemini CLI
+
+按场景输出与真实 CLI 相同格式的 stream-json / JSONL 事件，用于离线测试与基准测试：
+
+    from ccg_mcp.testing import install_fake_cli
+
+    install_fake_cli(bin_dir, "codex", {"text": "ok", "delay": 0.01, "tool_uses": [{"name": "Bash"}]})
+
+场景字段（均可省略）：
+- session_id / model：初始化事件中的会话 ID 与模型名
+- startup_delay：输出初始化事件前的等待秒数；delay：相邻事件之间的等待秒数
+- text：assistant 回复；chunks：拆分为几段输出；line_bytes：每段回复至少填充到的字节数
+- tool_uses：内部工具调用列表 [{"name", "input", "output", "duration", "is_error"}]
+- reconnects：输出的 "Reconnecting... n/N" 事件数（codex）
+- garbage_lines：非 JSON 输出行数；invalid_utf8：输出一行非 UTF-8 字节
+- silent_busy：回复前无输出但占用 CPU 的秒数（模拟静默计算）
+- hang：在 "startup" / "after_init" / "before_result" 处挂起 hang_seconds 秒（默认 3600）
+- error：以后端对应的失败事件结束（如 codex 的 turn.failed）
+- usage：结果事件中的 token 用量 {"input_tokens", "output_tokens", "cached_tokens"}
+- exit_code：退出码（默认成功 0，error 时 1）
+- invocations：按调用次序覆盖上述字段的列表（第 N 次调用使用第 N 项，超出时用最后一项），
+  用于模拟「首次失败、重试成功」等场景
+
+故障注入字段（见 ccg_mcp.testing.faults）：
+- skip_stdin：不读取 stdin（prompt 较大时 runner 的写入会阻塞）；close_stdin：启动即关闭 stdin
+- ignore_sigterm：忽略 SIGTERM，只能被 SIGKILL 终止
+- spawn_child：启动一个长时间运行的孙进程，其 PID 写入该字段给出的文件
+- split_writes：每个事件分两次写出，中间间隔 split_delay 秒（默认 0.05）
+- crash：在 "startup" / "after_init" / "mid_text" 处以 exit_code（默认 1）立即退出
+- partial_line：crash 退出前写出半行 JSON（无换行符）
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：假 CLI 依赖 shebang，仅在 POSIX 下使用
+    fcntl = None  # type: ignore[assignment]
+
+BACKENDS = ("claude", "codex", "gemini")
+
+# 安装到 PATH 的 CLI 名称（coder 工具调用 claude）
+CLI_NAMES = {"claude": "claude", "coder": "claude", "codex": "codex", "gemini": "gemini"}
+
+
+# ============================================================================
+# 安装
+# ============================================================================
+
+def install_fake_cli(
+    bin_dir: Path,
+    backend: str,
+    scenario: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """在 bin_dir 中安装假 CLI（bin_dir 需在 PATH 中）
+
+    Args:
+        bin_dir: 安装目录
+        backend: "claude"（或 "coder"）、"codex"、"gemini"
+        scenario: 场景配置，见模块文档
+
+    Returns:
+        假 CLI 脚本路径
+    """
+    name = CLI_NAMES[backend]
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    scenario_path = bin_dir / f"{name}.scenario.json"
+    scenario_path.write_text(json.dumps(scenario or {}, ensure_ascii=False), encoding="utf-8")
+    # 计数文件记录调用次数（invocations 使用），重新安装时清零
+    _counter_path(scenario_path).unlink(missing_ok=True)
+    package_root = Path(__file__).resolve().parents[2]
+    script = bin_dir / name
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        f"sys.path.insert(0, {str(package_root)!r})\n"
+        "from ccg_mcp.testing.fake_cli import main\n"
+        f"sys.exit(main({name!r}, {str(scenario_path)!r}))\n",
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return script
+
+
+def _counter_path(scenario_path: Path) -> Path:
+    return scenario_path.with_suffix(".count")
+
+
+def invocation_count(bin_dir: Path, backend: str) -> int:
+    """假 CLI 已被调用的次数"""
+    path = _counter_path(Path(bin_dir) / f"{CLI_NAMES[backend]}.scenario.json")
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _next_invocation(scenario_path: Path) -> int:
+    """记录一次调用并返回调用序号（从 0 开始，并发调用下按追加顺序）"""
+    fd = os.open(_counter_path(scenario_path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, b".")
+        return max(0, os.fstat(fd).st_size - 1)
+    finally:
+        os.close(fd)  # 关闭时释放锁
+
+
+# ============================================================================
+# 事件构建
+# ============================================================================
+
+class EventBuilder:
+    """按后端格式构建事件（假 CLI 与合成输出流共用）"""
+
+    def __init__(self, backend: str, scenario: Optional[Dict[str, Any]] = None):
+        self.backend = CLI_NAMES[backend]
+        self.scenario = scenario or {}
+        self.session_id = self.scenario.get("session_id") or f"fake-{self.backend}-{os.getpid()}"
+        self.model = self.scenario.get("model", f"fake-{self.backend}-model")
+        self._messages = 0
+
+    def init(self) -> List[Dict[str, Any]]:
+        if self.backend == "claude":
+            return [{"type": "system", "subtype": "init", "session_id": self.session_id, "model": self.model}]
+        if self.backend == "codex":
+            return [{"type": "thread.started", "thread_id": self.session_id}, {"type": "turn.started"}]
+        return [{"type": "init", "session_id": self.session_id, "model": self.model}]
+
+    def reconnect(self, index: int, total: int) -> List[Dict[str, Any]]:
+        if self.backend == "codex":
+            return [{"type": "error", "message": f"Reconnecting... {index}/{total}"}]
+        return []
+
+    def tool_use_start(self, index: int, spec: Dict[str, Any]) -> Dict[str, Any]:
+        tool_id = spec.get("id") or f"tool_{index}"
+        name = spec.get("name", "Bash")
+        tool_input = spec.get("input", {"command": "echo fake"})
+        if self.backend == "claude":
+            return {
+                "type": "assistant",
+                "message": {"content": [{"type": "tool_use", "id": tool_id, "name": name, "input": tool_input}]},
+            }
+        if self.backend == "codex":
+            command = tool_input.get("command", name)
+            return {"type": "item.started", "item": {
+                "id": tool_id, "type": "command_execution", "command": command, "status": "in_progress",
+            }}
+        return {"type": "tool_use", "tool_name": name, "tool_id": tool_id, "parameters": tool_input}
+
+    def tool_use_end(self, index: int, spec: Dict[str, Any]) -> Dict[str, Any]:
+        tool_id = spec.get("id") or f"tool_{index}"
+        output = spec.get("output", "fake output")
+        is_error = bool(spec.get("is_error", False))
+        if self.backend == "claude":
+            return {
+                "type": "user",
+                "message": {"content": [{
+                    "type": "tool_result", "tool_use_id": tool_id, "content": output, "is_error": is_error,
+                }]},
+            }
+        if self.backend == "codex":
+            command = spec.get("input", {"command": "echo fake"}).get("command", spec.get("name", "Bash"))
+            return {"type": "item.completed", "item": {
+                "id": tool_id, "type": "command_execution", "command": command,
+                "aggregated_output": output, "exit_code": 1 if is_error else 0,
+                "status": "failed" if is_error else "completed",
+            }}
+        return {
+            "type": "tool_result", "tool_id": tool_id,
+            "status": "error" if is_error else "success", "output": output,
+        }
+
+    def text(self, chunk: str) -> Dict[str, Any]:
+        if self.backend == "claude":
+            return {"type": "assistant", "message": {"content": [{"type": "text", "text": chunk}]}}
+        if self.backend == "codex":
+            self._messages += 1
+            return {"type": "item.completed", "item": {
+                "id": f"msg_{self._messages}", "type": "agent_message", "text": chunk,
+            }}
+        return {"type": "message", "role": "assistant", "content": chunk, "delta": True}
+
+    def result(self, text: str) -> Dict[str, Any]:
+        usage = self.scenario.get("usage") or {}
+        if self.backend == "claude":
+            return {
+                "type": "result", "subtype": "success", "is_error": False, "result": text,
+                "session_id": self.session_id,
+                "usage": {
+                    "input_tokens": usage.get("input_tokens", 0),
+                    "output_tokens": usage.get("output_tokens", 0),
+                    "cache_read_input_tokens": usage.get("cached_tokens", 0),
+                },
+            }
+        if self.backend == "codex":
+            return {"type": "turn.completed", "usage": {
+                "input_tokens": usage.get("input_tokens", 0),
+                "cached_input_tokens": usage.get("cached_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+            }}
+        return {"type": "result", "status": "success", "stats": {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "cached": usage.get("cached_tokens", 0),
+        }}
+
+    def error(self, message: str) -> List[Dict[str, Any]]:
+        if self.backend == "claude":
+            return [{
+                "type": "result", "subtype": "error_during_execution", "is_error": True,
+                "result": message, "session_id": self.session_id,
+            }]
+        if self.backend == "codex":
+            return [{"type": "turn.failed", "error": {"message": message}}]
+        return [
+            {"type": "error", "message": message},
+            {"type": "result", "status": "error", "error": {"message": message}},
+        ]
+
+
+class _Emitter:
+    """把事件写到 stdout，相邻事件之间等待 delay 秒"""
+
+    def __init__(self, delay: float, split_delay: Optional[float] = None):
+        self.delay = delay
+        self.split_delay = split_delay
+        self._out = sys.stdout.buffer
+
+    def raw(self, data: bytes) -> None:
+        self._out.write(data)
+        self._out.flush()
+
+    def event(self, payload: Dict[str, Any], wait: bool = True) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+        if self.split_delay is not None:
+            # 半行先写出，读取端需等到换行符才能得到完整的一行
+            self.raw(data[:len(data) // 2])
+            time.sleep(self.split_delay)
+            data = data[len(data) // 2:]
+        self.raw(data)
+        if wait and self.delay:
+            time.sleep(self.delay)
+
+
+def _split(text: str, chunks: int) -> List[str]:
+    chunks = max(1, min(chunks, len(text) or 1))
+    size = -(-len(text) // chunks) or 1
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _hang(scenario: Dict[str, Any], point: str) -> None:
+    if scenario.get("hang") == point:
+        time.sleep(float(scenario.get("hang_seconds", 3600)))
+
+
+def _crash(scenario: Dict[str, Any], point: str, emitter: "_Emitter") -> None:
+    """在指定位置立即退出（不输出结果事件，不做清理）"""
+    if scenario.get("crash") != point:
+        return
+    if scenario.get("partial_line"):
+        emitter.raw(b'{"type": "item.completed", "item": {"type": "agent_mess')
+    sys.stdout.flush()
+    os._exit(int(scenario.get("exit_code", 1)))
+
+
+def _spawn_child(pid_file: str) -> None:
+    """启动长时间运行的孙进程（继承进程组，用于检查清理是否覆盖整个进程树）"""
+    child = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(3600)"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    Path(pid_file).write_text(str(child.pid), encoding="utf-8")
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+
+def run(backend: str, scenario: Dict[str, Any]) -> int:
+    """按场景输出事件，返回退出码"""
+    events = EventBuilder(backend, scenario)
+    emitter = _Emitter(
+        float(scenario.get("delay", 0)),
+        float(scenario.get("split_delay", 0.05)) if scenario.get("split_writes") else None,
+    )
+    if scenario.get("ignore_sigterm") and hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if scenario.get("spawn_child"):
+        _spawn_child(str(scenario["spawn_child"]))
+
+    # 与真实 CLI 一样从 stdin 读取 prompt（runner 写入后关闭 stdin）
+    if scenario.get("close_stdin"):
+        os.close(0)
+    elif not scenario.get("skip_stdin"):
+        try:
+            sys.stdin.read()
+        except (OSError, ValueError):
+            pass
+
+    time.sleep(float(scenario.get("startup_delay", 0)))
+    _hang(scenario, "startup")
+    _crash(scenario, "startup", emitter)
+    for event in events.init():
+        emitter.event(event)
+    _hang(scenario, "after_init")
+    _crash(scenario, "after_init", emitter)
+
+    reconnects = int(scenario.get("reconnects", 0))
+    for index in range(1, reconnects + 1):
+        for event in events.reconnect(index, reconnects):
+            emitter.event(event)
+
+    for index in range(int(scenario.get("garbage_lines", 0))):
+        emitter.raw(f"warning: fake diagnostic line {index}\n".encode("utf-8"))
+    if scenario.get("invalid_utf8"):
+        emitter.raw(b"\xff\xfe fake invalid utf-8 \xc3\x28\n")
+
+    for index, spec in enumerate(scenario.get("tool_uses") or []):
+        emitter.event(events.tool_use_start(index, spec))
+        time.sleep(float(spec.get("duration", 0)))
+        emitter.event(events.tool_use_end(index, spec))
+
+    busy = float(scenario.get("silent_busy", 0))
+    if busy:
+        end = time.monotonic() + busy
+        while time.monotonic() < end:
+            pass
+
+    text = str(scenario.get("text", "ok"))
+    line_bytes = int(scenario.get("line_bytes", 0))
+    for chunk in _split(text, int(scenario.get("chunks", 1))):
+        if line_bytes and len(chunk.encode("utf-8")) < line_bytes:
+            chunk += " " * (line_bytes - len(chunk.encode("utf-8")))
+        emitter.event(events.text(chunk))
+        _crash(scenario, "mid_text", emitter)
+
+    _hang(scenario, "before_result")
+    if scenario.get("error"):
+        for event in events.error(str(scenario["error"])):
+            emitter.event(event, wait=False)
+        return int(scenario.get("exit_code", 1))
+    emitter.event(events.result(text), wait=False)
+    return int(scenario.get("exit_code", 0))
+
+
+def load_scenario(scenario_path: str) -> Dict[str, Any]:
+    """读取场景并按调用序号合并 invocations 中的覆盖项"""
+    path = Path(scenario_path)
+    scenario: Dict[str, Any] = json.loads(path.read_text(encoding="utf-8"))
+    invocations = scenario.pop("invocations", None)
+    index = _next_invocation(path)
+    if invocations:
+        scenario.update(invocations[min(index, len(invocations) - 1)])
+    return scenario
+
+
+def main(backend: str, scenario_path: str) -> int:
+    try:
+        return run(backend, load_scenario(scenario_path))
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
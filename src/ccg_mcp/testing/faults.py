@@ -0,0 +1,236 @@
+"""子进程执行器故障注入
+
+借助假 CLI 模拟超时、管道断开、半行 JSON、超长行、忽略 SIGTERM 的子进程、
+不读取 stdin 即退出的进程等故障，检查每种故障下：
+- 调用在限定时间内结束（清理不会卡住）
+- 没有遗留的读取线程与子进程（含孙进程）
+- error_kind 符合预期
+
+    from ccg_mcp.testing.faults import FAULTS, run_fault
+
+    report = run_fault("codex", FAULTS["idle_hang"], bin_dir, cd)
+    assert report.ok, report.problems
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ccg_mcp.runner import RUNNER_THREAD_PREFIX, running_processes
+from ccg_mcp.testing.fake_cli import CLI_NAMES, install_fake_cli
+
+# 后端 CLI 名称 -> 工具模块
+_TOOL_MODULES = {"claude": "coder", "codex": "codex", "gemini": "gemini"}
+
+# 等待读取线程退出的宽限时间（秒）
+THREAD_GRACE = 2.0
+
+# 超过管道缓冲区的 prompt，用于触发 stdin 写入阻塞 / 管道断开
+LARGE_PROMPT = "p" * (4 << 20)
+
+
+class Fault:
+    """一种故障场景
+
+    Args:
+        scenario: 假 CLI 场景（见 ccg_mcp.testing.fake_cli）
+        expected: 预期的 error_kind（None 表示预期成功），可按后端给出 {"codex": ...}
+        max_seconds: 调用（含清理）耗时上限
+        tool_kwargs: 传给工具的额外参数（如 timeout、max_duration），max_retries 默认为 0
+        prompt: 发送的 prompt
+        backends: 仅适用于这些后端（None 表示全部）
+    """
+
+    def __init__(
+        self,
+        scenario: Dict[str, Any],
+        expected: Any,
+        max_seconds: float,
+        tool_kwargs: Optional[Dict[str, Any]] = None,
+        prompt: str = "fault injection",
+        backends: Optional[Sequence[str]] = None,
+    ):
+        self.scenario = scenario
+        self.expected = expected
+        self.max_seconds = max_seconds
+        # 只检查单次执行的故障处理，不经过重试调度
+        self.tool_kwargs = {"max_retries": 0, **(tool_kwargs or {})}
+        self.prompt = prompt
+        self.backends = tuple(backends) if backends else tuple(_TOOL_MODULES)
+
+    def expected_for(self, backend: str) -> Optional[str]:
+        if isinstance(self.expected, dict):
+            return self.expected.get(CLI_NAMES[backend])
+        return self.expected
+
+
+FAULTS: Dict[str, Fault] = {
+    # 初始化后无输出：空闲超时
+    "idle_hang": Fault({"hang": "after_init"}, "idle_timeout", 5, {"timeout": 1}),
+    # 持续输出但超过总时长上限
+    "max_duration": Fault(
+        {"text": "x" * 4000, "chunks": 4000, "delay": 0.01}, "timeout", 5, {"max_duration": 1, "timeout": 30},
+    ),
+    # 启动卡住：启动超时，新进程上立即重试一次仍卡住
+    "startup_hang": Fault({"hang": "startup"}, "startup_timeout", 7, {"startup_timeout": 1}),
+    # 忽略 SIGTERM：清理需升级到 SIGKILL（5 秒宽限）
+    "ignore_sigterm": Fault(
+        {"hang": "after_init", "ignore_sigterm": True}, "idle_timeout", 10, {"timeout": 1}, backends=["codex"],
+    ),
+    # 孙进程：超时清理需终止整个进程组
+    "grandchild": Fault({"hang": "after_init", "spawn_child": True}, "idle_timeout", 5, {"timeout": 1}),
+    # 输出中途崩溃：非零退出码
+    "crash_mid_stream": Fault(
+        {"crash": "mid_text", "chunks": 3, "text": "partial answer", "exit_code": 3}, "subprocess_error", 5,
+    ),
+    # 崩溃前写出半行 JSON
+    "half_line_crash": Fault(
+        {"crash": "mid_text", "partial_line": True, "exit_code": 2}, "subprocess_error", 5,
+    ),
+    # 每个事件分两次写出：读取端应拼回完整行
+    "split_writes": Fault({"split_writes": True, "split_delay": 0.02, "chunks": 3, "text": "abcdef"}, None, 5),
+    # 超长单行
+    "huge_line": Fault({"line_bytes": 16 << 20}, None, 10),
+    # 不读取 stdin、输出后卡住：prompt 写入不能阻塞超时判定
+    "stdin_not_read": Fault(
+        {"skip_stdin": True, "hang": "after_init"}, "idle_timeout", 6, {"timeout": 1}, prompt=LARGE_PROMPT,
+    ),
+    # 启动即关闭 stdin 并退出：写入 prompt 时管道断开
+    "exit_before_stdin": Fault(
+        {"close_stdin": True, "crash": "startup", "exit_code": 1},
+        {"claude": "protocol_missing_session", "codex": "protocol_missing_session", "gemini": "empty_result"},
+        5, prompt=LARGE_PROMPT,
+    ),
+}
+
+
+class FaultReport:
+    """一次故障注入的结果"""
+
+    def __init__(self, result: Dict[str, Any], elapsed: float, expected: Optional[str], max_seconds: float):
+        self.result = result
+        self.elapsed = elapsed
+        self.expected = expected
+        self.max_seconds = max_seconds
+        self.leaked_threads: List[str] = []
+        self.leaked_processes: List[int] = []
+        self.running: Dict[str, int] = {}
+
+    @property
+    def error_kind(self) -> Optional[str]:
+        return None if self.result.get("success") else self.result.get("error_kind")
+
+    @property
+    def problems(self) -> List[str]:
+        problems = []
+        if self.error_kind != self.expected:
+            problems.append(f"error_kind 为 {self.error_kind!r}，预期 {self.expected!r}")
+        if self.elapsed > self.max_seconds:
+            problems.append(f"耗时 {self.elapsed:.2f}s 超过上限 {self.max_seconds:g}s")
+        if self.leaked_threads:
+            problems.append(f"遗留线程: {self.leaked_threads}")
+        if self.leaked_processes:
+            problems.append(f"遗留进程: {self.leaked_processes}")
+        if self.running:
+            problems.append(f"running_processes 未归零: {self.running}")
+        return problems
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # 已退出但未被回收的僵尸进程视为已结束
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def _child_pids() -> List[int]:
+    """本进程的直接子进程（Linux 下读取 /proc，其他平台返回空列表）"""
+    me = os.getpid()
+    pids: List[int] = []
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return pids
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == me and fields[0] != "Z":
+            pids.append(int(entry.name))
+    return pids
+
+
+def _wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def run_fault(backend: str, fault: Fault, bin_dir: Path, cd: Path) -> FaultReport:
+    """安装故障场景的假 CLI 并调用对应工具，检查耗时、泄漏与 error_kind
+
+    bin_dir 需已在 PATH 中；claude 后端需已有可用的 Coder 配置（如 CODER_API_TOKEN）。
+    """
+    scenario = dict(fault.scenario)
+    child_pid_file: Optional[Path] = None
+    if scenario.get("spawn_child"):
+        child_pid_file = Path(bin_dir) / "grandchild.pid"
+        child_pid_file.unlink(missing_ok=True)
+        scenario["spawn_child"] = str(child_pid_file)
+    install_fake_cli(bin_dir, backend, scenario)
+
+    name = _TOOL_MODULES[CLI_NAMES[backend]]
+    tool = getattr(importlib.import_module(f"ccg_mcp.tools.{name}"), f"{name}_tool")
+    # 只检查 runner 的读取 / 写入线程（指标存储等常驻线程可能在调用中首次启动）
+    threads_before = {t for t in threading.enumerate() if t.name.startswith(RUNNER_THREAD_PREFIX)}
+    children_before = set(_child_pids())
+
+    start = time.monotonic()
+    result = asyncio.run(tool(PROMPT=fault.prompt, cd=cd, **fault.tool_kwargs))
+    elapsed = time.monotonic() - start
+
+    report = FaultReport(result, elapsed, fault.expected_for(backend), fault.max_seconds)
+
+    def new_threads() -> List[threading.Thread]:
+        return [
+            t for t in threading.enumerate()
+            if t.name.startswith(RUNNER_THREAD_PREFIX) and t not in threads_before and t.is_alive()
+        ]
+
+    _wait_until(lambda: not new_threads(), THREAD_GRACE)
+    report.leaked_threads = [t.name for t in new_threads()]
+    report.leaked_processes = [pid for pid in _child_pids() if pid not in children_before]
+    if child_pid_file is not None and child_pid_file.exists():
+        grandchild = int(child_pid_file.read_text(encoding="utf-8"))
+        if not _wait_until(lambda: not _pid_alive(grandchild), THREAD_GRACE):
+            report.leaked_processes.append(grandchild)
+    report.running = running_processes()
+    return report
+
+
+def fault_cases() -> List[Tuple[str, str]]:
+    """(故障名, 后端) 组合，供参数化测试使用"""
+    return [(name, backend) for name, fault in FAULTS.items() for backend in fault.backends]
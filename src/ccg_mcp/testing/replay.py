@@ -0,0 +1,70 @@
+"""回放已录制的后端输出流
+
+把 ccg_mcp.recording 录制的夹具安装为假 CLI，使回放经过真实的子进程与 runner：
+
+    from ccg_mcp.testing import install_replay_cli
+
+    install_replay_cli(bin_dir, "streams/codex-20250101-120000-000000.jsonl.gz", speed=10)
+
+speed 为加速倍数（1 为原速，0 为不等待、尽快输出），退出码与录制时一致。
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Optional
+
+from ccg_mcp.recording import load_fixture
+from ccg_mcp.testing.fake_cli import CLI_NAMES
+
+
+def install_replay_cli(
+    bin_dir: Path,
+    fixture_path: Path,
+    speed: float = 1.0,
+    backend: Optional[str] = None,
+) -> Path:
+    """在 bin_dir 中安装回放夹具的假 CLI（bin_dir 需在 PATH 中）
+
+    Args:
+        bin_dir: 安装目录
+        fixture_path: 夹具文件路径
+        speed: 加速倍数，0 表示不等待
+        backend: 安装为哪个 CLI，默认按夹具录制时的工具
+
+    Returns:
+        假 CLI 脚本路径
+    """
+    fixture_path = Path(fixture_path).resolve()
+    name = CLI_NAMES[backend or load_fixture(fixture_path).tool]
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    package_root = Path(__file__).resolve().parents[2]
+    script = bin_dir / name
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        f"sys.path.insert(0, {str(package_root)!r})\n"
+        "from ccg_mcp.testing.replay import main\n"
+        f"sys.exit(main({str(fixture_path)!r}, {float(speed)!r}))\n",
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return script
+
+
+def main(fixture_path: str, speed: float) -> int:
+    fixture = load_fixture(Path(fixture_path))
+    try:
+        sys.stdin.read()  # 与真实 CLI 一样读取 prompt
+    except (OSError, ValueError):
+        pass
+    out = sys.stdout
+    try:
+        for line in fixture.replay(speed):
+            out.write(line + "\n")
+            out.flush()
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
+    return fixture.exit_code or 0
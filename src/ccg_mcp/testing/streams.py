@@ -0,0 +1,156 @@
+"""合成输出流与解析阶段测量
+
+生成指定规模的后端输出流（事件数、每行字节数、tool_result 负载），并让 coder / codex / gemini
+工具在进程内直接消费这些行（替换 runner 的子进程执行），测量逐行解析阶段的吞吐与峰值内存：
+
+    from ccg_mcp.testing import measure_parser, synthetic_stream
+
+    result = measure_parser("codex", lambda: synthetic_stream("codex", events=100_000, line_bytes=1024))
+    result["events_per_s"], result["peak_memory_mb"]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from unittest import mock
+
+from ccg_mcp.testing.fake_cli import CLI_NAMES, EventBuilder
+
+# 后端 CLI 名称 -> 工具模块
+_TOOL_MODULES = {"claude": "coder", "codex": "codex", "gemini": "gemini"}
+
+
+def _dumps(event: Dict[str, Any]) -> str:
+    return json.dumps(event, ensure_ascii=False)
+
+
+def synthetic_stream(
+    backend: str,
+    events: int = 10_000,
+    line_bytes: int = 1024,
+    tool_result_bytes: int = 0,
+    tool_every: int = 10,
+) -> Iterator[str]:
+    """生成合成输出流（不含换行符的行）
+
+    Args:
+        backend: "claude"（或 "coder"）、"codex"、"gemini"
+        events: 初始化与结果事件之间的事件数
+        line_bytes: assistant 文本事件每行的目标字节数
+        tool_result_bytes: 大于 0 时每 tool_every 个事件插入一对工具调用，结果负载为此字节数
+        tool_every: 工具调用的间隔
+
+    每个文本行复用同一个字符串对象，工具调用行只拼接 ID，生成开销远小于解析开销。
+    """
+    builder = EventBuilder(backend, {"session_id": "synthetic", "usage": {"input_tokens": 1, "output_tokens": 1}})
+    for event in builder.init():
+        yield _dumps(event)
+
+    # 文本行：先按空文本计算事件外壳长度，再填充到目标字节数
+    shell = len(_dumps(builder.text("")).encode("utf-8"))
+    text_line = _dumps(builder.text("x" * max(1, line_bytes - shell)))
+
+    marker = "__TOOL_ID__"
+    spec = {"id": marker, "name": "Bash", "input": {"command": "cat big.log"}, "output": "y" * tool_result_bytes}
+    start_parts = _dumps(builder.tool_use_start(0, spec)).split(marker)
+    end_parts = _dumps(builder.tool_use_end(0, spec)).split(marker)
+
+    emitted = 0
+    index = 0
+    while emitted < events:
+        if tool_result_bytes and index % max(1, tool_every) == 0 and emitted + 2 <= events:
+            tool_id = f"tool_{index}"
+            yield tool_id.join(start_parts)
+            yield tool_id.join(end_parts)
+            emitted += 2
+        else:
+            yield text_line
+            emitted += 1
+        index += 1
+
+    yield _dumps(builder.result("done"))
+
+
+@contextmanager
+def _direct_lines(module: Any, lines: Iterable[str], counter: Dict[str, int]) -> Iterator[None]:
+    """让工具模块的 safe_cli_command 直接返回给定的行（不启动子进程）"""
+
+    @contextmanager
+    def fake_safe_cli_command(*args: Any, **kwargs: Any) -> Iterator[Any]:
+        def generator() -> Iterator[str]:
+            for line in lines:
+                counter["lines"] += 1
+                counter["bytes"] += len(line)
+                yield line
+            return (0, counter["lines"])  # type: ignore[return-value]
+
+        yield generator()
+
+    with mock.patch.object(module, "safe_cli_command", fake_safe_cli_command):
+        yield
+
+
+def _run_tool(backend: str, lines: Iterable[str], cd: Path) -> Dict[str, Any]:
+    import importlib
+
+    name = _TOOL_MODULES[CLI_NAMES[backend]]
+    module = importlib.import_module(f"ccg_mcp.tools.{name}")
+    tool = getattr(module, f"{name}_tool")
+    counter = {"lines": 0, "bytes": 0}
+    with _direct_lines(module, lines, counter):
+        result = asyncio.run(tool(PROMPT="benchmark", cd=cd, max_retries=0))
+    return {"success": bool(result.get("success")), "lines": counter["lines"], "bytes": counter["bytes"]}
+
+
+def measure_parser(
+    backend: str,
+    stream_factory: Callable[[], Iterable[str]],
+    trace_memory: bool = True,
+    cd: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """测量工具解析阶段的吞吐与峰值内存
+
+    吞吐与内存分两次运行测量（tracemalloc 会显著拖慢执行）。stream_factory 每次调用返回一个新的流。
+    峰值内存为解析期间 Python 分配的峰值（tracemalloc），不含解释器基线。
+    """
+    with tempfile.TemporaryDirectory(prefix="ccg-parser-") as tmp:
+        workdir = Path(cd or tmp)
+        gc.collect()
+        start = time.perf_counter()
+        run = _run_tool(backend, stream_factory(), workdir)
+        seconds = time.perf_counter() - start
+
+        peak_mb: Optional[float] = None
+        if trace_memory:
+            gc.collect()
+            already_tracing = tracemalloc.is_tracing()
+            if not already_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            try:
+                _run_tool(backend, stream_factory(), workdir)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                if not already_tracing:
+                    tracemalloc.stop()
+            peak_mb = round((peak - baseline) / 2**20, 2)
+
+    return {
+        "backend": CLI_NAMES[backend],
+        "success": run["success"],
+        "events": run["lines"],
+        "bytes": run["bytes"],
+        "seconds": round(seconds, 4),
+        "events_per_s": round(run["lines"] / seconds, 1) if seconds else 0.0,
+        "mb_per_s": round(run["bytes"] / 2**20 / seconds, 2) if seconds else 0.0,
+        "peak_memory_mb": peak_mb,
+    }
@@ -0,0 +1,217 @@
+"""自适应超时模块
+
+按 工具 / 模型 / prompt 规模 分桶记录成功调用的最大事件间隔与总耗时，
+调用方开启 adaptive_timeout 时，以历史高分位数推导空闲超时与总时长上限：
+卡死的运行被更早终止，而历史上本就耗时较长的任务不会被默认值误杀。
+推导值只替换调用方未显式传入（仍为默认值）的参数，显式传入的值保持不变。
+
+历史数据保存在 ~/.ccg-mcp/timeout_history.json，每个桶只保留最近 MAX_SAMPLES 条。
+多个服务器进程共用该文件：每次记录时在文件锁内重新读取并合并后再原子替换，不会互相覆盖样本。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ccg_mcp.metrics import percentile
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+# 每个桶保留的样本数
+MAX_SAMPLES = 200
+# 推导超时所需的最少样本数，样本不足时沿用调用方传入的超时
+MIN_SAMPLES = 10
+# 推导所用分位数与安全系数
+ADAPTIVE_PERCENTILE = 99
+IDLE_MARGIN = 2.0
+DURATION_MARGIN = 1.5
+# 工具 timeout / max_duration 参数的默认值（等于默认值视为调用方未显式传入）
+DEFAULT_TIMEOUT_S = 300
+DEFAULT_MAX_DURATION_S = 1800
+# 推导结果的上下限（秒）
+MIN_IDLE_S = 30
+MAX_IDLE_S = 1800
+MIN_DURATION_S = 120
+MAX_DURATION_S = 7200
+
+# prompt 规模分档（字符数上界）
+_PROMPT_SIZE_BUCKETS = ((2_000, "s"), (20_000, "m"))
+
+
+def get_history_path() -> Path:
+    """获取超时历史文件路径"""
+    return Path.home() / ".ccg-mcp" / "timeout_history.json"
+
+
+def history_bucket(tool: str, model: str, prompt: str) -> str:
+    """计算历史分桶键：工具:模型:prompt 规模"""
+    size = "l"
+    for limit, name in _PROMPT_SIZE_BUCKETS:
+        if len(prompt) < limit:
+            size = name
+            break
+    return f"{tool}:{model or 'default'}:{size}"
+
+
+class AdaptiveTimeouts:
+    """由历史推导出的超时设置"""
+
+    def __init__(self, bucket: str, samples: int, timeout: int, max_duration: int):
+        self.bucket = bucket
+        self.samples = samples  # 参与推导的样本数
+        self.timeout = timeout  # 空闲超时（秒）
+        self.max_duration = max_duration  # 总时长上限（秒）
+        self.explicit: List[str] = []  # 调用方显式传入、未被替换的参数
+
+    def apply(self, timeout: int, max_duration: int) -> Tuple[int, int]:
+        """返回实际使用的 (timeout, max_duration)：只替换仍为默认值的参数
+
+        显式传入的值保持不变（推导值可能比调用方要求的更紧），并记录在 explicit 中。
+        """
+        if timeout != DEFAULT_TIMEOUT_S:
+            self.timeout = timeout
+            self.explicit.append("timeout")
+        if max_duration != DEFAULT_MAX_DURATION_S:
+            self.max_duration = max_duration
+            self.explicit.append("max_duration")
+        return self.timeout, self.max_duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket": self.bucket,
+            "samples": self.samples,
+            "timeout": self.timeout,
+            "max_duration": self.max_duration,
+            "explicit": list(self.explicit),
+        }
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """跨进程互斥锁（锁文件无法创建或加锁失败时不加锁继续，历史数据只是尽力而为）"""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+    try:
+        try:
+            if sys.platform == "win32":
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except OSError:
+            pass
+        yield
+    finally:
+        os.close(fd)  # 关闭时释放锁
+
+
+class TimeoutHistory:
+    """超时历史记录
+
+    record() 记录一次成功调用；suggest() 在样本充足时返回推导出的超时。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or get_history_path()
+        self._buckets: Dict[str, Dict[str, List[int]]] = {}
+        self._lock = threading.Lock()
+        self._mtime_ns: Optional[int] = None  # 最近一次读取时文件的修改时间
+
+    def _load(self) -> None:
+        """文件被（其他进程）修改过时重新读取（调用方需持有锁）"""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is not None and mtime_ns == self._mtime_ns:
+            return
+        self._mtime_ns = mtime_ns
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            buckets = data.get("buckets", {})
+            self._buckets = buckets if isinstance(buckets, dict) else {}
+        except FileNotFoundError:
+            pass  # 尚未写入过：保留内存中的样本
+        except (OSError, ValueError, AttributeError):
+            self._buckets = {}
+
+    def _save(self) -> None:
+        """原子写入历史文件（调用方需持有锁与文件锁，写入失败静默忽略）"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "buckets": self._buckets}, f)
+            os.replace(tmp_path, self.path)
+            self._mtime_ns = self.path.stat().st_mtime_ns
+        except OSError:
+            pass
+
+    def record(self, bucket: str, max_gap_ms: Optional[int], duration_ms: Optional[int]) -> None:
+        """记录一次成功调用的最大事件间隔与总耗时
+
+        在文件锁内重新读取其他进程写入的样本后再追加，避免并发的服务器互相覆盖。
+        """
+        if max_gap_ms is None or duration_ms is None:
+            return
+        with self._lock, _file_lock(self.path.with_suffix(".lock")):
+            self._load()
+            entry = self._buckets.setdefault(bucket, {"gaps_ms": [], "durations_ms": []})
+            for key, value in (("gaps_ms", max_gap_ms), ("durations_ms", duration_ms)):
+                samples = entry.setdefault(key, [])
+                samples.append(int(value))
+                del samples[:-MAX_SAMPLES]
+            self._save()
+
+    def samples(self, bucket: str) -> Dict[str, List[int]]:
+        """获取某个桶的样本副本"""
+        with self._lock:
+            self._load()
+            entry = self._buckets.get(bucket, {})
+            return {key: list(values) for key, values in entry.items()}
+
+    def suggest(self, bucket: str) -> Optional[AdaptiveTimeouts]:
+        """按历史高分位数推导超时，样本不足时返回 None"""
+        entry = self.samples(bucket)
+        gaps = entry.get("gaps_ms", [])
+        durations = entry.get("durations_ms", [])
+        count = min(len(gaps), len(durations))
+        if count < MIN_SAMPLES:
+            return None
+        idle_s = percentile(gaps, ADAPTIVE_PERCENTILE) / 1000 * IDLE_MARGIN
+        duration_s = percentile(durations, ADAPTIVE_PERCENTILE) / 1000 * DURATION_MARGIN
+        timeout = int(min(max(idle_s, MIN_IDLE_S), MAX_IDLE_S))
+        max_duration = int(min(max(duration_s, MIN_DURATION_S, timeout), MAX_DURATION_S))
+        return AdaptiveTimeouts(bucket=bucket, samples=count, timeout=timeout, max_duration=max_duration)
+
+
+# 全局超时历史（所有工具共享，首次使用时加载）
+_timeout_history: Optional[TimeoutHistory] = None
+
+
+def get_timeout_history() -> TimeoutHistory:
+    """获取服务级超时历史"""
+    global _timeout_history
+    if _timeout_history is None:
+        _timeout_history = TimeoutHistory()
+    return _timeout_history
+
+
+def set_timeout_history(history: Optional[TimeoutHistory]) -> None:
+    """替换服务级超时历史（None 表示下次使用时重新创建，主要用于测试）"""
+    global _timeout_history
+    _timeout_history = history
@@ -1,7 +1,23 @@
-"""CCG-MCP 工具模块"""
+"""CCG-MCP 工具模块
 
-from ccg_mcp.tools.coder import coder_tool
-from ccg_mcp.tools.codex import codex_tool
-from ccg_mcp.tools.gemini import gemini_tool
+各工具按需导入（首次访问 coder_tool 等属性时），避免服务器启动时加载全部实现。
+"""
+
+from __future__ import annotations
+
+import importlib
+from typing import Any
+
+_TOOLS = {
+    "coder_tool": "ccg_mcp.tools.coder",
+    "codex_tool": "ccg_mcp.tools.codex",
+    "gemini_tool": "ccg_mcp.tools.gemini",
+}
 
 __all__ = ["coder_tool", "codex_tool", "gemini_tool"]
+
+
+def __getattr__(name: str) -> Any:
+    if name in _TOOLS:
+        return getattr(importlib.import_module(_TOOLS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
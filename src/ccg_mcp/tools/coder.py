@@ -7,36 +7,26 @@
 from __future__ import annotations
 
 import json
-import queue
-import shutil
-import subprocess
-import sys
-import threading
-import time
-from contextlib import contextmanager
-from datetime import datetime, timezone
 from pathlib import Path
-from typing import Annotated, Any, Dict, Generator, Iterator, Literal, Optional
+from typing import Annotated, Any, ContextManager, Dict, Generator, Literal, Optional
 
 from pydantic import Field
 
+from ccg_mcp.actions import ToolActionTracker, payload_bytes, summarize_input
 from ccg_mcp.config import build_coder_env, get_config
-
-
-# ============================================================================
-# 错误类型定义
-# ============================================================================
-
-class CommandNotFoundError(Exception):
-    """命令不存在错误"""
-    pass
-
-
-class CommandTimeoutError(Exception):
-    """命令执行超时错误"""
-    def __init__(self, message: str, is_idle: bool = False):
-        super().__init__(message)
-        self.is_idle = is_idle  # 标记是否为空闲超时
+from ccg_mcp.metrics import MetricsCollector, Phase, PhaseTimeline
+from ccg_mcp.output import OutputPathError, OutputWriter, resolve_output_path
+from ccg_mcp.retry import (
+    MAX_STARTUP_RETRIES,
+    Deadline,
+    RateLimitSignal,
+    RetryScheduler,
+    classify_rate_limit,
+)
+from ccg_mcp.runner import CommandNotFoundError, CommandTimeoutError, interruptible_sleep, safe_cli_command
+from ccg_mcp.timeouts import get_timeout_history, history_bucket
+from ccg_mcp.tracing import start_trace
+from ccg_mcp.usage import TokenUsage, account_usage, parse_claude_usage
 
 
 # ============================================================================
@@ -47,478 +37,82 @@ class ErrorKind:
     """结构化错误类型枚举"""
     TIMEOUT = "timeout"  # 总时长超时
     IDLE_TIMEOUT = "idle_timeout"  # 空闲超时（无输出）
+    STARTUP_TIMEOUT = "startup_timeout"  # 启动超时（未收到初始化事件）
     COMMAND_NOT_FOUND = "command_not_found"
     UPSTREAM_ERROR = "upstream_error"
     JSON_DECODE = "json_decode"
     PROTOCOL_MISSING_SESSION = "protocol_missing_session"
     EMPTY_RESULT = "empty_result"
     SUBPROCESS_ERROR = "subprocess_error"
+    RATE_LIMITED = "rate_limited"  # 上游限流（429 / quota / overloaded）
     CONFIG_ERROR = "config_error"
+    DEADLINE_EXCEEDED = "deadline_exceeded"  # 端到端截止时间已到
+    CANCELLED = "cancelled"  # 调用被取消（如 cancel_job）
+    INVALID_OUTPUT_PATH = "invalid_output_path"  # output_path 不在 cd 之内或为目录
     UNEXPECTED_EXCEPTION = "unexpected_exception"
 
 
-# ============================================================================
-# 指标收集
-# ============================================================================
-
-class MetricsCollector:
-    """指标收集器"""
-
-    def __init__(self, tool: str, prompt: str, sandbox: str):
-        self.tool = tool
-        self.sandbox = sandbox
-        self.prompt_chars = len(prompt)
-        self.prompt_lines = prompt.count('\n') + 1
-        self.ts_start = datetime.now(timezone.utc)
-        self.ts_end: Optional[datetime] = None
-        self.duration_ms: int = 0
-        self.success: bool = False
-        self.error_kind: Optional[str] = None
-        self.retries: int = 0
-        self.exit_code: Optional[int] = None
-        self.result_chars: int = 0
-        self.result_lines: int = 0
-        self.raw_output_lines: int = 0
-        self.json_decode_errors: int = 0
-
-    def finish(
-        self,
-        success: bool,
-        error_kind: Optional[str] = None,
-        result: str = "",
-        exit_code: Optional[int] = None,
-        raw_output_lines: int = 0,
-        json_decode_errors: int = 0,
-        retries: int = 0,
-    ) -> None:
-        """完成指标收集"""
-        self.ts_end = datetime.now(timezone.utc)
-        self.duration_ms = int((self.ts_end - self.ts_start).total_seconds() * 1000)
-        self.success = success
-        self.error_kind = error_kind
-        self.result_chars = len(result)
-        self.result_lines = result.count('\n') + 1 if result else 0
-        self.exit_code = exit_code
-        self.raw_output_lines = raw_output_lines
-        self.json_decode_errors = json_decode_errors
-        self.retries = retries
-
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            "ts_start": self.ts_start.isoformat() if self.ts_start else None,
-            "ts_end": self.ts_end.isoformat() if self.ts_end else None,
-            "duration_ms": self.duration_ms,
-            "tool": self.tool,
-            "sandbox": self.sandbox,
-            "success": self.success,
-            "error_kind": self.error_kind,
-            "retries": self.retries,
-            "exit_code": self.exit_code,
-            "prompt_chars": self.prompt_chars,
-            "prompt_lines": self.prompt_lines,
-            "result_chars": self.result_chars,
-            "result_lines": self.result_lines,
-            "raw_output_lines": self.raw_output_lines,
-            "json_decode_errors": self.json_decode_errors,
-        }
-
-    def format_duration(self) -> str:
-        """格式化耗时为 "xmxs" 格式"""
-        total_seconds = self.duration_ms // 1000
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        return f"{minutes}m{seconds}s"
-
-    def log_to_stderr(self) -> None:
-        """将指标输出到 stderr（JSONL 格式）"""
-        metrics = self.to_dict()
-        # 移除 None 值以减少输出
-        metrics = {k: v for k, v in metrics.items() if v is not None}
-        try:
-            print(json.dumps(metrics, ensure_ascii=False), file=sys.stderr)
-        except Exception:
-            pass  # 静默失败，不影响主流程
-
-
 # ============================================================================
 # 命令执行
 # ============================================================================
 
-def run_coder_command(
-    cmd: list[str],
-    env: dict[str, str],
-    cwd: Path | None = None,
-    timeout: int = 300,
-    max_duration: int = 1800,
-    prompt: str = "",
-) -> Generator[str, None, tuple[Optional[int], int]]:
-    """执行 Coder 命令并流式返回输出
-
-    Args:
-        cmd: 命令和参数列表
-        env: 环境变量字典
-        cwd: 工作目录
-        timeout: 空闲超时（秒），无输出超过此时间触发超时，默认 300 秒（5 分钟）
-        max_duration: 总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制
-        prompt: 通过 stdin 传递的对话 prompt
-
-    Yields:
-        输出行
-
-    Returns:
-        (exit_code, raw_output_lines) 元组
-
-    Raises:
-        CommandNotFoundError: claude CLI 未安装时抛出
-        CommandTimeoutError: 命令执行超时时抛出
-    """
-    # 查找 claude CLI 路径
-    claude_path = shutil.which('claude')
-    if not claude_path:
-        raise CommandNotFoundError(
-            "未找到 claude CLI。请确保已安装 Claude Code CLI 并添加到 PATH。\n"
-            "安装指南：https://docs.anthropic.com/en/docs/claude-code"
-        )
-    popen_cmd = cmd.copy()
-    popen_cmd[0] = claude_path
-
-    process = subprocess.Popen(
-        popen_cmd,
-        shell=False,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        encoding='utf-8',
-        errors='replace',  # 处理非 UTF-8 字符，避免 UnicodeDecodeError
-        env=env,
-        cwd=cwd,
-    )
-
-    # 通过 stdin 传递对话 prompt，然后关闭 stdin
-    if process.stdin:
-        try:
-            if prompt:
-                process.stdin.write(prompt)
-        except (BrokenPipeError, OSError):
-            pass
-        finally:
-            try:
-                process.stdin.close()
-            except (BrokenPipeError, OSError):
-                pass
-
-    output_queue: queue.Queue[str | None] = queue.Queue()
-    raw_output_lines = 0
-    GRACEFUL_SHUTDOWN_DELAY = 0.3
-
-    def is_session_completed(line: str) -> bool:
-        """检查是否会话完成（stream-json 格式）"""
-        try:
-            data = json.loads(line)
-            # stream-json 格式：result 或 error 类型表示会话结束
-            return data.get("type") in ("result", "error")
-        except (json.JSONDecodeError, AttributeError, TypeError):
-            return False
-
-    def read_output() -> None:
-        """在单独线程中读取进程输出"""
-        nonlocal raw_output_lines
-        if process.stdout:
-            for line in iter(process.stdout.readline, ""):
-                stripped = line.strip()
-                # 任意行都入队（触发活动判定），但只计数非空行
-                output_queue.put(stripped)
-                if stripped:
-                    raw_output_lines += 1
-                if is_session_completed(stripped):
-                    time.sleep(GRACEFUL_SHUTDOWN_DELAY)
-                    break
-            process.stdout.close()
-        output_queue.put(None)
-
-    thread = threading.Thread(target=read_output)
-    thread.start()
-
-    # 持续读取输出，带双重超时保障
-    start_time = time.time()
-    last_activity_time = time.time()
-    timeout_error: CommandTimeoutError | None = None
-
-    while True:
-        now = time.time()
-
-        # 检查总时长硬上限（优先级高）
-        if max_duration > 0 and (now - start_time) >= max_duration:
-            timeout_error = CommandTimeoutError(
-                f"coder 执行超时（总时长超过 {max_duration}s），进程已终止。",
-                is_idle=False
-            )
-            break
-
-        # 检查空闲超时
-        if (now - last_activity_time) >= timeout:
-            timeout_error = CommandTimeoutError(
-                f"coder 空闲超时（{timeout}s 无输出），进程已终止。",
-                is_idle=True
-            )
-            break
-
-        try:
-            line = output_queue.get(timeout=0.5)
-            if line is None:
-                break
-            # 有输出（包括空行），重置空闲计时器
-            last_activity_time = time.time()
-            if line:  # 非空行才 yield
-                yield line
-        except queue.Empty:
-            if process.poll() is not None and not thread.is_alive():
-                break
-
-    # 如果超时，终止进程
-    if timeout_error is not None:
-        process.terminate()
-        try:
-            process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.wait()
-        thread.join(timeout=5)
-        raise timeout_error
-
-    exit_code: Optional[int] = None
+def _is_init_event(line: str) -> bool:
+    """检查是否为初始化事件（stream-json 的 system/init）"""
     try:
-        exit_code = process.wait(timeout=5)  # 此时进程应已结束，短超时即可
-    except subprocess.TimeoutExpired:
-        process.terminate()
-        try:
-            process.wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.wait()
-        # 进程等待超时（罕见情况），视为总时长超时
-        timeout_error = CommandTimeoutError(
-            f"coder 进程等待超时，进程已终止。",
-            is_idle=False
-        )
-    finally:
-        thread.join(timeout=5)
+        data = json.loads(line)
+        return data.get("type") == "system" and data.get("subtype") == "init"
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return False
 
-    if timeout_error is not None:
-        raise timeout_error
-
-    # 读取剩余输出（不再累加 raw_output_lines，避免重复计数）
-    while not output_queue.empty():
-        try:
-            line = output_queue.get_nowait()
-            if line is not None:
-                yield line
-        except queue.Empty:
-            break
 
-    # 返回退出码和原始输出行数
-    return (exit_code, raw_output_lines)
+def _is_session_completed(line: str) -> bool:
+    """检查是否会话完成（stream-json 格式：result 或 error 类型表示会话结束）"""
+    try:
+        data = json.loads(line)
+        return data.get("type") in ("result", "error")
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return False
 
 
-@contextmanager
 def safe_coder_command(
     cmd: list[str],
     env: dict[str, str],
     cwd: Path | None = None,
-    timeout: int = 300,
-    max_duration: int = 1800,
+    timeout: float = 300,
+    max_duration: float = 1800,
     prompt: str = "",
-) -> Iterator[Generator[str, None, tuple[Optional[int], int]]]:
+    stats: Optional[Dict[str, Any]] = None,
+    startup_timeout: float = 0,
+    phases: Optional[PhaseTimeline] = None,
+) -> ContextManager[Generator[str, None, tuple[Optional[int], int]]]:
     """安全执行 Coder 命令的上下文管理器
 
-    确保在任何情况下（包括异常）都能正确清理子进程。
+    确保在任何情况下（包括异常）都能正确清理子进程，见 ccg_mcp.runner.safe_cli_command。
 
     用法:
         with safe_coder_command(cmd, env, cwd, timeout, max_duration, prompt) as gen:
             for line in gen:
                 process_line(line)
     """
-    # 查找 claude CLI 路径
-    claude_path = shutil.which('claude')
-    if not claude_path:
-        raise CommandNotFoundError(
+    return safe_cli_command(
+        cmd,
+        tool="Coder",
+        not_found_message=(
             "未找到 claude CLI。请确保已安装 Claude Code CLI 并添加到 PATH。\n"
             "安装指南：https://docs.anthropic.com/en/docs/claude-code"
-        )
-    popen_cmd = cmd.copy()
-    popen_cmd[0] = claude_path
-
-    process = subprocess.Popen(
-        popen_cmd,
-        shell=False,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        encoding='utf-8',
-        errors='replace',  # 处理非 UTF-8 字符，避免 UnicodeDecodeError
+        ),
+        is_completed=_is_session_completed,
         env=env,
         cwd=cwd,
+        timeout=timeout,
+        max_duration=max_duration,
+        prompt=prompt,
+        stats=stats,
+        is_started=_is_init_event,
+        startup_timeout=startup_timeout,
+        phases=phases,
     )
 
-    thread: Optional[threading.Thread] = None
-
-    def cleanup() -> None:
-        """清理子进程和线程（best-effort，不抛异常）"""
-        nonlocal thread
-        # 1. 先关闭 stdout 以解除读取线程的阻塞
-        try:
-            if process.stdout and not process.stdout.closed:
-                process.stdout.close()
-        except (OSError, IOError):
-            pass
-        # 2. 终止进程
-        try:
-            if process.poll() is None:
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    try:
-                        process.wait(timeout=2)  # kill 后也设超时
-                    except subprocess.TimeoutExpired:
-                        pass  # 极端情况：进程无法终止，放弃
-        except (ProcessLookupError, OSError):
-            pass  # 进程已退出，忽略
-        # 3. 等待线程结束
-        if thread is not None and thread.is_alive():
-            thread.join(timeout=5)
-
-    try:
-        # 通过 stdin 传递对话 prompt，然后关闭 stdin
-        if process.stdin:
-            try:
-                if prompt:
-                    process.stdin.write(prompt)
-            except (BrokenPipeError, OSError):
-                pass
-            finally:
-                try:
-                    process.stdin.close()
-                except (BrokenPipeError, OSError):
-                    pass
-
-        output_queue: queue.Queue[str | None] = queue.Queue()
-        raw_output_lines_holder = [0]  # 使用列表以便在嵌套函数中修改
-        GRACEFUL_SHUTDOWN_DELAY = 0.3
-
-        def is_session_completed(line: str) -> bool:
-            """检查是否会话完成（stream-json 格式）"""
-            try:
-                data = json.loads(line)
-                # stream-json 格式：result 或 error 类型表示会话结束
-                return data.get("type") in ("result", "error")
-            except (json.JSONDecodeError, AttributeError, TypeError):
-                return False
-
-        def read_output() -> None:
-            """在单独线程中读取进程输出"""
-            try:
-                if process.stdout:
-                    for line in iter(process.stdout.readline, ""):
-                        stripped = line.strip()
-                        output_queue.put(stripped)
-                        if stripped:
-                            raw_output_lines_holder[0] += 1
-                        if is_session_completed(stripped):
-                            time.sleep(GRACEFUL_SHUTDOWN_DELAY)
-                            break
-                    process.stdout.close()
-            except (OSError, IOError, ValueError):
-                pass  # stdout 被关闭，正常退出
-            finally:
-                output_queue.put(None)  # 确保投递哨兵
-
-        thread = threading.Thread(target=read_output, daemon=True)
-        thread.start()
-
-        def generator() -> Generator[str, None, tuple[Optional[int], int]]:
-            """生成器：读取输出并处理超时"""
-            nonlocal thread
-            start_time = time.time()
-            last_activity_time = time.time()
-            timeout_error: CommandTimeoutError | None = None
-
-            while True:
-                now = time.time()
-
-                if max_duration > 0 and (now - start_time) >= max_duration:
-                    timeout_error = CommandTimeoutError(
-                        f"coder 执行超时（总时长超过 {max_duration}s），进程已终止。",
-                        is_idle=False
-                    )
-                    break
-
-                if (now - last_activity_time) >= timeout:
-                    timeout_error = CommandTimeoutError(
-                        f"coder 空闲超时（{timeout}s 无输出），进程已终止。",
-                        is_idle=True
-                    )
-                    break
-
-                try:
-                    line = output_queue.get(timeout=0.5)
-                    if line is None:
-                        break
-                    last_activity_time = time.time()
-                    if line:
-                        yield line
-                except queue.Empty:
-                    if process.poll() is not None and not thread.is_alive():
-                        break
-
-            if timeout_error is not None:
-                cleanup()
-                raise timeout_error
-
-            exit_code: Optional[int] = None
-            try:
-                exit_code = process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.terminate()
-                try:
-                    process.wait(timeout=2)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    process.wait()
-                timeout_error = CommandTimeoutError(
-                    f"coder 进程等待超时，进程已终止。",
-                    is_idle=False
-                )
-            finally:
-                if thread is not None:
-                    thread.join(timeout=5)
-
-            if timeout_error is not None:
-                raise timeout_error
-
-            while not output_queue.empty():
-                try:
-                    line = output_queue.get_nowait()
-                    if line is not None:
-                        yield line
-                except queue.Empty:
-                    break
-
-            return (exit_code, raw_output_lines_holder[0])
-
-        yield generator()
-
-    except Exception:
-        cleanup()
-        raise
-    finally:
-        # 确保在退出上下文时清理
-        cleanup()
-
 
 def _filter_last_lines(lines: list[str], max_lines: int = 50) -> list[str]:
     """过滤 last_lines，脱敏 tool_result 中的大内容
@@ -567,7 +161,9 @@ def _build_error_detail(
     json_decode_errors: int = 0,
     idle_timeout_s: Optional[int] = None,
     max_duration_s: Optional[int] = None,
+    deadline_s: Optional[float] = None,
     retries: int = 0,
+    attempts: Optional[list[Dict[str, Any]]] = None,
 ) -> Dict[str, Any]:
     """构建结构化错误详情"""
     detail: Dict[str, Any] = {"message": message}
@@ -589,8 +185,16 @@ def _build_error_detail(
             "任务总时长超时。建议：1) 增加 max_duration 参数 "
             "2) 拆分为更小的子任务 3) 检查是否存在死循环"
         )
+    if deadline_s is not None:
+        detail["deadline_s"] = deadline_s
+        detail["suggestion"] = (
+            "已达到端到端截止时间。建议：1) 增加 deadline 参数 "
+            "2) 减少 max_retries 3) 拆分为更小的子任务"
+        )
     if retries > 0:
         detail["retries"] = retries
+    if attempts and len(attempts) > 1:
+        detail["attempts"] = attempts
     return detail
 
 
@@ -618,6 +222,11 @@ async def coder_tool(
     timeout: Annotated[int, "空闲超时（秒），无输出超过此时间触发超时，默认 300 秒"] = 300,
     max_duration: Annotated[int, "总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制"] = 1800,
     max_retries: Annotated[int, "最大重试次数，默认 0（不重试）"] = 0,
+    deadline: Annotated[float, "端到端截止时间（秒），覆盖所有尝试与退避等待，默认 0 表示不限制"] = 0,
+    startup_timeout: Annotated[int, "启动超时（秒），超过此时间未收到初始化事件即在新进程上立即重试，默认 60 秒，0 表示不限制"] = 60,
+    adaptive_timeout: Annotated[bool, "是否按历史耗时分布自动推导 timeout / max_duration（样本不足时沿用传入值）"] = False,
+    trace_id: Annotated[str, "追踪 ID（32 位十六进制、W3C traceparent 或任意字符串），传入时将本次调用的 span 写入 .ccg/traces/，默认不追踪"] = "",
+    output_path: Annotated[str, "结果写入的文件路径（相对 cd，必须位于 cd 之内）；传入时输出边产出边写入文件，返回值只保留摘要与路径，默认不写文件"] = "",
     log_metrics: Annotated[bool, "是否将指标输出到 stderr"] = False,
 ) -> Dict[str, Any]:
     """执行 Coder 代码任务
@@ -636,7 +245,8 @@ async def coder_tool(
     **重试策略**：Coder 默认不重试（有写入副作用），除非显式设置 max_retries
     """
     # 初始化指标收集器
-    metrics = MetricsCollector(tool="coder", prompt=PROMPT, sandbox=sandbox)
+    metrics = MetricsCollector(tool="coder", prompt=PROMPT, sandbox=sandbox, project=cd)
+    start_trace(metrics, trace_id)
 
     # 获取配置并构建环境变量
     try:
@@ -659,6 +269,27 @@ async def coder_tool(
             result["metrics"] = metrics.to_dict()
         return result
 
+    # 结果写入工作区文件（output_path）
+    output: Optional[OutputWriter] = None
+    if output_path:
+        try:
+            output = OutputWriter(resolve_output_path(cd, output_path), separator='\n\n')
+        except OutputPathError as e:
+            metrics.finish(success=False, error_kind=ErrorKind.INVALID_OUTPUT_PATH)
+            if log_metrics:
+                metrics.log_to_stderr()
+
+            result = {
+                "success": False,
+                "tool": "coder",
+                "error": str(e),
+                "error_kind": ErrorKind.INVALID_OUTPUT_PATH,
+                "error_detail": _build_error_detail(str(e)),
+            }
+            if return_metrics:
+                result["metrics"] = metrics.to_dict()
+            return result
+
     # 构建命令（按逻辑分层排序）
     cmd = [
         "claude",
@@ -683,12 +314,38 @@ async def coder_tool(
     normalized_prompt = PROMPT.replace('\r\n', '\n').replace('\r', '\n')
     # 对话 prompt 通过 stdin 传递，system prompt 通过 --append-system-prompt 命令行参数传递
 
+    # 自适应超时：按历史高分位数推导（样本不足时沿用传入值）
+    history = get_timeout_history()
+    history_key = history_bucket("coder", config.get("coder", {}).get("model", ""), PROMPT)
+    adaptive = history.suggest(history_key) if adaptive_timeout else None
+    if adaptive is not None:
+        timeout, max_duration = adaptive.apply(timeout, max_duration)
+        metrics.adaptive_timeout = adaptive.to_dict()
+
     # 执行循环（支持重试）
     retries = 0
     last_error: Optional[Dict[str, Any]] = None
     all_last_lines: list[str] = []
+    scheduler = RetryScheduler(deadline=Deadline(deadline))
+    runner_stats: Dict[str, Any] = {}  # 子进程执行统计（跨尝试累计）
+    usage = TokenUsage()  # token 用量（跨尝试累计）
+    startup_retries = 0
+    error_kind: Optional[str] = None  # 最近一次尝试的错误类型
 
     while retries <= max_retries:
+        # 截止时间已到时不再开始新的尝试（如启动超时后的立即重试、退避结束后的重试）
+        if scheduler.attempts and scheduler.deadline.expired():
+            err_message = f"coder 已达到端到端截止时间（{deadline}s），未开始新的尝试。"
+            error_kind, success = ErrorKind.DEADLINE_EXCEEDED, False  # 上一次尝试可能因启动超时直接进入下一轮
+            if last_error is not None:
+                last_error.update(error_kind=error_kind, err_message=err_message)
+            break
+        scheduler.begin_attempt()
+        metrics.phases.begin_attempt()
+        if output is not None:
+            output.begin_attempt()
+        # 每次尝试只能使用截止时间内的剩余预算
+        attempt_max_duration = scheduler.attempt_max_duration(max_duration)
         all_messages: list[Dict[str, Any]] = []
         result_content = ""
         success = True
@@ -698,12 +355,17 @@ async def coder_tool(
         exit_code: Optional[int] = None
         raw_output_lines = 0
         json_decode_errors = 0
-        error_kind: Optional[str] = None
+        error_kind = None
+        rate_limit_signal: Optional[RateLimitSignal] = None
         last_lines: list[str] = []
         assistant_text_parts: list[str] = []  # 累积所有 assistant 消息的文本（多轮对话拼接）
+        actions = ToolActionTracker(timeline=metrics.phases)  # 跟踪内部工具调用（tool_use / tool_result 配对）
 
         try:
-            with safe_coder_command(cmd, env, cd, timeout, max_duration, prompt=normalized_prompt) as gen:
+            with safe_coder_command(
+                cmd, env, cd, timeout, attempt_max_duration, prompt=normalized_prompt,
+                stats=runner_stats, startup_timeout=startup_timeout, phases=metrics.phases
+            ) as gen:
                 try:
                     for line in gen:
                         last_lines.append(line)
@@ -733,6 +395,8 @@ async def coder_tool(
                             # S0.3: 从 system/init 消息提取 session_id
                             if msg_type == "system" and line_dict.get("subtype") == "init":
                                 session_id = line_dict.get("session_id")
+                                if session_id:
+                                    metrics.phases.mark(Phase.SESSION_ID)
 
                             # S0.4: 从 assistant 消息提取文本（多轮对话拼接）
                             elif msg_type == "assistant":
@@ -746,9 +410,36 @@ async def coder_tool(
                                                 text = block.get("text", "")
                                                 if text:
                                                     assistant_text_parts.append(text)
+                                                    if output is not None:
+                                                        output.write(text)
+                                                    metrics.phases.mark(Phase.FIRST_TEXT)
+                                            elif block.get("type") == "tool_use":
+                                                actions.start(
+                                                    block.get("id"),
+                                                    block.get("name", ""),
+                                                    summarize_input(block.get("input")),
+                                                    payload_bytes(block.get("input")),
+                                                )
+
+                            # 从 user 消息的 tool_result 标记工具调用完成
+                            elif msg_type == "user":
+                                message = line_dict.get("message", {})
+                                content = message.get("content") if isinstance(message, dict) else None
+                                if isinstance(content, list):
+                                    for block in content:
+                                        if isinstance(block, dict) and block.get("type") == "tool_result":
+                                            actions.finish(
+                                                block.get("tool_use_id"),
+                                                bool(block.get("is_error")),
+                                                output_bytes=payload_bytes(block.get("content")),
+                                            )
 
                             # 处理 result 类型（stream-json 中可能也有）
                             elif msg_type == "result":
+                                metrics.phases.mark(Phase.RESULT)
+                                attempt_usage = parse_claude_usage(line_dict)
+                                if attempt_usage is not None:
+                                    usage.add(attempt_usage)
                                 # stream-json 的 result 可能包含完整结果或仅包含 stats
                                 if "result" in line_dict:
                                     result_content = line_dict.get("result", "")
@@ -759,12 +450,19 @@ async def coder_tool(
                                     had_error = True
                                     err_message = line_dict.get("result", "") or line_dict.get("error", "")
                                     error_kind = ErrorKind.UPSTREAM_ERROR
+                                    # 识别限流信号（429 / quota / overloaded）
+                                    rate_limit_signal = classify_rate_limit(str(err_message))
+                                    if rate_limit_signal:
+                                        error_kind = ErrorKind.RATE_LIMITED
 
                             elif msg_type == "error":
                                 had_error = True
                                 error_data = line_dict.get("error", {})
                                 err_message = error_data.get("message", str(line_dict))
                                 error_kind = ErrorKind.UPSTREAM_ERROR
+                                rate_limit_signal = classify_rate_limit(str(err_message))
+                                if rate_limit_signal:
+                                    error_kind = ErrorKind.RATE_LIMITED
 
                         except json.JSONDecodeError:
                             json_decode_errors += 1
@@ -775,20 +473,23 @@ async def coder_tool(
                             had_error = True
                             error_kind = ErrorKind.UNEXPECTED_EXCEPTION
                             break
-                except StopIteration as e:
-                    # 正确捕获生成器返回值
-                    if isinstance(e.value, tuple) and len(e.value) == 2:
-                        exit_code, raw_output_lines = e.value
+                finally:
+                    # for 循环取不到生成器的返回值，退出码与输出行数由 runner 写入 runner_stats
+                    exit_code = runner_stats.get("exit_code")
+                    raw_output_lines = runner_stats.get("raw_output_lines", 0)
 
             # 如果没有从 result 获取到内容，拼接所有 assistant 消息的文本
             if not result_content and assistant_text_parts:
                 result_content = "\n\n".join(assistant_text_parts)
 
         except CommandNotFoundError as e:
+            scheduler.end_attempt(ErrorKind.COMMAND_NOT_FOUND)
             metrics.finish(
                 success=False,
                 error_kind=ErrorKind.COMMAND_NOT_FOUND,
                 retries=retries,
+                retry_stats=scheduler.to_dict(),
+                runner_stats=runner_stats,
             )
             if log_metrics:
                 metrics.log_to_stderr()
@@ -800,6 +501,8 @@ async def coder_tool(
                 "error_kind": ErrorKind.COMMAND_NOT_FOUND,
                 "error_detail": _build_error_detail(str(e)),
             }
+            if output is not None:
+                output.finish(result)
             if return_metrics:
                 result["metrics"] = metrics.to_dict()
             return result
@@ -807,8 +510,20 @@ async def coder_tool(
         except CommandTimeoutError as e:
             # 根据异常属性区分空闲超时和总时长超时
             error_kind = ErrorKind.IDLE_TIMEOUT if e.is_idle else ErrorKind.TIMEOUT
+            if e.is_startup:
+                error_kind = ErrorKind.STARTUP_TIMEOUT
             had_error = True
             err_message = str(e)
+            if scheduler.deadline.expired():
+                error_kind = ErrorKind.DEADLINE_EXCEEDED
+                err_message = f"coder 已达到端到端截止时间（{deadline}s），进程已终止。"
+            if e.is_cancelled:
+                error_kind = ErrorKind.CANCELLED
+            scheduler.end_attempt(error_kind)
+            # 启动卡住时任务尚未开始，立即在新进程上重试（不计入 max_retries，不退避）
+            if error_kind == ErrorKind.STARTUP_TIMEOUT and startup_retries < MAX_STARTUP_RETRIES:
+                startup_retries += 1
+                continue
             success = False  # 明确设置为失败
             # 超时不重试（已经耗时太久），保存错误信息后跳出
             all_last_lines = last_lines.copy()
@@ -818,6 +533,11 @@ async def coder_tool(
                 "exit_code": exit_code,
                 "json_decode_errors": json_decode_errors,
                 "raw_output_lines": raw_output_lines,
+                "partial": {
+                    "SESSION_ID": session_id,
+                    "partial_result": result_content or "\n\n".join(assistant_text_parts),
+                    "completed_actions": actions.completed_actions(),
+                },
             }
             break
 
@@ -844,6 +564,8 @@ async def coder_tool(
                 error_kind = ErrorKind.SUBPROCESS_ERROR
             err_message = f"进程退出码非零：{exit_code}\n\n" + err_message
 
+        scheduler.end_attempt(None if success else error_kind)
+
         if success:
             # 成功，跳出重试循环
             break
@@ -859,12 +581,23 @@ async def coder_tool(
             }
             # 检查是否需要重试
             if retries < max_retries:
+                # 去相关抖动退避（限流时遵循 retry-after），预算耗尽则放弃重试
+                delay = scheduler.next_delay(rate_limit_signal)
+                if delay is None:
+                    break
                 retries += 1
-                # 指数退避
-                time.sleep(0.5 * (2 ** (retries - 1)))
+                interruptible_sleep(delay)
             else:
                 break
 
+    # 记录成功调用的事件间隔与耗时，供自适应超时使用
+    if success:
+        history.record(history_key, runner_stats.get("max_event_gap_ms"), runner_stats.get("run_duration_ms"))
+
+    # token 用量与成本，按会话 / 项目累计
+    metrics.model = config.get("coder", {}).get("model", "") or ""
+    metrics.usage = account_usage("coder", metrics.model, session_id, cd, usage)
+
     # 完成指标收集
     metrics.finish(
         success=success,
@@ -874,6 +607,8 @@ async def coder_tool(
         raw_output_lines=raw_output_lines,
         json_decode_errors=json_decode_errors,
         retries=retries,
+        retry_stats=scheduler.to_dict(),
+        runner_stats=runner_stats,
     )
     if log_metrics:
         metrics.log_to_stderr()
@@ -907,11 +642,20 @@ async def coder_tool(
                 json_decode_errors=json_decode_errors,
                 idle_timeout_s=timeout if error_kind == ErrorKind.IDLE_TIMEOUT else None,
                 max_duration_s=max_duration if error_kind == ErrorKind.TIMEOUT else None,
+                deadline_s=deadline if error_kind == ErrorKind.DEADLINE_EXCEEDED else None,
                 retries=retries,
+                attempts=scheduler.attempts,
             ),
             "duration": metrics.format_duration(),
         }
 
+        # 超时时返回已产出的部分结果、会话 ID 与已完成的工具动作，便于调用方续接而非重做
+        if last_error and last_error.get("partial"):
+            result.update(last_error["partial"])
+
+    if output is not None:
+        output.finish(result)
+
     if return_all_messages:
         result["all_messages"] = all_messages
 
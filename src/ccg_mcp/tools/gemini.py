@@ -7,34 +7,25 @@ Gemini 是多面手，权限灵活，由 Claude 按场景控制。
 from __future__ import annotations
 
 import json
-import queue
-import shutil
-import subprocess
-import sys
-import threading
-import time
-from contextlib import contextmanager
-from datetime import datetime, timezone
 from pathlib import Path
-from typing import Annotated, Any, Dict, Generator, Iterator, List, Literal, Optional
+from typing import Annotated, Any, ContextManager, Dict, Generator, Literal, Optional
 
 from pydantic import Field
 
-
-# ============================================================================
-# 错误类型定义
-# ============================================================================
-
-class CommandNotFoundError(Exception):
-    """命令不存在错误"""
-    pass
-
-
-class CommandTimeoutError(Exception):
-    """命令执行超时错误"""
-    def __init__(self, message: str, is_idle: bool = False):
-        super().__init__(message)
-        self.is_idle = is_idle  # 标记是否为空闲超时
+from ccg_mcp.actions import ToolActionTracker, payload_bytes, summarize_input
+from ccg_mcp.metrics import MetricsCollector, Phase, PhaseTimeline
+from ccg_mcp.output import OutputPathError, OutputWriter, resolve_output_path
+from ccg_mcp.retry import (
+    MAX_STARTUP_RETRIES,
+    RESUME_PROMPT, Deadline,
+    RateLimitSignal,
+    RetryScheduler,
+    classify_rate_limit,
+)
+from ccg_mcp.runner import CommandNotFoundError, CommandTimeoutError, interruptible_sleep, safe_cli_command
+from ccg_mcp.timeouts import get_timeout_history, history_bucket
+from ccg_mcp.tracing import start_trace
+from ccg_mcp.usage import TokenUsage, account_usage, parse_gemini_usage
 
 
 # ============================================================================
@@ -45,471 +36,80 @@ class ErrorKind:
     """结构化错误类型枚举"""
     TIMEOUT = "timeout"  # 总时长超时
     IDLE_TIMEOUT = "idle_timeout"  # 空闲超时（无输出）
+    STARTUP_TIMEOUT = "startup_timeout"  # 启动超时（未收到初始化事件）
     COMMAND_NOT_FOUND = "command_not_found"
     UPSTREAM_ERROR = "upstream_error"
     AUTH_REQUIRED = "auth_required"  # 需要登录认证
+    RATE_LIMITED = "rate_limited"  # 上游限流（429 / quota / overloaded）
     JSON_DECODE = "json_decode"
     PROTOCOL_MISSING_SESSION = "protocol_missing_session"
     EMPTY_RESULT = "empty_result"
     SUBPROCESS_ERROR = "subprocess_error"
+    DEADLINE_EXCEEDED = "deadline_exceeded"  # 端到端截止时间已到
+    CANCELLED = "cancelled"  # 调用被取消（如 cancel_job）
+    INVALID_OUTPUT_PATH = "invalid_output_path"  # output_path 不在 cd 之内或为目录
     UNEXPECTED_EXCEPTION = "unexpected_exception"
 
 
-# ============================================================================
-# 指标收集
-# ============================================================================
-
-class MetricsCollector:
-    """指标收集器"""
-
-    def __init__(self, tool: str, prompt: str, sandbox: str):
-        self.tool = tool
-        self.sandbox = sandbox
-        self.prompt_chars = len(prompt)
-        self.prompt_lines = prompt.count('\n') + 1
-        self.ts_start = datetime.now(timezone.utc)
-        self.ts_end: Optional[datetime] = None
-        self.duration_ms: int = 0
-        self.success: bool = False
-        self.error_kind: Optional[str] = None
-        self.retries: int = 0
-        self.exit_code: Optional[int] = None
-        self.result_chars: int = 0
-        self.result_lines: int = 0
-        self.raw_output_lines: int = 0
-        self.json_decode_errors: int = 0
-
-    def finish(
-        self,
-        success: bool,
-        error_kind: Optional[str] = None,
-        result: str = "",
-        exit_code: Optional[int] = None,
-        raw_output_lines: int = 0,
-        json_decode_errors: int = 0,
-        retries: int = 0,
-    ) -> None:
-        """完成指标收集"""
-        self.ts_end = datetime.now(timezone.utc)
-        self.duration_ms = int((self.ts_end - self.ts_start).total_seconds() * 1000)
-        self.success = success
-        self.error_kind = error_kind
-        self.result_chars = len(result)
-        self.result_lines = result.count('\n') + 1 if result else 0
-        self.exit_code = exit_code
-        self.raw_output_lines = raw_output_lines
-        self.json_decode_errors = json_decode_errors
-        self.retries = retries
-
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            "ts_start": self.ts_start.isoformat() if self.ts_start else None,
-            "ts_end": self.ts_end.isoformat() if self.ts_end else None,
-            "duration_ms": self.duration_ms,
-            "tool": self.tool,
-            "sandbox": self.sandbox,
-            "success": self.success,
-            "error_kind": self.error_kind,
-            "retries": self.retries,
-            "exit_code": self.exit_code,
-            "prompt_chars": self.prompt_chars,
-            "prompt_lines": self.prompt_lines,
-            "result_chars": self.result_chars,
-            "result_lines": self.result_lines,
-            "raw_output_lines": self.raw_output_lines,
-            "json_decode_errors": self.json_decode_errors,
-        }
-
-    def format_duration(self) -> str:
-        """格式化耗时为 "xmxs" 格式"""
-        total_seconds = self.duration_ms // 1000
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        return f"{minutes}m{seconds}s"
-
-    def log_to_stderr(self) -> None:
-        """将指标输出到 stderr（JSONL 格式）"""
-        metrics = self.to_dict()
-        # 移除 None 值以减少输出
-        metrics = {k: v for k, v in metrics.items() if v is not None}
-        try:
-            print(json.dumps(metrics, ensure_ascii=False), file=sys.stderr)
-        except Exception:
-            pass  # 静默失败，不影响主流程
-
-
 # ============================================================================
 # 命令执行
 # ============================================================================
 
-def run_gemini_command(
-    cmd: list[str],
-    timeout: int = 300,
-    max_duration: int = 1800,
-    prompt: str = "",
-    cwd: Optional[Path] = None,
-) -> Generator[str, None, tuple[Optional[int], int]]:
-    """执行 Gemini 命令并流式返回输出
-
-    Args:
-        cmd: 命令和参数列表
-        timeout: 空闲超时（秒），无输出超过此时间触发超时，默认 300 秒（5 分钟）
-        max_duration: 总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制
-        prompt: 通过 stdin 传递的 prompt 内容
-        cwd: 工作目录
-
-    Yields:
-        输出行
-
-    Returns:
-        (exit_code, raw_output_lines) 元组
-
-    Raises:
-        CommandNotFoundError: gemini CLI 未安装时抛出
-        CommandTimeoutError: 命令执行超时时抛出
-    """
-    gemini_path = shutil.which('gemini')
-    if not gemini_path:
-        raise CommandNotFoundError(
-            "未找到 gemini CLI。请确保已安装 Gemini CLI 并添加到 PATH。\n"
-            "安装指南：https://github.com/google-gemini/gemini-cli"
-        )
-    popen_cmd = cmd.copy()
-    popen_cmd[0] = gemini_path
-
-    process = subprocess.Popen(
-        popen_cmd,
-        shell=False,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        encoding='utf-8',
-        errors='replace',  # 处理非 UTF-8 字符，避免 UnicodeDecodeError
-        cwd=str(cwd) if cwd else None,
-    )
-
-    # 通过 stdin 传递 prompt，然后关闭 stdin
-    if process.stdin:
-        try:
-            if prompt:
-                process.stdin.write(prompt)
-        except (BrokenPipeError, OSError):
-            # 子进程可能已退出，忽略写入错误
-            pass
-        finally:
-            try:
-                process.stdin.close()
-            except (BrokenPipeError, OSError):
-                pass
-
-    output_queue: queue.Queue[str | None] = queue.Queue()
-    raw_output_lines = 0
-    GRACEFUL_SHUTDOWN_DELAY = 0.3
-
-    def is_turn_completed(line: str) -> bool:
-        """检查是否回合完成"""
-        try:
-            data = json.loads(line)
-            # Gemini CLI 使用 turn.completed 表示回合完成
-            return data.get("type") == "turn.completed"
-        except (json.JSONDecodeError, AttributeError, TypeError):
-            return False
-
-    def read_output() -> None:
-        """在单独线程中读取进程输出"""
-        nonlocal raw_output_lines
-        if process.stdout:
-            for line in iter(process.stdout.readline, ""):
-                stripped = line.strip()
-                # 任意行都入队（触发活动判定），但只计数非空行
-                output_queue.put(stripped)
-                if stripped:
-                    raw_output_lines += 1
-                if is_turn_completed(stripped):
-                    # 等待剩余输出被 drain
-                    time.sleep(GRACEFUL_SHUTDOWN_DELAY)
-                    break
-            process.stdout.close()
-        output_queue.put(None)
-
-    thread = threading.Thread(target=read_output)
-    thread.start()
-
-    # 持续读取输出，带双重超时保障
-    start_time = time.time()
-    last_activity_time = time.time()
-    timeout_error: CommandTimeoutError | None = None
-
-    while True:
-        now = time.time()
-
-        # 检查总时长硬上限（优先级高）
-        if max_duration > 0 and (now - start_time) >= max_duration:
-            timeout_error = CommandTimeoutError(
-                f"gemini 执行超时（总时长超过 {max_duration}s），进程已终止。",
-                is_idle=False
-            )
-            break
-
-        # 检查空闲超时
-        if (now - last_activity_time) >= timeout:
-            timeout_error = CommandTimeoutError(
-                f"gemini 空闲超时（{timeout}s 无输出），进程已终止。",
-                is_idle=True
-            )
-            break
-
-        try:
-            line = output_queue.get(timeout=0.5)
-            if line is None:
-                break
-            # 有输出（包括空行），重置空闲计时器
-            last_activity_time = time.time()
-            if line:  # 非空行才 yield
-                yield line
-        except queue.Empty:
-            if process.poll() is not None and not thread.is_alive():
-                break
-
-    # 如果超时，终止进程
-    if timeout_error is not None:
-        process.terminate()
-        try:
-            process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.wait()
-        thread.join(timeout=5)
-        raise timeout_error
-
-    exit_code: Optional[int] = None
+def _is_init_event(line: str) -> bool:
+    """检查是否为初始化事件（stream-json 的 init）"""
     try:
-        exit_code = process.wait(timeout=5)  # 此时进程应已结束，短超时即可
-    except subprocess.TimeoutExpired:
-        process.terminate()
-        try:
-            process.wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.wait()
-        # 进程等待超时（罕见情况），视为总时长超时
-        timeout_error = CommandTimeoutError(
-            f"gemini 进程等待超时，进程已终止。",
-            is_idle=False
-        )
-    finally:
-        thread.join(timeout=5)
-
-    if timeout_error is not None:
-        raise timeout_error
+        data = json.loads(line)
+        return data.get("type") == "init"
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return False
 
-    # 读取剩余输出（不再累加 raw_output_lines，避免重复计数）
-    while not output_queue.empty():
-        try:
-            line = output_queue.get_nowait()
-            if line is not None:
-                yield line
-        except queue.Empty:
-            break
 
-    # 返回退出码和原始输出行数
-    return (exit_code, raw_output_lines)
+def _is_turn_completed(line: str) -> bool:
+    """检查是否回合完成"""
+    try:
+        data = json.loads(line)
+        return data.get("type") == "turn.completed"
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return False
 
 
-@contextmanager
 def safe_gemini_command(
     cmd: list[str],
-    timeout: int = 300,
-    max_duration: int = 1800,
+    timeout: float = 300,
+    max_duration: float = 1800,
     prompt: str = "",
     cwd: Optional[Path] = None,
-) -> Iterator[Generator[str, None, tuple[Optional[int], int]]]:
+    stats: Optional[Dict[str, Any]] = None,
+    startup_timeout: float = 0,
+    phases: Optional[PhaseTimeline] = None,
+) -> ContextManager[Generator[str, None, tuple[Optional[int], int]]]:
     """安全执行 Gemini 命令的上下文管理器
 
-    确保在任何情况下（包括异常）都能正确清理子进程。
+    确保在任何情况下（包括异常）都能正确清理子进程，见 ccg_mcp.runner.safe_cli_command。
 
     用法:
         with safe_gemini_command(cmd, timeout, max_duration, prompt, cwd) as gen:
             for line in gen:
                 process_line(line)
     """
-    gemini_path = shutil.which('gemini')
-    if not gemini_path:
-        raise CommandNotFoundError(
+    return safe_cli_command(
+        cmd,
+        tool="Gemini",
+        not_found_message=(
             "未找到 gemini CLI。请确保已安装 Gemini CLI 并添加到 PATH。\n"
             "安装指南：https://github.com/google-gemini/gemini-cli"
-        )
-    popen_cmd = cmd.copy()
-    popen_cmd[0] = gemini_path
-
-    process = subprocess.Popen(
-        popen_cmd,
-        shell=False,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        encoding='utf-8',
-        errors='replace',  # 处理非 UTF-8 字符，避免 UnicodeDecodeError
-        cwd=str(cwd) if cwd else None,
+        ),
+        is_completed=_is_turn_completed,
+        cwd=cwd,
+        timeout=timeout,
+        max_duration=max_duration,
+        prompt=prompt,
+        stats=stats,
+        is_started=_is_init_event,
+        startup_timeout=startup_timeout,
+        phases=phases,
     )
 
-    thread: Optional[threading.Thread] = None
-
-    def cleanup() -> None:
-        """清理子进程和线程（best-effort，不抛异常）"""
-        nonlocal thread
-        # 1. 先关闭 stdout 以解除读取线程的阻塞
-        try:
-            if process.stdout and not process.stdout.closed:
-                process.stdout.close()
-        except (OSError, IOError):
-            pass
-        # 2. 终止进程
-        try:
-            if process.poll() is None:
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    try:
-                        process.wait(timeout=2)  # kill 后也设超时
-                    except subprocess.TimeoutExpired:
-                        pass  # 极端情况：进程无法终止，放弃
-        except (ProcessLookupError, OSError):
-            pass  # 进程已退出，忽略
-        # 3. 等待线程结束
-        if thread is not None and thread.is_alive():
-            thread.join(timeout=5)
-
-    try:
-        # 通过 stdin 传递 prompt，然后关闭 stdin
-        if process.stdin:
-            try:
-                if prompt:
-                    process.stdin.write(prompt)
-            except (BrokenPipeError, OSError):
-                pass
-            finally:
-                try:
-                    process.stdin.close()
-                except (BrokenPipeError, OSError):
-                    pass
-
-        output_queue: queue.Queue[str | None] = queue.Queue()
-        raw_output_lines_holder = [0]
-        GRACEFUL_SHUTDOWN_DELAY = 0.3
-
-        def is_turn_completed(line: str) -> bool:
-            """检查是否回合完成"""
-            try:
-                data = json.loads(line)
-                return data.get("type") == "turn.completed"
-            except (json.JSONDecodeError, AttributeError, TypeError):
-                return False
-
-        def read_output() -> None:
-            """在单独线程中读取进程输出"""
-            try:
-                if process.stdout:
-                    for line in iter(process.stdout.readline, ""):
-                        stripped = line.strip()
-                        output_queue.put(stripped)
-                        if stripped:
-                            raw_output_lines_holder[0] += 1
-                        if is_turn_completed(stripped):
-                            time.sleep(GRACEFUL_SHUTDOWN_DELAY)
-                            break
-                    process.stdout.close()
-            except (OSError, IOError, ValueError):
-                pass  # stdout 被关闭，正常退出
-            finally:
-                output_queue.put(None)  # 确保投递哨兵
-
-        thread = threading.Thread(target=read_output, daemon=True)
-        thread.start()
-
-        def generator() -> Generator[str, None, tuple[Optional[int], int]]:
-            """生成器：读取输出并处理超时"""
-            nonlocal thread
-            start_time = time.time()
-            last_activity_time = time.time()
-            timeout_error: CommandTimeoutError | None = None
-
-            while True:
-                now = time.time()
-
-                if max_duration > 0 and (now - start_time) >= max_duration:
-                    timeout_error = CommandTimeoutError(
-                        f"gemini 执行超时（总时长超过 {max_duration}s），进程已终止。",
-                        is_idle=False
-                    )
-                    break
-
-                if (now - last_activity_time) >= timeout:
-                    timeout_error = CommandTimeoutError(
-                        f"gemini 空闲超时（{timeout}s 无输出），进程已终止。",
-                        is_idle=True
-                    )
-                    break
-
-                try:
-                    line = output_queue.get(timeout=0.5)
-                    if line is None:
-                        break
-                    last_activity_time = time.time()
-                    if line:
-                        yield line
-                except queue.Empty:
-                    if process.poll() is not None and not thread.is_alive():
-                        break
-
-            if timeout_error is not None:
-                cleanup()
-                raise timeout_error
-
-            exit_code: Optional[int] = None
-            try:
-                exit_code = process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.terminate()
-                try:
-                    process.wait(timeout=2)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    process.wait()
-                timeout_error = CommandTimeoutError(
-                    f"gemini 进程等待超时，进程已终止。",
-                    is_idle=False
-                )
-            finally:
-                if thread is not None:
-                    thread.join(timeout=5)
-
-            if timeout_error is not None:
-                raise timeout_error
-
-            while not output_queue.empty():
-                try:
-                    line = output_queue.get_nowait()
-                    if line is not None:
-                        yield line
-                except queue.Empty:
-                    break
-
-            return (exit_code, raw_output_lines_holder[0])
-
-        yield generator()
-
-    except Exception:
-        cleanup()
-        raise
-    finally:
-        cleanup()
-
 
 def _filter_last_lines(lines: list[str], max_lines: int = 50) -> list[str]:
     """过滤 last_lines，脱敏 tool_result 中的大内容
@@ -548,7 +148,9 @@ def _build_error_detail(
     json_decode_errors: int = 0,
     idle_timeout_s: Optional[int] = None,
     max_duration_s: Optional[int] = None,
+    deadline_s: Optional[float] = None,
     retries: int = 0,
+    attempts: Optional[list[Dict[str, Any]]] = None,
 ) -> Dict[str, Any]:
     """构建结构化错误详情"""
     detail: Dict[str, Any] = {"message": message}
@@ -570,8 +172,16 @@ def _build_error_detail(
             "任务总时长超时。建议：1) 增加 max_duration 参数 "
             "2) 拆分为更小的子任务 3) 检查是否存在死循环"
         )
+    if deadline_s is not None:
+        detail["deadline_s"] = deadline_s
+        detail["suggestion"] = (
+            "已达到端到端截止时间。建议：1) 增加 deadline 参数 "
+            "2) 减少 max_retries 3) 拆分为更小的子任务"
+        )
     if retries > 0:
         detail["retries"] = retries
+    if attempts and len(attempts) > 1:
+        detail["attempts"] = attempts
     return detail
 
 
@@ -646,6 +256,15 @@ async def gemini_tool(
         Field(description="总时长硬上限（秒），默认 1800 秒（30 分钟），0 表示无限制"),
     ] = 1800,
     max_retries: Annotated[int, "最大重试次数，默认 1"] = 1,
+    deadline: Annotated[float, "端到端截止时间（秒），覆盖所有尝试与退避等待，默认 0 表示不限制"] = 0,
+    startup_timeout: Annotated[int, "启动超时（秒），超过此时间未收到初始化事件即在新进程上立即重试，默认 60 秒，0 表示不限制"] = 60,
+    adaptive_timeout: Annotated[bool, "是否按历史耗时分布自动推导 timeout / max_duration（样本不足时沿用传入值）"] = False,
+    trace_id: Annotated[str, "追踪 ID（32 位十六进制、W3C traceparent 或任意字符串），传入时将本次调用的 span 写入 .ccg/traces/，默认不追踪"] = "",
+    resume_on_retry: Annotated[
+        bool,
+        Field(description="重试时若已获取会话 ID，则续接原会话继续而非从头重跑，默认 true"),
+    ] = True,
+    output_path: Annotated[str, "结果写入的文件路径（相对 cd，必须位于 cd 之内）；传入时输出边产出边写入文件，返回值只保留摘要与路径，默认不写文件"] = "",
     log_metrics: Annotated[bool, "是否将指标输出到 stderr"] = False,
 ) -> Dict[str, Any]:
     """执行 Gemini 任务
@@ -668,7 +287,29 @@ async def gemini_tool(
     """
     # 初始化指标收集器
     sandbox_str = "yolo" if yolo else sandbox
-    metrics = MetricsCollector(tool="gemini", prompt=PROMPT, sandbox=sandbox_str)
+    metrics = MetricsCollector(tool="gemini", prompt=PROMPT, sandbox=sandbox_str, project=cd)
+    start_trace(metrics, trace_id)
+
+    # 结果写入工作区文件（output_path）
+    output: Optional[OutputWriter] = None
+    if output_path:
+        try:
+            output = OutputWriter(resolve_output_path(cd, output_path), separator='')
+        except OutputPathError as e:
+            metrics.finish(success=False, error_kind=ErrorKind.INVALID_OUTPUT_PATH)
+            if log_metrics:
+                metrics.log_to_stderr()
+
+            result: Dict[str, Any] = {
+                "success": False,
+                "tool": "gemini",
+                "error": str(e),
+                "error_kind": ErrorKind.INVALID_OUTPUT_PATH,
+                "error_detail": _build_error_detail(str(e)),
+            }
+            if return_metrics:
+                result["metrics"] = metrics.to_dict()
+            return result
 
     # 构建命令
     # gemini CLI 命令格式: gemini [options]
@@ -696,31 +337,69 @@ async def gemini_tool(
     model_to_use = model if model else "gemini-3-pro-preview"
     cmd.extend(["--model", model_to_use])
 
-    # 会话恢复
-    if SESSION_ID:
-        cmd.extend(["--resume", SESSION_ID])
+    # 会话恢复参数在每次尝试时追加（重试时可能续接失败尝试的会话）
 
     # PROMPT 通过 stdin 传递
 
+    # 自适应超时：按历史高分位数推导（样本不足时沿用传入值）
+    history = get_timeout_history()
+    history_key = history_bucket("gemini", model_to_use, PROMPT)
+    adaptive = history.suggest(history_key) if adaptive_timeout else None
+    if adaptive is not None:
+        timeout, max_duration = adaptive.apply(timeout, max_duration)
+        metrics.adaptive_timeout = adaptive.to_dict()
+
     # 执行循环（支持重试）
     retries = 0
     last_error: Optional[Dict[str, Any]] = None
     all_last_lines: list[str] = []
+    scheduler = RetryScheduler(deadline=Deadline(deadline))
+    runner_stats: Dict[str, Any] = {}  # 子进程执行统计（跨尝试累计）
+    usage = TokenUsage()  # token 用量（跨尝试累计）
+    startup_retries = 0
+    resume_from: Optional[str] = None  # 本次尝试续接的会话 ID（resume-on-retry）
+    resume_prefix = ""  # 被中断的尝试已产出的内容
+    error_kind: Optional[str] = None  # 最近一次尝试的错误类型
+    success = False
+    agent_messages = ""
 
     while retries <= max_retries:
+        # 截止时间已到时不再开始新的尝试（如启动超时后的立即重试、退避结束后的重试）
+        if scheduler.attempts and scheduler.deadline.expired():
+            err_message = f"gemini 已达到端到端截止时间（{deadline}s），未开始新的尝试。"
+            error_kind = ErrorKind.DEADLINE_EXCEEDED
+            if last_error is not None:
+                last_error.update(error_kind=error_kind, err_message=err_message)
+            break
+        # 续接会话时只发送简短的继续指令，否则完整运行原 PROMPT
+        attempt_session = resume_from or SESSION_ID
+        attempt_cmd = cmd + ["--resume", attempt_session] if attempt_session else cmd
+        attempt_prompt = RESUME_PROMPT if resume_from else PROMPT
+        scheduler.begin_attempt(mode="resume" if resume_from else "fresh")
+        metrics.phases.begin_attempt()
+        if output is not None:
+            # 续接会话时保留被中断尝试已产出的内容，从头重试时清空
+            output.begin_attempt(resume_prefix if resume_from else "")
+        # 每次尝试只能使用截止时间内的剩余预算
+        attempt_max_duration = scheduler.attempt_max_duration(max_duration)
         all_messages: list[Dict[str, Any]] = []
-        agent_messages = ""
+        agent_message_parts: list[str] = []  # 逐段累积，结束后一次拼接（避免 += 反复复制整段文本）
         had_error = False
         err_message = ""
         session_id: Optional[str] = None
         exit_code: Optional[int] = None
         raw_output_lines = 0
         json_decode_errors = 0
-        error_kind: Optional[str] = None
+        error_kind = None
+        rate_limit_signal: Optional[RateLimitSignal] = None
         last_lines: list[str] = []
+        actions = ToolActionTracker(timeline=metrics.phases)  # 跟踪内部工具调用（tool_use / tool_result 配对）
 
         try:
-            with safe_gemini_command(cmd, timeout=timeout, max_duration=max_duration, prompt=PROMPT, cwd=cd) as gen:
+            with safe_gemini_command(
+                attempt_cmd, timeout=timeout, max_duration=attempt_max_duration, prompt=attempt_prompt, cwd=cd,
+                stats=runner_stats, startup_timeout=startup_timeout, phases=metrics.phases
+            ) as gen:
                 try:
                     for line in gen:
                         last_lines.append(line)
@@ -751,16 +430,40 @@ async def gemini_tool(
                                 role = line_dict.get("role", "")
                                 content = line_dict.get("content", "")
                                 if role == "assistant" and content:
-                                    agent_messages += content
+                                    agent_message_parts.append(content)
+                                    if output is not None:
+                                        output.write(content)
+                                    metrics.phases.mark(Phase.FIRST_TEXT)
+
+                            # 内部工具调用：tool_use 开始，tool_result 结束
+                            if event_type == "tool_use":
+                                actions.start(
+                                    line_dict.get("tool_id"),
+                                    line_dict.get("tool_name", ""),
+                                    summarize_input(line_dict.get("parameters")),
+                                    payload_bytes(line_dict.get("parameters")),
+                                )
+                            elif event_type == "tool_result":
+                                actions.finish(
+                                    line_dict.get("tool_id"),
+                                    line_dict.get("status") == "error",
+                                    output_bytes=payload_bytes(line_dict.get("output", line_dict.get("error"))),
+                                )
 
                             # 提取 result 事件（最终统计）
                             if event_type == "result":
+                                metrics.phases.mark(Phase.RESULT)
+                                attempt_usage = parse_gemini_usage(line_dict)
+                                if attempt_usage is not None:
+                                    usage.add(attempt_usage)
                                 # result 事件包含 response 和统计信息
                                 response = line_dict.get("response", "")
                                 if response:
                                     # 如果 result 中有完整响应，使用它
-                                    if not agent_messages:
-                                        agent_messages = response
+                                    if not agent_message_parts:
+                                        agent_message_parts.append(response)
+                                        if output is not None:
+                                            output.write(response)
 
                             # 提取 session_id (Gemini 可能在 init 事件中返回)
                             if event_type == "init":
@@ -768,6 +471,8 @@ async def gemini_tool(
                                     session_id = line_dict.get("session_id")
                                 if line_dict.get("thread_id") is not None:
                                     session_id = line_dict.get("thread_id")
+                                if session_id:
+                                    metrics.phases.mark(Phase.SESSION_ID)
 
                             # 错误处理
                             # 注意：AUTH_REQUIRED 优先级最高，一旦设置不再被覆盖
@@ -779,11 +484,15 @@ async def gemini_tool(
                                 if _is_auth_error(error_msg):
                                     error_kind = ErrorKind.AUTH_REQUIRED
                                 elif error_kind != ErrorKind.AUTH_REQUIRED:
-                                    error_kind = ErrorKind.UPSTREAM_ERROR
+                                    # 识别限流信号（429 / quota / overloaded）
+                                    rate_limit_signal = classify_rate_limit(error_msg) or rate_limit_signal
+                                    error_kind = ErrorKind.RATE_LIMITED if rate_limit_signal else ErrorKind.UPSTREAM_ERROR
 
                         except json.JSONDecodeError:
                             # JSON 解析失败，记录错误计数
                             json_decode_errors += 1
+                            # CLI 在 stderr 打印的限流提示（如 "Please retry in 36s"）用于退避
+                            rate_limit_signal = classify_rate_limit(line) or rate_limit_signal
                             # 非 JSON 输出记录到日志但不作为响应内容
                             # 避免将 CLI 警告/错误文本误认为成功结果
                             continue
@@ -793,27 +502,34 @@ async def gemini_tool(
                             had_error = True
                             error_kind = ErrorKind.UNEXPECTED_EXCEPTION
                             break
-                except StopIteration as e:
-                    # 正确捕获生成器返回值
-                    if isinstance(e.value, tuple) and len(e.value) == 2:
-                        exit_code, raw_output_lines = e.value
+                finally:
+                    # for 循环取不到生成器的返回值，退出码与输出行数由 runner 写入 runner_stats
+                    exit_code = runner_stats.get("exit_code")
+                    raw_output_lines = runner_stats.get("raw_output_lines", 0)
+
+            agent_messages = "".join(agent_message_parts)
 
         except CommandNotFoundError as e:
+            scheduler.end_attempt(ErrorKind.COMMAND_NOT_FOUND)
             metrics.finish(
                 success=False,
                 error_kind=ErrorKind.COMMAND_NOT_FOUND,
                 retries=retries,
+                retry_stats=scheduler.to_dict(),
+                runner_stats=runner_stats,
             )
             if log_metrics:
                 metrics.log_to_stderr()
 
-            result: Dict[str, Any] = {
+            result = {
                 "success": False,
                 "tool": "gemini",
                 "error": str(e),
                 "error_kind": ErrorKind.COMMAND_NOT_FOUND,
                 "error_detail": _build_error_detail(str(e)),
             }
+            if output is not None:
+                output.finish(result)
             if return_metrics:
                 result["metrics"] = metrics.to_dict()
             return result
@@ -821,11 +537,30 @@ async def gemini_tool(
         except CommandTimeoutError as e:
             # 根据异常属性区分空闲超时和总时长超时
             error_kind = ErrorKind.IDLE_TIMEOUT if e.is_idle else ErrorKind.TIMEOUT
+            if e.is_startup:
+                error_kind = ErrorKind.STARTUP_TIMEOUT
             had_error = True
             err_message = str(e)
+            if scheduler.deadline.expired():
+                error_kind = ErrorKind.DEADLINE_EXCEEDED
+                err_message = f"gemini 已达到端到端截止时间（{deadline}s），进程已终止。"
+            if e.is_cancelled:
+                error_kind = ErrorKind.CANCELLED
+            scheduler.end_attempt(error_kind)
+            # 启动卡住时任务尚未开始，立即在新进程上重试（不计入 max_retries，不退避）
+            if error_kind == ErrorKind.STARTUP_TIMEOUT and startup_retries < MAX_STARTUP_RETRIES:
+                startup_retries += 1
+                continue
             success = False
+            agent_messages = "".join(agent_message_parts)
+            # 超时保留部分结果，便于调用方续接
+            partial = {
+                "SESSION_ID": session_id,
+                "partial_result": "\n\n".join(p for p in (resume_prefix, agent_messages) if p),
+                "completed_actions": actions.completed_actions(),
+            }
             # 超时可以重试
-            if retries < max_retries:
+            if retries < max_retries and error_kind != ErrorKind.CANCELLED:
                 all_last_lines = last_lines.copy()
                 last_error = {
                     "error_kind": error_kind,
@@ -833,9 +568,18 @@ async def gemini_tool(
                     "exit_code": exit_code,
                     "json_decode_errors": json_decode_errors,
                     "raw_output_lines": raw_output_lines,
+                    "partial": partial,
                 }
+                delay = scheduler.next_delay(rate_limit_signal)
+                if delay is None:
+                    break
+                # 已获取会话 ID 时续接原会话继续；续接失败后再从头重跑
+                if resume_on_retry and session_id and not resume_from:
+                    resume_from, resume_prefix = session_id, agent_messages
+                else:
+                    resume_from, resume_prefix = None, ""
                 retries += 1
-                time.sleep(0.5 * (2 ** (retries - 1)))
+                interruptible_sleep(delay)
                 continue
             else:
                 # 已达最大重试次数
@@ -846,6 +590,7 @@ async def gemini_tool(
                     "exit_code": exit_code,
                     "json_decode_errors": json_decode_errors,
                     "raw_output_lines": raw_output_lines,
+                    "partial": partial,
                 }
                 break
 
@@ -875,6 +620,12 @@ async def gemini_tool(
                 error_kind = ErrorKind.SUBPROCESS_ERROR
             err_message = f"进程退出码非零：{exit_code}\n\n" + err_message
 
+        scheduler.end_attempt(None if success else error_kind)
+
+        # 续接成功：拼接中断前已产出的内容
+        if success and resume_from and resume_prefix:
+            agent_messages = resume_prefix + "\n\n" + agent_messages
+
         if success:
             # 成功，跳出重试循环
             break
@@ -889,9 +640,17 @@ async def gemini_tool(
                     "json_decode_errors": json_decode_errors,
                     "raw_output_lines": raw_output_lines,
                 }
+                # 去相关抖动退避（限流时遵循 retry-after），预算耗尽则放弃重试
+                delay = scheduler.next_delay(rate_limit_signal)
+                if delay is None:
+                    break
+                # 已获取会话 ID 时续接原会话继续；续接失败后再从头重跑
+                if resume_on_retry and session_id and not resume_from:
+                    resume_from, resume_prefix = session_id, agent_messages
+                else:
+                    resume_from, resume_prefix = None, ""
                 retries += 1
-                # 指数退避
-                time.sleep(0.5 * (2 ** (retries - 1)))
+                interruptible_sleep(delay)
             else:
                 # 不可重试或已达到最大重试次数
                 all_last_lines = last_lines.copy()
@@ -904,6 +663,14 @@ async def gemini_tool(
                 }
                 break
 
+    # 记录成功调用的事件间隔与耗时（续接会话的尝试只覆盖部分任务，不计入），供自适应超时使用
+    if success and not resume_from:
+        history.record(history_key, runner_stats.get("max_event_gap_ms"), runner_stats.get("run_duration_ms"))
+
+    # token 用量与成本，按会话 / 项目累计
+    metrics.model = model_to_use or ""
+    metrics.usage = account_usage("gemini", metrics.model, session_id, cd, usage)
+
     # 完成指标收集
     metrics.finish(
         success=success,
@@ -913,6 +680,8 @@ async def gemini_tool(
         raw_output_lines=raw_output_lines,
         json_decode_errors=json_decode_errors,
         retries=retries,
+        retry_stats=scheduler.to_dict(),
+        runner_stats=runner_stats,
     )
     if log_metrics:
         metrics.log_to_stderr()
@@ -958,11 +727,20 @@ async def gemini_tool(
                 json_decode_errors=json_decode_errors,
                 idle_timeout_s=timeout if error_kind == ErrorKind.IDLE_TIMEOUT else None,
                 max_duration_s=max_duration if error_kind == ErrorKind.TIMEOUT else None,
+                deadline_s=deadline if error_kind == ErrorKind.DEADLINE_EXCEEDED else None,
                 retries=retries,
+                attempts=scheduler.attempts,
             ),
             "duration": metrics.format_duration(),
         }
 
+        # 超时时返回已产出的部分结果、会话 ID 与已完成的工具动作，便于调用方续接而非重做
+        if last_error and last_error.get("partial"):
+            result.update(last_error["partial"])
+
+    if output is not None:
+        output.finish(result)
+
     if return_all_messages:
         result["all_messages"] = all_messages
 
@@ -0,0 +1,380 @@
+"""调用追踪模块
+
+调用方传入 trace_id 时，每次工具调用结束后由 MetricsCollector.finish 回调生成 span：
+
+    <tool> 调用
+    └── attempt N（每次尝试，含重试与启动重试）
+        └── subprocess（子进程 spawn → exit）
+            └── tool_use: <name>（后端内部工具调用）
+
+同一 trace_id 的每次调用向项目目录下的 `.ccg/traces/<trace_id>.spans.jsonl` 追加一行，
+render_trace()（`ccg-mcp trace` 或进程退出时）据此生成：
+- `<trace_id>.chrome.json`：Chrome trace-event 格式（chrome://tracing、Perfetto 可直接打开）
+- `<trace_id>.otlp.json`：OTLP JSON（ExportTraceServiceRequest），可导入兼容 OTLP 的后端
+
+trace_id 可以是 32 位十六进制、W3C traceparent（`00-<trace_id>-<parent_span_id>-01`，
+此时调用 span 挂在 parent_span_id 下），或任意字符串（按哈希映射为固定的 trace_id）。
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from ccg_mcp.metrics import MetricsCollector, Phase, add_finish_hook
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+TRACES_DIR = Path(".ccg") / "traces"
+SERVICE_NAME = "ccg-mcp"
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+def new_span_id() -> str:
+    """生成 16 位十六进制 span ID"""
+    return secrets.token_hex(8)
+
+
+def parse_trace_context(value: str) -> Tuple[str, Optional[str]]:
+    """解析调用方传入的 trace_id
+
+    Returns:
+        (trace_id, parent_span_id)，非 traceparent 格式时 parent_span_id 为 None
+    """
+    text = value.strip().lower()
+    match = _TRACEPARENT.match(text)
+    if match:
+        return match.group(1), match.group(2)
+    if _TRACE_ID.match(text):
+        return text, None
+    return hashlib.sha256(value.strip().encode("utf-8")).hexdigest()[:32], None
+
+
+def start_trace(metrics: MetricsCollector, trace_id: str) -> None:
+    """为本次调用启用追踪（trace_id 为空时不启用）"""
+    if not trace_id or not trace_id.strip():
+        return
+    metrics.trace_id, metrics.parent_span_id = parse_trace_context(trace_id)
+    metrics.span_id = new_span_id()
+
+
+class Span:
+    """追踪 span（时间为 Unix 纳秒）"""
+
+    def __init__(
+        self,
+        name: str,
+        span_id: str,
+        parent_id: Optional[str],
+        start_ns: int,
+        end_ns: int,
+        attributes: Optional[Dict[str, Any]] = None,
+        error: bool = False,
+    ):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = max(end_ns, start_ns)
+        self.attributes = attributes or {}
+        self.error = error
+
+
+# ============================================================================
+# 由调用指标构建 span
+# ============================================================================
+
+def build_call_spans(metrics: MetricsCollector) -> List[Span]:
+    """由完成的调用指标构建 span 树（调用 → 尝试 → 子进程 → 内部工具调用）"""
+    if metrics.span_id is None or metrics.ts_end is None:
+        return []
+    origin_ns = int(metrics.ts_start.timestamp() * 1_000_000_000)
+    end_ns = int(metrics.ts_end.timestamp() * 1_000_000_000)
+
+    def at(offset_ms: Optional[int], default: int) -> int:
+        return origin_ns + offset_ms * 1_000_000 if offset_ms is not None else default
+
+    call = Span(
+        name=metrics.tool,
+        span_id=metrics.span_id,
+        parent_id=metrics.parent_span_id,
+        start_ns=origin_ns,
+        end_ns=end_ns,
+        attributes={
+            "ccg.tool": metrics.tool,
+            "ccg.model": metrics.model or "default",
+            "ccg.success": metrics.success,
+            "ccg.error_kind": metrics.error_kind,
+            "ccg.retries": metrics.retries,
+        },
+        error=not metrics.success,
+    )
+    spans = [call]
+
+    timelines = metrics.phases.attempt_timelines()
+    for index, timeline in enumerate(timelines):
+        marks = timeline["marks"]
+        info = metrics.attempts[index] if index < len(metrics.attempts) else {}
+        attempt_start = at(marks.get(Phase.ATTEMPT_START), origin_ns)
+        if info.get("duration_ms") is not None:
+            attempt_end = attempt_start + int(info["duration_ms"]) * 1_000_000
+        elif index + 1 < len(timelines):
+            attempt_end = at(timelines[index + 1]["marks"].get(Phase.ATTEMPT_START), end_ns)
+        else:
+            attempt_end = end_ns
+        attempt = Span(
+            name=f"attempt {index}",
+            span_id=new_span_id(),
+            parent_id=call.span_id,
+            start_ns=attempt_start,
+            end_ns=attempt_end,
+            attributes={"ccg.attempt": index, "ccg.mode": info.get("mode"), "ccg.error_kind": info.get("error_kind")},
+            error=bool(info.get("error_kind")),
+        )
+        spans.append(attempt)
+        if marks.get(Phase.SPAWN) is None:
+            continue
+
+        subprocess_end = at(marks.get(Phase.EXIT), attempt_end)
+        subprocess = Span(
+            name="subprocess",
+            span_id=new_span_id(),
+            parent_id=attempt.span_id,
+            start_ns=at(marks.get(Phase.SPAWN), attempt_start),
+            end_ns=subprocess_end,
+            attributes={
+                f"ccg.{phase}_ms": marks[phase]
+                for phase in (Phase.FIRST_BYTE, Phase.SESSION_ID, Phase.FIRST_TEXT, Phase.RESULT)
+                if phase in marks
+            },
+        )
+        spans.append(subprocess)
+        for tool_use in timeline["tool_uses"]:
+            spans.append(Span(
+                name=f"tool_use: {tool_use.get('name') or 'unknown'}",
+                span_id=new_span_id(),
+                parent_id=subprocess.span_id,
+                start_ns=at(tool_use.get("start_ms"), subprocess.start_ns),
+                end_ns=at(tool_use.get("end_ms"), subprocess_end),
+                attributes={"ccg.tool_use_id": tool_use.get("id"), "ccg.tool_use_name": tool_use.get("name")},
+            ))
+    return spans
+
+
+# ============================================================================
+# 导出格式
+# ============================================================================
+
+def to_chrome_events(spans: List[Span], trace_id: str) -> List[Dict[str, Any]]:
+    """转换为 Chrome trace-event（"X" 完整事件，同一次调用位于同一行）"""
+    if not spans:
+        return []
+    root = spans[0]
+    lane = int(root.span_id[:7], 16)
+    events: List[Dict[str, Any]] = [{
+        "name": "thread_name",
+        "ph": "M",
+        "pid": 1,
+        "tid": lane,
+        "args": {"name": f"{root.name} {root.span_id[:8]}"},
+    }]
+    for span in spans:
+        events.append({
+            "name": span.name,
+            "cat": "ccg",
+            "ph": "X",
+            "ts": span.start_ns // 1000,
+            "dur": (span.end_ns - span.start_ns) // 1000,
+            "pid": 1,
+            "tid": lane,
+            "args": {
+                "trace_id": trace_id,
+                "span_id": span.span_id,
+                "parent_span_id": span.parent_id,
+                **{key: value for key, value in span.attributes.items() if value is not None},
+            },
+        })
+    return events
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_spans(spans: List[Span], trace_id: str) -> List[Dict[str, Any]]:
+    """转换为 OTLP JSON span"""
+    result = []
+    for span in spans:
+        entry: Dict[str, Any] = {
+            "traceId": trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 2 if span.error else 1},  # ERROR / OK
+        }
+        if span.parent_id:
+            entry["parentSpanId"] = span.parent_id
+        result.append(entry)
+    return result
+
+
+# ============================================================================
+# 写入
+# ============================================================================
+
+_dirty: Set[Tuple[Path, str]] = set()  # 有新 span 尚未生成文档的 (项目, trace_id)
+_dirty_lock = threading.Lock()
+
+
+def get_traces_dir(project: Path) -> Path:
+    """获取项目的追踪目录"""
+    return Path(project) / TRACES_DIR
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """跨进程互斥锁（加锁失败时不加锁继续，追踪只是尽力而为）"""
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+    try:
+        try:
+            if sys.platform == "win32":
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except OSError:
+            pass
+        yield
+    finally:
+        os.close(fd)  # 关闭时释放锁
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def export_spans(project: Path, trace_id: str, spans: List[Span]) -> None:
+    """将一次调用的 span 作为一行追加到 `<trace_id>.spans.jsonl`
+
+    每次调用只做一次 O_APPEND 写入，与已有 span 数量无关；Chrome trace 与 OTLP
+    文档由 render_trace() 在读取时或进程退出时生成。
+    """
+    if not spans:
+        return
+    directory = get_traces_dir(project)
+    directory.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(
+        {"chrome": to_chrome_events(spans, trace_id), "otlp": to_otlp_spans(spans, trace_id)},
+        ensure_ascii=False,
+    ) + "\n"
+    with _file_lock(directory / f"{trace_id}.lock"):
+        fd = os.open(directory / f"{trace_id}.spans.jsonl", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+    with _dirty_lock:
+        _dirty.add((Path(project), trace_id))
+
+
+def render_trace(project: Path, trace_id: str) -> Tuple[Path, Path]:
+    """由 `<trace_id>.spans.jsonl` 生成 `.chrome.json` 与 `.otlp.json`，返回两者路径
+
+    不完整或无法解析的行（如进程写入中途退出）会被跳过。
+    """
+    directory = get_traces_dir(project)
+    chrome_path = directory / f"{trace_id}.chrome.json"
+    otlp_path = directory / f"{trace_id}.otlp.json"
+    events: List[Dict[str, Any]] = []
+    otlp_spans: List[Dict[str, Any]] = []
+    with _file_lock(directory / f"{trace_id}.lock"):
+        with open(directory / f"{trace_id}.spans.jsonl", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    chrome, otlp = record["chrome"], record["otlp"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                events.extend(chrome)
+                otlp_spans.extend(otlp)
+        _write_json(chrome_path, {"traceEvents": events, "displayTimeUnit": "ms"})
+        _write_json(otlp_path, {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "ccg_mcp"}, "spans": otlp_spans}],
+            }]
+        })
+    return chrome_path, otlp_path
+
+
+def flush_traces() -> None:
+    """为本进程写入过 span 的 trace 重新生成 Chrome trace 与 OTLP 文档"""
+    with _dirty_lock:
+        pending = list(_dirty)
+        _dirty.clear()
+    for project, trace_id in pending:
+        try:
+            render_trace(project, trace_id)
+        except OSError:
+            pass  # 静默失败，span 仍保留在 .spans.jsonl 中
+
+
+atexit.register(flush_traces)
+
+
+def _export(metrics: MetricsCollector) -> None:
+    if metrics.trace_id is None or metrics.project is None:
+        return
+    try:
+        export_spans(metrics.project, metrics.trace_id, build_call_spans(metrics))
+    except (OSError, KeyError, IndexError, TypeError):
+        pass  # 静默失败，不影响主流程
+
+
+_installed = False
+
+
+def install_tracing() -> None:
+    """启用追踪导出：带 trace_id 的调用结束后写入对应项目的 .ccg/traces/"""
+    global _installed
+    if not _installed:
+        add_finish_hook(_export)
+        _installed = True
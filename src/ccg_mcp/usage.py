@@ -0,0 +1,275 @@
+"""Token 用量与成本统计模块
+
+从三个后端的结果事件中提取 token 用量并归一化：
+- coder：stream-json `result` 事件的 usage（input / output / cache_read / cache_creation）与 total_cost_usd
+- codex：`turn.completed` 事件的 usage（input_tokens 含缓存命中部分）
+- gemini：`result` 事件的 stats（扁平字段或按模型分组的 models）
+
+归一化口径：input_tokens 为全部输入（含缓存读写），cache_read_tokens / cache_write_tokens 为其中缓存部分。
+可选的价格表（config.toml 中的 [pricing.<模型名>]）用于估算成本，并按会话、项目在进程内累计。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ccg_mcp.config import get_price_table
+
+
+def _int(value: Any) -> int:
+    try:
+        return max(0, int(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class TokenUsage:
+    """归一化的 token 用量"""
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+    def __init__(
+        self,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        cache_read_tokens: int = 0,
+        cache_write_tokens: int = 0,
+        reported_cost_usd: Optional[float] = None,
+    ):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cache_read_tokens = cache_read_tokens
+        self.cache_write_tokens = cache_write_tokens
+        self.reported_cost_usd = reported_cost_usd  # 后端自行报告的成本（如 claude 的 total_cost_usd）
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def is_empty(self) -> bool:
+        return self.total_tokens == 0 and self.reported_cost_usd is None
+
+    def add(self, other: TokenUsage) -> None:
+        """累加另一份用量（如多次尝试）"""
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        if other.reported_cost_usd is not None:
+            self.reported_cost_usd = (self.reported_cost_usd or 0.0) + other.reported_cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {field: getattr(self, field) for field in self.FIELDS}
+        result["total_tokens"] = self.total_tokens
+        return result
+
+
+# ============================================================================
+# 后端事件解析
+# ============================================================================
+
+def parse_claude_usage(event: Dict[str, Any]) -> Optional[TokenUsage]:
+    """解析 claude stream-json 的 result 事件"""
+    usage = event.get("usage")
+    cost = event.get("total_cost_usd")
+    if not isinstance(usage, dict) and cost is None:
+        return None
+    usage = usage if isinstance(usage, dict) else {}
+    cache_read = _int(usage.get("cache_read_input_tokens"))
+    cache_write = _int(usage.get("cache_creation_input_tokens"))
+    return TokenUsage(
+        # claude 的 input_tokens 不含缓存部分
+        input_tokens=_int(usage.get("input_tokens")) + cache_read + cache_write,
+        output_tokens=_int(usage.get("output_tokens")),
+        cache_read_tokens=cache_read,
+        cache_write_tokens=cache_write,
+        reported_cost_usd=float(cost) if isinstance(cost, (int, float)) else None,
+    )
+
+
+def parse_codex_usage(event: Dict[str, Any]) -> Optional[TokenUsage]:
+    """解析 codex 的 turn.completed 事件"""
+    usage = event.get("usage")
+    if not isinstance(usage, dict):
+        return None
+    return TokenUsage(
+        input_tokens=_int(usage.get("input_tokens")),
+        output_tokens=_int(usage.get("output_tokens")),
+        cache_read_tokens=_int(usage.get("cached_input_tokens")),
+    )
+
+
+def parse_gemini_usage(event: Dict[str, Any]) -> Optional[TokenUsage]:
+    """解析 gemini stream-json 的 result 事件（stats 字段）"""
+    stats = event.get("stats")
+    if not isinstance(stats, dict):
+        return None
+    models = stats.get("models")
+    if isinstance(models, dict) and models:
+        # 按模型分组：{"<model>": {"tokens": {"prompt": n, "candidates": n, "cached": n}}}
+        total = TokenUsage()
+        for model_stats in models.values():
+            tokens = model_stats.get("tokens", {}) if isinstance(model_stats, dict) else {}
+            total.add(TokenUsage(
+                input_tokens=_int(tokens.get("prompt") or tokens.get("input")),
+                output_tokens=_int(tokens.get("candidates") or tokens.get("output")),
+                cache_read_tokens=_int(tokens.get("cached")),
+            ))
+        return total
+    if not any(key in stats for key in ("input_tokens", "output_tokens", "total_tokens")):
+        return None
+    return TokenUsage(
+        input_tokens=_int(stats.get("input_tokens")),
+        output_tokens=_int(stats.get("output_tokens")),
+        cache_read_tokens=_int(stats.get("cached") or stats.get("cached_tokens")),
+    )
+
+
+# ============================================================================
+# 成本估算
+# ============================================================================
+
+def estimate_cost(usage: TokenUsage, price: Optional[Dict[str, float]]) -> Optional[float]:
+    """按价格表估算成本（美元）
+
+    Args:
+        usage: token 用量
+        price: {"input": x, "output": x, "cache_read": x, "cache_write": x}，单位：美元 / 百万 token，
+            缺省的缓存价格按 input 价格计算
+
+    Returns:
+        成本，未提供价格时返回 None
+    """
+    if not price:
+        return None
+    input_price = float(price.get("input", 0))
+    cache_read_price = float(price.get("cache_read", input_price))
+    cache_write_price = float(price.get("cache_write", input_price))
+    uncached = max(0, usage.input_tokens - usage.cache_read_tokens - usage.cache_write_tokens)
+    cost = (
+        uncached * input_price
+        + usage.cache_read_tokens * cache_read_price
+        + usage.cache_write_tokens * cache_write_price
+        + usage.output_tokens * float(price.get("output", 0))
+    ) / 1_000_000
+    return round(cost, 6)
+
+
+def lookup_price(price_table: Dict[str, Dict[str, float]], model: str, tool: str) -> Optional[Dict[str, float]]:
+    """按模型名查找价格，找不到时回退到工具名（如 [pricing.codex]）"""
+    return price_table.get(model) or price_table.get(tool)
+
+
+# ============================================================================
+# 会话 / 项目累计
+# ============================================================================
+
+# 保留累计的会话数上限（超出时淘汰最久未使用的会话）
+MAX_SESSIONS = 10_000
+
+
+class UsageLedger:
+    """进程内 token 用量与成本累计（按会话、按项目）"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS) -> None:
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._max_sessions = max(1, max_sessions)
+        self._projects: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _accumulate(totals: Dict[str, Any], usage: TokenUsage, cost_usd: Optional[float]) -> None:
+        totals["calls"] = totals.get("calls", 0) + 1
+        for field in TokenUsage.FIELDS:
+            totals[field] = totals.get(field, 0) + getattr(usage, field)
+        totals["total_tokens"] = totals.get("total_tokens", 0) + usage.total_tokens
+        if cost_usd is not None:
+            totals["cost_usd"] = round(totals.get("cost_usd", 0.0) + cost_usd, 6)
+
+    def record(
+        self,
+        tool: str,
+        session_id: Optional[str],
+        project: Optional[Path],
+        usage: TokenUsage,
+        cost_usd: Optional[float],
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """记录一次调用的用量
+
+        Returns:
+            {"session": 会话累计, "project": 项目累计}，缺少会话 ID / 项目时为 None
+        """
+        session_key = f"{tool}:{session_id}" if session_id else None
+        project_key = str(Path(project).resolve()) if project else None
+        with self._lock:
+            result: Dict[str, Optional[Dict[str, Any]]] = {"session": None, "project": None}
+            if session_key:
+                totals = self._sessions.setdefault(session_key, {})
+                self._sessions.move_to_end(session_key)
+                while len(self._sessions) > self._max_sessions:
+                    self._sessions.popitem(last=False)
+                self._accumulate(totals, usage, cost_usd)
+                result["session"] = dict(totals)
+            if project_key:
+                totals = self._projects.setdefault(project_key, {})
+                self._accumulate(totals, usage, cost_usd)
+                result["project"] = dict(totals)
+            return result
+
+    def session_totals(self, tool: str, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            totals = self._sessions.get(f"{tool}:{session_id}")
+            return dict(totals) if totals else None
+
+    def project_totals(self, project: Path) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            totals = self._projects.get(str(Path(project).resolve()))
+            return dict(totals) if totals else None
+
+    def reset(self) -> None:
+        """清空累计（主要用于测试）"""
+        with self._lock:
+            self._sessions.clear()
+            self._projects.clear()
+
+
+# 全局用量累计（所有工具共享）
+_usage_ledger = UsageLedger()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """获取服务级用量累计"""
+    return _usage_ledger
+
+
+def account_usage(
+    tool: str,
+    model: str,
+    session_id: Optional[str],
+    project: Optional[Path],
+    usage: TokenUsage,
+) -> Optional[Dict[str, Any]]:
+    """估算一次调用的成本并计入会话 / 项目累计
+
+    成本优先按价格表估算，未配置价格时使用后端报告的成本。
+
+    Returns:
+        写入 metrics.usage 的字典，没有任何用量数据时返回 None
+    """
+    if usage.is_empty():
+        return None
+    cost_usd = estimate_cost(usage, lookup_price(get_price_table(), model, tool))
+    cost_source = "price_table" if cost_usd is not None else None
+    if cost_usd is None and usage.reported_cost_usd is not None:
+        cost_usd, cost_source = round(usage.reported_cost_usd, 6), "reported"
+    totals = get_usage_ledger().record(tool, session_id, project, usage, cost_usd)
+    result = usage.to_dict()
+    result.update({
+        "model": model or None,
+        "cost_usd": cost_usd,
+        "cost_source": cost_source,
+        "session_totals": totals["session"],
+        "project_totals": totals["project"],
+    })
+    return result
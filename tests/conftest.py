@@ -38,3 +38,50 @@ def mock_env_vars(monkeypatch):
     monkeypatch.setenv("CODER_API_TOKEN", "env-test-token")
     monkeypatch.setenv("CODER_BASE_URL", "https://env-test.example.com")
     monkeypatch.setenv("CODER_MODEL", "env-test-model")
+
+
+@pytest.fixture(autouse=True)
+def isolated_timeout_history(tmp_path):
+    """每个测试使用独立的超时历史文件，避免写入 ~/.ccg-mcp"""
+    from ccg_mcp.timeouts import TimeoutHistory, set_timeout_history
+
+    history = TimeoutHistory(tmp_path / "timeout_history.json")
+    set_timeout_history(history)
+    yield history
+    set_timeout_history(None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_job_store(tmp_path):
+    """每个测试使用独立的任务队列，避免写入工作目录下的 .ccg/"""
+    from ccg_mcp.jobstore import JobStore, set_job_store
+
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    set_job_store(store)
+    yield store
+    set_job_store(None)
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    """安装可编排的假 claude / codex / gemini CLI（见 ccg_mcp.testing）
+
+    用法：fake_cli("codex", text="ok", tool_uses=[...])，返回安装目录。
+    安装 claude 时同时提供最小 Coder 配置。
+    """
+    from ccg_mcp import config
+    from ccg_mcp.testing import install_fake_cli
+
+    bin_dir = tmp_path / "fake-bin"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def install(backend: str, **scenario):
+        if backend in ("claude", "coder"):
+            monkeypatch.setattr(config, "get_config_path", lambda: tmp_path / "no-config.toml")
+            monkeypatch.setenv("CODER_API_TOKEN", "fake-token")
+            config.reset_config_cache()
+        install_fake_cli(bin_dir, backend, scenario)
+        return bin_dir
+
+    yield install
+    config.reset_config_cache()
@@ -0,0 +1,33 @@
+"""端到端并发基准冒烟测试"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCHMARK = Path(__file__).resolve().parents[2] / "benchmarks" / "e2e_concurrency.py"
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+def test_e2e_benchmark_smoke(tmp_path):
+    """测试基准通过 stdio 服务器完成调用并输出可对比的 JSON 结果"""
+    output = tmp_path / "result.json"
+    cmd = [sys.executable, str(BENCHMARK), "--calls", "6", "--concurrency", "3",
+           "--event-delay", "0", "--output", str(output)]
+    subprocess.run(cmd, check=True, capture_output=True, timeout=120)
+
+    result = json.loads(output.read_text(encoding="utf-8"))
+    assert result["errors"] == 0
+    assert result["latency_ms"]["count"] == 6
+    assert result["throughput_rps"] > 0
+
+    # 与自身对比：宽松阈值下不应报告回退
+    compared = subprocess.run(
+        cmd[:-2] + ["--compare", str(output), "--threshold", "10"],
+        capture_output=True, text=True, timeout=120,
+    )
+    assert compared.returncode == 0, compared.stderr
+    assert json.loads(compared.stdout)["comparison"]["regressions"] == []
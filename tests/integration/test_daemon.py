@@ -0,0 +1,166 @@
+"""守护进程模式集成测试：多个客户端通过 streamable HTTP / Unix socket 共享一个服务器"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+
+REPO_SRC = Path(__file__).resolve().parents[2] / "src"
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 POSIX")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(connect, process, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器已退出：{process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            connect()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError("服务器未就绪")
+
+
+@pytest.fixture
+def start_daemon(tmp_path):
+    processes = []
+
+    def start(*args: str) -> subprocess.Popen:
+        home = tmp_path / "home"
+        home.mkdir(exist_ok=True)
+        env = dict(os.environ)
+        env.update({
+            "HOME": str(home),
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_SRC), env.get("PYTHONPATH")])),
+        })
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ccg_mcp.cli", *args],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def _call(session: ClientSession, tool: str, arguments: dict) -> dict:
+    result = await session.call_tool(tool, arguments)
+    return json.loads(result.content[0].text)
+
+
+def test_http_daemon_shares_server_and_isolates_clients(fake_cli, start_daemon, tmp_path):
+    fake_cli("codex", text="review ok", delay=0.1, session_id="thread-a")
+    project = tmp_path / "project"
+    project.mkdir()
+    port = _free_port()
+    process = start_daemon("--transport", "streamable-http", "--port", str(port))
+    _wait_ready(lambda: socket.create_connection(("127.0.0.1", port), timeout=1).close(), process)
+    url = f"http://127.0.0.1:{port}/mcp"
+
+    async def main():
+        async with streamable_http_client(url) as (read_a, write_a, _), \
+                streamable_http_client(url) as (read_b, write_b, _):
+            async with ClientSession(read_a, write_a) as alice, ClientSession(read_b, write_b) as bob:
+                await alice.initialize()
+                await bob.initialize()
+
+                start = time.monotonic()
+                await _call(alice, "codex", {"PROMPT": "warmup", "cd": str(project)})
+                single = time.monotonic() - start
+
+                # 两个客户端的调用并行执行（串行约需 4 倍单次耗时）
+                start = time.monotonic()
+                results = await asyncio.gather(
+                    *(_call(client, "codex", {"PROMPT": "review", "cd": str(project)})
+                      for client in (alice, bob, alice, bob))
+                )
+                parallel = time.monotonic() - start
+                assert all(r["success"] for r in results), results
+                assert parallel < single * 2.5, (parallel, single)
+
+                # 会话归创建它的客户端所有（假 CLI 总是返回同一个会话 ID，由 alice 的预热调用创建）
+                resumed = await _call(alice, "codex", {"PROMPT": "again", "cd": str(project), "SESSION_ID": "thread-a"})
+                assert resumed["success"], resumed
+                forbidden = await _call(bob, "codex", {"PROMPT": "again", "cd": str(project), "SESSION_ID": "thread-a"})
+                assert forbidden["error_kind"] == "session_forbidden"
+
+                # 守护进程模式下 cd 必须为绝对路径
+                relative = await _call(alice, "codex", {"PROMPT": "x", "cd": "project"})
+                assert relative["error_kind"] == "invalid_cd"
+
+                status = await _call(alice, "debug_profile", {"action": "status"})
+                assert status["clients"]["connected_clients"] == 2
+                assert status["admission"]["codex"]["active"] == 0
+
+    asyncio.run(main())
+
+
+def test_unix_socket_daemon(fake_cli, start_daemon, tmp_path):
+    fake_cli("gemini", text="hello")
+    path = tmp_path / "ccg.sock"
+    process = start_daemon("--socket", str(path))
+
+    def connect():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(str(path))
+
+    _wait_ready(connect, process)
+    assert oct(path.stat().st_mode & 0o777) == oct(0o600)
+
+    async def main():
+        http_client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=str(path)), timeout=30)
+        async with http_client, streamable_http_client("http://localhost/mcp", http_client=http_client) as (r, w, _):
+            async with ClientSession(r, w) as session:
+                await session.initialize()
+                tools = await session.list_tools()
+                assert {"coder", "codex", "gemini"} <= {tool.name for tool in tools.tools}
+                return await _call(session, "gemini", {"PROMPT": "hi", "cd": str(tmp_path)})
+
+    result = asyncio.run(main())
+    assert result["success"], result
+    assert result["result"] == "hello"
+
+    # 已有服务器在监听时拒绝启动第二个
+    second = start_daemon("--socket", str(path))
+    assert second.wait(timeout=30) == 1
+    assert "已有服务器" in second.stderr.read().decode()
+
+
+def test_socket_conflicts_with_stdio(start_daemon, tmp_path):
+    """测试 stdio 传输同时指定 socket（命令行或 [server] 配置）时拒绝启动，而不是忽略 socket"""
+    path = tmp_path / "ccg.sock"
+    process = start_daemon("--transport", "stdio", "--socket", str(path))
+    assert process.wait(timeout=30) == 1
+    assert "stdio" in process.stderr.read().decode()
+
+    config = tmp_path / "home" / ".ccg-mcp" / "config.toml"
+    config.parent.mkdir(parents=True)
+    config.write_text(f'[server]\ntransport = "stdio"\nsocket = "{path}"\n')
+    process = start_daemon()
+    assert process.wait(timeout=30) == 1
+    assert "stdio" in process.stderr.read().decode()
+    assert not path.exists()
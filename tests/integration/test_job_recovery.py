@@ -0,0 +1,71 @@
+"""后台任务重启恢复集成测试：stdio 服务器退出后，下次启动续接未完成任务的会话"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from ccg_mcp.testing.fake_cli import invocation_count
+
+REPO_SRC = Path(__file__).resolve().parents[2] / "src"
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 POSIX")
+
+
+async def _call(session: ClientSession, tool: str, arguments: dict) -> dict:
+    result = await session.call_tool(tool, arguments)
+    return json.loads(result.content[0].text)
+
+
+def test_restart_resumes_interrupted_job(fake_cli, tmp_path):
+    bin_dir = fake_cli("codex", session_id="thread-7", invocations=[
+        {"hang": "after_init"},  # 第一个服务器退出时仍在执行
+        {"text": "resumed ok"},
+    ])
+    project = tmp_path / "project"
+    project.mkdir()
+    home = tmp_path / "home"
+    home.mkdir()
+    env = dict(os.environ)
+    env.update({
+        "HOME": str(home),
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_SRC), env.get("PYTHONPATH")])),
+    })
+    params = StdioServerParameters(command=sys.executable, args=["-m", "ccg_mcp.cli"], env=env, cwd=str(project))
+
+    async def first_server() -> str:
+        async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+            await session.initialize()
+            submitted = await _call(session, "submit_job", {"tool": "codex", "PROMPT": "review", "cd": str(project)})
+            deadline = time.monotonic() + 20
+            while time.monotonic() < deadline:
+                status = await _call(session, "job_status", {"job_id": submitted["job_id"]})
+                if status.get("SESSION_ID"):
+                    return submitted["job_id"]
+                await asyncio.sleep(0.05)
+            raise AssertionError(f"未捕获会话 ID：{status}")
+
+    async def second_server(job_id: str) -> dict:
+        async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+            await session.initialize()
+            return await _call(session, "job_result", {"job_id": job_id, "wait": 30})
+
+    job_id = asyncio.run(first_server())
+    # 第一个服务器退出后，任务在队列中仍为执行中，并记录了会话 ID
+    with sqlite3.connect(project / ".ccg" / "jobs.sqlite3") as conn:
+        status, session_id = conn.execute("SELECT status, session_id FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert (status, session_id) == ("running", "thread-7")
+
+    result = asyncio.run(second_server(job_id))
+    assert result["status"] == "succeeded", result
+    assert result["recoveries"] == 1
+    assert result["result"]["result"] == "resumed ok"
+    assert result["SESSION_ID"] == "thread-7"
+    assert invocation_count(bin_dir, "codex") == 2
@@ -0,0 +1,38 @@
+"""内部工具调用跟踪模块单元测试"""
+from ccg_mcp.actions import ToolActionTracker, summarize_input
+
+
+def test_summarize_input_prefers_known_keys():
+    """测试摘要优先使用命令、文件路径等字段"""
+    assert summarize_input({"description": "run tests", "command": "pytest -q"}) == "pytest -q"
+    assert summarize_input({"file_path": "src/app.py", "content": "..."}) == "src/app.py"
+    assert summarize_input({"command": ["bash", "-lc", "ls"]}) == "bash -lc ls"
+    assert summarize_input({"other": "x" * 500}) == "x" * 200
+    assert summarize_input(None) == ""
+
+
+def test_tracker_pairs_start_and_finish():
+    """测试按 id 配对开始与结束事件"""
+    tracker = ToolActionTracker()
+    tracker.start("t1", "Bash", "pytest -q")
+    tracker.start("t2", "Read", "README.md")
+    tracker.finish("t2")
+    tracker.finish("t1", is_error=True)
+
+    completed = tracker.completed_actions()
+    assert [a["id"] for a in completed] == ["t2", "t1"]
+    assert completed[1] == {"id": "t1", "name": "Bash", "summary": "pytest -q", "is_error": True}
+    assert tracker.pending_actions() == []
+
+
+def test_tracker_records_finish_without_start():
+    """测试仅有结束事件的动作（如 codex item.completed）也被记录"""
+    tracker = ToolActionTracker()
+    tracker.start("pending", "Bash", "sleep 100")
+    tracker.finish("item_1", name="command_execution", summary="ls")
+    tracker.finish(None)
+
+    assert tracker.completed_actions() == [
+        {"id": "item_1", "name": "command_execution", "summary": "ls", "is_error": False}
+    ]
+    assert [a["id"] for a in tracker.pending_actions()] == ["pending"]
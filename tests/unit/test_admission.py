@@ -0,0 +1,218 @@
+"""准入控制与客户端隔离测试"""
+
+import asyncio
+import gc
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from ccg_mcp.admission import AdmissionController, AdmissionRejected, set_admission
+from ccg_mcp.clients import ClientRegistry, set_client_registry
+from ccg_mcp.runner import interruptible_sleep
+from ccg_mcp.server import _dispatch, debug_profile, stats
+
+
+class _Client:
+    """代替 MCP 会话对象（需支持弱引用）"""
+
+
+async def _sleep_in_worker(seconds: float, seen: list):
+    seen.append(threading.current_thread().name)
+    time.sleep(seconds)  # 工具实现内部是同步阻塞的
+    return seconds
+
+
+def test_limit_per_tool_and_parallel_execution():
+    controller = AdmissionController(max_concurrent=2, limits={"coder": 1})
+    seen: list = []
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(*(
+            controller.call("codex", lambda: _sleep_in_worker(0.2, seen)) for _ in range(4)
+        ))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    # 上限为 2：4 个调用分两批执行
+    assert 0.35 < elapsed < 1.0
+    assert all(name.startswith("ccg-tool-") for name in seen)
+    assert controller.limit("coder") == 1
+    assert controller.active() == {}
+    controller.shutdown()
+
+
+def test_event_loop_not_blocked_while_tools_run():
+    controller = AdmissionController(max_concurrent=1)
+
+    async def main():
+        task = asyncio.ensure_future(controller.call("gemini", lambda: _sleep_in_worker(0.3, [])))
+        ticks = 0
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        await task
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+    controller.shutdown()
+
+
+def test_queue_full_rejects():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+
+    async def main():
+        running = asyncio.ensure_future(controller.call("codex", lambda: _sleep_in_worker(0.2, [])))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(controller.call("codex", lambda: _sleep_in_worker(0, [])))
+        await asyncio.sleep(0.01)
+        assert controller.queued() == {"codex": 1}
+        with pytest.raises(AdmissionRejected):
+            await controller.call("codex", lambda: _sleep_in_worker(0, []))
+        # 其他后端不受影响
+        await controller.call("gemini", lambda: _sleep_in_worker(0, []))
+        await asyncio.gather(running, queued)
+
+    asyncio.run(main())
+    assert controller.rejected() == {"codex": 1}
+    assert controller.snapshot()["codex"] == {"limit": 1, "active": 0, "queued": 0, "rejected": 1}
+    controller.shutdown()
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    controller = AdmissionController(max_concurrent=1)
+
+    async def main():
+        running = asyncio.ensure_future(controller.call("codex", lambda: _sleep_in_worker(0.1, [])))
+        await asyncio.sleep(0.02)
+        waiter = asyncio.ensure_future(controller.acquire("codex"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await running
+        # 名额已全部交还
+        await controller.acquire("codex")
+        controller.release("codex")
+
+    asyncio.run(main())
+    assert controller.active() == {} and controller.queued() == {}
+    controller.shutdown()
+
+
+def test_deadline_starts_at_dispatch_and_bounds_queueing():
+    controller = AdmissionController(max_concurrent=1)
+    set_admission(controller)
+    budgets = []
+
+    async def call(deadline: float = 0):
+        budgets.append(deadline)
+        return {"success": True}
+
+    async def main():
+        await controller.acquire("codex")  # 名额被占用
+        start = time.monotonic()
+        result = await _dispatch("codex", None, Path("."), "", call, deadline=0.3)
+        waited = time.monotonic() - start
+        assert result["error_kind"] == "deadline_exceeded" and 0.25 < waited < 1.0
+        assert controller.queued() == {} and budgets == []
+        controller.release("codex")
+
+        # 获得名额后只传入剩余预算
+        await _dispatch("codex", None, Path("."), "", call, deadline=60)
+        await _dispatch("codex", None, Path("."), "", call)
+
+    try:
+        asyncio.run(main())
+    finally:
+        set_admission(None)
+    assert 0 < budgets[0] <= 60 and budgets[1] == 0
+    assert controller.active() == {}
+
+
+def test_cancelled_request_terminates_worker():
+    controller = AdmissionController(max_concurrent=1)
+    set_admission(controller)
+
+    async def wait_for_cancel(deadline: float = 0):
+        # 工作线程中的工具在取消事件设置后尽快结束（如 runner 终止子进程）
+        return {"finished_early": not interruptible_sleep(5)}
+
+    async def main():
+        task = asyncio.ensure_future(_dispatch("codex", None, Path("."), "", wait_for_cancel))
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 名额在工作线程结束后交还
+        await controller.acquire("codex")
+        controller.release("codex")
+        return time.monotonic() - start
+
+    try:
+        assert asyncio.run(main()) < 2
+    finally:
+        set_admission(None)
+
+
+def test_session_owned_by_creating_client():
+    registry = ClientRegistry()
+    alice, bob = _Client(), _Client()
+    registry.claim(alice, "codex", "thread-1")
+
+    assert registry.check_session(alice, "codex", "thread-1") is None
+    assert "另一个客户端" in registry.check_session(bob, "codex", "thread-1")
+    # 其他工具的同名会话、未记录的会话不受限制
+    assert registry.check_session(bob, "gemini", "thread-1") is None
+    assert registry.check_session(bob, "codex", "thread-2") is None
+    # 已属于其他在线客户端的会话不会被抢占
+    registry.claim(bob, "codex", "thread-1")
+    assert registry.check_session(bob, "codex", "thread-1") is not None
+    assert registry.connected_clients() == 2
+    assert registry.owned_sessions() == {"codex": 1}
+
+    # 所属客户端断开后可被接管
+    del alice
+    gc.collect()
+    assert registry.check_session(bob, "codex", "thread-1") is None
+    assert registry.connected_clients() == 1
+
+
+def test_owned_sessions_are_bounded():
+    registry = ClientRegistry(max_sessions=2)
+    client = _Client()
+    for i in range(3):
+        registry.claim(client, "codex", f"t-{i}")
+    assert registry.owned_sessions() == {"codex": 2}
+
+
+def test_cd_checks(tmp_path):
+    registry = ClientRegistry(allowed_roots=[tmp_path / "work"], require_absolute_cd=True)
+    (tmp_path / "work" / "repo").mkdir(parents=True)
+
+    assert registry.check_cd(tmp_path / "work" / "repo") is None
+    assert registry.check_cd(tmp_path / "work") is None
+    assert "allowed_roots" in registry.check_cd(tmp_path / "other")
+    assert "allowed_roots" in registry.check_cd(tmp_path / "work" / ".." / "other")
+    assert "绝对路径" in registry.check_cd(tmp_path.joinpath("work").relative_to(tmp_path))
+
+    # stdio 模式：相对路径按服务器当前目录解析
+    assert ClientRegistry().check_cd(tmp_path.relative_to(tmp_path)) is None
+
+
+def test_stats_and_profile_respect_allowed_roots(tmp_path):
+    set_client_registry(ClientRegistry(allowed_roots=[tmp_path / "work"], require_absolute_cd=True))
+    try:
+        outside = tmp_path / "other"
+        denied = asyncio.run(stats(cd=outside))
+        assert not denied["success"] and denied["error_kind"] == "invalid_cd"
+        denied = asyncio.run(debug_profile(action="cprofile_stop", cd=outside))
+        assert denied["error_kind"] == "invalid_cd" and not outside.exists()
+        assert asyncio.run(stats(cd=tmp_path / "work"))["success"]
+        # 不写文件的操作不需要 cd
+        assert asyncio.run(debug_profile(action="status"))["success"]
+    finally:
+        set_client_registry(None)
@@ -0,0 +1,85 @@
+"""大结果转存与分页读取测试"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from ccg_mcp.artifacts import ArtifactStore, offload_result, set_artifact_store
+from ccg_mcp.server import gemini, mcp, read_artifact
+
+
+@pytest.fixture
+def artifact_store():
+    store = ArtifactStore()
+    set_artifact_store(store, inline_limit=1000)
+    yield store
+    set_artifact_store(None)
+
+
+def test_small_results_are_returned_inline(artifact_store):
+    result = {"success": True, "result": "x" * 1000, "all_messages": [{"type": "init"}]}
+    assert offload_result(result) is result
+    assert artifact_store.snapshot()["count"] == 0
+
+
+def test_large_fields_become_resources(artifact_store):
+    text = "第一行\n" + "y" * 5000
+    messages = [{"type": "item", "text": "z" * 100, "n": i} for i in range(20)]
+    result = {"success": True, "SESSION_ID": "s-1", "result": text, "all_messages": messages}
+
+    offloaded = offload_result(result)
+    assert result["result"] == text and "resources" not in result  # 原返回值不变
+    assert offloaded["SESSION_ID"] == "s-1"
+    assert offloaded["result"].startswith("第一行\n") and len(offloaded["result"]) < 2100
+    assert "all_messages" not in offloaded
+
+    handle = offloaded["resources"]["result"]
+    assert handle["uri"].startswith("ccg://artifacts/")
+    assert handle["chars"] == len(text) and handle["bytes"] == len(text.encode("utf-8")) and handle["lines"] == 2
+    lines = artifact_store.get(offloaded["resources"]["all_messages"]["uri"]).text.splitlines()
+    assert [json.loads(line) for line in lines] == messages
+
+    # 相同内容不重复存放
+    assert offload_result(result)["resources"]["result"]["uri"] == handle["uri"]
+    assert artifact_store.snapshot()["count"] == 2
+
+
+def test_paged_reads_and_eviction(artifact_store):
+    text = "".join(f"{i:05d}\n" for i in range(2000))
+    uri = offload_result({"result": text})["resources"]["result"]["uri"]
+
+    async def read_all():
+        parts, offset = [], 0
+        while offset is not None:
+            page = await read_artifact(uri=uri, offset=offset, limit=3000)
+            assert page["success"] and page["offset"] == offset
+            parts.append(page["content"])
+            offset = page["next_offset"]
+        return parts
+
+    parts = asyncio.run(read_all())
+    assert len(parts) == 4 and "".join(parts) == text
+    missing = asyncio.run(read_artifact(uri="ccg://artifacts/nope"))
+    assert missing["error_kind"] == "artifact_not_found"
+
+    # 超出总大小上限时淘汰最久未读取的内容
+    small = ArtifactStore(max_bytes=10_000)
+    first, second = small.put("a" * 6000), small.put("b" * 6000)
+    assert small.get(first.uri) is None and small.get(second.uri) is second
+    assert small.snapshot()["bytes"] == 6000
+
+
+@pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 POSIX")
+def test_tool_response_references_resource(fake_cli, tmp_path, artifact_store):
+    fake_cli("gemini", text="g" * 4000)
+
+    async def main():
+        result = await gemini(PROMPT="explain", cd=tmp_path)
+        contents = await mcp.read_resource(result["resources"]["result"]["uri"])
+        return result, contents
+
+    result, contents = asyncio.run(main())
+    assert result["success"] and len(result["result"]) < 2100
+    assert contents[0].content == "g" * 4000
@@ -0,0 +1,74 @@
+"""假 CLI 单元测试：三个工具在离线环境下的完整调用路径"""
+import asyncio
+import os
+
+import pytest
+
+from ccg_mcp.testing import invocation_count
+from ccg_mcp.tools.coder import coder_tool
+from ccg_mcp.tools.codex import codex_tool
+from ccg_mcp.tools.gemini import gemini_tool
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+
+TOOLS = {"claude": coder_tool, "codex": codex_tool, "gemini": gemini_tool}
+TOOL_USES = [
+    {"name": "Bash", "input": {"command": "pytest -q"}, "output": "x" * 1000, "duration": 0.2},
+    {"name": "Read", "input": {"file_path": "a.py"}, "output": "print()", "is_error": True},
+]
+
+
+def _call(backend, tmp_path, **kwargs):
+    kwargs.setdefault("return_metrics", True)
+    return asyncio.run(TOOLS[backend](PROMPT="hi", cd=tmp_path, **kwargs))
+
+
+@pytest.mark.parametrize("backend", ["claude", "codex", "gemini"])
+def test_fake_cli_full_run(fake_cli, tmp_path, backend):
+    """测试初始化、分段回复、内部工具调用、用量与结果事件均被正确解析"""
+    fake_cli(
+        backend, text="hello world", chunks=3, session_id="s-1", tool_uses=TOOL_USES,
+        usage={"input_tokens": 100, "output_tokens": 20},
+    )
+    result = _call(backend, tmp_path)
+
+    assert result["success"] is True, result
+    assert "hello world" in result["result"]
+    assert result["SESSION_ID"] == "s-1"
+    metrics = result["metrics"]
+    summary = {group["name"]: group for group in metrics["tool_use_summary"]}
+    expected_name = "command_execution" if backend == "codex" else "Bash"
+    assert summary[expected_name]["total_ms"] >= 200
+    assert metrics["tool_use_summary"][0]["name"] == expected_name
+    assert metrics["usage"]["output_tokens"] == 20
+
+
+@pytest.mark.parametrize("backend", ["claude", "codex", "gemini"])
+def test_fake_cli_upstream_error(fake_cli, tmp_path, backend):
+    """测试后端失败事件映射为 upstream_error"""
+    fake_cli(backend, error="internal server error")
+    result = _call(backend, tmp_path, max_retries=0)
+
+    assert result["success"] is False
+    assert result["error_kind"] == "upstream_error"
+
+
+def test_fake_cli_noise_does_not_break_parsing(fake_cli, tmp_path):
+    """测试重连提示、非 JSON 行与非 UTF-8 字节不影响结果"""
+    fake_cli("codex", reconnects=2, garbage_lines=3, invalid_utf8=True, line_bytes=4096)
+    result = _call("codex", tmp_path)
+
+    assert result["success"] is True
+    assert result["result"].startswith("ok")
+    assert result["metrics"]["json_decode_errors"] == 4
+
+
+def test_fake_cli_invocations_drive_retries(fake_cli, tmp_path):
+    """测试按调用次序切换场景：首次启动卡住，重试成功"""
+    bin_dir = fake_cli("gemini", invocations=[{"hang": "startup"}, {"text": "recovered"}])
+    result = _call("gemini", tmp_path, startup_timeout=1)
+
+    assert result["success"] is True
+    assert result["result"] == "recovered"
+    assert result["metrics"]["startup_timeouts"] == 1
+    assert invocation_count(bin_dir, "gemini") == 2
@@ -0,0 +1,154 @@
+"""后台任务（submit_job / job_status / job_result / cancel_job）测试"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from ccg_mcp import jobs
+from ccg_mcp.admission import AdmissionController, set_admission
+from ccg_mcp.clients import ClientRegistry, set_client_registry
+from ccg_mcp.jobs import JobLimitError, JobTable, set_job_table
+from ccg_mcp.runner import running_processes
+from ccg_mcp.server import cancel_job, job_result, job_status, submit_job
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 POSIX")
+
+
+@pytest.fixture(autouse=True)
+def isolated_state():
+    controller = AdmissionController(max_concurrent=1)
+    set_admission(controller)
+    set_client_registry(ClientRegistry())
+    set_job_table(JobTable())
+    yield controller
+    set_admission(None)
+    set_client_registry(None)
+    set_job_table(None)
+
+
+async def _wait_status(job_id: str, status: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = await job_status(job_id=job_id)
+        if info["status"] == status:
+            return info
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"任务未进入 {status} 状态：{info}")
+
+
+def test_submit_and_collect_result(fake_cli, tmp_path):
+    fake_cli("codex", text="looks good", delay=0.05, session_id="thread-9")
+
+    async def main():
+        submitted = await submit_job(tool="codex", PROMPT="review", cd=tmp_path, arguments={"model": "m"})
+        assert submitted["success"] and submitted["status"] in ("queued", "running")
+
+        # 未结束时 wait=0 立即返回当前状态
+        pending = await job_result(job_id=submitted["job_id"])
+        assert "result" not in pending or pending["status"] == "succeeded"
+
+        done = await job_result(job_id=submitted["job_id"], wait=30)
+        listing = await job_status()
+        return done, listing
+
+    done, listing = asyncio.run(main())
+    assert done["status"] == "succeeded"
+    assert done["SESSION_ID"] == "thread-9"
+    assert done["result"]["success"] and done["result"]["result"] == "looks good"
+    assert [job["job_id"] for job in listing["jobs"]] == [done["job_id"]]
+
+
+def test_cancel_running_job_terminates_process(fake_cli, tmp_path):
+    fake_cli("gemini", hang="after_init")
+
+    async def main():
+        submitted = await submit_job(tool="gemini", PROMPT="long task", cd=tmp_path)
+        await _wait_status(submitted["job_id"], "running")
+        await asyncio.sleep(0.3)  # 等子进程启动
+        start = time.monotonic()
+        cancelled = await cancel_job(job_id=submitted["job_id"])
+        final = await job_result(job_id=submitted["job_id"], wait=10)
+        return cancelled, final, time.monotonic() - start
+
+    cancelled, final, elapsed = asyncio.run(main())
+    assert cancelled["cancelled"] is True
+    assert final["status"] == "cancelled"
+    assert final["result"]["error_kind"] == "cancelled"
+    assert elapsed < 5
+    assert running_processes() == {}
+
+
+def test_cancel_queued_job(fake_cli, tmp_path):
+    fake_cli("codex", hang="after_init")
+
+    async def main():
+        first = await submit_job(tool="codex", PROMPT="a", cd=tmp_path, arguments={"max_retries": 0})
+        second = await submit_job(tool="codex", PROMPT="b", cd=tmp_path)
+        await _wait_status(first["job_id"], "running")
+        queued = await job_status(job_id=second["job_id"])
+        cancelled_second = await cancel_job(job_id=second["job_id"])
+        cancelled_first = await cancel_job(job_id=first["job_id"])
+        await job_result(job_id=first["job_id"], wait=10)
+        return queued, cancelled_second, cancelled_first
+
+    queued, cancelled_second, cancelled_first = asyncio.run(main())
+    assert queued["status"] == "queued"
+    assert cancelled_second["status"] == "cancelled" and cancelled_second["started_at"] is None
+    assert cancelled_first["cancelled"] is True
+    assert running_processes() == {}
+
+
+def test_invalid_requests(tmp_path):
+    async def main():
+        bad_argument = await submit_job(tool="codex", PROMPT="x", cd=tmp_path, arguments={"no_such": 1})
+        missing = await job_result(job_id="nope")
+        cancel_missing = await cancel_job(job_id="nope")
+        return bad_argument, missing, cancel_missing
+
+    bad_argument, missing, cancel_missing = asyncio.run(main())
+    assert bad_argument["error_kind"] == "invalid_arguments" and "no_such" in bad_argument["error"]
+    assert missing["error_kind"] == "job_not_found"
+    assert cancel_missing["error_kind"] == "job_not_found"
+
+
+class _Client:
+    """代替 MCP 会话对象"""
+
+
+def test_job_table_history_limits_and_ownership():
+    table = JobTable(max_active=2, max_finished=2)
+    alice, bob = _Client(), _Client()
+
+    async def quick(job):
+        job.mark_running()
+        return {"success": True}
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def slow(job):
+            await gate.wait()
+            return {"success": False, "error_kind": "upstream_error"}
+
+        held = [table.submit("codex", "slow", "/tmp", slow, owner=alice) for _ in range(2)]
+        with pytest.raises(JobLimitError):
+            table.submit("codex", "third", "/tmp", quick)
+        gate.set()
+        for job in held:
+            await table.wait(job, 5)
+
+        finished = []
+        for i in range(3):
+            finished.append(table.submit("gemini", f"q{i}", "/tmp", quick, owner=bob))
+            await table.wait(finished[-1], 5)
+        return held, finished
+
+    held, finished = asyncio.run(main())
+    assert [job.status for job in held] == [jobs.FAILED, jobs.FAILED]
+    # 只保留最近结束的 2 个任务
+    assert [job.id for job in table.list()] == [job.id for job in finished[1:]]
+    assert table.get(finished[2].id, alice) is None
+    assert table.get(finished[2].id, bob) is finished[2]
+    assert table.counts() == {jobs.SUCCEEDED: 2}
@@ -0,0 +1,135 @@
+"""任务持久化与重启恢复测试"""
+
+import asyncio
+import json
+
+from ccg_mcp import jobs, jobstore
+from ccg_mcp.jobs import JobTable
+from ccg_mcp.jobstore import JobStore
+from ccg_mcp.retry import RESUME_PROMPT
+
+
+def _interrupt(path, monkeypatch, submissions):
+    """在「上一个服务器进程」中提交任务，未结束时退出，返回 job_id 列表"""
+    table = JobTable(store=JobStore(path))
+
+    async def main():
+        gate = asyncio.Event()
+        ids = []
+        for tool, prompt, arguments, output in submissions:
+            async def run(job, output=output):
+                if output is not None:
+                    job.mark_running()
+                    for line in output:
+                        job.observe(line)
+                await gate.wait()  # 进程退出前不会结束
+                return {"success": True}
+
+            ids.append(table.submit(tool, prompt, "/work", run, arguments=arguments).id)
+        await asyncio.sleep(0.05)
+        return ids  # 事件循环关闭时取消未结束的任务，如同服务器退出
+
+    ids = asyncio.run(main())
+    table.store.close()
+    # 之后的操作视为重启后的新进程
+    monkeypatch.setattr(jobstore, "SERVER_ID", "restarted")
+    return ids
+
+
+def test_recovery_resumes_captured_sessions(tmp_path, monkeypatch):
+    path = tmp_path / "jobs.sqlite3"
+    init = json.dumps({"type": "thread.started", "thread_id": "thread-7"})
+    resumable, queued, coder = _interrupt(path, monkeypatch, [
+        ("codex", "review all", {"model": "m"}, [init, '{"type": "turn.started"}']),
+        ("gemini", "explain", {}, None),
+        ("coder", "write code", {}, ['{"type": "assistant"}']),
+    ])
+
+    launched = []
+    table = JobTable(store=JobStore(path))
+
+    async def main():
+        async def run(job):
+            job.mark_running()
+            return {"success": True, "SESSION_ID": job.session_id}
+
+        def launch(record, prompt, arguments):
+            launched.append((record["id"], prompt, arguments))
+            return table.submit(record["tool"], record["prompt"], record["cd"], run,
+                                arguments=record["arguments"], record=record)
+
+        recovered = table.recover(launch)
+        for job in recovered:
+            await table.wait(job, 5)
+        return recovered
+
+    recovered = asyncio.run(main())
+    assert launched == [
+        (resumable, RESUME_PROMPT, {"model": "m", "SESSION_ID": "thread-7"}),
+        (queued, "explain", {}),
+    ]
+    by_id = {job.id: job for job in recovered}
+    assert by_id[resumable].status == jobs.SUCCEEDED
+    assert by_id[resumable].to_dict()["recoveries"] == 1
+    # coder 有写入副作用：未捕获会话 ID 时不从头重跑
+    assert by_id[coder].status == jobs.FAILED
+    assert by_id[coder].result["error_kind"] == jobs.INTERRUPTED
+    assert "assistant" in by_id[coder].result["partial_output"]
+
+    # 再次重启：已结束的任务载入后仍可取回，不会再次执行
+    monkeypatch.setattr(jobstore, "SERVER_ID", "restarted-again")
+    table = JobTable(store=JobStore(path))
+    assert table.recover(lambda *args: None) == []
+    restored = table.get(resumable)
+    assert restored is not None and restored.status == jobs.SUCCEEDED
+    assert restored.result["SESSION_ID"] == "thread-7"
+    assert {job.id for job in table.list()} == {resumable, queued, coder}
+
+
+def test_claim_skips_live_servers_and_limits_recoveries(tmp_path, monkeypatch):
+    path = tmp_path / "jobs.sqlite3"
+    (job_id,) = _interrupt(path, monkeypatch, [("gemini", "explain", {}, [])])
+    store = JobStore(path)
+
+    # 所属进程仍在运行时不接管（记录中的 PID 为本测试进程，getpid 改为其他值）
+    monkeypatch.setattr(jobstore.os, "getpid", lambda: 1)
+    assert store.claim_interrupted() == []
+    monkeypatch.undo()
+    monkeypatch.setattr(jobstore, "SERVER_ID", "restarted")
+
+    (record,) = store.claim_interrupted()
+    assert record["id"] == job_id and record["status"] == jobs.RUNNING
+    # 已被接管的记录不会被再次接管
+    assert store.claim_interrupted() == []
+
+    record["recoveries"] = jobs.MAX_RECOVERIES
+    plan, reason = jobs.plan_recovery(record)
+    assert plan is None and "不再自动恢复" in reason
+
+
+def test_unwritable_store_does_not_break_jobs(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    table = JobTable(store=JobStore(blocker / "jobs.sqlite3"))
+
+    async def main():
+        async def run(job):
+            job.mark_running()
+            job.observe('{"type": "init", "session_id": "s-1"}')
+            return {"success": True}
+
+        job = table.submit("gemini", "hi", "/work", run)
+        await table.wait(job, 5)
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == jobs.SUCCEEDED
+    assert job.to_dict()["SESSION_ID"] == "s-1"
+    assert table.recover(lambda *args: None) == []
+
+
+def test_owner_of_unknown_state_counts_as_alive(monkeypatch):
+    # 无法探测进程的平台上不能把其他服务器的任务当作孤儿接管
+    monkeypatch.setattr(jobstore.sys, "platform", "unknown")
+    monkeypatch.setattr(jobstore.os, "name", "unknown")
+    assert jobstore._pid_alive(2 ** 22 + 1)
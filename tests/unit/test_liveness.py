@@ -0,0 +1,84 @@
+"""子进程活动监测单元测试"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ccg_mcp.liveness import LivenessSignal, ProcessActivityMonitor, process_tree
+from ccg_mcp.runner import CommandTimeoutError, safe_cli_command
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="需要 /proc")
+
+BUSY = "import time\nend = time.time() + {s}\nwhile time.time() < end: pass\n"
+
+
+def _spawn(code: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-c", code], start_new_session=True)
+
+
+def test_monitor_detects_busy_descendant():
+    """测试后代进程消耗 CPU 时被识别为活动"""
+    parent = _spawn(
+        "import subprocess, sys\n"
+        f"subprocess.run([sys.executable, '-c', {BUSY.format(s=3)!r}])\n"
+    )
+    try:
+        monitor = ProcessActivityMonitor(parent.pid)
+        assert monitor.poll() is None  # 首次调用只建立基线
+        time.sleep(1.0)
+        assert len(process_tree(parent.pid)) >= 2
+        assert monitor.poll() == LivenessSignal.CPU
+    finally:
+        parent.kill()
+        parent.wait()
+
+
+def test_monitor_ignores_sleeping_process():
+    """测试完全阻塞的进程不被视为活动"""
+    proc = _spawn("import time; time.sleep(30)")
+    try:
+        monitor = ProcessActivityMonitor(proc.pid)
+        time.sleep(0.3)
+        monitor.poll()
+        time.sleep(0.5)
+        assert monitor.poll() is None
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def test_monitor_missing_process():
+    """测试进程不存在时降级为无信号"""
+    proc = _spawn("pass")
+    proc.wait()
+    monitor = ProcessActivityMonitor(proc.pid)
+    assert monitor.poll() is None
+    assert monitor.poll() is None
+
+
+def _run(**kwargs):
+    with safe_cli_command(
+        ["codex"], tool="Fake", not_found_message="missing", is_completed=lambda line: False, **kwargs
+    ) as gen:
+        return list(gen)
+
+
+def test_runner_extends_idle_timeout_on_cpu_activity(fake_cli):
+    """测试静默但在消耗 CPU 的子进程不会触发空闲超时"""
+    fake_cli("codex", silent_busy=2.5, text="done")
+    stats: dict = {}
+    lines = _run(timeout=1.5, max_duration=30, liveness_interval=0.5, stats=stats)
+
+    assert json.loads(lines[-2])["item"]["text"] == "done"
+    assert stats["liveness_extensions"].get(LivenessSignal.CPU, 0) >= 1
+
+
+def test_runner_idle_timeout_without_liveness(fake_cli):
+    """测试禁用活动检测时仍按无输出时间判定空闲超时"""
+    fake_cli("codex", silent_busy=2.5)
+    with pytest.raises(CommandTimeoutError) as exc_info:
+        _run(timeout=1.0, max_duration=30, liveness_interval=0)
+    assert exc_info.value.is_idle
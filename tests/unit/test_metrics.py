@@ -0,0 +1,109 @@
+"""指标收集单元测试"""
+import asyncio
+import time
+
+from ccg_mcp.actions import ToolActionTracker
+from ccg_mcp.metrics import MetricsCollector, Phase, PhaseTimeline
+from ccg_mcp.tools.gemini import gemini_tool
+
+
+def test_phase_timeline_marks_first_occurrence_per_attempt():
+    """测试同一尝试内阶段只记录第一次，新尝试清空时间点"""
+    timeline = PhaseTimeline()
+    timeline.begin_attempt()
+    timeline.mark(Phase.SPAWN)
+    time.sleep(0.02)
+    timeline.mark(Phase.SPAWN)
+    assert timeline.get(Phase.SPAWN) < 20
+    assert timeline.get(Phase.ATTEMPT_START) == 0
+
+    timeline.begin_attempt()
+    assert timeline.get(Phase.SPAWN) is None
+    assert timeline.get(Phase.ATTEMPT_START) >= 20
+
+
+def test_server_overhead_and_ttft():
+    """测试服务端开销 = 启动前 + 退出后的耗时"""
+    timeline = PhaseTimeline()
+    timeline.begin_attempt()
+    timeline._marks.update({Phase.SPAWN: 5, Phase.FIRST_TEXT: 120, Phase.EXIT: 900})
+
+    assert timeline.ttft_ms() == 120
+    assert timeline.server_overhead_ms(duration_ms=910) == 15
+    assert PhaseTimeline().server_overhead_ms(duration_ms=10) is None
+
+
+def test_tracker_records_tool_use_timing():
+    """测试工具调用跟踪器同步记录起止时间"""
+    timeline = PhaseTimeline()
+    timeline.begin_attempt()
+    tracker = ToolActionTracker(timeline=timeline)
+    tracker.start("t1", "Bash", "ls")
+    tracker.finish("t1")
+    tracker.finish("t2", name="file_change")
+
+    uses = timeline.to_dict()["tool_uses"]
+    assert [u["id"] for u in uses] == ["t1", "t2"]
+    assert uses[0]["start_ms"] is not None and uses[0]["end_ms"] >= uses[0]["start_ms"]
+    assert uses[1]["start_ms"] is None and uses[1]["name"] == "file_change"
+
+
+def test_tool_use_summary_aggregates_by_name():
+    """测试按工具名汇总耗时、错误与输出字节数，按总耗时降序"""
+    timeline = PhaseTimeline()
+    timeline.begin_attempt()
+    tracker = ToolActionTracker(timeline=timeline)
+    tracker.start("b1", "Bash", "pytest -q", input_bytes=20)
+    tracker.start("r1", "Read", "a.py")
+    tracker.finish("r1", output_bytes=100)
+    timeline.begin_attempt()  # 重试：上一次尝试中未结束的 Bash 仍计入汇总
+    tracker = ToolActionTracker(timeline=timeline)
+    tracker.start("b2", "Bash", "pytest -q")
+    for entry in timeline._open_tool_uses.values():
+        entry["start_ms"] -= 500
+    tracker.finish("b2", is_error=True, output_bytes=6)
+
+    uses = timeline.to_dict()["tool_uses"]
+    assert uses[0]["duration_ms"] >= 500 and uses[0]["is_error"] is True and uses[0]["output_bytes"] == 6
+    summary = timeline.tool_use_summary(duration_ms=1000)
+    assert [g["name"] for g in summary] == ["Bash", "Read"]
+    bash = summary[0]
+    assert bash["count"] == 2
+    assert bash["errors"] == 1
+    assert bash["unfinished"] == 1
+    assert bash["total_ms"] >= 500
+    assert bash["share"] >= 0.5
+    assert summary[1]["output_bytes"] == 100
+
+
+def test_metrics_to_dict_includes_phases():
+    """测试 to_dict 输出阶段时间线"""
+    metrics = MetricsCollector(tool="codex", prompt="hi", sandbox="read-only")
+    metrics.finish(success=True)
+    data = metrics.to_dict()
+
+    assert data["phases"] == {"tool_uses": []}
+    assert data["ttft_ms"] is None
+    assert data["server_overhead_ms"] is None
+
+
+def test_gemini_reports_phase_breakdown(fake_cli, tmp_path):
+    """测试 gemini 调用返回完整的阶段时间线"""
+    fake_cli(
+        "gemini", session_id="s-1", model="gemini-3-pro-preview", delay=0.05, text="done",
+        tool_uses=[{"id": "r1", "name": "read_file", "input": {"file_path": "a.py"}, "output": "x"}],
+    )
+
+    result = asyncio.run(gemini_tool(PROMPT="hi", cd=tmp_path, return_metrics=True))
+
+    assert result["success"] is True
+    metrics = result["metrics"]
+    phases = metrics["phases"]
+    order = ["attempt_start_ms", "spawn_ms", "first_byte_ms", "session_id_ms", "first_text_ms", "result_ms", "exit_ms"]
+    assert [phases[key] for key in order] == sorted(phases[key] for key in order)
+    assert phases["tool_uses"][0]["name"] == "read_file"
+    assert phases["tool_uses"][0]["output_bytes"] == 1
+    assert phases["tool_uses"][0]["duration_ms"] >= 0
+    assert metrics["tool_use_summary"][0]["name"] == "read_file"
+    assert metrics["ttft_ms"] == phases["first_text_ms"]
+    assert metrics["server_overhead_ms"] is not None
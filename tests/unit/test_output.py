@@ -0,0 +1,68 @@
+"""结果写入工作区文件（output_path）测试"""
+
+import asyncio
+import os
+
+import pytest
+
+from ccg_mcp.output import SUMMARY_CHARS, OutputPathError, OutputWriter, resolve_output_path
+from ccg_mcp.server import coder, codex, gemini
+
+posix_only = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 POSIX")
+
+
+def test_output_path_must_stay_inside_cd(tmp_path):
+    (tmp_path / "docs").mkdir()
+    assert resolve_output_path(tmp_path, "docs/review.md") == (tmp_path / "docs" / "review.md").resolve()
+    for bad in ("../escape.md", str(tmp_path.parent / "abs.md"), "docs", "."):
+        with pytest.raises(OutputPathError):
+            resolve_output_path(tmp_path, bad)
+
+    result = asyncio.run(gemini(PROMPT="explain", cd=tmp_path, output_path="../escape.md"))
+    assert not result["success"] and result["error_kind"] == "invalid_output_path"
+    assert not (tmp_path.parent / "escape.md").exists()
+
+
+def test_writer_truncates_on_retry_and_keeps_resume_prefix(tmp_path):
+    writer = OutputWriter(tmp_path / "out.md")
+    writer.begin_attempt()
+    writer.write("stale")
+    writer.begin_attempt()  # 从头重试
+    writer.write("a")
+    writer.begin_attempt("a")  # 续接会话
+    writer.write("b")
+    writer.write("c")
+    result = writer.finish({"success": True, "result": "a\n\nbc"})
+    assert (tmp_path / "out.md").read_text(encoding="utf-8") == "a\n\nbc"
+    assert result["output_bytes"] == 5 and result["result"].startswith("a\n\nbc\n\n[")
+
+    # 未产出任何内容时不创建文件，返回值不变
+    empty = OutputWriter(tmp_path / "nested" / "none.md")
+    empty.begin_attempt()
+    failed = {"success": False, "error": "boom"}
+    assert empty.finish(failed) == {"success": False, "error": "boom"}
+    assert not (tmp_path / "nested").exists()
+
+
+@posix_only
+def test_streams_output_and_returns_summary(fake_cli, tmp_path):
+    text = "".join(f"line {i:04d}\n" for i in range(300))
+    fake_cli("codex", text=text, chunks=5)
+
+    result = asyncio.run(codex(PROMPT="review", cd=tmp_path, output_path="reports/review.md"))
+    path = tmp_path / "reports" / "review.md"
+    assert result["success"], result
+    assert path.read_text(encoding="utf-8") == text
+    assert result["output_path"] == str(path.resolve())
+    assert result["output_bytes"] == len(text.encode("utf-8"))
+    assert result["result"].startswith(text[:SUMMARY_CHARS]) and len(result["result"]) < SUMMARY_CHARS + 200
+
+
+@posix_only
+def test_coder_file_matches_final_result(fake_cli, tmp_path):
+    # 流式文本按段落拼接，最终以 result 事件为准重写文件
+    fake_cli("claude", text="part one. part two.", chunks=2)
+
+    result = asyncio.run(coder(PROMPT="write", cd=tmp_path, output_path="out.md"))
+    assert result["success"], result
+    assert (tmp_path / "out.md").read_text(encoding="utf-8") == "part one. part two."
@@ -0,0 +1,62 @@
+"""解析阶段吞吐与内存预算测试
+
+预算远低于开发机实测值（见 benchmarks/parser_throughput.py），留出 CI 与覆盖率统计的余量；
+低于预算通常意味着逐行处理引入了平方级开销（如重复拼接、逐行深拷贝）。
+"""
+import pytest
+
+from ccg_mcp.testing import measure_parser, synthetic_stream
+
+BACKENDS = ["claude", "codex", "gemini"]
+
+# 小事件：每秒事件数下限
+MIN_EVENTS_PER_S = 10_000
+# 大负载 tool_result：每秒处理字节数下限（MB/s）
+MIN_TOOL_RESULT_MB_PER_S = 50
+# 大负载 tool_result 的峰值内存上限（MB）：只保留最近 50 行，不应随事件数增长
+MAX_TOOL_RESULT_PEAK_MB = 12
+
+
+@pytest.fixture(autouse=True)
+def coder_token(monkeypatch):
+    monkeypatch.setenv("CODER_API_TOKEN", "budget-test")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_small_event_throughput(backend, tmp_path):
+    """测试 1 KB 文本事件的解析吞吐"""
+    result = measure_parser(
+        backend, lambda: synthetic_stream(backend, events=20_000, line_bytes=1024),
+        trace_memory=False, cd=tmp_path,
+    )
+
+    assert result["success"] is True
+    assert result["events"] == 20_002 + (backend == "codex")
+    assert result["events_per_s"] >= MIN_EVENTS_PER_S, result
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_tool_result_throughput_and_memory(backend, tmp_path):
+    """测试大 tool_result 负载的吞吐，且峰值内存不随事件数增长"""
+    result = measure_parser(
+        backend,
+        lambda: synthetic_stream(backend, events=1_000, line_bytes=200, tool_result_bytes=64 << 10, tool_every=2),
+        cd=tmp_path,
+    )
+
+    assert result["success"] is True
+    assert result["mb_per_s"] >= MIN_TOOL_RESULT_MB_PER_S, result
+    assert result["peak_memory_mb"] <= MAX_TOOL_RESULT_PEAK_MB, result
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_large_line_memory_is_linear(backend, tmp_path):
+    """测试 1 MB 单行：峰值内存与回复总长度同量级（回复文本本身需要完整保留）"""
+    events, line_bytes = 10, 1 << 20
+    result = measure_parser(
+        backend, lambda: synthetic_stream(backend, events=events, line_bytes=line_bytes), cd=tmp_path,
+    )
+
+    assert result["success"] is True
+    text_mb = events * line_bytes / 2**20
+    assert result["peak_memory_mb"] <= text_mb * 2 + 8, result
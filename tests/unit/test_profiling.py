@@ -0,0 +1,106 @@
+"""服务端开销剖析单元测试"""
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from ccg_mcp import profiling
+from ccg_mcp.tools.codex import codex_tool
+
+
+@pytest.fixture
+def profiling_enabled():
+    profiling.set_enabled(True)
+    yield
+    profiling.set_enabled(False)
+
+
+def test_loop_lag_monitor_detects_blocking(profiling_enabled):
+    """测试阻塞事件循环的同步代码被计为事件循环延迟"""
+    async def scenario():
+        monitor = profiling.ensure_loop_monitor()
+        await asyncio.sleep(0.3)
+        started = time.monotonic()
+        time.sleep(0.5)  # 阻塞事件循环
+        blocked = monitor.max_lag_since(started)
+        await asyncio.sleep(0.3)
+        return blocked, monitor.stats()
+
+    blocked, stats = asyncio.run(scenario())
+    assert blocked >= 0.3
+    assert stats["max_ms"] >= 300
+    assert stats["samples"] >= 2
+
+
+@pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+def test_call_profile_reports_parse_cost(fake_cli, tmp_path, profiling_enabled):
+    """测试开启剖析时 metrics.profile 包含逐行解析耗时与服务端 CPU 时间"""
+    fake_cli("codex", text="x" * 20, chunks=20)
+    result = asyncio.run(codex_tool(PROMPT="hi", cd=tmp_path, return_metrics=True))
+
+    profile = result["metrics"]["profile"]
+    assert profile["parse"]["lines"] == 23  # thread.started、turn.started、20 条消息、turn.completed
+    assert profile["parse"]["max_us"] >= profile["parse"]["mean_us"] > 0
+    assert profile["server_cpu_ms"] >= 0
+    assert profile["loop_lag_max_ms"] is not None
+
+
+@pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+def test_profile_absent_when_disabled(fake_cli, tmp_path):
+    """测试未开启剖析时不记录"""
+    fake_cli("codex")
+    result = asyncio.run(codex_tool(PROMPT="hi", cd=tmp_path, return_metrics=True))
+    assert result["metrics"]["profile"] is None
+
+
+def test_snapshots_written_to_profiles_dir(tmp_path):
+    """测试 tracemalloc / cProfile 快照写入 .ccg/profiles/"""
+    with pytest.raises(RuntimeError):
+        profiling.stop_cprofile(tmp_path)
+
+    profiling.start_tracemalloc()
+    try:
+        data = [bytes(1000) for _ in range(100)]
+        snapshot = profiling.snapshot_tracemalloc(tmp_path, top=5)
+    finally:
+        profiling.stop_tracemalloc()
+    assert snapshot["peak_bytes"] >= 100_000
+    assert "test_profiling.py" in snapshot["top"][0]
+    del data
+
+    profiling.start_cprofile()
+    sum(i * i for i in range(10000))
+    result = profiling.stop_cprofile(tmp_path, top=5)
+    assert profiling.status()["cprofile"] is False
+
+    files = sorted(p.suffix for p in profiling.get_profiles_dir(tmp_path).iterdir())
+    assert files == [".prof", ".snapshot", ".txt", ".txt"]
+    assert result["path"].endswith(".prof")
+
+
+def _parse_in_worker():
+    return sum(len(json.dumps({"i": i})) for i in range(20000))
+
+
+def test_cprofile_covers_worker_threads(tmp_path):
+    """测试 cProfile 记录在准入控制工作线程中执行的工具调用"""
+    import pstats
+
+    from ccg_mcp.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrent=1)
+
+    async def call():
+        return _parse_in_worker()
+
+    profiling.start_cprofile()
+    try:
+        asyncio.run(controller.call("codex", call))
+    finally:
+        result = profiling.stop_cprofile(tmp_path, top=50)
+        controller.shutdown()
+
+    functions = {name for _, _, name in pstats.Stats(result["path"]).stats}
+    assert "_parse_in_worker" in functions
@@ -0,0 +1,110 @@
+"""Prometheus / OpenMetrics 指标导出单元测试"""
+import urllib.request
+
+from ccg_mcp.metrics import MetricsCollector
+from ccg_mcp.prometheus import (
+    CallMetrics,
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    TextfileExporter,
+    get_call_metrics,
+    start_http_server,
+)
+
+
+def _finished(success=True, error_kind=None, attempts=None, ttfe_ms=None):
+    metrics = MetricsCollector(tool="codex", prompt="hi", sandbox="read-only", model="gpt-5")
+    metrics.finish(
+        success=success,
+        error_kind=error_kind,
+        retry_stats={"attempts": attempts or []},
+        runner_stats={"time_to_first_event_ms": ttfe_ms} if ttfe_ms is not None else None,
+    )
+    return metrics
+
+
+def test_call_metrics_counters_and_histograms():
+    """测试调用、错误、重试计数与耗时直方图"""
+    call_metrics = CallMetrics()
+    call_metrics.observe(_finished(ttfe_ms=800))
+    call_metrics.observe(_finished(
+        success=False,
+        error_kind="idle_timeout",
+        attempts=[{"error_kind": "startup_timeout"}, {"error_kind": "idle_timeout"}],
+    ))
+
+    assert call_metrics.calls.get(tool="codex", model="gpt-5", outcome="success") == 1
+    assert call_metrics.calls.get(tool="codex", model="gpt-5", outcome="error") == 1
+    assert call_metrics.errors.get(tool="codex", error_kind="idle_timeout") == 1
+    # 最后一次失败的尝试没有被重试
+    assert call_metrics.retries.get(tool="codex", error_kind="startup_timeout") == 1
+    assert call_metrics.retries.get(tool="codex", error_kind="idle_timeout") == 0
+
+    text = call_metrics.registry.render()
+    assert "# TYPE ccg_calls_total counter" in text
+    assert 'ccg_calls_total{tool="codex",model="gpt-5",outcome="success"} 1' in text
+    assert 'ccg_time_to_first_event_seconds_bucket{tool="codex",le="1"} 1' in text
+    assert 'ccg_time_to_first_event_seconds_bucket{tool="codex",le="0.5"} 0' in text
+    assert 'ccg_call_duration_seconds_count{tool="codex"} 2' in text
+
+
+def test_render_openmetrics():
+    """测试 OpenMetrics 格式：族名不带 _total，以 # EOF 结尾"""
+    call_metrics = CallMetrics()
+    call_metrics.observe(_finished())
+    text = call_metrics.registry.render(openmetrics=True)
+
+    assert "# TYPE ccg_calls counter" in text
+    assert text.endswith("# EOF\n")
+
+
+def test_histogram_cumulative_buckets():
+    """测试直方图分桶为累积计数，并包含 +Inf"""
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("h_seconds", "test", buckets=(1, 10)))
+    for value in (0.5, 5, 50):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+
+    assert 'h_seconds_bucket{le="1"} 1' in lines
+    assert 'h_seconds_bucket{le="10"} 2' in lines
+    assert 'h_seconds_bucket{le="+Inf"} 3' in lines
+    assert "h_seconds_sum 55.5" in lines
+
+
+def test_counter_from_callback():
+    """测试由回调取值的计数器按 counter 类型导出 _total 样本"""
+    counter = Counter("rejected", "Rejected calls", ("tool",), lambda: {("codex",): 2})
+    assert counter.get(tool="codex") == 2
+    assert counter.render(openmetrics=False) == [
+        "# HELP rejected_total Rejected calls",
+        "# TYPE rejected_total counter",
+        'rejected_total{tool="codex"} 2',
+    ]
+    assert counter.render(openmetrics=True)[1] == "# TYPE rejected counter"
+
+
+def test_http_endpoint_and_textfile(tmp_path):
+    """测试 /metrics HTTP 端点与 textfile 导出"""
+    get_call_metrics()
+    server = start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+            assert response.headers["Content-Type"].startswith("text/plain")
+        assert "# TYPE ccg_inflight_processes gauge" in body
+        assert "# TYPE ccg_admission_queued gauge" in body
+        assert "# TYPE ccg_admission_rejected_total counter" in body
+
+        request = urllib.request.Request(url, headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.read().decode("utf-8").endswith("# EOF\n")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    path = tmp_path / "ccg_mcp.prom"
+    TextfileExporter(path).write()
+    assert "ccg_call_duration_seconds" in path.read_text()
@@ -0,0 +1,85 @@
+"""后端输出流录制与回放单元测试"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from ccg_mcp import recording
+from ccg_mcp.recording import SCRUBBED, Scrubber, iter_fixtures, load_fixture
+from ccg_mcp.testing import install_replay_cli
+from ccg_mcp.tools.codex import codex_tool
+
+posix_only = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+
+
+@pytest.fixture
+def record_dir(tmp_path):
+    directory = tmp_path / "streams"
+    recording.set_record_dir(directory)
+    yield directory
+    recording.set_record_dir(None)
+
+
+def test_scrubber_masks_secrets():
+    """测试密钥环境变量的值、常见密钥形态与键值对被替换"""
+    scrub = Scrubber({"MY_SERVICE_TOKEN": "tok-1234567890", "PATH": "/usr/bin"})
+    text = scrub(
+        'token tok-1234567890 key sk-ant-REDACTED '
+        '{"api_key": "plainsecret"} Authorization: Bearer abc.def.ghi123 /usr/bin'
+    )
+
+    assert "tok-1234567890" not in text
+    assert "sk-ant-" not in text
+    assert "plainsecret" not in text
+    assert "abc.def.ghi123" not in text
+    assert '"api_key": "' + SCRUBBED in text
+    assert "/usr/bin" in text  # 非密钥变量不替换
+
+
+@posix_only
+def test_record_and_replay_roundtrip(fake_cli, record_dir, tmp_path, monkeypatch):
+    """测试录制经 runner 的原始输出，并经回放得到相同结果"""
+    monkeypatch.setenv("FAKE_API_KEY", "secret-value-123")
+    fake_cli("codex", text="answer secret-value-123", delay=0.05, tool_uses=[{"name": "Bash"}])
+    original = asyncio.run(codex_tool(PROMPT="hi", cd=tmp_path))
+    assert original["success"] is True
+
+    [path] = list(iter_fixtures(record_dir))
+    fixture = load_fixture(path)
+    assert fixture.tool == "codex"
+    assert fixture.exit_code == 0
+    assert fixture.header["argv"][0].endswith("codex")
+    assert fixture.lines[0][1].startswith('{"type": "thread.started"')
+    assert fixture.duration_ms >= 150
+    assert all("secret-value-123" not in text for _, text in fixture.lines)
+
+    # 关闭录制后回放：加速回放耗时小于录制耗时，解析结果一致
+    recording.set_record_dir(None)
+    install_replay_cli(tmp_path / "fake-bin", path, speed=0)
+    start = time.monotonic()
+    replayed = asyncio.run(codex_tool(PROMPT="hi", cd=tmp_path))
+    elapsed_ms = (time.monotonic() - start) * 1000
+
+    assert replayed["success"] is True
+    assert replayed["result"] == f"answer {SCRUBBED}"
+    assert replayed["SESSION_ID"] == original["SESSION_ID"]
+    assert elapsed_ms < fixture.duration_ms + 5000
+    assert list(iter_fixtures(record_dir)) == [path]
+
+
+def test_fixture_replay_speed(tmp_path):
+    """测试按录制时序回放与加速"""
+    recorder = recording.StreamRecorder(tmp_path, "gemini", ["gemini", "-o", "stream-json"], env={})
+    recorder.line('{"type": "init"}')
+    time.sleep(0.1)
+    recorder.line('{"type": "result"}')
+    recorder.line("")
+    fixture = load_fixture(recorder.save(0))
+
+    assert [text for _, text in fixture.lines] == ['{"type": "init"}', '{"type": "result"}']
+    assert fixture.duration_ms >= 100
+
+    start = time.monotonic()
+    assert len(list(fixture.replay(speed=10))) == 2
+    assert time.monotonic() - start < 0.08
@@ -0,0 +1,147 @@
+"""重试调度模块单元测试"""
+import time
+
+import pytest
+from ccg_mcp.retry import (
+    MIN_ATTEMPT_SECONDS,
+    Deadline,
+    RateLimitKind,
+    RateLimitSignal,
+    RetryBudget,
+    RetryScheduler,
+    classify_rate_limit,
+    parse_retry_after,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Retry-After: 30", 30.0),
+    ('{"retry_after": 12}', 12.0),
+    ('"retryDelay": "36s"', 36.0),
+    ("Please retry in 36.31s.", 36.31),
+    ("Rate limit reached. Please try again in 1m30s", 90.0),
+    ("retry-after-ms: 1500", 1.5),
+    ("limit resets after 2 minutes", 120.0),
+    ("429 Too Many Requests", None),
+    ("", None),
+])
+def test_parse_retry_after(text, expected):
+    """测试解析 retry-after 提示"""
+    result = parse_retry_after(text)
+    if expected is None:
+        assert result is None
+    else:
+        assert result == pytest.approx(expected)
+
+
+def test_classify_rate_limit_kinds():
+    """测试识别限流信号类型"""
+    assert classify_rate_limit("stream error: 429 Too Many Requests").kind == RateLimitKind.RATE_LIMIT
+    assert classify_rate_limit("RESOURCE_EXHAUSTED: Quota exceeded").kind == RateLimitKind.QUOTA
+    assert classify_rate_limit('{"type":"overloaded_error"}').kind == RateLimitKind.OVERLOADED
+    assert classify_rate_limit("permission denied") is None
+
+    signal = classify_rate_limit("429 rate limit exceeded, retry after 7s")
+    assert signal.retry_after_s == pytest.approx(7.0)
+
+
+def test_retry_budget_limits_retries():
+    """测试重试预算按请求量比例限制重试次数"""
+    budget = RetryBudget(ratio=0.5, min_retries=1, ttl_s=60)
+    for _ in range(4):
+        budget.record_request()
+
+    # 允许 1 + 0.5 * 4 = 3 次重试
+    assert [budget.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_scheduler_decorrelated_jitter_bounds():
+    """测试去相关抖动退避在 [base, cap] 范围内"""
+    scheduler = RetryScheduler(base_delay=0.5, max_delay=4.0, budget=RetryBudget(min_retries=100))
+    delays = [scheduler.next_delay() for _ in range(20)]
+
+    assert all(0.5 <= d <= 4.0 for d in delays)
+    assert scheduler.to_dict()["rate_limited"] is False
+
+
+def test_scheduler_honours_retry_after():
+    """测试限流时遵循 retry-after 提示并叠加抖动"""
+    scheduler = RetryScheduler(budget=RetryBudget(min_retries=10))
+    delay = scheduler.next_delay(RateLimitSignal(RateLimitKind.RATE_LIMIT, retry_after_s=10.0))
+
+    assert 10.0 <= delay <= 15.0
+    stats = scheduler.to_dict()
+    assert stats["rate_limited"] is True
+    assert stats["retry_after_s"] == 10.0
+
+
+def test_scheduler_gives_up_when_budget_exhausted():
+    """测试预算耗尽或等待过长时放弃重试"""
+    scheduler = RetryScheduler(budget=RetryBudget(ratio=0, min_retries=0))
+    assert scheduler.next_delay() is None
+    assert scheduler.to_dict()["retry_budget_exhausted"] is True
+
+    scheduler = RetryScheduler(budget=RetryBudget(min_retries=10))
+    assert scheduler.next_delay(RateLimitSignal(RateLimitKind.QUOTA, retry_after_s=3600)) is None
+
+
+def test_deadline_caps_attempt_duration():
+    """测试截止时间收紧单次尝试的总时长上限"""
+    assert Deadline(0).cap(1800) == 1800
+    assert not Deadline(0).expired()
+
+    deadline = Deadline(10)
+    assert deadline.cap(1800) <= 10
+    assert 0 < deadline.cap(0) <= 10
+    assert deadline.cap(5) == 5
+
+    # 已到期时仍返回正数上限（0 对 runner 意味着不限制）
+    expired = Deadline(0.001)
+    time.sleep(0.01)
+    assert expired.expired()
+    assert 0 < expired.cap(1800) <= MIN_ATTEMPT_SECONDS
+    assert 0 < expired.cap(0) <= MIN_ATTEMPT_SECONDS
+
+
+def test_scheduler_respects_deadline():
+    """测试截止时间不足时放弃重试，且退避不超过剩余预算"""
+    scheduler = RetryScheduler(budget=RetryBudget(min_retries=10), deadline=Deadline(0.5))
+    assert scheduler.next_delay() is None
+
+    scheduler = RetryScheduler(budget=RetryBudget(min_retries=10), deadline=Deadline(5))
+    delay = scheduler.next_delay(RateLimitSignal(RateLimitKind.RATE_LIMIT, retry_after_s=3.5))
+    assert delay is not None and delay <= 4.0
+    assert scheduler.next_delay(RateLimitSignal(RateLimitKind.RATE_LIMIT, retry_after_s=30)) is None
+
+
+def test_scheduler_records_attempts():
+    """测试按尝试记录耗时与错误类型"""
+    scheduler = RetryScheduler(budget=RetryBudget(), deadline=Deadline(60))
+    scheduler.begin_attempt()
+    scheduler.end_attempt("idle_timeout")
+    scheduler.begin_attempt()
+    scheduler.end_attempt(None)
+
+    stats = scheduler.to_dict()
+    assert stats["deadline_s"] == 60
+    assert [a["error_kind"] for a in stats["attempts"]] == ["idle_timeout", None]
+    assert all(a["duration_ms"] >= 0 for a in stats["attempts"])
+
+
+def test_scheduler_counts_resumed_and_restarted_attempts():
+    """测试区分续接会话与从头重跑的重试统计"""
+    scheduler = RetryScheduler(budget=RetryBudget())
+    for mode, error_kind in [
+        ("fresh", "idle_timeout"),
+        ("resume", "upstream_error"),
+        ("fresh", "idle_timeout"),
+        ("resume", None),
+    ]:
+        scheduler.begin_attempt(mode=mode)
+        scheduler.end_attempt(error_kind)
+
+    stats = scheduler.to_dict()
+    assert [a["mode"] for a in stats["attempts"]] == ["fresh", "resume", "fresh", "resume"]
+    assert stats["resumed_attempts"] == 2
+    assert stats["recovered_by_resume"] == 1
+    assert stats["restarted_attempts"] == 1
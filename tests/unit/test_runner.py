@@ -0,0 +1,80 @@
+"""子进程执行器单元测试"""
+import asyncio
+import json
+import os
+
+import pytest
+
+from ccg_mcp.retry import Deadline
+from ccg_mcp.runner import CommandTimeoutError, safe_cli_command
+from ccg_mcp.tools.coder import coder_tool
+from ccg_mcp.tools.codex import codex_tool
+from ccg_mcp.tools.gemini import gemini_tool
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+
+
+def _run(**kwargs):
+    with safe_cli_command(
+        ["codex"],
+        tool="Fake",
+        not_found_message="missing",
+        is_completed=lambda line: False,
+        is_started=lambda line: "thread_id" in line,
+        **kwargs,
+    ) as gen:
+        return list(gen)
+
+
+def test_startup_timeout_when_no_init_event(fake_cli):
+    """测试未收到初始化事件时按启动超时终止，而不是等满空闲超时"""
+    fake_cli("codex", hang="startup")
+    stats: dict = {}
+    with pytest.raises(CommandTimeoutError) as exc_info:
+        _run(timeout=30, max_duration=60, startup_timeout=1, stats=stats)
+
+    assert exc_info.value.is_startup
+    assert not exc_info.value.is_idle
+    assert stats["startup_timeouts"] == 1
+    assert "time_to_first_event_ms" not in stats
+
+
+def test_records_time_to_first_event(fake_cli):
+    """测试记录首个初始化事件的耗时"""
+    fake_cli("codex", startup_delay=0.2, session_id="t-1")
+    stats: dict = {}
+    lines = _run(timeout=10, max_duration=30, startup_timeout=5, stats=stats)
+
+    assert json.loads(lines[0]) == {"type": "thread.started", "thread_id": "t-1"}
+    assert stats["time_to_first_event_ms"] >= 200
+    assert "startup_timeouts" not in stats
+
+
+def test_codex_retries_stuck_launch_on_fresh_process(fake_cli, tmp_path):
+    """测试启动卡住时立即在新进程上重试，且不占用 max_retries"""
+    fake_cli("codex", invocations=[{"hang": "startup"}, {"text": "ok"}])
+    result = asyncio.run(codex_tool(
+        PROMPT="hi", cd=tmp_path, max_retries=0, startup_timeout=1, return_metrics=True,
+    ))
+
+    assert result["success"] is True
+    assert result["result"] == "ok"
+    metrics = result["metrics"]
+    assert metrics["startup_timeouts"] == 1
+    assert metrics["retries"] == 0
+    assert [a["error_kind"] for a in metrics["attempts"]] == ["startup_timeout", None]
+    assert metrics["time_to_first_event_ms"] is not None
+
+
+@pytest.mark.parametrize("backend, tool", [("claude", coder_tool), ("codex", codex_tool), ("gemini", gemini_tool)])
+def test_deadline_expiring_after_startup_timeout(fake_cli, tmp_path, monkeypatch, backend, tool):
+    """测试启动超时后截止时间已到时不再重试，返回 deadline_exceeded 而非误判成功或抛出异常"""
+    fake_cli(backend, hang="startup")
+    checks = []
+    # 启动超时时截止时间尚未到达（按启动超时立即重试），下一轮开始前已到达
+    monkeypatch.setattr(Deadline, "expired", lambda self: bool(checks.append(None)) or len(checks) > 1)
+    result = asyncio.run(tool(PROMPT="hi", cd=tmp_path, startup_timeout=1, deadline=60, return_metrics=True))
+
+    assert result["success"] is False
+    assert result["error_kind"] == "deadline_exceeded"
+    assert [a["error_kind"] for a in result["metrics"]["attempts"]] == ["startup_timeout"]
@@ -0,0 +1,17 @@
+"""子进程执行器故障注入测试：清理耗时有上限、无线程 / 进程泄漏、error_kind 正确"""
+import os
+
+import pytest
+
+from ccg_mcp.testing.faults import FAULTS, fault_cases, run_fault
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+
+
+@pytest.mark.parametrize("fault_name,backend", fault_cases())
+def test_fault_is_contained(fake_cli, tmp_path, fault_name, backend):
+    """测试故障下调用按时结束、资源全部回收且错误分类正确"""
+    bin_dir = fake_cli(backend)
+    report = run_fault(backend, FAULTS[fault_name], bin_dir, tmp_path)
+
+    assert report.ok, (report.problems, report.result.get("error"))
@@ -0,0 +1,48 @@
+"""服务器冷启动单元测试：按需导入与导入耗时预算"""
+import pytest
+
+from ccg_mcp.startup import LAZY_MODULES, measure_handshake, measure_imports, parse_importtime
+
+# ccg_mcp 自身模块的导入耗时预算（毫秒，自身耗时之和，不含 mcp / pydantic 等依赖）
+OWN_IMPORT_BUDGET_MS = 150
+
+
+def test_parse_importtime():
+    """测试解析 -X importtime 输出"""
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   ccg_mcp.config\n"
+        "import time:      3000 |       3120 | ccg_mcp.server\n"
+        "unrelated line\n"
+    )
+
+    assert parse_importtime(stderr) == [("ccg_mcp.config", 120, 120), ("ccg_mcp.server", 3000, 3120)]
+
+
+def test_server_import_is_lazy_and_within_budget():
+    """测试启动时不导入工具实现等模块，且自身导入耗时在预算内"""
+    report = measure_imports()
+
+    assert "ccg_mcp.server" in report["loaded_modules"]
+    assert report["eager_lazy_modules"] == [], report["eager_lazy_modules"]
+    assert report["own_modules_ms"] <= OWN_IMPORT_BUDGET_MS, report["by_package_ms"]
+
+
+def test_handshake_lists_all_tools():
+    """测试冷启动后可完成 initialize 并列出全部工具（工具实现尚未导入）"""
+    report = measure_handshake()
+
+    assert report["server"]["name"] == "CCG-MCP Server"
+    assert {"coder", "codex", "gemini", "stats"} <= set(report["tools"])
+    assert report["initialize_ms"] <= report["tools_list_ms"]
+
+
+@pytest.mark.parametrize("name", ["coder_tool", "codex_tool", "gemini_tool"])
+def test_tools_package_attributes_load_on_access(name):
+    """测试 ccg_mcp.tools 的工具属性按需导入"""
+    import ccg_mcp.tools
+
+    assert callable(getattr(ccg_mcp.tools, name))
+    assert f"ccg_mcp.tools.{name[:-5]}" in LAZY_MODULES
+    with pytest.raises(AttributeError):
+        getattr(ccg_mcp.tools, "missing_tool")
@@ -0,0 +1,119 @@
+"""指标持久化与聚合统计单元测试"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ccg_mcp.cli import main
+from ccg_mcp.metrics import MetricsCollector, add_finish_hook, remove_finish_hook
+from ccg_mcp.store import (
+    MetricsStore,
+    _persist,
+    compute_stats,
+    flush_all,
+    get_metrics_dir,
+    iter_records,
+    parse_window,
+)
+
+
+def _record(tool="codex", model="", success=True, duration_ms=100, retries=0, error_kind=None, age_s=0):
+    ts = datetime.now(timezone.utc) - timedelta(seconds=age_s)
+    return {
+        "ts_start": ts.isoformat(),
+        "tool": tool,
+        "model": model or None,
+        "success": success,
+        "duration_ms": duration_ms,
+        "retries": retries,
+        "error_kind": error_kind,
+    }
+
+
+def _write(project, records):
+    store = MetricsStore(get_metrics_dir(project))
+    for record in records:
+        store.append(record)
+    store.flush()
+    return store
+
+
+def test_parse_window():
+    """测试时间窗口解析"""
+    assert parse_window("30m") == 1800
+    assert parse_window("24h") == 86400
+    assert parse_window("7d") == 7 * 86400
+    assert parse_window("2") == 7200  # 无单位按小时
+    with pytest.raises(ValueError):
+        parse_window("yesterday")
+
+
+def test_store_rotates_by_size(tmp_path):
+    """测试超过大小上限时轮转，读取时按时间顺序合并"""
+    store = MetricsStore(tmp_path, max_bytes=300, backup_count=2)
+    for index in range(12):
+        store.append({"ts_start": datetime.now(timezone.utc).isoformat(), "index": index})
+        store.flush()
+
+    assert (tmp_path / "metrics.jsonl.1").exists()
+    assert not (tmp_path / "metrics.jsonl.3").exists()
+    indexes = []
+    for name in ("metrics.jsonl.2", "metrics.jsonl.1", "metrics.jsonl"):
+        path = tmp_path / name
+        if path.exists():
+            indexes += [json.loads(line)["index"] for line in path.read_text().splitlines()]
+    assert indexes == sorted(indexes)
+    assert indexes[-1] == 11
+
+
+def test_compute_stats_groups_and_percentiles(tmp_path):
+    """测试按 工具 / 模型 分组汇总，并排除时间窗口之外的记录"""
+    records = [_record(duration_ms=ms) for ms in range(100, 1100, 100)]
+    records.append(_record(success=False, retries=2, error_kind="idle_timeout", duration_ms=5000))
+    records.append(_record(tool="gemini", model="gemini-3-pro-preview", duration_ms=300))
+    records.append(_record(duration_ms=99999, age_s=3 * 86400))  # 窗口之外
+    _write(tmp_path, records)
+
+    result = compute_stats(tmp_path, window="24h")
+
+    assert result["overall"]["calls"] == 12
+    codex = result["groups"]["codex:default"]
+    assert codex["calls"] == 11
+    assert codex["success_rate"] == round(10 / 11, 4)
+    assert codex["retry_rate"] == round(1 / 11, 4)
+    assert codex["retries"] == 2
+    assert codex["duration_ms"]["p50"] == 600
+    assert codex["duration_ms"]["p99"] > 1000
+    assert codex["error_kinds"] == {"idle_timeout": 1}
+    assert result["groups"]["gemini:gemini-3-pro-preview"]["calls"] == 1
+
+    filtered = compute_stats(tmp_path, window="7d", tool="codex")
+    assert list(filtered["groups"]) == ["codex:default"]
+    assert filtered["overall"]["calls"] == 12
+
+
+def test_finish_hook_persists_metrics(tmp_path):
+    """测试 finish 回调将指标写入项目目录"""
+    add_finish_hook(_persist)
+    try:
+        metrics = MetricsCollector(tool="codex", prompt="hi", sandbox="read-only", project=tmp_path, model="gpt-5")
+        metrics.finish(success=True)
+        flush_all()
+    finally:
+        remove_finish_hook(_persist)
+
+    records = list(iter_records(tmp_path))
+    assert len(records) == 1
+    assert records[0]["tool"] == "codex"
+    assert records[0]["model"] == "gpt-5"
+
+
+def test_cli_stats(tmp_path, capsys):
+    """测试 ccg-mcp stats 命令输出 JSON"""
+    _write(tmp_path, [_record(), _record(success=False, error_kind="command_failed")])
+
+    main(["stats", "--cd", str(tmp_path), "--window", "1h"])
+
+    output = json.loads(capsys.readouterr().out)
+    assert output["overall"]["calls"] == 2
+    assert output["overall"]["error_kinds"] == {"command_failed": 1}
@@ -0,0 +1,129 @@
+"""自适应超时单元测试"""
+import asyncio
+import json
+
+from ccg_mcp.metrics import percentile
+from ccg_mcp.timeouts import (
+    DEFAULT_MAX_DURATION_S,
+    DEFAULT_TIMEOUT_S,
+    MAX_SAMPLES,
+    MIN_IDLE_S,
+    MIN_SAMPLES,
+    TimeoutHistory,
+    history_bucket,
+)
+from ccg_mcp.tools.codex import codex_tool
+
+
+def test_percentile_interpolates():
+    """测试分位数线性插值"""
+    assert percentile([], 99) == 0
+    assert percentile([5], 50) == 5
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile(list(range(101)), 99) == 99
+
+
+def test_history_bucket_by_prompt_size():
+    """测试按工具、模型与 prompt 规模分桶"""
+    assert history_bucket("gemini", "gemini-3-pro-preview", "hi") == "gemini:gemini-3-pro-preview:s"
+    assert history_bucket("codex", "", "x" * 5000) == "codex:default:m"
+    assert history_bucket("coder", "glm-4.7", "x" * 50000) == "coder:glm-4.7:l"
+
+
+def test_suggest_requires_enough_samples(tmp_path):
+    """测试样本不足时不推导"""
+    history = TimeoutHistory(tmp_path / "history.json")
+    for _ in range(MIN_SAMPLES - 1):
+        history.record("codex:default:s", 10_000, 60_000)
+
+    assert history.suggest("codex:default:s") is None
+
+
+def test_suggest_from_high_percentiles(tmp_path):
+    """测试按高分位数与安全系数推导超时"""
+    history = TimeoutHistory(tmp_path / "history.json")
+    for i in range(100):
+        history.record("coder:glm-4.7:l", 20_000 + i * 400, 600_000 + i * 6_000)
+
+    adaptive = history.suggest("coder:glm-4.7:l")
+    assert adaptive.samples == 100
+    # p99 间隔约 59.6s，×2 ≈ 119s；p99 耗时约 1194s，×1.5 ≈ 1791s
+    assert 115 <= adaptive.timeout <= 120
+    assert 1780 <= adaptive.max_duration <= 1800
+
+
+def test_suggest_applies_floor(tmp_path):
+    """测试推导结果不低于下限"""
+    history = TimeoutHistory(tmp_path / "history.json")
+    for _ in range(MIN_SAMPLES):
+        history.record("gemini:default:s", 500, 3_000)
+
+    adaptive = history.suggest("gemini:default:s")
+    assert adaptive.timeout == MIN_IDLE_S
+    assert adaptive.max_duration >= adaptive.timeout
+
+
+def test_history_persists_and_is_bounded(tmp_path):
+    """测试历史落盘、重新加载且每桶样本数有上限"""
+    path = tmp_path / "history.json"
+    history = TimeoutHistory(path)
+    for i in range(MAX_SAMPLES + 5):
+        history.record("codex:default:s", i, i)
+
+    reloaded = TimeoutHistory(path)
+    samples = reloaded.samples("codex:default:s")
+    assert len(samples["gaps_ms"]) == MAX_SAMPLES
+    assert samples["gaps_ms"][-1] == MAX_SAMPLES + 4
+    assert json.loads(path.read_text())["version"] == 1
+
+
+def test_concurrent_processes_merge_samples(tmp_path):
+    """测试共用历史文件的多个进程不会互相覆盖样本"""
+    path = tmp_path / "history.json"
+    first, second = TimeoutHistory(path), TimeoutHistory(path)
+    first.record("codex:default:s", 1, 1)
+    second.record("codex:default:s", 2, 2)
+    first.record("codex:default:s", 3, 3)
+
+    assert TimeoutHistory(path).samples("codex:default:s")["gaps_ms"] == [1, 2, 3]
+    assert second.samples("codex:default:s")["gaps_ms"] == [1, 2, 3]
+
+
+def test_adaptive_keeps_explicit_values(tmp_path):
+    """测试推导值只替换仍为默认值的参数"""
+    history = TimeoutHistory(tmp_path / "history.json")
+    for _ in range(MIN_SAMPLES):
+        history.record("codex:default:s", 500, 3_000)
+
+    adaptive = history.suggest("codex:default:s")
+    assert adaptive.apply(DEFAULT_TIMEOUT_S, DEFAULT_MAX_DURATION_S) == (MIN_IDLE_S, adaptive.max_duration)
+
+    adaptive = history.suggest("codex:default:s")
+    timeout, max_duration = adaptive.apply(600, DEFAULT_MAX_DURATION_S)
+    assert timeout == 600 and max_duration < DEFAULT_MAX_DURATION_S
+    assert adaptive.to_dict()["explicit"] == ["timeout"]
+
+
+def test_corrupt_history_is_ignored(tmp_path):
+    """测试历史文件损坏时从空历史开始"""
+    path = tmp_path / "history.json"
+    path.write_text("{not json")
+
+    history = TimeoutHistory(path)
+    assert history.suggest("codex:default:s") is None
+    history.record("codex:default:s", 1, 1)
+    assert history.samples("codex:default:s")["gaps_ms"] == [1]
+
+
+def test_codex_uses_and_records_history(fake_cli, isolated_timeout_history, tmp_path):
+    """测试 codex 开启 adaptive_timeout 时使用历史推导值，并在成功后记录样本"""
+    fake_cli("codex", text="ok")
+    key = history_bucket("codex", "", "review")
+    for _ in range(MIN_SAMPLES):
+        isolated_timeout_history.record(key, 1_000, 5_000)
+
+    result = asyncio.run(codex_tool(PROMPT="review", cd=tmp_path, adaptive_timeout=True, return_metrics=True))
+
+    assert result["success"] is True
+    assert result["metrics"]["adaptive_timeout"]["timeout"] == MIN_IDLE_S
+    assert len(isolated_timeout_history.samples(key)["durations_ms"]) == MIN_SAMPLES + 1
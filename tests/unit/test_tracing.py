@@ -0,0 +1,97 @@
+"""调用追踪单元测试"""
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from ccg_mcp.metrics import add_finish_hook, remove_finish_hook
+from ccg_mcp.tools.codex import codex_tool
+from ccg_mcp.tracing import (
+    Span,
+    _export,
+    export_spans,
+    get_traces_dir,
+    parse_trace_context,
+    render_trace,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def test_parse_trace_context():
+    """测试 trace_id 的三种写法"""
+    assert parse_trace_context(TRACE_ID) == (TRACE_ID, None)
+    assert parse_trace_context(f"00-{TRACE_ID}-00f067aa0ba902b7-01") == (TRACE_ID, "00f067aa0ba902b7")
+    trace_id, parent = parse_trace_context("workflow-42")
+    assert len(trace_id) == 32 and parent is None
+    assert parse_trace_context("workflow-42")[0] == trace_id  # 同一字符串映射到同一 trace
+
+
+@pytest.fixture
+def tracing():
+    add_finish_hook(_export)
+    yield
+    remove_finish_hook(_export)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="假 CLI 依赖 shebang")
+def test_codex_call_exports_span_tree(fake_cli, tmp_path, tracing):
+    """测试调用、尝试、子进程与内部工具调用 span 的父子关系，同一 trace 的多次调用写入同一文件"""
+    fake_cli("codex", invocations=[
+        {"hang": "startup"},
+        {"tool_uses": [{"id": "c1", "input": {"command": "ls"}}], "text": "ok"},
+    ])
+    parent = "00f067aa0ba902b7"
+    first = asyncio.run(codex_tool(
+        PROMPT="hi", cd=tmp_path, startup_timeout=1, return_metrics=True,
+        trace_id=f"00-{TRACE_ID}-{parent}-01",
+    ))
+    second = asyncio.run(codex_tool(PROMPT="again", cd=tmp_path, return_metrics=True, trace_id=TRACE_ID))
+    assert first["success"] and second["success"]
+    assert first["metrics"]["trace_id"] == TRACE_ID
+
+    directory = get_traces_dir(tmp_path)
+    assert len((directory / f"{TRACE_ID}.spans.jsonl").read_text().splitlines()) == 2
+    render_trace(tmp_path, TRACE_ID)
+    otlp = json.loads((directory / f"{TRACE_ID}.otlp.json").read_text())
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_id = {span["spanId"]: span for span in spans}
+    call = by_id[first["metrics"]["span_id"]]
+    assert call["parentSpanId"] == parent
+
+    attempts = [s for s in spans if s.get("parentSpanId") == call["spanId"]]
+    assert [s["name"] for s in attempts] == ["attempt 0", "attempt 1"]
+    assert attempts[0]["status"]["code"] == 2  # 启动超时
+    subprocesses = [s for s in spans if s.get("parentSpanId") == attempts[1]["spanId"]]
+    assert [s["name"] for s in subprocesses] == ["subprocess"]
+    tool_uses = [s for s in spans if s.get("parentSpanId") == subprocesses[0]["spanId"]]
+    assert [s["name"] for s in tool_uses] == ["tool_use: command_execution"]
+    assert int(call["startTimeUnixNano"]) <= int(attempts[1]["startTimeUnixNano"])
+    assert int(tool_uses[0]["endTimeUnixNano"]) <= int(call["endTimeUnixNano"])
+
+    assert second["metrics"]["span_id"] in by_id
+    chrome = json.loads((directory / f"{TRACE_ID}.chrome.json").read_text())
+    complete = [e for e in chrome["traceEvents"] if e["ph"] == "X"]
+    assert len(complete) == len(spans)
+
+
+def test_concurrent_exports_append_without_losing_spans(tmp_path):
+    """测试并发导出各自追加一行，生成的文档包含全部 span"""
+    def worker(index):
+        for call in range(20):
+            span = Span(f"call {index}-{call}", f"{index:08x}{call:08x}", None, 1_000, 2_000)
+            export_spans(tmp_path, TRACE_ID, [span])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    chrome_path, otlp_path = render_trace(tmp_path, TRACE_ID)
+    spans = json.loads(otlp_path.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len({span["spanId"] for span in spans}) == 80
+    assert len(json.loads(chrome_path.read_text())["traceEvents"]) >= 80
+    assert not list(get_traces_dir(tmp_path).glob("*.tmp"))
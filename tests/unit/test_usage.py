@@ -0,0 +1,125 @@
+"""Token 用量与成本统计单元测试"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from ccg_mcp.config import get_price_table, reset_config_cache
+from ccg_mcp.tools.codex import codex_tool
+from ccg_mcp.usage import (
+    TokenUsage,
+    UsageLedger,
+    account_usage,
+    estimate_cost,
+    get_usage_ledger,
+    parse_claude_usage,
+    parse_codex_usage,
+    parse_gemini_usage,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    reset_config_cache()
+    get_usage_ledger().reset()
+    yield
+    reset_config_cache()
+    get_usage_ledger().reset()
+
+
+def test_parse_claude_usage_includes_cache():
+    """测试 claude result 事件：input 归一化为含缓存的总输入"""
+    usage = parse_claude_usage({
+        "type": "result",
+        "usage": {
+            "input_tokens": 10,
+            "cache_read_input_tokens": 900,
+            "cache_creation_input_tokens": 90,
+            "output_tokens": 50,
+        },
+        "total_cost_usd": 0.0123,
+    })
+    assert usage.to_dict() == {
+        "input_tokens": 1000,
+        "output_tokens": 50,
+        "cache_read_tokens": 900,
+        "cache_write_tokens": 90,
+        "total_tokens": 1050,
+    }
+    assert usage.reported_cost_usd == pytest.approx(0.0123)
+    assert parse_claude_usage({"type": "result"}) is None
+
+
+def test_parse_codex_and_gemini_usage():
+    """测试 codex turn.completed 与 gemini result 的用量解析"""
+    codex = parse_codex_usage({"type": "turn.completed", "usage": {
+        "input_tokens": 2000, "cached_input_tokens": 1500, "output_tokens": 300,
+    }})
+    assert (codex.input_tokens, codex.cache_read_tokens, codex.output_tokens) == (2000, 1500, 300)
+
+    flat = parse_gemini_usage({"type": "result", "stats": {"input_tokens": 40, "output_tokens": 8, "cached": 4}})
+    assert (flat.input_tokens, flat.output_tokens, flat.cache_read_tokens) == (40, 8, 4)
+
+    nested = parse_gemini_usage({"type": "result", "stats": {"models": {
+        "gemini-3-pro-preview": {"tokens": {"prompt": 100, "candidates": 20, "cached": 60}},
+        "gemini-2.5-flash": {"tokens": {"prompt": 10, "candidates": 2}},
+    }}})
+    assert (nested.input_tokens, nested.output_tokens, nested.cache_read_tokens) == (110, 22, 60)
+    assert parse_gemini_usage({"type": "result", "stats": {"duration_ms": 5}}) is None
+
+
+def test_estimate_cost_prices_cache_separately():
+    """测试按价格表估算成本，缓存读取单独计价"""
+    usage = TokenUsage(input_tokens=1_000_000, output_tokens=100_000, cache_read_tokens=500_000)
+    cost = estimate_cost(usage, {"input": 2.0, "output": 10.0, "cache_read": 0.5})
+    # 500K 未缓存 × 2 + 500K 缓存 × 0.5 + 100K 输出 × 10
+    assert cost == pytest.approx(1.0 + 0.25 + 1.0)
+    assert estimate_cost(usage, None) is None
+
+
+def test_price_table_from_config(tmp_path):
+    """测试从配置文件读取价格表（无需 Coder 配置）"""
+    config_file = tmp_path / "config.toml"
+    config_file.write_text('[pricing."gpt-5"]\ninput = 1.25\noutput = 10\n\n[pricing.codex]\ninput = 1\n')
+    with patch("ccg_mcp.config.get_config_path", return_value=config_file):
+        table = get_price_table()
+
+    assert table == {"gpt-5": {"input": 1.25, "output": 10.0}, "codex": {"input": 1.0}}
+
+
+def test_account_usage_aggregates_by_session_and_project(tmp_path):
+    """测试按会话与项目累计用量，未配置价格时使用后端报告的成本"""
+    with patch("ccg_mcp.usage.get_price_table", return_value={}):
+        first = account_usage("coder", "glm-4.7", "s-1", tmp_path, TokenUsage(100, 10, reported_cost_usd=0.01))
+        second = account_usage("coder", "glm-4.7", "s-2", tmp_path, TokenUsage(200, 20, reported_cost_usd=0.02))
+
+    assert first["cost_source"] == "reported"
+    assert first["session_totals"]["total_tokens"] == 110
+    assert second["session_totals"]["calls"] == 1
+    assert second["project_totals"]["calls"] == 2
+    assert second["project_totals"]["cost_usd"] == pytest.approx(0.03)
+    assert account_usage("coder", "glm-4.7", "s-1", tmp_path, TokenUsage()) is None
+
+
+def test_ledger_evicts_least_recently_used_sessions():
+    """测试会话累计数量有上限，超出时淘汰最久未使用的会话，项目累计不受影响"""
+    ledger = UsageLedger(max_sessions=2)
+    for session_id in ("s-1", "s-2", "s-1", "s-3"):
+        ledger.record("codex", session_id, None, TokenUsage(10, 1), None)
+
+    assert ledger.session_totals("codex", "s-1")["calls"] == 2
+    assert ledger.session_totals("codex", "s-2") is None
+    assert ledger.session_totals("codex", "s-3")["calls"] == 1
+
+
+def test_codex_reports_usage_in_metrics(fake_cli, tmp_path):
+    """测试 codex 调用在 metrics 中返回用量与按价格表估算的成本"""
+    fake_cli("codex", session_id="t-9", usage={"input_tokens": 1000, "output_tokens": 100})
+    with patch("ccg_mcp.usage.get_price_table", return_value={"o3": {"input": 2, "output": 8}}):
+        result = asyncio.run(codex_tool(PROMPT="hi", cd=tmp_path, model="o3", return_metrics=True))
+
+    usage = result["metrics"]["usage"]
+    assert usage["total_tokens"] == 1100
+    assert usage["cost_usd"] == pytest.approx(0.0028)
+    assert usage["cost_source"] == "price_table"
+    assert usage["session_totals"]["calls"] == 1